@@ -2,34 +2,19 @@ import os
 import numpy as np
 from lib.generateData import *
 from lib.boundary import *
+from lib.bootstrap import *
+from lib.truePlan import *
+from lib.coverage import *
+from lib.streaming import *
+from lib.rng import *
+from lib.parallel import *
 from lib.fileio import *
+from lib.noiseBank import *
+from lib.workspace import *
 import yaml
 from scipy.ndimage.measurements import label
 import matplotlib.pyplot as plt
 
-# Powerset function, taken from:
-# https://stackoverflow.com/questions/1482308/how-to-get-all-subsets-of-a-set-powerset
-def powerset(s):
-
-    # Get length of x
-    x = len(s)
-
-    # Masks is a list of `aliases' for the elements of s. I.e. for the
-    # i^th element of s, the corresponding element of masks is 2^(i+1).
-    masks = [1 << i for i in range(x)]
-    
-    # a << x is the same as a*(2^x) so we are looping over length of
-    # powerset here
-    for i in range(1,1 << x):
-
-        # Yeild makes a generator obect
-        # zip(masks,s) is pairing each element of s with a power of 2
-        yield np.array([ss for mask, ss in zip(masks, s) if i & mask])
-
-m = 5
-alphas=list(powerset(np.arange(m)))
-
-
 # Even circle points function, taken from:
 # https://stackoverflow.com/questions/33510979/generator-of-evenly-spaced-points-in-a-circle-in-python
 def circle_points(r, n):
@@ -41,20 +26,6 @@ def circle_points(r, n):
         circles.append(np.c_[x, y])
     return circles[0]
 
-def get_data_1field(muSpec,noiseSpec,dim):
-
-    # Obtain the noise fields
-    noise = get_noise(noiseSpec, dim)
-
-    # Obtain mu
-    mu = get_mu(muSpec, dim)
-    
-    # Create the data
-    data = mu + noise
-
-    # Return the data and mu
-    return(data,mu)
-
 def SpatialSims_Mmu(ipath):
 
     # -----------------------------------------------------------------------
@@ -85,9 +56,99 @@ def SpatialSims_Mmu(ipath):
     # Get number of simulation realizations
     nReals = int(inputs['nReals'])
 
+    # Get the tolerance for sequential stopping of the realizations. If this
+    # is given, the (interpolated) coverage confidence intervals are checked
+    # every realCheck realizations and the realizations stop once every 
+    # monitored p-value has half-width at most realTol (and nReals is then 
+    # the maximum number of realizations)
+    if 'realTol' in inputs:
+        realTol = float(inputs['realTol'])
+    else:
+        realTol = None
+
+    # Get number of realizations to run between checks of the intervals
+    if 'realCheck' in inputs:
+        realCheck = int(inputs['realCheck'])
+    else:
+        realCheck = REAL_CHECK
+
     # Get number of bootstraps
     nBoot = int(inputs['nBoot'])
 
+    # Get number of bootstraps to perform at once
+    if 'bootBlockSize' in inputs:
+        bootBlockSize = int(inputs['bootBlockSize'])
+    else:
+        bootBlockSize = BOOT_BLOCK_SIZE
+
+    # Get the tolerance for the adaptive bootstrap. If this is given, the 
+    # bootstrap stops once the confidence interval for every percentile has
+    # half-width at most bootTol (and nBoot is then the maximum number of 
+    # bootstraps)
+    if 'bootTol' in inputs:
+        bootTol = float(inputs['bootTol'])
+    else:
+        bootTol = None
+
+    # Get the backend used to run the bootstrap ('numpy', or 'numba' for the
+    # fused bootstrap kernel, which falls back to NumPy if numba is not
+    # installed, see `get_boot_backend`)
+    if 'bootBackend' in inputs:
+        bootBackend = get_boot_backend(inputs['bootBackend'])
+    else:
+        bootBackend = 'numpy'
+
+    # Get number of subjects to generate at once. If this is given, the data
+    # are streamed a block of subjects at a time (in two passes) rather than
+    # all being held in memory at once.
+    if 'subBlockSize' in inputs:
+        subBlockSize = int(inputs['subBlockSize'])
+    else:
+        subBlockSize = None
+
+    # Get the floating point type of the data (float64 or float32). In 
+    # float32 the noise, data, residuals and bootstrap are all held in 
+    # single precision (halving their memory), while the means and sums of
+    # squares are still accumulated in float64. The coverage obtained in 
+    # float32 should agree with that in float64 within Monte Carlo error 
+    # (this can be checked with `get_coverage_agreement`).
+    if 'dtype' in inputs:
+        dtype = np.dtype(inputs['dtype'])
+        if dtype not in (np.float32, np.float64):
+            raise ValueError('dtype must be float32 or float64.')
+    else:
+        dtype = np.dtype(np.float64)
+
+    # Get number of worker processes to run the realizations in (if this is
+    # more than 1 the realizations are run in parallel)
+    if 'nWorkers' in inputs:
+        nWorkers = int(inputs['nWorkers'])
+    else:
+        nWorkers = 1
+
+    # Get the root seed and bit generator for the random number generators
+    # (if no seed is given the legacy global generator is used)
+    seed, bitGenerator = get_root_seed(inputs)
+
+    # Realizations run in parallel must draw from their own streams, so if we
+    # have no root seed we make one
+    if nWorkers > 1 and seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+        print('Root seed: ', seed)
+
+    # Get the noise bank. If this is given, the noise for each realization
+    # is read from a bank of noise fields on disk (shared by every
+    # configuration with the same noise and root seed) rather than being
+    # generated, and noiseBankSize is the maximum size of the bank in
+    # gigabytes (see `get_bank_noise`)
+    if 'noiseBank' in inputs:
+        if 'noiseBankSize' in inputs:
+            noiseBank = get_noise_bank(inputs['noiseBank'], inputs['noiseBankSize'], seed, bitGenerator)
+        else:
+            noiseBank = get_noise_bank(inputs['noiseBank'], None, seed, bitGenerator)
+    else:
+        noiseBank = None
+
     # Get Threshold
     c = np.float(inputs['c'])
 
@@ -97,6 +158,13 @@ def SpatialSims_Mmu(ipath):
     # Get the number of p-values we're looking at
     nPvals = len(p)
 
+    # Get the p-values monitored when stopping the realizations sequentially
+    # (by default, all of them)
+    if 'realP' in inputs:
+        realMonitor = np.any(np.isclose(np.reshape(p,(-1,1)), np.reshape(eval(inputs['realP']),(1,-1))),axis=1)
+    else:
+        realMonitor = None
+
     # Get number of bootstraps
     if 'tau' in inputs:
         tau = eval(inputs['tau'])
@@ -106,9 +174,6 @@ def SpatialSims_Mmu(ipath):
     # Dimensions of simulated data
     data_dim = np.array([nSub, 100,100])
 
-    # Dimensions of bootstrap variables
-    boot_dim = np.array([nSub, 1]) 
-
     # Initialise array for recording the whether set violations occured, for a derived
     # from bootstrapping the true boundary and estimated boundary, respectively. The
     # result in these arrays are based on voxelwise assessment of set condition 
@@ -162,6 +227,14 @@ def SpatialSims_Mmu(ipath):
         # Save noiseSpec
         noiseSpec[str(i+1)] = noiseSpeci
 
+    # Correlation between noise fields. This may be a single correlation
+    # (used between every pair of fields) or an m by m correlation matrix,
+    # which is factorised here once for every realization.
+    if 'noiseCorr' in inputs:
+        noiseFactor = get_corr_factor(eval(str(inputs['noiseCorr'])), m)
+    else:
+        noiseFactor = None
+
     # Initialise array for recording the whether set violations occured, for a derived
     # from bootstrapping the true boundary and estimated boundary, respectively. The
     # result in these arrays are based on interpolation based assessment of set
@@ -169,953 +242,633 @@ def SpatialSims_Mmu(ipath):
     trueBdry_success_intrp = np.zeros((nReals,nPvals))
     estBdry_success_intrp = np.zeros((nReals,nPvals))
 
-    # Loop through realizations
-    for r in np.arange(nReals):
-
-        print('Realization: ', r)
-
-        # Make a structure to hold the true and estimated boundary locations
-        true_bdry_locs = {}
-        est_bdry_locs = {}
-
-        # Make a structure to hold the true and estimated boundary weights
-        true_bdry_weights = {}
-        est_bdry_weights = {}
+    # Initialise array for recording the number of bootstraps used in each 
+    # realization
+    nBoot_used = np.zeros((nReals,1))
 
-        # Make a structure to hold the true and estimated boundary weights in
-        # array form (it's current handy to have both forms close to hand but
-        # this will likely be changed in later versions of the code)
-        true_bdry_weights_concat = {}
-        est_bdry_weights_concat = {}
-
-        for i in np.arange(m):
-
-            # ----------------------------------------------------------------
-            # Data generation
-            # ----------------------------------------------------------------
-
-            # Obtain data
-            data, mu = get_data_1field(muSpec[str(i+1)],noiseSpec[str(i+1)],data_dim)
-
-            # Save mus
-            if i == 0:
-                mus = np.array(mu)
-            else:
-                mus = np.concatenate((mus,mu),axis=0)
-
-            # Combine data
-            if i == 0:
-                datas = np.array(data.reshape(1,*(data.shape)))
-            else:
-                datas = np.concatenate((datas,data.reshape(1,*(data.shape))),axis=0)
-
-            # plt.figure(int(i))
-            # plt.imshow(1*mu[0,:,:])
-
-
-            # -------------------------------------------------------------------
-            # Mean and standard deviation estimates
-            # -------------------------------------------------------------------
-
-            # Obtain mu estimate
-            muHat = np.mean(data, axis=0).reshape(mu.shape)
-
-            # Save muHats
-            if i == 0:
-                muHats = np.array(muHat)
-            else:
-                muHats = np.concatenate((muHats,muHat),axis=0)
-
-            # Obtain sigma
-            sigma = np.std(data, axis=0).reshape(mu.shape)
-
-            # Save sigmas
-            if i == 0:
-                sigmas = np.array(sigma)
-            else:
-                sigmas = np.concatenate((sigmas,sigma),axis=0)
-
-            # -------------------------------------------------------------------
-            # Boundary locations for Aci
-            # -------------------------------------------------------------------
-            # Get boolean map for the boundary of Aci
-            Ac_bdry_map = get_bdry_maps(mu, c)
-
-            # Get coordinates for the boundary of Aci
-            Ac_bdry_locs = get_bdry_locs(Ac_bdry_map)
-
-            # Save boundary locations
-            true_bdry_locs['Ac'+str(i+1)] = Ac_bdry_locs
-
-            # Delete map as we no longer need it
-            del Ac_bdry_map
-
-            # -------------------------------------------------------------------
-            # Boundary locations for AcHati
-            # -------------------------------------------------------------------
-            # Get boolean maps for the boundary of AcHat
-            AcHat_bdry_map = get_bdry_maps(muHat, c)
-
-            # Get coordinates for the boundary of AcHat
-            AcHat_bdry_locs = get_bdry_locs(AcHat_bdry_map)
-
-            # Save boundary locations
-            est_bdry_locs['AcHat'+str(i+1)] = AcHat_bdry_locs
-
-            # Delete map as we no longer need it
-            del AcHat_bdry_map
+    # -----------------------------------------------------------------------
+    # True boundary plan
+    # -----------------------------------------------------------------------
+    # The mus (and everything derived from them) are the same for every
+    # realization, so we only work them out once.
+    truePlan = get_true_plan([muSpec[str(i+1)] for i in np.arange(m)], data_dim, c)
 
-            # -------------------------------------------------------------------
-            # Interpolation weights for Aci boundary (Dict version)
-            # -------------------------------------------------------------------
-            # Obtain the values along the boundary for Aci
-            Ac_bdry_vals = get_bdry_values(mu, Ac_bdry_locs)
+    # Obtain the mus
+    mus = truePlan['mus']
 
-            # Obtain the weights along the boundary for Aci
-            Ac_bdry_weights = get_bdry_weights(Ac_bdry_vals, c)
+    # Obtain the minimum of the mus (this is named cap as the excursion set 
+    # of the minimum field is the intersection of all fields)
+    cap_mu = truePlan['cap_mu']
 
-            # Save boundary weights
-            true_bdry_weights['Ac'+str(i+1)] = Ac_bdry_weights
+    # Get coordinates for the boundary of Fc
+    Fc_bdry_locs = truePlan['Fc_bdry_locs']
 
-            # Delete values as we no longer need them
-            del Ac_bdry_vals
+    # Each point on dFc is labelled with a bitmask, alpha, of the fields for
+    # which mu is less than or equal to c outside Fc. The points are sorted
+    # by label so that d^alpha Fc is a contiguous block of points.
+    dFc_order = truePlan['dFc_order']
+    dFc_labels = truePlan['dFc_labels']
+    dFc_alphas = truePlan['dFc_alphas']
+    dFc_starts = truePlan['dFc_starts']
 
-            # -------------------------------------------------------------------
-            # Interpolation weights for Aci boundary (Array version)
-            # -------------------------------------------------------------------
-            # Obtain the values along the boundary for Aci
-            Ac_bdry_vals_concat = get_bdry_values_concat(mu, Ac_bdry_locs)
+    # Every partition found by get_bdry_partitions is non-empty
+    dFc_nonempty = np.ones(len(dFc_alphas), dtype=bool)
 
-            # Obtain the weights along the boundary for Aci
-            Ac_bdry_weights_concat = get_bdry_weights_concat(Ac_bdry_vals_concat, c)
+    # Mask recording which fields belong to the partition of each point
+    # (this has shape [m, nBdry])
+    dFc_fieldMask = get_label_field_mask(dFc_labels, m)
 
-            # Save boundary weights
-            true_bdry_weights_concat['Ac'+str(i+1)] = Ac_bdry_weights_concat
+    # Obtain mu for every field along Fc, sorted by partition (of shape
+    # [m, nBdry, 2])
+    mus_dFc = truePlan['mus_dFc'][:,dFc_order,:]
 
-            # Delete values as we no longer need them
-            del Ac_bdry_vals_concat
+    # Weights for every field along dFc. For fields which are not in a 
+    # point's partition these may be nan or inf, but such values are always
+    # masked out before they are used.
+    with np.errstate(invalid='ignore'):
+        weights_dFc = get_bdry_weights_concat(mus_dFc, c)
 
-            # -------------------------------------------------------------------
-            # Interpolation weights for AcHati boundary (Array version)
-            # -------------------------------------------------------------------
-            # Obtain the values along the boundary for AcHati
-            AcHat_bdry_vals_concat = get_bdry_values_concat(muHat, AcHat_bdry_locs)
+    # Number of voxels in each field (with singleton dimensions removed)
+    nVox = np.prod(Fc_bdry_locs['edges']['shape'])
 
-            # Obtain the weights along the boundary for AcHati
-            AcHat_bdry_weights_concat = get_bdry_weights_concat(AcHat_bdry_vals_concat, c)
+    # Flat voxel indices along dFc, sorted by partition and offset so that 
+    # they index into the stack of all m fields (of shape [m, nBdry, 2])
+    inds_dFc = get_bdry_inds_concat(Fc_bdry_locs)[dFc_order,:] + nVox*np.arange(m).reshape(m,1,1)
 
-            # Save boundary weights
-            est_bdry_weights_concat['AcHat'+str(i+1)] = AcHat_bdry_weights_concat
+    # Unique voxels along dFc and the interpolation operator onto every 
+    # (field, boundary point) pair. Only the fields in each point's 
+    # partition are needed, so only their voxels are bootstrapped.
+    vox_dFc, interp_op_dFc = get_bdry_interp_op(inds_dFc, weights_dFc, dFc_fieldMask)
 
-            # Delete values as we no longer need them
-            del AcHat_bdry_vals_concat
+    # Obtain Ac for all i
+    Ac = mus > c
 
+    # Obtain Fc
+    Fc = cap_mu > c
 
-        # -------------------------------------------------------------------
-        # Get minimum fields
-        # -------------------------------------------------------------------
-        # This is named cap as the excursion set of the minimum field is
-        # the intersection of all fields (\cap in latex)
-        cap_mu = np.amin(mus,axis=0)
-        cap_muHat = np.amin(muHats,axis=0)
+    # -----------------------------------------------------------------------
+    # Realizations
+    # -----------------------------------------------------------------------
+    # Everything the realizations need which is the same for every
+    # realization
+    consts = {}
+    consts['seed'] = seed
+    consts['simNo'] = simNo
+    consts['cfgId'] = cfgId
+    consts['bitGenerator'] = bitGenerator
+    consts['noiseBank'] = noiseBank
+    consts['m'] = m
+    consts['subBlockSize'] = subBlockSize
+    consts['dtype'] = dtype
+    consts['noiseSpec'] = noiseSpec
+    consts['noiseFactor'] = noiseFactor
+    consts['data_dim'] = data_dim
+    consts['mus'] = mus
+    consts['c'] = c
+    consts['cap_mu'] = cap_mu
+    consts['Fc'] = Fc
+    consts['nVox'] = nVox
+    consts['nSub'] = nSub
+    consts['vox_dFc'] = vox_dFc
+    consts['nBoot'] = nBoot
+    consts['bootBlockSize'] = bootBlockSize
+    consts['bootTol'] = bootTol
+    consts['bootBackend'] = bootBackend
+    consts['interp_op_dFc'] = interp_op_dFc
+    consts['dFc_fieldMask'] = dFc_fieldMask
+    consts['dFc_starts'] = dFc_starts
+    consts['dFc_nonempty'] = dFc_nonempty
+    consts['p'] = p
+    consts['nPvals'] = nPvals
+    consts['tau'] = tau
+    consts['Fc_bdry_locs'] = Fc_bdry_locs
+    consts['dFc_order'] = dFc_order
+    consts['weights_dFc'] = weights_dFc
+
+    # If we are stopping sequentially, stop once the confidence intervals for
+    # the interpolated coverage (the running means of the third and fourth 
+    # results of each realization) are all narrow enough
+    if realTol is not None:
+        def stop(results):
+            return(get_coverage_converged([[res[2] for res in results],[res[3] for res in results]], realTol, realMonitor))
+    else:
+        stop = None
 
-        # -------------------------------------------------------------------
-        # Boundary locations for Fc 
-        # -------------------------------------------------------------------
-        # Get boolean map for the boundary of Fc
-        Fc_bdry_map = get_bdry_maps(cap_mu, c)
+    # Run the realizations (sharded across a pool of nWorkers processes if
+    # nWorkers > 1), in order
+    results = get_realizations(SpatialSims_Mmu_real, consts, nReals, nWorkers, stop, realCheck)
 
-        # Get coordinates for the boundary of Fc
-        Fc_bdry_locs = get_bdry_locs(Fc_bdry_map)
+    # Free the workspace used by the realizations run in this process
+    free_workspace()
 
-        # Save boundary locations
-        true_bdry_locs['Fc'] = Fc_bdry_locs
+    # Number of realizations actually run
+    nReals = len(results)
 
-        # Delete maps as we no longer need them
-        del Fc_bdry_map
+    # Record whether each realization observed successful sets (and the 
+    # number of bootstraps it used)
+    for r in np.arange(nReals):
+        trueBdry_success[r,:], estBdry_success[r,:], trueBdry_success_intrp[r,:], estBdry_success_intrp[r,:], nBoot_used[r,:] = results[r]
 
-        # -------------------------------------------------------------------
-        # Boundary locations for FcHat
-        # -------------------------------------------------------------------
-        # Get boolean map for the boundary of FcHat
-        FcHat_bdry_map = get_bdry_maps(cap_muHat, c)
+    # Remove any realizations we did not run
+    trueBdry_success = trueBdry_success[:nReals,:]
+    estBdry_success = estBdry_success[:nReals,:]
+    trueBdry_success_intrp = trueBdry_success_intrp[:nReals,:]
+    estBdry_success_intrp = estBdry_success_intrp[:nReals,:]
+    nBoot_used = nBoot_used[:nReals,:]
 
-        # Get coordinates for the boundary of FcHat
-        FcHat_bdry_locs = get_bdry_locs(FcHat_bdry_map)
+    # Coverage probabilities
+    coverage_trueBdry = np.mean(trueBdry_success,axis=0)
+    coverage_estBdry = np.mean(estBdry_success,axis=0)
 
-        # Save boundary locations
-        est_bdry_locs['FcHat'] = FcHat_bdry_locs
+    # Coverage probabilities
+    coverage_trueBdry_intrp = np.mean(trueBdry_success_intrp,axis=0)
+    coverage_estBdry_intrp = np.mean(estBdry_success_intrp,axis=0)
 
-        # Delete maps as we no longer need them
-        del FcHat_bdry_map
+    # Control variate estimates of the coverage for the estimated boundary 
+    # (using the true boundary successes as the control), and their standard
+    # errors
+    coverage_estBdry_cv, se_estBdry_cv = get_cv_coverage(estBdry_success, trueBdry_success, p)
+    coverage_estBdry_intrp_cv, se_estBdry_intrp_cv = get_cv_coverage(estBdry_success_intrp, trueBdry_success_intrp, p)
 
-        # -------------------------------------------------------------------
-        # Interpolation weights for Fc boundary (Dict version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Fc
-        Fc_bdry_vals = get_bdry_values(cap_mu, Fc_bdry_locs)
+    # Make results folder
+    if not os.path.exists(os.path.join(simDir, 'RawResults')):
+        os.mkdir(os.path.join(simDir, 'RawResults'))
 
-        # Obtain the weights along the boundary for Fc
-        Fc_bdry_weights = get_bdry_weights(Fc_bdry_vals, c)
+    # Save the violations to a file
+    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess.csv'), trueBdry_success) # Successes based on the true boundary (assessed without interpolation)
+    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess.csv'), estBdry_success) # Successes based on the interpolated boundary (assessed without interpolation) 
+    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess_intrp.csv'), trueBdry_success_intrp) # Successes based on the true boundary (assessed with interpolation)
+    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess_intrp.csv'), estBdry_success_intrp) # Successes based on the interpolated boundary (assessed with interpolation) 
+    append_to_file(os.path.join(simDir, 'RawResults', 'nBoot.csv'), nBoot_used) # Number of bootstraps used in each realization
+    append_to_file(os.path.join(simDir, 'RawResults', 'nReals.csv'), np.array([[nReals]])) # Number of realizations run
+    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess_intrp_ci.csv'), np.array(get_coverage_ci(trueBdry_success_intrp))) # Confidence interval (lower and upper rows) for the coverage based on the true boundary (assessed with interpolation)
+    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess_intrp_ci.csv'), np.array(get_coverage_ci(estBdry_success_intrp))) # Confidence interval (lower and upper rows) for the coverage based on the interpolated boundary (assessed with interpolation)
+    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess_cv.csv'), np.array([coverage_estBdry_cv, se_estBdry_cv])) # Control variate estimate (first row) and standard error (second row) of the coverage based on the interpolated boundary (assessed without interpolation)
+    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess_intrp_cv.csv'), np.array([coverage_estBdry_intrp_cv, se_estBdry_intrp_cv])) # Control variate estimate (first row) and standard error (second row) of the coverage based on the interpolated boundary (assessed with interpolation)
+
+
+# ===========================================================================
+#
+# This function runs a single realization of `SpatialSims_Mmu`. It is run
+# for every realization by `get_realizations` (serially, or in a pool of
+# worker processes).
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `r`: The realization number.
+# - `consts`: Dictionary of everything which is the same for every 
+#             realization (the inputs, the mus and the true boundary
+#             quantities computed in `SpatialSims_Mmu`). These must not be
+#             modified.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `trueBdry_success`, `estBdry_success`: Whether the sets based on the
+#                                          true and estimated boundary were
+#                                          successful, for each p-value 
+#                                          (assessed without interpolation).
+# - `trueBdry_success_intrp`, `estBdry_success_intrp`: As above, assessed 
+#                                                      with interpolation.
+# - `nBoot_used`: The number of bootstraps used (this is nBoot unless the
+#                bootstrap is adaptive, see `get_boot_converged`).
+#
+# ===========================================================================
+def SpatialSims_Mmu_real(r, consts):
 
-        # Save boundary weights
-        true_bdry_weights['Fc'] = Fc_bdry_weights
+    # -----------------------------------------------------------------------
+    # Unpack the constants
+    # -----------------------------------------------------------------------
+    seed = consts['seed']
+    simNo = consts['simNo']
+    cfgId = consts['cfgId']
+    bitGenerator = consts['bitGenerator']
+    noiseBank = consts['noiseBank']
+    m = consts['m']
+    subBlockSize = consts['subBlockSize']
+    dtype = consts['dtype']
+    noiseSpec = consts['noiseSpec']
+    noiseFactor = consts['noiseFactor']
+    data_dim = consts['data_dim']
+    mus = consts['mus']
+    c = consts['c']
+    cap_mu = consts['cap_mu']
+    Fc = consts['Fc']
+    nVox = consts['nVox']
+    nSub = consts['nSub']
+    vox_dFc = consts['vox_dFc']
+    nBoot = consts['nBoot']
+    bootBlockSize = consts['bootBlockSize']
+    bootTol = consts['bootTol']
+    bootBackend = consts['bootBackend']
+    interp_op_dFc = consts['interp_op_dFc']
+    dFc_fieldMask = consts['dFc_fieldMask']
+    dFc_starts = consts['dFc_starts']
+    dFc_nonempty = consts['dFc_nonempty']
+    p = consts['p']
+    nPvals = consts['nPvals']
+    tau = consts['tau']
+    Fc_bdry_locs = consts['Fc_bdry_locs']
+    dFc_order = consts['dFc_order']
+    weights_dFc = consts['weights_dFc']
+
+    print('Realization: ', r)
+
+    # Workspace for this configuration (the arrays in this are reused by 
+    # every realization, see `get_workspace`)
+    workspace = get_workspace(data_dim, m, nBoot, bootBlockSize, subBlockSize is None, dtype)
+
+    # Generator for the bootstrap
+    boot_rng = get_rng(seed, simNo, cfgId, r, 0, 'boot', bitGenerator)
+
+    # Make a structure to hold the estimated boundary locations
+    est_bdry_locs = {}
+
+    # Make a structure to hold the estimated boundary weights in array
+    # form
+    est_bdry_weights_concat = {}
+
+    # Make a structure to hold the noise streams (if we are streaming)
+    noise_streams = []
+
+    # Generators for the noise in each field
+    noise_rngs = [get_rng(seed, simNo, cfgId, r, i, 'noise', bitGenerator) for i in np.arange(m)]
+
+    # Noise for each field from the noise bank (if we are using one)
+    if noiseBank is not None:
+        noises = [get_bank_noise(noiseBank, noiseSpec[str(i+1)], data_dim, r, i) for i in np.arange(m)]
+    else:
+        noises = [None]*m
 
-        # Delete values as we no longer need them
-        del Fc_bdry_vals
+    # If we are not streaming, generate all of the data at once
+    if subBlockSize is None:
 
         # -------------------------------------------------------------------
-        # Interpolation weights for Fc boundary (Array version)
+        # Data generation
         # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Fc
-        Fc_bdry_vals_concat = get_bdry_values_concat(cap_mu, Fc_bdry_locs)
 
-        # Obtain the weights along the boundary for Fc
-        Fc_bdry_weights_concat = get_bdry_weights_concat(Fc_bdry_vals_concat, c)
+        # Obtain the noise for every field in one preallocated stack (of 
+        # shape [m, nSub, ...]), and add mu to get the data
+        datas = get_noise_stack([noiseSpec[str(i+1)] for i in np.arange(m)], data_dim, noise_rngs, out=workspace['data'], noises=noises, workspace=workspace)
 
-        # Save boundary weights
-        true_bdry_weights_concat['Fc'] = Fc_bdry_weights_concat
+        # Correlate the noise in place if needed
+        if noiseFactor is not None:
+            correlate_noise_stack(datas, noiseFactor)
 
-        # Delete values as we no longer need them
-        del Fc_bdry_vals_concat
+        datas += mus.reshape(m, 1, *mus.shape[1:])
 
         # -------------------------------------------------------------------
-        # Interpolation weights for FcHat boundary (Array version)
+        # Mean and standard deviation estimates
         # -------------------------------------------------------------------
-        # Obtain the values along the boundary for FcHat
-        FcHat_bdry_vals_concat = get_bdry_values_concat(cap_mu, FcHat_bdry_locs)
 
-        # Obtain the weights along the boundary for FcHat
-        FcHat_bdry_weights_concat = get_bdry_weights_concat(FcHat_bdry_vals_concat, c)
+        # Obtain mu estimate for every field (accumulated in float64)
+        muHats = np.mean(datas, axis=1, dtype=np.float64, out=workspace['muHat'])
 
-        # Save boundary weights
-        est_bdry_weights_concat['Fc'] = FcHat_bdry_weights_concat
-
-        # Delete values as we no longer need them
-        del FcHat_bdry_vals_concat
+        # Obtain sigma for every field (accumulated in float64)
+        sigmas = np.std(datas, axis=1, dtype=np.float64, out=workspace['sigma'])
 
-        # Empty dicts to store residuals
-        resids_dFc = {}
-        resids_dFcHat = {}
+    # Otherwise, stream the data (pass one)
+    else:
 
-        # Empty dicts to store mu and muHat
-        mu_dFc = {}
-        muHat_dFcHat = {}
+        # Running moments for every field
+        moments = [get_moments_init() for i in np.arange(m)]
 
-        # Loop through to get residuals
         for i in np.arange(m):
 
-            # -------------------------------------------------------------------
-            # Residuals along dFc and dFcHat
-            # -------------------------------------------------------------------
-
-            # Obtain residuals
-            resid = (datas[i,...]-muHats[i,...])/sigmas[i,...] # NEED DATA TO BE SAVED FIRST
-
-            # Residuals along Fc boundary
-            resid_dFc_concat = get_bdry_values_concat(resid, Fc_bdry_locs)
-
-            # Save residuals
-            resids_dFc['field'+str(i+1)] = resid_dFc_concat
-
-            # Residuals along FcHat boundary
-            resid_dFcHat_concat = get_bdry_values_concat(resid, FcHat_bdry_locs)
-
-            # Save residuals
-            resids_dFcHat['field'+str(i+1)] = resid_dFcHat_concat
-
-            # -------------------------------------------------------------------
-            # Mu along dFc
-            # -------------------------------------------------------------------
-
-            # Obtain Mu along Fc
-            mu_Fc_bdry_concat = get_bdry_values_concat(mus[i,...], Fc_bdry_locs)
-
-            # Save mu
-            mu_dFc['field'+str(i+1)] = mu_Fc_bdry_concat
-
-            # -------------------------------------------------------------------
-            # MuHat along dFcHat
-            # -------------------------------------------------------------------
-
-            # Obtain MuHat along FcHat
-            muHat_FcHat_bdry_concat = get_bdry_values_concat(muHats[i,...], FcHat_bdry_locs)
-
-            # Save mu
-            muHat_dFcHat['field'+str(i+1)] = muHat_FcHat_bdry_concat
-
-        # Delete data as it is longer needed
-        del datas, resid
-
-        # -------------------------------------------------------------------
-        # Boundary partitions 
-        # -------------------------------------------------------------------
-
-        # Get list of possible alphas to be considered
-        alphas=list(powerset(np.arange(m)+1))
-
-        # Locations of the dalpha boundaries
-        dalphaFc_locs = {}
-        dalphaFcHat_locs = {}
-
-        # Loop through alphas
-        for alpha in alphas:
-
-            # Loop through possible elements of alpha
-            for i in (np.arange(m)+1):
-
-                # Get indices representing where mui and muhati are less
-                # than or equal to c if i is in alpha.
-                if i in alpha:
-
-                    # Mu
-                    in_dalphaFc_i = (mu_dFc['field'+str(i)][:,1] <= c)
-
-                    # Muhat
-                    in_dalphaFcHat_i = (muHat_dFcHat['field'+str(i)][:,1] <= c)
-
-                # Get indices representing where mui is greater than c
-                # if i is not in alpha.
-                else:
-
-                    # Mu
-                    in_dalphaFc_i = (mu_dFc['field'+str(i)][:,1] > c)
-
-                    # Muhat
-                    in_dalphaFcHat_i = (muHat_dFcHat['field'+str(i)][:,1] > c)
-
-                # print('alpha: ', alpha)
-                # print('i: ', i)
-                # print(in_dalpha_i)
-
-                # Get a boolean index telling us whether each location in dFc
-                # belongs to d^\alpha Fc.
-                if i == 1:
-
-                    # Initial running product for mu
-                    in_dalphaFc = np.array(in_dalphaFc_i)
-
-                    # Initial running product for muHat
-                    in_dalphaFcHat = np.array(in_dalphaFcHat_i)
-
-                else:
-
-                    # Update running product for mu
-                    in_dalphaFc = in_dalphaFc*in_dalphaFc_i
-
-                    # Update running product for muhat
-                    in_dalphaFcHat = in_dalphaFcHat*in_dalphaFcHat_i
-
-            # Convert boolean 1/0s into coordinates
-            dalphaFc_loc = np.where(in_dalphaFc)[0]
-            dalphaFcHat_loc = np.where(in_dalphaFcHat)[0]
-
-            # Save locations
-            dalphaFc_locs[np.array2string(alpha)] = dalphaFc_loc
-            dalphaFcHat_locs[np.array2string(alpha)] = dalphaFcHat_loc
-
-        # -------------------------------------------------------------------
-        # Get residuals, mu and muhat along boundary partitions
-        # -------------------------------------------------------------------
-
-        # Empty dicts for residuals, mu and muHat
-        resids_dFc_partitioned = {}
-        resids_dFcHat_partitioned = {}
-        mu_dFc_partitioned = {}
-        muHat_dFcHat_partitioned = {}
-
-        # Loop through boundary partitions
-        for alpha in alphas:
-
-            # New empty dicts for Fc
-            resids_dalphaFc = {}
-            mu_dalphaFc = {}
-
-            # New empty dicts for FcHat
-            resids_dalphaFcHat = {}
-            muHat_dalphaFcHat = {}
-
-            # Get dalpha locations
-            dalphaFc_loc = dalphaFc_locs[np.array2string(alpha)]
-            dalphaFcHat_loc = dalphaFcHat_locs[np.array2string(alpha)]
-
-            # Loop through i in alpha getting values for interpolation
-            for i in alpha:
-
-                # ------------------------------------------------------
-                # Residuals and mu on true boundary; dFc
-                # ------------------------------------------------------
-
-                # Get residuals for field i along dFc
-                residsi_dFc = resids_dFc['field'+str(i)]
-
-                # Save residuals for field i along dalphaFc
-                resids_dalphaFc[str(i)] = residsi_dFc[:,dalphaFc_loc,:]
-
-                # Get mu for field i along dFc
-                mui_dFc = mu_dFc['field'+str(i)]
-
-                # Save residuals for field i along dalphaFc
-                mu_dalphaFc[str(i)] = mui_dFc[dalphaFc_loc,:]
-
-                # ------------------------------------------------------
-                # Residuals and mu on estimates boundary; dFcHat
-                # ------------------------------------------------------
-
-                # Get residuals for field i along dFcHat
-                residsi_dFcHat = resids_dFcHat['field'+str(i)]
-
-                # Save residuals for field i along dalphaFc
-                resids_dalphaFcHat[str(i)] = residsi_dFcHat[:,dalphaFcHat_loc,:]
-
-                # Get mu for field i along dFcHat
-                muHati_dFcHat = muHat_dFcHat['field'+str(i)]
-
-                # Save residuals for field i along dalphaFc
-                muHat_dalphaFcHat[str(i)] = muHati_dFcHat[dalphaFcHat_loc,:]
-
-            # Save residuals for alpha
-            resids_dFc_partitioned[np.array2string(alpha)] = resids_dalphaFc
-            resids_dFcHat_partitioned[np.array2string(alpha)] = resids_dalphaFcHat
-
-            # Save mu and muhat for alpha
-            mu_dFc_partitioned[np.array2string(alpha)] = mu_dalphaFc
-            muHat_dFcHat_partitioned[np.array2string(alpha)] = muHat_dalphaFcHat
-
-        # -------------------------------------------------------------------
-        # Get weights from mu and muhat along boundary partitions for 
-        # interpolation
-        # -------------------------------------------------------------------
-
-        # Empty dicts for weights
-        weights_dFc = {}
-        weights_dFcHat = {}
-
-        # Loop through boundary partitions
-        for alpha in alphas:
-
-            # New empty dicts for weights
-            weights_dalphaFc = {}
-            weights_dalphaFcHat = {}
-
-            # Loop through i in alpha getting values for interpolation
-            for i in alpha:
-
-                # Get mui and muhati along dalpha Fc
-                mui_dalphaFc = mu_dFc_partitioned[np.array2string(alpha)][str(i)]
-                muHati_dalphaFcHat = muHat_dFcHat_partitioned[np.array2string(alpha)][str(i)]
-
-                # For true boundary
-                dalphaFc_mui_weights = get_bdry_weights_concat(mui_dalphaFc, c)
+            # Set up a stream for the noise (or read the noise from the 
+            # noise bank a block at a time)
+            if noiseBank is None:
+                noise_streams.append(get_noise_stream(noiseSpec[str(i+1)], data_dim, subBlockSize, noise_rngs[i], dtype))
+            else:
+                noise_streams.append(get_bank_noise_stream(noises[i], subBlockSize, dtype))
 
-                # For estimated boundary
-                dalphaFcHat_muHati_weights = get_bdry_weights_concat(muHati_dalphaFcHat, c)
+        # Accumulate the moments a block at a time (the fields are streamed 
+        # together, so that they can be correlated)
+        for s0, s1, datas in get_data_blocks_mfield(noise_streams, mus, noiseFactor):
+            for i in np.arange(m):
+                moments[i] = get_moments_update(moments[i], datas[i])
 
-                # Save weights
-                weights_dalphaFc[str(i)] = dalphaFc_mui_weights
-                weights_dalphaFcHat[str(i)] = dalphaFcHat_muHati_weights
+        # Obtain mu estimate and sigma for every field
+        muHats = workspace['muHat']
+        sigmas = workspace['sigma']
+        for i in np.arange(m):
+            muHats[i,...], sigmas[i,...] = get_moments_final(moments[i])
 
-            # Save weights
-            weights_dFc[np.array2string(alpha)] = weights_dalphaFc
-            weights_dFcHat[np.array2string(alpha)] = weights_dalphaFcHat
+    # Loop through the fields, getting the boundary of each AcHati
+    for i in np.arange(m):
 
+        # Mu estimate for this field
+        muHat = muHats[i:(i+1),...]
 
         # -------------------------------------------------------------------
-        # True and estimated excursion sets
+        # Boundary locations for AcHati
         # -------------------------------------------------------------------
-        # Obtain Ac for all i
-        Ac = mus > c
+        # Get the edges along the boundary of AcHat
+        AcHat_bdry_edges = get_bdry_edges(muHat, c)
 
-        # Obtain Fc
-        Fc = cap_mu > c
+        # Get coordinates for the boundary of AcHat
+        AcHat_bdry_locs = get_bdry_locs(AcHat_bdry_edges)
 
-        # Obtain AcHat for all i
-        AcHat = muHats > c
-
-        # Obtain FcHat
-        FcHat = cap_muHat > c
+        # Save boundary locations
+        est_bdry_locs['AcHat'+str(i+1)] = AcHat_bdry_locs
 
+        # Delete edges as we no longer need them
+        del AcHat_bdry_edges
 
         # -------------------------------------------------------------------
-        # Bootstrap 
+        # Interpolation weights for AcHati boundary (Array version)
         # -------------------------------------------------------------------
-        # Initialize empty bootstrap stores for supremum along each boundary
-        # e.g. supg_dFc[str(alpha)][str(i)] will give the supremum of g^i 
-        #      along the boundary d\alpha F_c
-        supg_dFc = {}
-        supg_dFcHat = {}
-
-        # Loop through boundary partitions
-        for alpha in alphas:
-
-            # Initialize
-            supg_dalphaFc = {}
-            supg_dalphaFcHat = {}
-
-            # Loop through i in alpha getting values for interpolation
-            for i in alpha:
-
-                # Save empty bootstrap stores
-                supg_dalphaFc[str(i)] = np.zeros(nBoot)
-                supg_dalphaFcHat[str(i)] = np.zeros(nBoot)
-
-            # Save empty bootstrap stores
-            supg_dFc[np.array2string(alpha)] = supg_dalphaFc
-            supg_dFcHat[np.array2string(alpha)] = supg_dalphaFcHat
-
-        # Initalize empty bootstrap stores for the min
-        min_supg_dFc = {}
-        min_supg_dFcHat = {}
-
-        # Loop through boundary partitions
-        for alpha in alphas:
-
-            # Save empty bootstrap stores
-            min_supg_dFc[np.array2string(alpha)] = np.zeros(nBoot)
-            min_supg_dFcHat[np.array2string(alpha)] = np.zeros(nBoot)
-
-        # Save empty bootstrap stores
-        min_supg_dFc['max'] = np.zeros(nBoot)
-        min_supg_dFcHat['max'] = np.zeros(nBoot)
-
-        t1 = time.time()
-        # For each bootstrap record the max of the residuals along the
-        # boundary
-        for b in np.arange(nBoot):
-
-            # print('Bootstrap: ', b)
-
-            # Obtain bootstrap variables
-            boot_vars = 2*np.random.randint(0,2,boot_dim)-1
-
-            # Reshape for broadcasting purposes (extra axis refers to the fact we have
-            # inner and outer boundary values in the last axes of resid_FsdGc_bdry_concat
-            # and resid_FsdGcHat_bdry_concat)
-            boot_vars = boot_vars.reshape((*boot_vars.shape),1)
-            
-            # -------------------------------------------------------------------------
-            # Bootstrap residuals along dalphaFc
-            # -------------------------------------------------------------------------
-            boot_resids_dFc = {}
-            boot_resids_dFcHat = {}
-
-            # Loop through boundary partitions
-            for alpha in alphas:
-
-                # New empty dicts for Fc
-                boot_resids_dalphaFc = {}
-
-                # New empty dicts for FcHat
-                boot_resids_dalphaFcHat = {}
-
-                # New empty dict for gi along dalphaFc
-                boot_g_dalphaFc = {}
-
-                # New empty dict for gi along dalphaFcHat
-                boot_g_dalphaFcHat = {}
-
-                # Loop through i in alpha getting gi interpolated
-                for i in alpha:
-
-                    # ------------------------------------------------------
-                    # Get residuals true and estimated boundary
-                    # ------------------------------------------------------
-
-                    # Get original residuals of mui along boundary Aci
-                    residsi_dalphaFc = resids_dFc_partitioned[np.array2string(alpha)][str(i)]
-                    residsi_dalphaFcHat = resids_dFcHat_partitioned[np.array2string(alpha)][str(i)]
+        # Obtain the values along the boundary for AcHati
+        AcHat_bdry_vals_concat = get_bdry_values_concat(muHat, AcHat_bdry_locs)
 
-                    # ------------------------------------------------------
-                    # Bootstrap residuals
-                    # ------------------------------------------------------
+        # Obtain the weights along the boundary for AcHati
+        AcHat_bdry_weights_concat = get_bdry_weights_concat(AcHat_bdry_vals_concat, c)
 
-                    # Multiply by rademacher variables
-                    boot_residsi_dalphaFc = boot_vars*residsi_dalphaFc
-                    boot_residsi_dalphaFcHat = boot_vars*residsi_dalphaFcHat
-
-                    # ------------------------------------------------------
-                    # Get gi along dalpha Fc
-                    # ------------------------------------------------------
-
-                    # Sum across subjects to get the bootstrapped a values along
-                    # the boundary of dalphaFc. (Note: For some reason this is 
-                    # much faster if performed seperately for each of the last rows. 
-                    # I am still looking into why this is)
-                    boot_gi_dalphaFc = np.zeros(boot_residsi_dalphaFc.shape[-2:])
-                    boot_gi_dalphaFc[...,0] = np.sum(boot_residsi_dalphaFc[...,0], axis=0)/np.sqrt(nSub)
-                    boot_gi_dalphaFc[...,1] = np.sum(boot_residsi_dalphaFc[...,1], axis=0)/np.sqrt(nSub)
-
-                    # Obtain bootstrap standard deviations for mu i along dalphaFc. 
-                    # (Note: For some reason this is much faster if performed seperately
-                    # for each of the last rows. I am still looking into why this is)
-                    boot_sigmai_dalphaFc = np.zeros(boot_residsi_dalphaFc.shape[-2:])
-                    boot_sigmai_dalphaFc[...,0] = np.std(boot_residsi_dalphaFc[...,0], axis=0, ddof=1)
-                    boot_sigmai_dalphaFc[...,1] = np.std(boot_residsi_dalphaFc[...,1], axis=0, ddof=1)
-
-                    # Divide by the boostrap standard deviation of mui
-                    boot_gi_dalphaFc = boot_gi_dalphaFc/boot_sigmai_dalphaFc
-
-                    # ------------------------------------------------------
-                    # Get gi along dalpha FcHat
-                    # ------------------------------------------------------
-
-                    # Sum across subjects to get the bootstrapped a values along
-                    # the boundary of dalphaFcHat. (Note: For some reason this is 
-                    # much faster if performed seperately for each of the last rows. 
-                    # I am still looking into why this is)
-                    boot_gi_dalphaFcHat = np.zeros(boot_residsi_dalphaFcHat.shape[-2:])
-                    boot_gi_dalphaFcHat[...,0] = np.sum(boot_residsi_dalphaFcHat[...,0], axis=0)/np.sqrt(nSub)
-                    boot_gi_dalphaFcHat[...,1] = np.sum(boot_residsi_dalphaFcHat[...,1], axis=0)/np.sqrt(nSub)
-
-                    # Obtain bootstrap standard deviations for muHat i along dalphaFcHat. 
-                    # (Note: For some reason this is much faster if performed seperately
-                    # for each of the last rows. I am still looking into why this is)
-                    boot_sigmai_dalphaFcHat = np.zeros(boot_residsi_dalphaFcHat.shape[-2:])
-                    boot_sigmai_dalphaFcHat[...,0] = np.std(boot_residsi_dalphaFcHat[...,0], axis=0, ddof=1)
-                    boot_sigmai_dalphaFcHat[...,1] = np.std(boot_residsi_dalphaFcHat[...,1], axis=0, ddof=1)
-
-                    # Divide by the boostrap standard deviation of mui
-                    boot_gi_dalphaFcHat = boot_gi_dalphaFcHat/boot_sigmai_dalphaFcHat
-
-                    # ------------------------------------------------------
-                    # Interpolate along dalpha Fc
-                    # ------------------------------------------------------
-
-                    # Get weights
-                    dalphaFc_mui_bdry_weights = weights_dFc[np.array2string(alpha)][str(i)]
-
-                    # Interpolation for gi along dalphaFc
-                    boot_gi_dalphaFc = get_bdry_vals_interpolated_concat(boot_gi_dalphaFc,dalphaFc_mui_bdry_weights)
-
-                    # ------------------------------------------------------
-                    # Interpolate along dalpha FcHat
-                    # ------------------------------------------------------
-
-                    # Get weights
-                    dalphaFcHat_muHati_bdry_weights = weights_dFcHat[np.array2string(alpha)][str(i)]
-
-                    # Interpolation for gi along dalphaFc
-                    boot_gi_dalphaFcHat = get_bdry_vals_interpolated_concat(boot_gi_dalphaFcHat,dalphaFcHat_muHati_bdry_weights)
-
-                    # ------------------------------------------------------
-                    # Get supremum along dalphaFc
-                    # ------------------------------------------------------
-
-                    # Get the maximum of gi along dalphaFc if it exists
-                    if np.prod(boot_gi_dalphaFc.shape) > 0:
-
-                        boot_g_dalphaFc[str(i)] = boot_gi_dalphaFc
-
-                    # ------------------------------------------------------
-                    # Get supremum along dalphaFcHat
-                    # ------------------------------------------------------
-
-                    # Get the maximum of gi along dalphaFcHat if it exists
-                    if np.prod(boot_gi_dalphaFcHat.shape) > 0:
-
-                        boot_g_dalphaFcHat[str(i)] = boot_gi_dalphaFcHat
-
-                # Boolean telling us if this is the first field we are looking at
-                first = True
-
-                # -----------------------------------------------------------------
-                # Get sup_{dalpha Fc} |min_{alpha} g^i|
-                # -----------------------------------------------------------------
-
-                # Loop through i in alpha getting min(gi)
-                for i in alpha:
+        # Save boundary weights
+        est_bdry_weights_concat['AcHat'+str(i+1)] = AcHat_bdry_weights_concat
 
-                    # Check if we have boundary values for gi
-                    if str(i) in boot_g_dalphaFc:
+        # Delete values as we no longer need them
+        del AcHat_bdry_vals_concat
 
-                        # If this is the first time initalize the min(g) array
-                        if first:
 
-                            # Initialize elementwise minimum across gi of boot_g
-                            boot_ming_dalphaFc = boot_g_dalphaFc[str(i)] 
+    # -----------------------------------------------------------------------
+    # Get minimum fields
+    # -----------------------------------------------------------------------
+    # This is named cap as the excursion set of the minimum field is
+    # the intersection of all fields (\cap in latex)
+    cap_muHat = np.amin(muHats,axis=0)
 
-                            # We are no longer looking at the first
-                            first = False
+    # -----------------------------------------------------------------------
+    # Boundary locations for FcHat
+    # -----------------------------------------------------------------------
+    # Get the edges along the boundary of FcHat
+    FcHat_bdry_edges = get_bdry_edges(cap_muHat, c)
 
-                        else:
+    # Get coordinates for the boundary of FcHat
+    FcHat_bdry_locs = get_bdry_locs(FcHat_bdry_edges)
 
-                            # Get elementwise minimum across gi of boot_g
-                            boot_ming_dalphaFc = np.minimum(boot_ming_dalphaFc,boot_g_dalphaFc[str(i)])
+    # Save boundary locations
+    est_bdry_locs['FcHat'] = FcHat_bdry_locs
 
-                # If we saw some boundary values (i.e. we saw at least the first i),
-                # then the array was initialized
-                if not first:
+    # Delete edges as we no longer need them
+    del FcHat_bdry_edges
 
-                    # Save sup(|min(gi)|) along true dalpha Fc
-                    boot_sup_ming_dalphaFc = np.max(np.abs(boot_ming_dalphaFc))
+    # -----------------------------------------------------------------------
+    # Interpolation weights for FcHat boundary (Array version)
+    # -----------------------------------------------------------------------
+    # Obtain the values along the boundary for FcHat
+    FcHat_bdry_vals_concat = get_bdry_values_concat(cap_mu, FcHat_bdry_locs)
 
-                    # Save bootstrap result
-                    min_supg_dFc[np.array2string(alpha)][b] = boot_sup_ming_dalphaFc
+    # Obtain the weights along the boundary for FcHat
+    FcHat_bdry_weights_concat = get_bdry_weights_concat(FcHat_bdry_vals_concat, c)
 
+    # Save boundary weights
+    est_bdry_weights_concat['Fc'] = FcHat_bdry_weights_concat
 
-                # -----------------------------------------------------------------
-                # Get sup_{dalpha FcHat} |min_{alpha} g^i|
-                # -----------------------------------------------------------------
+    # Delete values as we no longer need them
+    del FcHat_bdry_vals_concat
 
-                # Reset first counter
-                first = True
+    # -----------------------------------------------------------------------
+    # Residuals along dFc and dFcHat, and muHat along dFcHat
+    # -----------------------------------------------------------------------
 
-                # Loop through i in alpha getting min(gi)
-                for i in alpha:
+    # Obtain muHat for every field along FcHat (of shape [m, nBdry, 2])
+    muHats_dFcHat = get_bdry_values_concat(muHats, FcHat_bdry_locs)
 
-                    # Check if we have boundary values for gi
-                    if str(i) in boot_g_dalphaFcHat:
+    # -----------------------------------------------------------------------
+    # Boundary partitions 
+    # -----------------------------------------------------------------------
+    # Each point on dFcHat is labelled with a bitmask, alpha, of the fields
+    # for which muHat is less than or equal to c outside FcHat. The points
+    # are then sorted by label so that d^alpha FcHat is a contiguous block
+    # of points.
+    dFcHat_order, dFcHat_labels, dFcHat_alphas, dFcHat_starts = get_bdry_partitions(muHats_dFcHat, c)
 
-                        # If this is the first time initalize the min(g) array
-                        if first:
+    # Every partition found by get_bdry_partitions is non-empty
+    dFcHat_nonempty = np.ones(len(dFcHat_alphas), dtype=bool)
 
-                            # Initialize elementwise minimum across gi of boot_g
-                            boot_ming_dalphaFcHat = boot_g_dalphaFcHat[str(i)] 
+    # Mask recording which fields belong to the partition of each point
+    # (this has shape [m, nBdry])
+    dFcHat_fieldMask = get_label_field_mask(dFcHat_labels, m)
 
-                            # We are no longer looking at the first
-                            first = False
+    # -----------------------------------------------------------------------
+    # Get muhat along boundary partitions
+    # -----------------------------------------------------------------------
 
-                        else:
+    # Sort muhat by partition
+    muHats_dFcHat = muHats_dFcHat[:,dFcHat_order,:]
 
-                            # Get elementwise minimum across gi of boot_g
-                            boot_ming_dalphaFcHat = np.minimum(boot_ming_dalphaFcHat,boot_g_dalphaFcHat[str(i)])
+    # -----------------------------------------------------------------------
+    # Get weights from mu and muhat along boundary partitions for 
+    # interpolation
+    # -----------------------------------------------------------------------
 
-                # If we saw some boundary values (i.e. we saw at least the first i),
-                # then the array was initialized
-                if not first:
+    # Weights for every field along dFcHat. For fields which are not in a
+    # point's partition these may be nan or inf, but such values are always
+    # masked out before they are used.
+    with np.errstate(invalid='ignore'):
+        weights_dFcHat = get_bdry_weights_concat(muHats_dFcHat, c)
 
-                    # Save sup(|min(gi)|) along estimated dalpha FcHat
-                    boot_sup_ming_dalphaFcHat = np.max(np.abs(boot_ming_dalphaFcHat))
+    # Flat voxel indices along dFcHat, sorted by partition and offset so
+    # that they index into the stack of all m fields
+    inds_dFcHat = get_bdry_inds_concat(FcHat_bdry_locs)[dFcHat_order,:] + nVox*np.arange(m).reshape(m,1,1)
 
-                    # Save bootstrap result
-                    min_supg_dFcHat[np.array2string(alpha)][b] = boot_sup_ming_dalphaFcHat
+    # Unique voxels along dFcHat and the interpolation operator
+    vox_dFcHat, interp_op_dFcHat = get_bdry_interp_op(inds_dFcHat, weights_dFcHat, dFcHat_fieldMask)
 
-            # -----------------------------------------------------------------
-            # Get max_{P(M)} sup_{dalpha Fc} |min_{alpha} g^i| and
-            # max_{P(M)} sup_{dalpha FcHat} |min_{alpha} g^i| 
-            # -----------------------------------------------------------------
+    # -----------------------------------------------------------------------
+    # Residuals at the unique voxels along dFc and dFcHat
+    # -----------------------------------------------------------------------
 
-            # Loop through alphas taking maximum
-            for alpha in alphas:
+    # Unique voxels along dFc and dFcHat (these index into the stack of all
+    # m fields)
+    vox = np.concatenate((vox_dFc, vox_dFcHat))
 
-                # Check if we have boundary values for dalpha Fc
-                if np.array2string(alpha) in min_supg_dFc:
+    # If we are not streaming, we have the data already
+    if subBlockSize is None:
 
-                    # Update the minimum value we've seen
-                    min_supg_dFc['max'][b] = np.maximum(min_supg_dFc['max'][b],min_supg_dFc[np.array2string(alpha)][b])
+        # Obtain the residuals at these voxels for every field in one 
+        # indexed read of the stack (of shape [nSub, nVox])
+        resids = (datas.reshape(m, nSub, nVox)[vox // nVox, :, vox % nVox].T - muHats.reshape(m*nVox)[vox])/sigmas.reshape(m*nVox)[vox]
 
-                # Check if we have boundary values for dalpha FcHat
-                if np.array2string(alpha) in min_supg_dFcHat:
+        # Delete data as it is longer needed
+        del datas
 
-                    # Update the minimum value we've seen
-                    min_supg_dFcHat['max'][b] = np.maximum(min_supg_dFcHat['max'][b],min_supg_dFcHat[np.array2string(alpha)][b])
+    # Otherwise, regenerate the data (pass two)
+    else:
 
-        # -------------------------------------------------------------------
-        # Obtaining a from percentiles of the max distribution
-        # -------------------------------------------------------------------
+        # Empty array to store residuals (of shape [nSub, nVox])
+        resids = get_workspace_buffer(workspace, 'resids', (nSub, len(vox)), dtype)
 
-        # Drop the instances where the boundary length was zero
-        min_supg_dFc['max'] = min_supg_dFc['max'][min_supg_dFc['max']!=0]
-        min_supg_dFcHat['max'] = min_supg_dFcHat['max'][min_supg_dFcHat['max']!=0]
+        # Obtain the residuals a block of subjects at a time
+        for s0, s1, datas in get_data_blocks_mfield(noise_streams, mus, noiseFactor):
+            resids[s0:s1,:] = (datas.reshape(m, s1-s0, nVox)[vox // nVox, :, vox % nVox].T - muHats.reshape(m*nVox)[vox])/sigmas.reshape(m*nVox)[vox]
 
+    # Residuals at the Fc and FcHat boundary voxels (copied so that each is
+    # contiguous)
+    resids_dFc = get_workspace_buffer(workspace, 'resids_dFc', (nSub, len(vox_dFc)), dtype)
+    resids_dFc[...] = resids[:,:len(vox_dFc)]
+    resids_dFcHat = get_workspace_buffer(workspace, 'resids_dFcHat', (nSub, len(vox_dFcHat)), dtype)
+    resids_dFcHat[...] = resids[:,len(vox_dFc):]
 
-        # If we have recorded values get their quantiles
-        if (np.prod(min_supg_dFc['max'].shape) > 0):
-            # Get the a estimates for the true boundary
-            a_trueBdry = np.percentile(min_supg_dFc['max'], 100*p).reshape(nPvals,1,1,1)
-        else:
-            # Set to inf by default
-            a_trueBdry = np.Inf*np.ones((nPvals,1,1,1))
+    # Delete residuals as they are no longer needed
+    del resids
 
-        # If we have recorded values get their quantiles
-        if (np.prod(min_supg_dFcHat['max'].shape) > 0):
-            # Get the a estimates for the estimated boundary
-            a_estBdry = np.percentile(min_supg_dFcHat['max'], 100*p).reshape(nPvals,1,1,1) # [pvals, 1, [1 for _ in dim>1]]
-        else:
-            # Set to inf by default
-            a_estBdry = np.Inf*np.ones((nPvals,1,1,1))
+    # -----------------------------------------------------------------------
+    # True and estimated excursion sets
+    # -----------------------------------------------------------------------
+    # Obtain AcHat for all i
+    AcHat = muHats > c
 
-        # Reformat them to an array form useful for boolean operation
-        a_trueBdry = np.concatenate((-a_trueBdry,a_trueBdry),axis=1)
-        a_estBdry = np.concatenate((-a_estBdry,a_estBdry),axis=1)
+    # Obtain FcHat
+    FcHat = cap_muHat > c
 
-        # -------------------------------------------------------------------
-        # Get FcHat^{+/-}
-        # -------------------------------------------------------------------
+    # -----------------------------------------------------------------------
+    # Bootstrap 
+    # -----------------------------------------------------------------------
+    # The sum of squares of the bootstrapped residuals does not change
+    # across bootstraps, so we only need to compute them once.
+    resids_dFc_sumsq = get_resid_sumsq(resids_dFc)
+    resids_dFcHat_sumsq = get_resid_sumsq(resids_dFcHat)
 
-        # Get the statistic field which defined Achat^{+/-,i}
-        g = ((muHats-c)/(sigmas*tau))
+    # Bootstrap stores (from the workspace) for max_{alpha} sup_{dalpha Fc}
+    # |min_{i in alpha} g^i| (and likewise for FcHat)
+    max_ming_dFc = workspace['boot_max'][0]
+    max_ming_dFcHat = workspace['boot_max'][1]
 
-        # Take minimum over i
-        stat = np.amin(g,axis=0)
-        stat = stat.reshape(stat.shape[-2],stat.shape[-1])
+    # Number of bootstraps used
+    nBoot_used = nBoot
 
-        # Obtain FcHat^+ and FcHat^- based on a from the true boundary. This variable
-        # has axes corresponding to [pvalue, plus/minus, field dimensions]
-        FcHat_pm_trueBdry = stat >= a_trueBdry
+    t1 = time.time()
+    # For each block of bootstraps record the max of the residuals along
+    # the boundary
+    for b0, b1 in get_boot_blocks(nBoot, bootBlockSize):
 
-        # Obtain FcHat^+ and FcHat^- based on a from the estimated boundary. This variable
-        # has axes corresponding to [pvalue, plus/minus, field dimensions]
-        FcHat_pm_estBdry = stat >= a_estBdry
+        # Obtain bootstrap variables for this block
+        boot_vars = get_boot_vars(b1-b0, nSub, boot_rng, out=workspace['boot_vars'][:(b1-b0)])
 
         # -------------------------------------------------------------------
-        # Some set logic to work out violations
+        # Get max_{alpha} sup_{dalpha Fc} |min_{i in alpha} g^i|
         # -------------------------------------------------------------------
 
-        # Obtain FcHat^+\FcHat based on the true boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        FcHatp_sub_Fc_trueBdry = FcHat_pm_trueBdry[:,1,...] & ~Fc[...]
+        # Get sup(|min(gi)|) along each true dalpha Fc
+        boot_sup_ming_dalphaFc = get_boot_sup_ming(boot_vars, resids_dFc, resids_dFc_sumsq, interp_op_dFc,
+                                                   dFc_fieldMask, dFc_starts, dFc_nonempty, bootBackend)
 
-        # Obtain FcHat^+\FcHat based on the estimated boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        FcHatp_sub_Fc_estBdry = FcHat_pm_estBdry[:,1,...] & ~Fc[...]
-
-        # Obtain Fc\FcHat^- based on the true boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        Fc_sub_FcHatm_trueBdry = Fc[...] & ~FcHat_pm_trueBdry[:,0,...]
-
-        # Obtain Fc\FcHat^- based on the estimated boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        Fc_sub_FcHatm_estBdry = Fc[...] & ~FcHat_pm_estBdry[:,0,...]
-
-        #print('anys: ', np.any(FcHatp_sub_Fc_trueBdry,axis=(1,2)), np.any(Fc_sub_FcHatm_trueBdry,axis=(1,2)))
-        # Record if we saw a violation in the true boundary based sets
-        trueBdry_success[r,:] = 1-(np.any(FcHatp_sub_Fc_trueBdry,axis=(1,2)) | np.any(Fc_sub_FcHatm_trueBdry,axis=(1,2))) # : AXES WONT WORK FOR 3D ATM
-
-        # Record if we saw a violation in the estimated boundary based sets
-        estBdry_success[r,:] = 1-(np.any(FcHatp_sub_Fc_estBdry,axis=(1,2)) | np.any(Fc_sub_FcHatm_estBdry,axis=(1,2)))# : AXES WONT WORK FOR 3D ATM
+        # Take the maximum over alpha
+        max_ming_dFc[b0:b1] = np.max(boot_sup_ming_dalphaFc, axis=-1, initial=0)
 
         # -------------------------------------------------------------------
-        # Get stat along the Fc boundary
+        # Get max_{alpha} sup_{dalpha FcHat} |min_{i in alpha} g^i|
         # -------------------------------------------------------------------
 
-        # Empty dict to store g along true boundary
-        g_dFc = {}
-
-        # Loop through fields
-        for i in np.arange(m):
-
-            # Get the values for gi along dFc
-            g_dFc[str(i+1)] = get_bdry_values_concat(g[i,...], Fc_bdry_locs)
-
-        # Empty dict to store interpolate g along true boundary
-        g_dFc_interp = {}
-
-        # Boolean to tell us if this is the first alpha we've looked at
-        Firstalpha = True
-
-        # Interpolate g
-        for alpha in alphas:
-
-            # Initial structure to hold interpolated g
-            g_dalphaFc_interp = {}
-
-            # Boolean to tell us if this is the first value of i we're looking at
-            Firsti = True
-
-            # Check if we have recorded values for this boundary
-            if np.array2string(alpha) in dalphaFc_locs:
-
-                # Loop through all fields relevent to boundary.
-                for i in alpha:
-
-                    # Get gi on dFc
-                    gi_dFc = g_dFc[str(i)] 
-
-                    # Get locations for dalphaFc
-                    dalphaFc_loc = dalphaFc_locs[np.array2string(alpha)]
-
-                    # Get gi on dalphaFc
-                    gi_dalphaFc = gi_dFc[dalphaFc_loc,:]
+        # Get sup(|min(gi)|) along each estimated dalpha FcHat
+        boot_sup_ming_dalphaFcHat = get_boot_sup_ming(boot_vars, resids_dFcHat, resids_dFcHat_sumsq, interp_op_dFcHat,
+                                                      dFcHat_fieldMask, dFcHat_starts, dFcHat_nonempty, bootBackend)
 
-                    # Get weights for interpolation
-                    dalphaFc_weightsi = weights_dFc[np.array2string(alpha)][str(i)]
+        # Take the maximum over alpha
+        max_ming_dFcHat[b0:b1] = np.max(boot_sup_ming_dalphaFcHat, axis=-1, initial=0)
 
-                    # Interpolate gi
-                    gi_dalphaFc_interp = get_bdry_vals_interpolated_concat(gi_dalphaFc,dalphaFc_weightsi)
+        # In the adaptive bootstrap, stop once every percentile has converged
+        if bootTol is not None and get_boot_converged([max_ming_dFc[:b1], max_ming_dFcHat[:b1]], p, bootTol):
+            nBoot_used = b1
+            break
 
-                    # If this is the first i we've looked at in alpha
-                    if Firsti:
+    # Keep only the bootstraps we used
+    max_ming_dFc = max_ming_dFc[:nBoot_used]
+    max_ming_dFcHat = max_ming_dFcHat[:nBoot_used]
 
-                        # set the minimum interpolated values to gi_dalphaFc_interp
-                        ming_dalphaFc_interp = gi_dalphaFc_interp 
-
-                        # Set first to false
-                        Firsti = False
-
-                    else:
-
-                        # Take the minimum between current gi_dalphaFc_interp and previous
-                        ming_dalphaFc_interp = np.minimum(ming_dalphaFc_interp, gi_dalphaFc_interp) 
+    # -----------------------------------------------------------------------
+    # Obtaining a from percentiles of the max distribution
+    # -----------------------------------------------------------------------
 
-                # -------------------------------------------------------------------
-                # Get stat along the Fc boundary
-                # -------------------------------------------------------------------
+    # Drop the instances where the boundary length was zero
+    max_ming_dFc = max_ming_dFc[max_ming_dFc!=0]
+    max_ming_dFcHat = max_ming_dFcHat[max_ming_dFcHat!=0]
 
-                # If this is the first alpha we've looked at, set the stat array to ming_dalphaFc_interp
-                if Firstalpha:
 
-                    stat_dFc = ming_dalphaFc_interp
+    # If we have recorded values get their quantiles
+    if (np.prod(max_ming_dFc.shape) > 0):
+        # Get the a estimates for the true boundary
+        a_trueBdry = np.percentile(max_ming_dFc, 100*p)
+    else:
+        # Set to inf by default
+        a_trueBdry = np.Inf*np.ones(nPvals)
 
-                    # Now we've seen an alpha
-                    Firstalpha = False
+    # If we have recorded values get their quantiles
+    if (np.prod(max_ming_dFcHat.shape) > 0):
+        # Get the a estimates for the estimated boundary
+        a_estBdry = np.percentile(max_ming_dFcHat, 100*p)
+    else:
+        # Set to inf by default
+        a_estBdry = np.Inf*np.ones(nPvals)
 
-                # Otherwise concatenate it on
-                else:
+    # -----------------------------------------------------------------------
+    # Get FcHat^{+/-}
+    # -----------------------------------------------------------------------
 
-                    stat_dFc = np.concatenate((ming_dalphaFc_interp,stat_dFc),axis=-1)
+    # Get the statistic field which defined Achat^{+/-,i}
+    g = ((muHats-c)/(sigmas*tau))
 
-        # -------------------------------------------------------------------
-        # Check whether there were any boundary violations using interpolated
-        # boundary values (checking if voxels had values corresponding to no
-        # violations, etc)
-        # -------------------------------------------------------------------
+    # Take minimum over i
+    stat = np.amin(g,axis=0)
+    stat = stat.reshape(stat.shape[-2],stat.shape[-1])
 
-        # Perform lower check on stat map using thresholds based on the
-        # estimated boundary
-        bdry_lowerCheck_estBdry = stat_dFc >= a_estBdry[:,0,:,0]
+    # -----------------------------------------------------------------------
+    # Work out the smallest a for which the voxelwise set logic observes
+    # no violations (i.e. FcHat^+ is contained in Fc and Fc is contained
+    # in FcHat^-)
+    # -----------------------------------------------------------------------
+    crit = get_crit_val(stat, Fc)
 
-        # Perform upper check on stat map using thresholds based on the
-        # estimated boundary
-        bdry_upperCheck_estBdry = stat_dFc <= a_estBdry[:,1,:,0]
+    # -----------------------------------------------------------------------
+    # Get stat along the Fc boundary
+    # -----------------------------------------------------------------------
 
-        # Perform lower check on stat map using thresholds based on the
-        # true boundary
-        bdry_lowerCheck_trueBdry = stat_dFc >= a_trueBdry[:,0,:,0]
+    # Get the values for gi along dFc, for every field, sorted by 
+    # partition
+    g_dFc = get_bdry_values_concat(g, Fc_bdry_locs)[:,dFc_order,:]
 
-        # Perform upper check on stat map using thresholds based on the
-        # true boundary
-        bdry_upperCheck_trueBdry = stat_dFc <= a_trueBdry[:,1,:,0]
+    # Interpolate gi along dFc for every field
+    with np.errstate(invalid='ignore'):
+        stat_dFc = get_bdry_vals_interpolated_concat(g_dFc, weights_dFc)
 
+    # Mask out the fields which are not in each point's partition and 
+    # take the minimum over i
+    stat_dFc = np.amin(np.where(dFc_fieldMask, stat_dFc, np.inf), axis=0)
 
-        # -------------------------------------------------------------------
-        # Work out whether simulation observed successful sets.
-        # -------------------------------------------------------------------
-        # Record if we saw a violation in the true boundary based sets
-        trueBdry_success_intrp[r,:] = np.all(bdry_lowerCheck_trueBdry,axis=(1)) & np.all(bdry_upperCheck_trueBdry,axis=(1))# : AXES WONT WORK FOR 3D ATM
+    # -----------------------------------------------------------------------
+    # Work out the smallest a for which the stat lies between -a and a
+    # along the interpolated boundary. For the interpolated boundary 
+    # success checks, we still need to do the voxelwise checks as well,
+    # so we take the larger critical value.
+    # -----------------------------------------------------------------------
+    crit_intrp = np.maximum(crit, get_crit_val_bdry(stat_dFc))
 
-        # Record if we saw a violation in the estimated boundary based sets
-        estBdry_success_intrp[r,:] = np.all(bdry_lowerCheck_estBdry,axis=(1)) & np.all(bdry_upperCheck_estBdry,axis=(1)) # : AXES WONT WORK FOR 3D ATM
+    # -----------------------------------------------------------------------
+    # Work out whether simulation observed successful sets.
+    # -----------------------------------------------------------------------
+    # Record if we saw a violation in the true boundary based sets
+    trueBdry_success = get_success(crit, a_trueBdry)
 
-    # For the interpolated boundary success checks, we still need to do the 
-    # voxelwise checks as well. This will take care of that.
-    trueBdry_success_intrp = trueBdry_success_intrp*trueBdry_success
-    estBdry_success_intrp = estBdry_success_intrp*estBdry_success
+    # Record if we saw a violation in the estimated boundary based sets
+    estBdry_success = get_success(crit, a_estBdry)
 
-    # Coverage probabilities
-    coverage_trueBdry = np.mean(trueBdry_success,axis=0)
-    coverage_estBdry = np.mean(estBdry_success,axis=0)
+    # Record if we saw a violation in the true boundary based sets
+    # (assessed with interpolation)
+    trueBdry_success_intrp = get_success(crit_intrp, a_trueBdry)
 
-    # Coverage probabilities
-    coverage_trueBdry_intrp = np.mean(trueBdry_success_intrp,axis=0)
-    coverage_estBdry_intrp = np.mean(estBdry_success_intrp,axis=0)
+    # Record if we saw a violation in the estimated boundary based sets
+    # (assessed with interpolation)
+    estBdry_success_intrp = get_success(crit_intrp, a_estBdry)
 
-    # Make results folder
-    if not os.path.exists(os.path.join(simDir, 'RawResults')):
-        os.mkdir(os.path.join(simDir, 'RawResults'))
+    # Return the successes and the number of bootstraps for this realization
+    return(trueBdry_success, estBdry_success, trueBdry_success_intrp, estBdry_success_intrp, nBoot_used)
 
-    # Save the violations to a file
-    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess.csv'), trueBdry_success) # Successes based on the true boundary (assessed without interpolation)
-    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess.csv'), estBdry_success) # Successes based on the interpolated boundary (assessed without interpolation) 
-    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess_intrp.csv'), trueBdry_success_intrp) # Successes based on the true boundary (assessed with interpolation)
-    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess_intrp.csv'), estBdry_success_intrp) # Successes based on the interpolated boundary (assessed with interpolation) 
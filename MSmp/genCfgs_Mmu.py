@@ -85,6 +85,11 @@ def generateCfgs(OutDir, simNo):
     # Add number of bootstraps
     inputs['nBoot'] = 5000
 
+    # Add root seed for the random number generators (every random number
+    # in the simulation is drawn from a stream derived from this, so the
+    # simulation can be reproduced)
+    inputs['seed'] = int(np.random.SeedSequence().entropy)
+
     # Number of fields, m
     ms = np.arange(2,8)
 
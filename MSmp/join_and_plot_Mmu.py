@@ -6,6 +6,7 @@ import shutil
 import pandas as pd
 from matplotlib import pyplot as plt
 from lib.fileio import *
+from lib.coverage import *
 
 def joinAndPlot(OutDir, simNo):
 
@@ -109,6 +110,16 @@ def joinAndPlot(OutDir, simNo):
                 # true boundary (for coverage assessed using interpolation)
                 covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
 
+                # Get the number of realizations run (if the realizations were
+                # stopped sequentially, this differs between configurations)
+                nReals = obs_est_intrp.shape[0]
+
+                # Get control variate estimates of the coverage for the estimated
+                # boundary (using the true boundary results as the control), and
+                # their standard errors
+                covp_est_cv, se_est_cv = get_cv_coverage(obs_est.values, obs_true.values, p)
+                covp_est_intrp_cv, se_est_intrp_cv = get_cv_coverage(obs_est_intrp.values, obs_true_intrp.values, p)
+
                 # ------------------------------------------------------------------
                 # Get number of subjects and fields
                 # ------------------------------------------------------------------
@@ -123,25 +134,39 @@ def joinAndPlot(OutDir, simNo):
                 # Add coverage probabilities to table
                 # ------------------------------------------------------------------
                 # Line for table of estimated boundary results
-                tableLine_est = np.concatenate((np.array([[cfgId,nSub,m]]),\
+                tableLine_est = np.concatenate((np.array([[cfgId,nSub,m,nReals]]),\
                                                 covp_est.reshape(1,n_p)),\
                                                 axis=1)
 
                 # Line for table of true boundary results
-                tableLine_true = np.concatenate((np.array([[cfgId,nSub,m]]),\
+                tableLine_true = np.concatenate((np.array([[cfgId,nSub,m,nReals]]),\
                                                  covp_true.reshape(1,n_p)),\
                                                  axis=1)
 
                 # Line for table of estimated boundary interpolation assessed results
-                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,m]]),\
+                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,m,nReals]]),\
                                                       covp_est_intrp.reshape(1,n_p)),\
                                                       axis=1)
 
                 # Line for table of true boundary interpolation assessed results
-                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,m]]),\
+                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,m,nReals]]),\
                                                        covp_true_intrp.reshape(1,n_p)),\
                                                        axis=1)
 
+                # Line for table of control variate estimated boundary results (the
+                # estimates followed by their standard errors)
+                tableLine_est_cv = np.concatenate((np.array([[cfgId,nSub,m,nReals]]),\
+                                                   covp_est_cv.reshape(1,n_p),\
+                                                   se_est_cv.reshape(1,n_p)),\
+                                                   axis=1)
+
+                # Line for table of control variate estimated boundary interpolation
+                # assessed results (the estimates followed by their standard errors)
+                tableLine_est_intrp_cv = np.concatenate((np.array([[cfgId,nSub,m,nReals]]),\
+                                                         covp_est_intrp_cv.reshape(1,n_p),\
+                                                         se_est_intrp_cv.reshape(1,n_p)),\
+                                                         axis=1)
+
                 # If this is the first cfg we've looked at, intialize the results tables
                 if first:
 
@@ -157,6 +182,12 @@ def joinAndPlot(OutDir, simNo):
                     # Initialize true boundary interpolated results table
                     table_true_intrp = pd.DataFrame(tableLine_true_intrp)
 
+                    # Initialize control variate estimated boundary results table
+                    table_est_cv = pd.DataFrame(tableLine_est_cv)
+
+                    # Initialize control variate estimated boundary interpolated results table
+                    table_est_intrp_cv = pd.DataFrame(tableLine_est_intrp_cv)
+
                 else:
 
                     # Append to existing estimated boundary results table
@@ -171,6 +202,12 @@ def joinAndPlot(OutDir, simNo):
                     # Append to existing true boundary interpolated results table
                     table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
 
+                    # Append to existing control variate estimated boundary results table
+                    table_est_cv = table_est_cv.append(pd.DataFrame(tableLine_est_cv))
+
+                    # Append to existing control variate estimated boundary interpolated results table
+                    table_est_intrp_cv = table_est_intrp_cv.append(pd.DataFrame(tableLine_est_intrp_cv))
+
                 # # ------------------------------------------------------------------
                 # # Get computation times
                 # # ------------------------------------------------------------------
@@ -224,12 +261,18 @@ def joinAndPlot(OutDir, simNo):
         # Save true boundary (with interpolation) results table
         append_to_file(os.path.join(fResDir,'trueBdry_intrp.csv'), table_true_intrp)
 
+        # Save control variate estimated boundary results table
+        append_to_file(os.path.join(fResDir,'estBdry_cv.csv'), table_est_cv)
+
+        # Save control variate estimated boundary (with interpolation) results table
+        append_to_file(os.path.join(fResDir,'estBdry_intrp_cv.csv'), table_est_intrp_cv)
+
         # ----------------------------------------------------------------------
         # Make figures
         # ----------------------------------------------------------------------
 
         # Column headers
-        colhdr = ['cfgID', 'n', 'm']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
+        colhdr = ['cfgID', 'n', 'm', 'nReals']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
 
         # Assign column headers
         table_true_intrp.columns=colhdr
@@ -2,7 +2,13 @@ import os
 import numpy as np
 from lib.generateData import *
 from lib.boundary import *
+from lib.bootstrap import *
+from lib.truePlan import *
+from lib.coverage import *
+from lib.rng import *
+from lib.parallel import *
 from lib.fileio import *
+from lib.workspace import *
 
 # ===========================================================================
 #
@@ -42,15 +48,47 @@ from lib.fileio import *
 #                            the inner and outer voxels, following which 
 #                            interpolation is performed. 
 #                     --------------------------------------------------------
+# - `bootBlockSize`: The number of bootstrap instances computed at once. 
+#                    Larger blocks are faster but use more memory.
+# - `seed`: Root seed for the random number generators (optional, see
+#           `get_rng`). If this is not given, the legacy global generator is
+#           used.
+# - `nWorkers`: The number of worker processes to run the realizations in
+#               (if this is more than 1 the realizations are run in
+#               parallel).
+# - `bootTol`: Tolerance for the adaptive bootstrap (optional). If this is
+#              given, the bootstrap stops once the confidence interval for
+#              every percentile has half-width at most `bootTol` (see 
+#              `get_boot_converged`).
+# - `realTol`: Tolerance for sequential stopping of the realizations 
+#              (optional). If this is given, the realizations stop once the
+#              confidence interval for the (interpolated) coverage at every
+#              p-value has half-width at most `realTol` (and `nReals` is then
+#              the maximum number of realizations).
+# - `realCheck`: The number of realizations run between checks of the 
+#                coverage confidence intervals.
+# - `bootBackend`: The backend used to run the bootstrap, 'numpy' (default)
+#                  or 'numba' (see `get_boot_backend`).
+# - `simNo`: The simulation number (used, with `seed`, to key the random
+#            number streams, see `get_rng`).
+# - `cfgId`: The configuration ID (as above). Configurations run with the
+#            same root seed should be given different IDs, as otherwise 
+#            they draw the same random numbers.
 #
 # ===========================================================================
-def SpatialSims(OutDir, nSub, muSpec, nReals, c, p, interpBootMode=2):
+def SpatialSims(OutDir, nSub, muSpec, nReals, c, p, interpBootMode=2, bootBlockSize=BOOT_BLOCK_SIZE, seed=None, nWorkers=1, bootTol=None, realTol=None, realCheck=REAL_CHECK, bootBackend='numpy', simNo=0, cfgId=0):
 
     t1overall = time.time()
 
     # Define tau_n
     tau = 1/np.sqrt(nSub)
 
+    # Realizations run in parallel must draw from their own streams, so if we
+    # have no root seed we make one
+    if nWorkers > 1 and seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+        print('Root seed: ', seed)
+
     # Get the number of p-values we're looking at
     nPvals = len(p)
 
@@ -60,9 +98,6 @@ def SpatialSims(OutDir, nSub, muSpec, nReals, c, p, interpBootMode=2):
     # Dimensions of simulated data
     data_dim = np.array([nSub, 100,100])
 
-    # Dimensions of bootstrap variables
-    boot_dim = np.array([nSub, 1]) # MARKER: COULD MAKE  np.array([batchBoot, nSub, 1])
-
     # Smoothing
     fwhm = [0,3,3]
 
@@ -80,448 +115,451 @@ def SpatialSims(OutDir, nSub, muSpec, nReals, c, p, interpBootMode=2):
     trueBdry_success_intrp = np.zeros((nReals,nPvals))
     estBdry_success_intrp = np.zeros((nReals,nPvals))
 
-    # Loop through realizations
+    # Initialise array for recording the number of bootstraps used in each 
+    # realization
+    nBoot_used = np.zeros((nReals,1))
+
+    # -----------------------------------------------------------------------
+    # True boundary plan
+    # -----------------------------------------------------------------------
+    # Mu (and everything derived from it) is the same for every realization,
+    # so we only work it out once. With a single field Fc is just Ac.
+    truePlan = get_true_plan([muSpec], data_dim, c)
+
+    # Get coordinates for the boundary of Ac
+    Ac_bdry_locs = truePlan['Fc_bdry_locs']
+
+    # Obtain the weights along the boundary for Ac (Dict version)
+    Ac_bdry_weights = truePlan['Fc_bdry_weights']
+
+    # Obtain the weights along the boundary for Ac (Array version)
+    Ac_bdry_weights_concat = truePlan['Fc_bdry_weights_concat']
+
+    # Obtain the unique voxels along the boundary for Ac and the operator
+    # interpolating from them onto the boundary (Sparse version)
+    Ac_bdry_vox = truePlan['Fc_bdry_vox']
+    Ac_bdry_interp_op = truePlan['Fc_bdry_interp_op']
+
+    # Number of non-singleton dimensions of the boundary
+    nDims = len(Ac_bdry_locs['edges']['shape'])
+
+    # Obtain Ac
+    Ac = truePlan['mus'] > c
+
+    # -----------------------------------------------------------------------
+    # Realizations
+    # -----------------------------------------------------------------------
+    # Everything the realizations need which is the same for every
+    # realization
+    consts = {}
+    consts['nSub'] = nSub
+    consts['seed'] = seed
+    consts['simNo'] = simNo
+    consts['cfgId'] = cfgId
+    consts['mus'] = truePlan['mus']
+    consts['data_dim'] = data_dim
+    consts['fwhm'] = fwhm
+    consts['c'] = c
+    consts['interpBootMode'] = interpBootMode
+    consts['Ac'] = Ac
+    consts['Ac_bdry_locs'] = Ac_bdry_locs
+    consts['Ac_bdry_weights'] = Ac_bdry_weights
+    consts['Ac_bdry_vox'] = Ac_bdry_vox
+    consts['nDims'] = nDims
+    consts['Ac_bdry_interp_op'] = Ac_bdry_interp_op
+    consts['nBoot'] = nBoot
+    consts['bootBlockSize'] = bootBlockSize
+    consts['bootTol'] = bootTol
+    consts['bootBackend'] = get_boot_backend(bootBackend)
+    consts['p'] = p
+    consts['tau'] = tau
+
+    # If we are stopping sequentially, stop once the confidence intervals for
+    # the interpolated coverage (the running means of the third and fourth 
+    # results of each realization) are all narrow enough
+    if realTol is not None:
+        def stop(results):
+            return(get_coverage_converged([[res[2] for res in results],[res[3] for res in results]], realTol))
+    else:
+        stop = None
+
+    # Run the realizations (sharded across a pool of nWorkers processes if
+    # nWorkers > 1), in order
+    results = get_realizations(SpatialSims_real, consts, nReals, nWorkers, stop, realCheck)
+
+    # Free the workspace used by the realizations run in this process
+    free_workspace()
+
+    # Number of realizations actually run
+    nReals = len(results)
+
+    # Record whether each realization observed successful sets (and the 
+    # number of bootstraps it used)
     for r in np.arange(nReals):
+        trueBdry_success[r,:], estBdry_success[r,:], trueBdry_success_intrp[r,:], estBdry_success_intrp[r,:], nBoot_used[r,:] = results[r]
 
-        print('r: ', r)
-        # -------------------------------------------------------------------
-        # Data generation
-        # -------------------------------------------------------------------
-
-        # Obtain data
-        data, mu = get_data(muSpec, data_dim, fwhm)
+    # Remove any realizations we did not run
+    trueBdry_success = trueBdry_success[:nReals,:]
+    estBdry_success = estBdry_success[:nReals,:]
+    trueBdry_success_intrp = trueBdry_success_intrp[:nReals,:]
+    estBdry_success_intrp = estBdry_success_intrp[:nReals,:]
+    nBoot_used = nBoot_used[:nReals,:]
 
-        # -------------------------------------------------------------------
-        # Mean and variance estimates
-        # -------------------------------------------------------------------
-
-        # Obtain mu estimate
-        muHat = np.mean(data, axis=0).reshape(mu.shape)
+    # Coverage probabilities
+    coverage_trueBdry = np.mean(trueBdry_success,axis=0)
+    coverage_estBdry = np.mean(estBdry_success,axis=0)
 
-        # Obtain sigma
-        sigma = np.std(data, axis=0).reshape(mu.shape)
+    # Coverage probabilities
+    coverage_trueBdry_intrp = np.mean(trueBdry_success_intrp,axis=0)
+    coverage_estBdry_intrp = np.mean(estBdry_success_intrp,axis=0)
 
-        # -------------------------------------------------------------------
-        # Boundary locations for Ac
-        # -------------------------------------------------------------------
-        # Get boolean maps for the boundary of Ac
-        Ac_bdry_maps = get_bdry_maps(mu, c)
+    # Control variate estimates of the coverage for the estimated boundary 
+    # (using the true boundary successes as the control), and their standard
+    # errors
+    coverage_estBdry_cv, se_estBdry_cv = get_cv_coverage(estBdry_success, trueBdry_success, p)
+    coverage_estBdry_intrp_cv, se_estBdry_intrp_cv = get_cv_coverage(estBdry_success_intrp, trueBdry_success_intrp, p)
 
-        # Get coordinates for the boundary of Ac
-        Ac_bdry_locs = get_bdry_locs(Ac_bdry_maps)
+    print('Coverage: ', coverage_estBdry_intrp)
+    print('Coverage (control variate): ', coverage_estBdry_intrp_cv, ' +/- ', se_estBdry_intrp_cv)
 
-        # Delete maps as we no longer need them
-        del Ac_bdry_maps
+    # Save the violations to a file
+    append_to_file('trueSuccess'+str(nSub)+'.csv', trueBdry_success) 
+    append_to_file('estSuccess'+str(nSub)+'.csv', estBdry_success)
+    append_to_file('trueSuccess'+str(nSub)+'_intrp.csv', trueBdry_success_intrp) 
+    append_to_file('estSuccess'+str(nSub)+'_intrp.csv', estBdry_success_intrp)
+    append_to_file('nBoot'+str(nSub)+'.csv', nBoot_used)
+    append_to_file('nReals'+str(nSub)+'.csv', np.array([[nReals]]))
+    append_to_file('trueSuccess'+str(nSub)+'_intrp_ci.csv', np.array(get_coverage_ci(trueBdry_success_intrp)))
+    append_to_file('estSuccess'+str(nSub)+'_intrp_ci.csv', np.array(get_coverage_ci(estBdry_success_intrp)))
+    append_to_file('estSuccess'+str(nSub)+'_cv.csv', np.array([coverage_estBdry_cv, se_estBdry_cv]))
+    append_to_file('estSuccess'+str(nSub)+'_intrp_cv.csv', np.array([coverage_estBdry_intrp_cv, se_estBdry_intrp_cv]))
 
-        # -------------------------------------------------------------------
-        # Boundary locations for AcHat
-        # -------------------------------------------------------------------
-        # Get boolean maps for the boundary of AcHat
-        AcHat_bdry_maps = get_bdry_maps(muHat, c)
+    t2overall = time.time()
 
-        # Get coordinates for the boundary of AcHat
-        AcHat_bdry_locs = get_bdry_locs(AcHat_bdry_maps)
+    print('overall time: ', t2overall-t1overall)
 
-        # Delete maps as we no longer need them
-        del AcHat_bdry_maps
 
-        # -------------------------------------------------------------------
-        # Interpolation weights for Ac boundary
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Ac
-        Ac_bdry_vals = get_bdry_values(mu, Ac_bdry_locs)
+# ===========================================================================
+#
+# This function runs a single realization of `SpatialSims`. It is run
+# for every realization by `get_realizations` (serially, or in a pool of
+# worker processes).
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `r`: The realization number.
+# - `consts`: Dictionary of everything which is the same for every 
+#             realization (the inputs, mu and the true boundary
+#             quantities computed in `SpatialSims`). These must not be
+#             modified.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `trueBdry_success`, `estBdry_success`: Whether the sets based on the
+#                                          true and estimated boundary were
+#                                          successful, for each p-value 
+#                                          (assessed without interpolation).
+# - `trueBdry_success_intrp`, `estBdry_success_intrp`: As above, assessed 
+#                                                      with interpolation.
+# - `nBoot_used`: The number of bootstraps used (this is nBoot unless the
+#                bootstrap is adaptive, see `get_boot_converged`).
+#
+# ===========================================================================
+def SpatialSims_real(r, consts):
+
+    # -----------------------------------------------------------------------
+    # Unpack the constants
+    # -----------------------------------------------------------------------
+    nSub = consts['nSub']
+    seed = consts['seed']
+    simNo = consts['simNo']
+    cfgId = consts['cfgId']
+    mus = consts['mus']
+    data_dim = consts['data_dim']
+    fwhm = consts['fwhm']
+    c = consts['c']
+    interpBootMode = consts['interpBootMode']
+    Ac = consts['Ac']
+    Ac_bdry_locs = consts['Ac_bdry_locs']
+    Ac_bdry_weights = consts['Ac_bdry_weights']
+    Ac_bdry_vox = consts['Ac_bdry_vox']
+    nDims = consts['nDims']
+    Ac_bdry_interp_op = consts['Ac_bdry_interp_op']
+    nBoot = consts['nBoot']
+    bootBlockSize = consts['bootBlockSize']
+    bootTol = consts['bootTol']
+    bootBackend = consts['bootBackend']
+    p = consts['p']
+    tau = consts['tau']
+
+    print('r: ', r)
+
+    # Workspace for this configuration (the arrays in this are reused by 
+    # every realization, see `get_workspace`)
+    workspace = get_workspace(data_dim, 1, nBoot, bootBlockSize)
+
+    # Generators for the noise and for the bootstrap
+    noise_rng = get_rng(seed, simNo, cfgId, r, 0, 'noise')
+    boot_rng = get_rng(seed, simNo, cfgId, r, 0, 'boot')
+
+    # -----------------------------------------------------------------------
+    # Data generation
+    # -----------------------------------------------------------------------
+
+    # Obtain data (`get_data` generates a pair of fields, so the single field
+    # is generated here, in the workspace)
+    mu = mus
+    data = get_noise_stack([{'type': 'homogen', 'FWHM': fwhm}], data_dim, [noise_rng], out=workspace['data'], workspace=workspace)[0]
+    data += mu
+
+    # -----------------------------------------------------------------------
+    # Mean and variance estimates
+    # -----------------------------------------------------------------------
+
+    # Obtain mu estimate
+    muHat = np.mean(data, axis=0, out=workspace['muHat'][0]).reshape(mu.shape)
+
+    # Obtain sigma
+    sigma = np.std(data, axis=0, out=workspace['sigma'][0]).reshape(mu.shape)
+
+    # -----------------------------------------------------------------------
+    # Boundary locations for AcHat
+    # -----------------------------------------------------------------------
+    # Get the edges along the boundary of AcHat
+    AcHat_bdry_edges = get_bdry_edges(muHat, c)
+
+    # Get coordinates for the boundary of AcHat
+    AcHat_bdry_locs = get_bdry_locs(AcHat_bdry_edges)
+
+    # Delete edges as we no longer need them
+    del AcHat_bdry_edges
+
+    # -----------------------------------------------------------------------
+    # Interpolation weights for AcHat boundary
+    # -----------------------------------------------------------------------
+
+    # If we are in mode 1, we work with the interpolated boundary in dict
+    # form.
+    if interpBootMode==1:
+
+        # Obtain the values along the boundary for AcHat
+        AcHat_bdry_vals = get_bdry_values(muHat, AcHat_bdry_locs)
 
         # Obtain the weights along the boundary for Ac
-        Ac_bdry_weights = get_bdry_weights(Ac_bdry_vals, c)
+        AcHat_bdry_weights = get_bdry_weights(AcHat_bdry_vals, c)
 
         # Delete values as we no longer need them
-        del Ac_bdry_vals
-
-        # -------------------------------------------------------------------
-        # Interpolation weights for AcHat boundary
-        # -------------------------------------------------------------------
-
-        # If we are in mode 1, we work with the interpolated boundary in dict
-        # form.
-        if interpBootMode==1:
-
-            # Obtain the values along the boundary for AcHat
-            AcHat_bdry_vals = get_bdry_values(muHat, AcHat_bdry_locs)
-
-            # Obtain the weights along the boundary for Ac
-            AcHat_bdry_weights = get_bdry_weights(AcHat_bdry_vals, c)
-
-            # Delete values as we no longer need them
-            del AcHat_bdry_vals
-
-        # If we are in mode 2, we work with the inner and outer boundaries in 
-        # np array form.
-        if interpBootMode==2:
-
-            # ---------------------------------------------------------------
-            # Interpolation weights for Ac boundary
-            # ---------------------------------------------------------------
-            # Obtain the values along the boundary for Ac
-            Ac_bdry_vals_concat = get_bdry_values_concat(mu, Ac_bdry_locs)
-
-            # Obtain the weights along the boundary for Ac
-            Ac_bdry_weights_concat = get_bdry_weights_concat(Ac_bdry_vals_concat, c)
-
-            # Delete values as we no longer need them
-            del Ac_bdry_vals_concat
-
-            # ---------------------------------------------------------------
-            # Interpolation weights for AcHat boundary
-            # ---------------------------------------------------------------
-            # Obtain the values along the boundary for AcHat
-            AcHat_bdry_vals_concat = get_bdry_values_concat(muHat, AcHat_bdry_locs)
-
-            # Obtain the weights along the boundary for Ac
-            AcHat_bdry_weights_concat = get_bdry_weights_concat(AcHat_bdry_vals_concat, c)
+        del AcHat_bdry_vals
 
-            # Delete values as we no longer need them
-            del AcHat_bdry_vals_concat
+    # If we are in mode 2, we work with the inner and outer boundaries in 
+    # np array form.
+    if interpBootMode==2:
 
         # -------------------------------------------------------------------
-        # Residuals
+        # Interpolation weights for AcHat boundary
         # -------------------------------------------------------------------
+        # Obtain the values along the boundary for AcHat
+        AcHat_bdry_vals_concat = get_bdry_values_concat(muHat, AcHat_bdry_locs)
 
-        # Obtain residuals
-        resid = (data-muHat)/sigma
-
-        # If we are in mode 1, we work with the interpolated boundary in dict
-        # form.
-        if interpBootMode==1:
-
-            # Residuals along Ac boundary
-            resid_Ac_bdry = get_bdry_values(resid, Ac_bdry_locs)
-
-            # Interpolate along Ac boundary
-            resid_Ac_bdry = get_bdry_vals_interpolated(resid_Ac_bdry, Ac_bdry_weights)
-
-            # Residuals along AcHat boundary
-            resid_AcHat_bdry = get_bdry_values(resid, AcHat_bdry_locs)
-
-            # Interpolate along AcHat boundary
-            resid_AcHat_bdry = get_bdry_vals_interpolated(resid_AcHat_bdry, AcHat_bdry_weights)
+        # Obtain the weights along the boundary for Ac
+        AcHat_bdry_weights_concat = get_bdry_weights_concat(AcHat_bdry_vals_concat, c)
 
-        #If we are in mode 2, we work with the inner and outer boundaries in 
-        #np array form.
-        if interpBootMode==2:
+        # Obtain the unique voxels along the boundary for AcHat and the
+        # operator interpolating from them onto the boundary
+        AcHat_bdry_vox, AcHat_bdry_interp_op = get_bdry_interp_op(get_bdry_inds_concat(AcHat_bdry_locs), AcHat_bdry_weights_concat)
 
-            # Residuals along Ac boundary
-            resid_Ac_bdry_concat = get_bdry_values_concat(resid, Ac_bdry_locs)
+        # Delete values as we no longer need them
+        del AcHat_bdry_vals_concat
 
-            # Residuals along AcHat boundary
-            resid_AcHat_bdry_concat = get_bdry_values_concat(resid, AcHat_bdry_locs)
+    # -----------------------------------------------------------------------
+    # Residuals
+    # -----------------------------------------------------------------------
 
-        # Delete residuals as they are no longer needed
-        del resid, data
+    # The residuals are only obtained at the boundary voxels (from the data
+    # at those voxels), rather than over the whole image.
 
-        # -------------------------------------------------------------------
-        # True and estimated excursion sets
-        # -------------------------------------------------------------------
-        # Obtain Ac
-        Ac = mu > c
-
-        # Obtain estimated Ac
-        AcHat = muHat > c
-
-        # -------------------------------------------------------------------
-        # Muhat (interpolated) along the true Ac boundary
-        # -------------------------------------------------------------------
+    # If we are in mode 1, we work with the interpolated boundary in dict
+    # form.
+    if interpBootMode==1:
 
         # Residuals along Ac boundary
-        muHat_AcBdry = get_bdry_values(muHat, Ac_bdry_locs)
+        resid_Ac_bdry = get_bdry_resid(data, muHat, sigma, Ac_bdry_locs)
 
         # Interpolate along Ac boundary
-        muHat_AcBdry = get_bdry_vals_interpolated(muHat_AcBdry, Ac_bdry_weights)
-
-        # If we are in mode 2, we work with the inner and outer boundaries in 
-        # np array form.
-        if interpBootMode==2:
-
-            # Residuals along Ac boundary
-            muHat_AcBdry_concat = get_bdry_values_concat(muHat, Ac_bdry_locs)
-
-            # Interpolate along Ac boundary
-            muHat_AcBdry_concat = get_bdry_vals_interpolated_concat(muHat_AcBdry_concat, Ac_bdry_weights_concat)
-
-        # -------------------------------------------------------------------
-        # Bootstrap 
-        # -------------------------------------------------------------------
-        # Initialize empty bootstrap stores
-        max_g_Ac = np.zeros(nBoot)
-        max_g_AcHat = np.zeros(nBoot)
-
-        t1 = time.time()
-        # For each bootstrap record the max of the residuals along the
-        # boundary
-        for b in np.arange(nBoot):
-
-            # Obtain bootstrap variables
-            boot_vars = 2*np.random.randint(0,2,boot_dim)-1
-
-            # If we are in mode 1, we perform the bootstrap on the
-            # interpolated residuals.
-            if interpBootMode==1:
-
-                # Bootstrap residuals along Ac
-                boot_resid_Ac_bdry = boot_vars*resid_Ac_bdry
-
-                # Bootstrap residuals along AcHat
-                boot_resid_AcHat_bdry = boot_vars*resid_AcHat_bdry
-
-                # Sum across subjects to get the bootstrapped a values along
-                # the boundary of Ac
-                boot_g_Ac_bdry = np.sum(boot_resid_Ac_bdry, axis=0)/np.sqrt(nSub)
-
-                # Obtain bootstrap standard deviations along Ac
-                sigma_boot_Ac = np.std(boot_resid_Ac_bdry, axis=0, ddof=1)
-
-                # Divide by the boostrap standard deviation on Ac
-                boot_g_Ac_bdry = boot_g_Ac_bdry/sigma_boot_Ac
-
-                # Sum across subjects to get the bootstrapped g values along
-                # the boundary of AcHat
-                boot_g_AcHat_bdry = np.sum(boot_resid_AcHat_bdry, axis=0)/np.sqrt(nSub)
-
-                # Obtain bootstrap standard deviations along AcHat
-                sigma_boot_AcHat = np.std(boot_resid_AcHat_bdry, axis=0, ddof=1)
-
-                # Divide by the boostrap standard deviation on AcHat
-                boot_g_AcHat_bdry = boot_g_AcHat_bdry/sigma_boot_AcHat
-
-                # Get maximum along Ac boudary
-                max_g_Ac[b] = np.max(np.abs(boot_g_Ac_bdry)) 
-
-                # Get maximum along AcHat boudary
-                max_g_AcHat[b] = np.max(np.abs(boot_g_AcHat_bdry)) 
-
-            # If we are in mode 2, we perform the bootstrap on the
-            # inner and outer residuals and then interpolate.
-            if interpBootMode==2:
-
-                # Reshape for broadcasting purposes (extra axis refers to the fact we have
-                # inner and outer boundary values in the last axes of resid_Ac_bdry_concat
-                # and resid_AcHat_bdry_concat)
-                boot_vars = boot_vars.reshape((*boot_vars.shape),1)
-
-                # Bootstrap residuals along Ac
-                boot_resid_Ac_bdry_concat = boot_vars*resid_Ac_bdry_concat
-
-                # Bootstrap residuals along AcHat
-                boot_resid_AcHat_bdry_concat = boot_vars*resid_AcHat_bdry_concat
-
-                # Sum across subjects to get the bootstrapped a values along
-                # the boundary of Ac. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. 
-                # I am still looking into why this is)
-                boot_g_Ac_bdry_concat = np.zeros(boot_resid_Ac_bdry_concat.shape[-2:])
-                boot_g_Ac_bdry_concat[...,0] = np.sum(boot_resid_Ac_bdry_concat[...,0], axis=0)/np.sqrt(nSub)
-                boot_g_Ac_bdry_concat[...,1] = np.sum(boot_resid_Ac_bdry_concat[...,1], axis=0)/np.sqrt(nSub)
-
-                # Obtain bootstrap standard deviations along Ac. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. I am still looking
-                # into why this is)
-                sigma_boot_Ac_concat = np.zeros(boot_resid_Ac_bdry_concat.shape[-2:])
-                sigma_boot_Ac_concat[...,0] = np.std(boot_resid_Ac_bdry_concat[...,0], axis=0, ddof=1)
-                sigma_boot_Ac_concat[...,1] = np.std(boot_resid_Ac_bdry_concat[...,1], axis=0, ddof=1)
-
-                # Divide by the boostrap standard deviation on Ac
-                boot_g_Ac_bdry_concat = boot_g_Ac_bdry_concat/sigma_boot_Ac_concat
-
-                # Sum across subjects to get the bootstrapped g values along
-                # the boundary of AcHat. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. 
-                # I am still looking into why this is)
-                boot_g_AcHat_bdry_concat = np.zeros(boot_resid_AcHat_bdry_concat.shape[-2:])
-                boot_g_AcHat_bdry_concat[...,0] = np.sum(boot_resid_AcHat_bdry_concat[...,0], axis=0)/np.sqrt(nSub)
-                boot_g_AcHat_bdry_concat[...,1] = np.sum(boot_resid_AcHat_bdry_concat[...,1], axis=0)/np.sqrt(nSub)
-
-                # Obtain bootstrap standard deviations along AcHat. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. I am still looking
-                # into why this is)
-                sigma_boot_AcHat_concat = np.zeros(boot_resid_AcHat_bdry_concat.shape[-2:])
-                sigma_boot_AcHat_concat[...,0] = np.std(boot_resid_AcHat_bdry_concat[...,0], axis=0, ddof=1)
-                sigma_boot_AcHat_concat[...,1] = np.std(boot_resid_AcHat_bdry_concat[...,1], axis=0, ddof=1)
-
-                # Divide by the boostrap standard deviation on AcHat
-                boot_g_AcHat_bdry_concat = boot_g_AcHat_bdry_concat/sigma_boot_AcHat_concat
-
-                # Interpolation for Ac boundary
-                boot_g_Ac_bdry_concat = get_bdry_vals_interpolated_concat(boot_g_Ac_bdry_concat,Ac_bdry_weights_concat)
-
-                # Interpolation for AcHat boundary
-                boot_g_AcHat_bdry_concat = get_bdry_vals_interpolated_concat(boot_g_AcHat_bdry_concat,AcHat_bdry_weights_concat)
-
-                # Get maximum along Ac boudary
-                max_g_Ac[b] = np.max(np.abs(boot_g_Ac_bdry_concat)) 
-
-                # Get maximum along AcHat boudary
-                max_g_AcHat[b] = np.max(np.abs(boot_g_AcHat_bdry_concat)) 
-
-        print(max_g_AcHat)
-
-        t2 = time.time()
-        print('Bootstrap time: ', t2-t1)
-
-        # -------------------------------------------------------------------
-        # Obtaining a from percentiles of the max distribution
-        # -------------------------------------------------------------------
-
-        # Get the a estimates along the true Ac boundary and estimated AcHat boundary
-        a_trueBdry = np.percentile(max_g_Ac, 100*p).reshape(nPvals,1,1,1)
-        a_estBdry = np.percentile(max_g_AcHat, 100*p).reshape(nPvals,1,1,1) # [pvals, 1, [1 for _ in dim>1]]
-
-        # Reformat them to an array form useful for boolean operation
-        a_trueBdry = np.concatenate((-a_trueBdry,a_trueBdry),axis=1)
-        a_estBdry = np.concatenate((-a_estBdry,a_estBdry),axis=1)
-
-        # Get the statistic field which defined Achat^{+/-}
-        stat = ((muHat-c)/(sigma*tau)).reshape(1,(*muHat.shape))
-
-        # Obtain AcHat^+ and AcHat^- based on a from the true boundary. This variable
-        # has axes corresponding to [pvalue, plus/minus, field dimensions]
-        AcHat_pm_trueBdry = stat >= a_trueBdry
-
-        # Obtain AcHat^+ and AcHat^- based on a from the estimated boundary. This variable
-        # has axes corresponding to [pvalue, plus/minus, field dimensions]
-        AcHat_pm_estBdry = stat >= a_estBdry
-
-        # -------------------------------------------------------------------
-        # Some set logic to work out violations
-        # -------------------------------------------------------------------
-
-        # Obtain AcHat^+\AcHat based on the true boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        AcHatp_sub_Ac_trueBdry = AcHat_pm_trueBdry[:,1,...] & ~Ac[...]
-
-        # Obtain AcHat^+\AcHat based on the estimated boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        AcHatp_sub_Ac_estBdry = AcHat_pm_estBdry[:,1,...] & ~Ac[...]
+        resid_Ac_bdry = get_bdry_vals_interpolated(resid_Ac_bdry, Ac_bdry_weights)
 
-        # Obtain Ac\AcHat^- based on the true boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        Ac_sub_AcHatm_trueBdry = Ac[...] & ~AcHat_pm_trueBdry[:,0,...]
+        # Residuals along AcHat boundary
+        resid_AcHat_bdry = get_bdry_resid(data, muHat, sigma, AcHat_bdry_locs)
 
-        # Obtain Ac\AcHat^- based on the estimated boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        Ac_sub_AcHatm_estBdry = Ac[...] & ~AcHat_pm_estBdry[:,0,...]
-
-        # -------------------------------------------------------------------
-        # Check whether there were any boundary violations using voxelwise
-        # set logic (checking if voxels existed in one set but not another, 
-        # etc)
-        # -------------------------------------------------------------------
+        # Interpolate along AcHat boundary
+        resid_AcHat_bdry = get_bdry_vals_interpolated(resid_AcHat_bdry, AcHat_bdry_weights)
 
-        # Record if we saw a violation in the true boundary based sets
-        trueBdry_success[r,:] = 1-(np.any(AcHatp_sub_Ac_trueBdry,axis=(1,2)) | np.any(Ac_sub_AcHatm_trueBdry,axis=(1,2))) # MARKER: AXES WONT WORK FOR 3D ATM
+    #If we are in mode 2, we work with the inner and outer boundaries in 
+    #np array form.
+    if interpBootMode==2:
 
-        # Record if we saw a violation in the estimated boundary based sets
-        estBdry_success[r,:] = 1-(np.any(AcHatp_sub_Ac_estBdry,axis=(1,2)) | np.any(Ac_sub_AcHatm_estBdry,axis=(1,2)))# MARKER: AXES WONT WORK FOR 3D ATM
+        # Residuals at the unique voxels along the Ac boundary
+        resid_Ac_bdry_vox = get_bdry_vox_resid(data, muHat, sigma, Ac_bdry_vox, nDims)
 
-        # -------------------------------------------------------------------
-        # Work out the threshold values of the muhat image given by:
-        #               thr(s) = c +/- a\tau\sigma(s)
-        # -------------------------------------------------------------------
+        # Residuals at the unique voxels along the AcHat boundary
+        resid_AcHat_bdry_vox = get_bdry_vox_resid(data, muHat, sigma, AcHat_bdry_vox, nDims)
 
-        # Obtain threshold maps for muhat to get lower and upper sets (for 
-        # true boundary). This variable will have dimensions corresponding
-        # to [number of p values, -a or a, dimensions of mu].
-        muHat_threshs_trueBdry = c + a_trueBdry*tau*sigma
+    # Delete data as it is no longer needed
+    del data
 
-        # Obtain threshold maps for muhat to get lower and upper sets (for 
-        # estimated boundary). This variable will have dimensions
-        # corresponding to [number of p values, -a or a, dimensions of mu].
-        muHat_threshs_estBdry = c + a_estBdry*tau*sigma
+    # -----------------------------------------------------------------------
+    # True and estimated excursion sets
+    # -----------------------------------------------------------------------
+    # Obtain estimated Ac
+    AcHat = muHat > c
 
-        # -------------------------------------------------------------------
-        # Work out the thresholds along the true boundary, using `a` derived
-        # from the maxima along the true boundary,
-        # -------------------------------------------------------------------
-        # Thresholds for muhat along Ac boundary
-        muHat_AcBdry_threshs_trueBdry = get_bdry_values(muHat_threshs_trueBdry, Ac_bdry_locs)
+    # -----------------------------------------------------------------------
+    # Muhat (interpolated) along the true Ac boundary
+    # -----------------------------------------------------------------------
 
-        # Delete whole map as we no longer need it
-        del muHat_threshs_trueBdry
+    # Residuals along Ac boundary
+    muHat_AcBdry = get_bdry_values(muHat, Ac_bdry_locs)
 
-        # Interpolate along Ac boundary
-        muHat_AcBdry_threshs_trueBdry = get_bdry_vals_interpolated(muHat_AcBdry_threshs_trueBdry, Ac_bdry_weights)
+    # Interpolate along Ac boundary
+    muHat_AcBdry = get_bdry_vals_interpolated(muHat_AcBdry, Ac_bdry_weights)
 
-        # -------------------------------------------------------------------
-        # Work out the thresholds along the true boundary, using `a` derived
-        # from the maxima along the estimated boundary,
-        # -------------------------------------------------------------------
-        # Thresholds for muhat along Ac boundary
-        muHat_AcBdry_threshs_estBdry = get_bdry_values(muHat_threshs_estBdry, Ac_bdry_locs)
+    # If we are in mode 2, we work with the inner and outer boundaries in 
+    # np array form.
+    if interpBootMode==2:
 
-        # Delete whole map as we no longer need it
-        del muHat_threshs_estBdry
+        # Muhat at the unique voxels along the Ac boundary
+        muHat_AcBdry_vox = get_bdry_vox_values(muHat, Ac_bdry_vox, nDims)
 
         # Interpolate along Ac boundary
-        muHat_AcBdry_threshs_estBdry = get_bdry_vals_interpolated(muHat_AcBdry_threshs_estBdry, Ac_bdry_weights)
-
-        # -------------------------------------------------------------------
-        # Check whether there were any boundary violations using interpolated
-        # boundary values (checking if voxels had values corresponding to no
-        # violations, etc)
-        # -------------------------------------------------------------------
-
-        # Perform lower check on muHat using thresholds based on the
-        # estimated boundary
-        bdry_lowerCheck_estBdry = muHat_AcBdry >= muHat_AcBdry_threshs_estBdry[:,0,:]
-
-        # Perform upper check on muHat using thresholds based on the
-        # estimated boundary
-        bdry_upperCheck_estBdry = muHat_AcBdry <= muHat_AcBdry_threshs_estBdry[:,1,:]
-
-        # Perform lower check on muHat using thresholds based on the
-        # true boundary
-        bdry_lowerCheck_trueBdry = muHat_AcBdry >= muHat_AcBdry_threshs_trueBdry[:,0,:]
-
-        # Perform upper check on muHat using thresholds based on the
-        # true boundary
-        bdry_upperCheck_trueBdry = muHat_AcBdry <= muHat_AcBdry_threshs_trueBdry[:,1,:]
-
-        print('here')
-        print(bdry_upperCheck_trueBdry.shape)
-        print(muHat_AcBdry.shape)
-        print(muHat_AcBdry_threshs_trueBdry[:,1,:].shape)
-
-        # -------------------------------------------------------------------
-        # Work out whether simulation observed successful sets.
-        # -------------------------------------------------------------------
-        # Record if we saw a violation in the true boundary based sets
-        trueBdry_success_intrp[r,:] = np.all(bdry_lowerCheck_trueBdry,axis=(1)) & np.all(bdry_upperCheck_trueBdry,axis=(1))# MARKER: AXES WONT WORK FOR 3D ATM
-
-        # Record if we saw a violation in the estimated boundary based sets
-        estBdry_success_intrp[r,:] = np.all(bdry_lowerCheck_estBdry,axis=(1)) & np.all(bdry_upperCheck_estBdry,axis=(1)) # MARKER: AXES WONT WORK FOR 3D ATM
+        muHat_AcBdry_concat = get_bdry_vals_interpolated_op(muHat_AcBdry_vox, Ac_bdry_interp_op)
+
+    # -----------------------------------------------------------------------
+    # Bootstrap 
+    # -----------------------------------------------------------------------
+    # Bootstrap stores (from the workspace)
+    max_g_Ac = workspace['boot_max'][0]
+    max_g_AcHat = workspace['boot_max'][1]
+
+    # Number of bootstraps used
+    nBoot_used = nBoot
+
+    # If we are in mode 1, we perform the bootstrap on the interpolated
+    # residuals.
+    if interpBootMode==1:
+
+        # Residuals to bootstrap along Ac and AcHat
+        boot_resid_Ac = resid_Ac_bdry
+        boot_resid_AcHat = resid_AcHat_bdry
+
+    # If we are in mode 2, we perform the bootstrap on the residuals at
+    # the (unique) boundary voxels and then interpolate.
+    if interpBootMode==2:
+
+        # Residuals to bootstrap along Ac and AcHat
+        boot_resid_Ac = resid_Ac_bdry_vox
+        boot_resid_AcHat = resid_AcHat_bdry_vox
+
+    # The sum of squares of the bootstrapped residuals does not change 
+    # across bootstraps (as the Rademacher variables square to 1), so we
+    # only need to compute it once.
+    resid_Ac_sumsq = get_resid_sumsq(boot_resid_Ac)
+    resid_AcHat_sumsq = get_resid_sumsq(boot_resid_AcHat)
+
+    t1 = time.time()
+    # For each block of bootstraps record the max of the residuals along
+    # the boundary
+    for b0, b1 in get_boot_blocks(nBoot, bootBlockSize):
+
+        # Obtain bootstrap variables for this block
+        boot_vars = get_boot_vars(b1-b0, nSub, boot_rng, out=workspace['boot_vars'][:(b1-b0)])
+
+        # Get maximum of the bootstrapped g values along Ac boudary (in 
+        # mode 2, we interpolate the bootstrapped g values first)
+        max_g_Ac[b0:b1] = get_boot_max_g(boot_vars, boot_resid_Ac, resid_Ac_sumsq, 
+                                         Ac_bdry_interp_op if interpBootMode==2 else None, bootBackend)
+
+        # Get maximum of the bootstrapped g values along AcHat boudary
+        max_g_AcHat[b0:b1] = get_boot_max_g(boot_vars, boot_resid_AcHat, resid_AcHat_sumsq, 
+                                            AcHat_bdry_interp_op if interpBootMode==2 else None, bootBackend)
+
+        # In the adaptive bootstrap, stop once every percentile has converged
+        if bootTol is not None and get_boot_converged([max_g_Ac[:b1], max_g_AcHat[:b1]], p, bootTol):
+            nBoot_used = b1
+            break
+
+    # Keep only the bootstraps we used
+    max_g_Ac = max_g_Ac[:nBoot_used]
+    max_g_AcHat = max_g_AcHat[:nBoot_used]
+
+    print(max_g_AcHat)
+
+    t2 = time.time()
+    print('Bootstrap time: ', t2-t1)
+
+    # -----------------------------------------------------------------------
+    # Obtaining a from percentiles of the max distribution
+    # -----------------------------------------------------------------------
+
+    # Get the a estimates along the true Ac boundary and estimated AcHat boundary
+    a_trueBdry = np.percentile(max_g_Ac, 100*p)
+    a_estBdry = np.percentile(max_g_AcHat, 100*p)
+
+    # Get the statistic field which defined Achat^{+/-}
+    stat = ((muHat-c)/(sigma*tau)).reshape(1,(*muHat.shape))
+
+    # -----------------------------------------------------------------------
+    # Work out the smallest a for which the voxelwise set logic observes
+    # no violations (i.e. AcHat^+ is contained in Ac and Ac is contained
+    # in AcHat^-)
+    # -----------------------------------------------------------------------
+    crit = get_crit_val(stat, Ac)
+
+    # -----------------------------------------------------------------------
+    # Work out the smallest a for which muhat lies between the thresholds
+    #               thr(s) = c +/- a\tau\sigma(s)
+    # along the interpolated Ac boundary. As the interpolation weights
+    # sum to one, this is the maximum of |muhat-c|/(\tau\sigma) along the
+    # boundary, with sigma interpolated in the same way as muhat.
+    # -----------------------------------------------------------------------
+
+    # Sigma along Ac boundary
+    sigma_AcBdry = get_bdry_values(sigma, Ac_bdry_locs)
+
+    # Interpolate along Ac boundary
+    sigma_AcBdry = get_bdry_vals_interpolated(sigma_AcBdry, Ac_bdry_weights)
 
     # For the interpolated boundary success checks, we still need to do the 
-    # voxelwise checks as well. This will take care of that.
-    trueBdry_success_intrp = trueBdry_success_intrp*trueBdry_success
-    estBdry_success_intrp = estBdry_success_intrp*estBdry_success
+    # voxelwise checks as well, so we take the larger critical value
+    crit_intrp = np.maximum(crit, get_crit_val_bdry((muHat_AcBdry-c)/(sigma_AcBdry*tau)))
 
-    # Coverage probabilities
-    coverage_trueBdry = np.mean(trueBdry_success,axis=0)
-    coverage_estBdry = np.mean(estBdry_success,axis=0)
+    # -----------------------------------------------------------------------
+    # Work out whether simulation observed successful sets.
+    # -----------------------------------------------------------------------
+    # Record if we saw a violation in the true boundary based sets
+    trueBdry_success = get_success(crit, a_trueBdry)
 
-    # Coverage probabilities
-    coverage_trueBdry_intrp = np.mean(trueBdry_success_intrp,axis=0)
-    coverage_estBdry_intrp = np.mean(estBdry_success_intrp,axis=0)
+    # Record if we saw a violation in the estimated boundary based sets
+    estBdry_success = get_success(crit, a_estBdry)
 
-    print('Coverage: ', coverage_estBdry_intrp)
+    # Record if we saw a violation in the true boundary based sets
+    # (assessed with interpolation)
+    trueBdry_success_intrp = get_success(crit_intrp, a_trueBdry)
 
-    # Save the violations to a file
-    append_to_file('trueSuccess'+str(nSub)+'.csv', trueBdry_success) 
-    append_to_file('estSuccess'+str(nSub)+'.csv', estBdry_success)
-    append_to_file('trueSuccess'+str(nSub)+'_intrp.csv', trueBdry_success_intrp) 
-    append_to_file('estSuccess'+str(nSub)+'_intrp.csv', estBdry_success_intrp)
+    # Record if we saw a violation in the estimated boundary based sets
+    # (assessed with interpolation)
+    estBdry_success_intrp = get_success(crit_intrp, a_estBdry)
 
-    t2overall = time.time()
+    # Return the successes and the number of bootstraps for this realization
+    return(trueBdry_success, estBdry_success, trueBdry_success_intrp, estBdry_success_intrp, nBoot_used)
 
-    print('overall time: ', t2overall-t1overall)
 
 # Run example
 SpatialSims('/home/tommaullin/Documents/ConfSets/',100, {'type': 'ramp2D', 'a': 1, 'b': 3, 'orient': 'horizontal'}, 5, 2, np.linspace(0,1,21), interpBootMode=2)
@@ -2,7 +2,15 @@ import os
 import numpy as np
 from lib.generateData import *
 from lib.boundary import *
+from lib.bootstrap import *
+from lib.truePlan import *
+from lib.coverage import *
+from lib.streaming import *
+from lib.rng import *
+from lib.parallel import *
 from lib.fileio import *
+from lib.noiseBank import *
+from lib.workspace import *
 import yaml
 from scipy.ndimage.measurements import label
 import matplotlib.pyplot as plt
@@ -24,7 +32,8 @@ import matplotlib.pyplot as plt
 # - `OutDir`: Output directory.
 # - `nSub`: Number of subjects.
 # - `nReals`: Number of realizations.
-# - `c`: threshold of interest for mu.
+# - `c`: threshold of interest for mu (or a string giving a numpy array of
+#        thresholds, which are then all run on the same data).
 # - `p`: numpy array of p-values.
 # - `simNo`: Number under which results will be saved
 #
@@ -50,14 +59,32 @@ def SpatialSims_2mu(ipath):
     # Get output directory
     OutDir = inputs['OutDir']
 
+    # If this configuration is part of a nested sample size design (and is 
+    # not the configuration with the largest sample size), it is run by the
+    # configuration with the largest sample size
+    if 'nestedIn' in inputs:
+        print('Run by configuration ', inputs['nestedIn'])
+        return
+
     # Get number of subjects
     nSub = int(inputs['nSub'])
 
     # Get number of simulation realizations
     nReals = int(inputs['nReals'])
 
-    # Get Threshold
-    c = np.float(inputs['c'])
+    # Get Threshold. Several thresholds can be given at once (as a string
+    # giving a numpy array, like p), in which case every threshold is run on
+    # the same data, residuals and bootstrap variables and the results for 
+    # each threshold are saved in their own folder.
+    if isinstance(inputs['c'], str):
+        cs = [float(c) for c in np.atleast_1d(eval(inputs['c']))]
+        multiC = True
+    else:
+        cs = [float(inputs['c'])]
+        multiC = False
+
+    # Number of thresholds
+    nCs = len(cs)
 
     # Get p values
     p = eval(inputs['p'])
@@ -89,11 +116,79 @@ def SpatialSims_2mu(ipath):
     else:
         nBoot = 5000 # Recommended 1e4 
 
-    # Get number of bootstraps
-    if 'tau' in inputs:
-        tau = eval(inputs['tau'])
+    # Get number of bootstraps to perform at once
+    if 'bootBlockSize' in inputs:
+        bootBlockSize = int(inputs['bootBlockSize'])
     else:
-        tau = 1/np.sqrt(nSub)
+        bootBlockSize = BOOT_BLOCK_SIZE
+
+    # Get the tolerance for the adaptive bootstrap. If this is given, the 
+    # bootstrap stops once the confidence interval for every percentile has
+    # half-width at most bootTol (and nBoot is then the maximum number of 
+    # bootstraps)
+    if 'bootTol' in inputs:
+        bootTol = float(inputs['bootTol'])
+    else:
+        bootTol = None
+
+    # Get the backend used to run the bootstrap ('numpy', or 'numba' for the
+    # fused bootstrap kernel, which falls back to NumPy if numba is not
+    # installed, see `get_boot_backend`)
+    if 'bootBackend' in inputs:
+        bootBackend = get_boot_backend(inputs['bootBackend'])
+    else:
+        bootBackend = 'numpy'
+
+    # Get the tolerance for sequential stopping of the realizations. If this
+    # is given, the (interpolated) coverage confidence intervals are checked
+    # every realCheck realizations and the realizations stop once every 
+    # monitored p-value has half-width at most realTol (and nReals is then 
+    # the maximum number of realizations)
+    if 'realTol' in inputs:
+        realTol = float(inputs['realTol'])
+    else:
+        realTol = None
+
+    # Get number of realizations to run between checks of the intervals
+    if 'realCheck' in inputs:
+        realCheck = int(inputs['realCheck'])
+    else:
+        realCheck = REAL_CHECK
+
+    # Get the p-values monitored when stopping the realizations sequentially
+    # (by default, all of them)
+    if 'realP' in inputs:
+        realMonitor = np.any(np.isclose(np.reshape(p,(-1,1)), np.reshape(eval(inputs['realP']),(1,-1))),axis=1)
+    else:
+        realMonitor = None
+
+    # Get number of subjects to generate at once. If this is given, the data
+    # are streamed a block of subjects at a time (in two passes) rather than
+    # all being held in memory at once.
+    if 'subBlockSize' in inputs:
+        subBlockSize = int(inputs['subBlockSize'])
+    else:
+        subBlockSize = None
+
+    # Get the floating point type of the data (float64 or float32). In 
+    # float32 the noise, data, residuals and bootstrap are all held in 
+    # single precision (halving their memory), while the means and sums of
+    # squares are still accumulated in float64. The coverage obtained in 
+    # float32 should agree with that in float64 within Monte Carlo error 
+    # (this can be checked with `get_coverage_agreement`).
+    if 'dtype' in inputs:
+        dtype = np.dtype(inputs['dtype'])
+        if dtype not in (np.float32, np.float64):
+            raise ValueError('dtype must be float32 or float64.')
+    else:
+        dtype = np.dtype(np.float64)
+
+    # Get number of worker processes to run the realizations in (if this is
+    # more than 1 the realizations are run in parallel)
+    if 'nWorkers' in inputs:
+        nWorkers = int(inputs['nWorkers'])
+    else:
+        nWorkers = 1
 
     # Get specification for mu 1
     muSpec1 = inputs['mu1']
@@ -116,15 +211,74 @@ def SpatialSims_2mu(ipath):
     # ID for the configuration
     cfgId = inputs['cfgId']
 
+    # Get the root seed and bit generator for the random number generators
+    # (if no seed is given the legacy global generator is used)
+    seed, bitGenerator = get_root_seed(inputs)
+
+    # Realizations run in parallel must draw from their own streams, so if we
+    # have no root seed we make one
+    if nWorkers > 1 and seed is None:
+        seed = int(np.random.SeedSequence().entropy)
+        print('Root seed: ', seed)
+
+    # Get the noise bank. If this is given, the noise for each realization
+    # is read from a bank of noise fields on disk (shared by every
+    # configuration with the same noise and root seed) rather than being
+    # generated, and noiseBankSize is the maximum size of the bank in
+    # gigabytes (see `get_bank_noise`)
+    if 'noiseBank' in inputs:
+        if 'noiseBankSize' in inputs:
+            noiseBank = get_noise_bank(inputs['noiseBank'], inputs['noiseBankSize'], seed, bitGenerator)
+        else:
+            noiseBank = get_noise_bank(inputs['noiseBank'], None, seed, bitGenerator)
+    else:
+        noiseBank = None
+
     # Bootstrap mode
     mode = inputs['mode']
 
+    # Get the configurations in a nested sample size design. If this is 
+    # given, every sample size in the design is run at once, each using the
+    # first nSub subjects of the same data (this configuration must have the 
+    # largest sample size). Otherwise, we only run this configuration.
+    if 'nestedCfgIds' in inputs:
+        cfgIds = [int(cfgId_k) for cfgId_k in inputs['nestedCfgIds']]
+    else:
+        cfgIds = [cfgId]
+
+    # Get the number of subjects and whether to make figures for each
+    # configuration
+    nSubs = []
+    figGens = []
+    for cfgId_k in cfgIds:
+
+        # Read in the inputs for this configuration
+        if cfgId_k == cfgId:
+            inputs_k = inputs
+        else:
+            with open(os.path.join(OutDir, 'sim'+str(simNo), 'cfgs', 'cfg'+str(cfgId_k)+'.yml'), 'r') as stream:
+                inputs_k = yaml.load(stream,Loader=yaml.FullLoader)
+
+        # Record them
+        nSubs.append(int(inputs_k['nSub']))
+        figGens.append(inputs_k['figGen'])
+
+    # Get tau for each configuration
+    if 'tau' in inputs:
+        taus = [eval(inputs['tau'], globals(), {'nSub': nSub_k}) for nSub_k in nSubs]
+    else:
+        taus = [1/np.sqrt(nSub_k) for nSub_k in nSubs]
+
+    # Number of configurations we are running
+    nCfgs = len(cfgIds)
+
     # -----------------------------------------------------------------------
 
-    # Simulation directory
-    simDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId))
-    if not os.path.exists(simDir):
-        os.mkdir(simDir)
+    # Simulation directory for each configuration
+    simDirs = [os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId_k)) for cfgId_k in cfgIds]
+    for simDir in simDirs:
+        if not os.path.exists(simDir):
+            os.mkdir(simDir)
 
     # Timing
     t1overall = time.time()
@@ -132,1152 +286,1294 @@ def SpatialSims_2mu(ipath):
     # Get the number of p-values we're looking at
     nPvals = len(p)
 
-    # Dimensions of simulated data
-    data_dim = np.array([nSub, 100,100])
-
-    # Dimensions of bootstrap variables
-    boot_dim = np.array([nSub, 1]) # : COULD MAKE  np.array([batchBoot, nSub, 1])
+    # Dimensions of simulated data (for the largest sample size)
+    data_dim = np.array([np.max(nSubs), 100,100])
 
 
     # Initialise array for recording the whether set violations occured, for a derived
     # from bootstrapping the true boundary and estimated boundary, respectively. The
     # result in these arrays are based on voxelwise assessment of set condition 
     # violations.
-    trueBdry_success = np.zeros((nReals,nPvals))
-    estBdry_success = np.zeros((nReals,nPvals))
+    trueBdry_success = np.zeros((nReals,nCfgs,nCs,nPvals))
+    estBdry_success = np.zeros((nReals,nCfgs,nCs,nPvals))
 
     # Initialise array for recording the whether set violations occured, for a derived
     # from bootstrapping the true boundary and estimated boundary, respectively. The
     # result in these arrays are based on interpolation based assessment of set
     # condition violations.
-    trueBdry_success_intrp = np.zeros((nReals,nPvals))
-    estBdry_success_intrp = np.zeros((nReals,nPvals))
-
-    # Loop through realizations
-    for r in np.arange(nReals):
-
-        print('r: ', r)
-        # -------------------------------------------------------------------
-        # Data generation
-        # -------------------------------------------------------------------
-
-        # Obtain data
-        data1, data2, mu1, mu2 = get_data(muSpec1,muSpec2,noiseSpec1,noiseSpec2, data_dim, noiseCorr)
-
-        #print('data shapes: ', data1.shape, data2.shape, mu1.shape, mu2.shape)
-
-        # -------------------------------------------------------------------
-        # Mean and variance estimates
-        # -------------------------------------------------------------------
-
-        # Obtain mu estimate
-        muHat1 = np.mean(data1, axis=0).reshape(mu1.shape)
-        muHat2 = np.mean(data2, axis=0).reshape(mu1.shape)
-
-        # Obtain sigma
-        sigma1 = np.std(data1, axis=0).reshape(mu1.shape)
-        sigma2 = np.std(data2, axis=0).reshape(mu1.shape)
-
-        # -------------------------------------------------------------------
-        # Boundary locations for Ac1 and Ac2
-        # -------------------------------------------------------------------
-        # Get boolean maps for the boundary of Ac1 and Ac2
-        Ac1_bdry_maps = get_bdry_maps(mu1, c)
-        Ac2_bdry_maps = get_bdry_maps(mu2, c)
-
-        # Get coordinates for the boundary of Ac1 and Ac2
-        Ac1_bdry_locs = get_bdry_locs(Ac1_bdry_maps)
-        Ac2_bdry_locs = get_bdry_locs(Ac2_bdry_maps)
-
-        # Delete maps as we no longer need them
-        del Ac1_bdry_maps, Ac2_bdry_maps
-
-        # -------------------------------------------------------------------
-        # Boundary locations for Fc (= Ac1 intersect Ac2)
-        # -------------------------------------------------------------------
-        # Get boolean maps for the boundary of Fc
-        Fc_bdry_maps = get_bdry_maps(np.minimum(mu1,mu2), c)
-
-        # Get coordinates for the boundary of Fc
-        Fc_bdry_locs = get_bdry_locs(Fc_bdry_maps)
-
-        # Delete maps as we no longer need them
-        del Fc_bdry_maps
-
-        # -------------------------------------------------------------------
-        # Boundary locations for AcHat1 and AcHat2
-        # -------------------------------------------------------------------
-        # Get boolean maps for the boundary of AcHat1 and AcHat2
-        AcHat1_bdry_maps = get_bdry_maps(muHat1, c)
-        AcHat2_bdry_maps = get_bdry_maps(muHat2, c)
-
-        # Get coordinates for the boundary of AcHat1 and AcHat2
-        AcHat1_bdry_locs = get_bdry_locs(AcHat1_bdry_maps)
-        AcHat2_bdry_locs = get_bdry_locs(AcHat2_bdry_maps)
-
-        # Delete maps as we no longer need them
-        del AcHat1_bdry_maps, AcHat2_bdry_maps 
-
-        # -------------------------------------------------------------------
-        # Boundary locations for FcHat(= AcHat1 intersect AcHat2)
-        # -------------------------------------------------------------------
-        # Get boolean maps for the boundary of FcHat
-        FcHat_bdry_maps = get_bdry_maps(np.minimum(muHat1,muHat2), c)
-
-        # Get coordinates for the boundary of FcHat
-        FcHat_bdry_locs = get_bdry_locs(FcHat_bdry_maps)
-
-        # Delete maps as we no longer need them
-        del FcHat_bdry_maps
-
-        # -------------------------------------------------------------------
-        # Interpolation weights for Ac1 and Ac2 boundary (Dict version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Ac1 and Ac2
-        Ac1_bdry_vals = get_bdry_values(mu1, Ac1_bdry_locs)
-        Ac2_bdry_vals = get_bdry_values(mu2, Ac2_bdry_locs)
-
-        # Obtain the weights along the boundary for Ac1 and Ac2
-        Ac1_bdry_weights = get_bdry_weights(Ac1_bdry_vals, c)
-        Ac2_bdry_weights = get_bdry_weights(Ac2_bdry_vals, c)
-
-        # Delete values as we no longer need them
-        del Ac1_bdry_vals, Ac2_bdry_vals
-
-        # -------------------------------------------------------------------
-        # Interpolation weights for Fc boundary (Dict version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Fc
-        Fc_bdry_vals = get_bdry_values(np.minimum(mu1,mu2), Fc_bdry_locs)
-
-        # Obtain the weights along the boundary for Fc
-        Fc_bdry_weights = get_bdry_weights(Fc_bdry_vals, c)
-
-        # Delete values as we no longer need them
-        del Fc_bdry_vals
-
-        # -------------------------------------------------------------------
-        # Interpolation weights for Ac1 and Ac2 boundary (Array version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Ac1 and Ac2
-        Ac1_bdry_vals_concat = get_bdry_values_concat(mu1, Ac1_bdry_locs)
-        Ac2_bdry_vals_concat = get_bdry_values_concat(mu2, Ac2_bdry_locs)
-
-        # Obtain the weights along the boundary for Ac1 and Ac2
-        Ac1_bdry_weights_concat = get_bdry_weights_concat(Ac1_bdry_vals_concat, c)
-        Ac2_bdry_weights_concat = get_bdry_weights_concat(Ac2_bdry_vals_concat, c)
-
-        # Delete values as we no longer need them
-        del Ac1_bdry_vals_concat, Ac2_bdry_vals_concat
+    trueBdry_success_intrp = np.zeros((nReals,nCfgs,nCs,nPvals))
+    estBdry_success_intrp = np.zeros((nReals,nCfgs,nCs,nPvals))
 
-        # -------------------------------------------------------------------
-        # Interpolation weights for Fc boundary (Array version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for Fc
-        Fc_bdry_vals_concat = get_bdry_values_concat(np.minimum(mu1,mu2), Fc_bdry_locs)
-
-        # Obtain the weights along the boundary for Fc
-        Fc_bdry_weights_concat = get_bdry_weights_concat(Fc_bdry_vals_concat, c)
- 
-        # Delete values as we no longer need them
-        del Fc_bdry_vals_concat
-
-        # -------------------------------------------------------------------
-        # Interpolation weights for AcHat1 and AcHat2 boundary (Array
-        # version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for AcHat1 and AcHat2
-        AcHat1_bdry_vals_concat = get_bdry_values_concat(muHat1, AcHat1_bdry_locs)
-        AcHat2_bdry_vals_concat = get_bdry_values_concat(muHat2, AcHat2_bdry_locs)
-
-        # Obtain the weights along the boundary for AcHat1 and AcHat2
-        AcHat1_bdry_weights_concat = get_bdry_weights_concat(AcHat1_bdry_vals_concat, c)
-        AcHat2_bdry_weights_concat = get_bdry_weights_concat(AcHat2_bdry_vals_concat, c)
-
-        # Delete values as we no longer need them
-        del AcHat1_bdry_vals_concat, AcHat2_bdry_vals_concat
-
-        # -------------------------------------------------------------------
-        # Interpolation weights for FcHat boundary (Array version)
-        # -------------------------------------------------------------------
-        # Obtain the values along the boundary for FcHat
-        FcHat_bdry_vals_concat = get_bdry_values_concat(np.minimum(muHat1,muHat2), FcHat_bdry_locs)
+    # Initialise array for recording the number of bootstraps used in each 
+    # realization
+    nBoot_used = np.zeros((nReals,nCfgs,nCs))
 
-        # Obtain the weights along the boundary for FcHat
-        FcHat_bdry_weights_concat = get_bdry_weights_concat(FcHat_bdry_vals_concat, c)
-
-        # Delete values as we no longer need them
-        del FcHat_bdry_vals_concat
-
-        # -------------------------------------------------------------------
-        # Residuals along dFcHat
-        # -------------------------------------------------------------------
-
-        # Obtain residuals
-        resid1 = (data1-muHat1)/sigma1
-        resid2 = (data2-muHat2)/sigma2
-
-        # Residuals along Fc boundary
-        resid1_dFc_concat = get_bdry_values_concat(resid1, Fc_bdry_locs)
-        resid2_dFc_concat = get_bdry_values_concat(resid2, Fc_bdry_locs)
+    # -----------------------------------------------------------------------
+    # True boundary plan
+    # -----------------------------------------------------------------------
+    # Mu1 and mu2 (and everything derived from them) are the same for every
+    # realization, so we only work them out once (for each threshold).
+    thresholds = []
+    for c in cs:
 
-        # Residuals along FcHat boundary
-        resid1_FcHat_bdry_concat = get_bdry_values_concat(resid1, FcHat_bdry_locs)
-        resid2_FcHat_bdry_concat = get_bdry_values_concat(resid2, FcHat_bdry_locs)
+        # Get the true boundary plan for this threshold
+        truePlan = get_true_plan([muSpec1, muSpec2], data_dim, c)
 
-        # Delete residuals as they are no longer needed
-        #del data1, data2
+        # Obtain mu1 and mu2
+        mu1 = truePlan['mus'][0:1,...]
+        mu2 = truePlan['mus'][1:2,...]
 
-        # -------------------------------------------------------------------
-        # Mu along FsdGcHat and MuHat along FsdGcHat
-        # -------------------------------------------------------------------
+        # Get coordinates for the boundary of Fc (= Ac1 intersect Ac2)
+        Fc_bdry_locs = truePlan['Fc_bdry_locs']
 
         # Obtain Mu along Fc
-        mu1_Fc_bdry_concat = get_bdry_values_concat(mu1, Fc_bdry_locs)
-        mu2_Fc_bdry_concat = get_bdry_values_concat(mu2, Fc_bdry_locs)
-
-        # -------------------------------------------------------------------
-        # Images
-        # -------------------------------------------------------------------
-        if r==1 and inputs['figGen']:
-            
-            # Make image directory
-            figDir = os.path.join(OutDir, 'sim'+str(simNo), 'Figures')
-            if not os.path.exists(figDir):
-                os.mkdir(figDir)
-
-            # AcHat1
-            AcHat1_im = muHat1>c
-            plt.figure(0)
-            plt.imshow(1*AcHat1_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'AcHat1_cfg'+str(cfgId)+'.png'))
-
-            # dAcHat1
-            dAcHat1_im = get_bdry_map_combined(muHat1, c)
-            plt.figure(1)
-            plt.imshow(1*dAcHat1_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dAcHat1_cfg'+str(cfgId)+'.png'))
-
-            # AcHat2
-            AcHat2_im = muHat2>c
-            plt.figure(2)
-            plt.imshow(1*AcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'AcHat2_cfg'+str(cfgId)+'.png'))
-
-            # dAcHat2
-            dAcHat2_im = get_bdry_map_combined(muHat2, c)
-            plt.figure(3)
-            plt.imshow(1*dAcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dAcHat2_cfg'+str(cfgId)+'.png'))
-
-            # AcHat1 \cup AcHat2
-            AcHat1cupAcHat2_im = np.maximum(muHat1,muHat2)>c
-            plt.figure(4)
-            plt.imshow(1*AcHat1cupAcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'GcHat_cfg'+str(cfgId)+'.png'))
-
-            # d(AcHat1 \cup AcHat2)
-            dAcHat1cupAcHat2_im = get_bdry_map_combined(np.maximum(muHat1,muHat2),c)
-            plt.figure(5)
-            plt.imshow(1*dAcHat1cupAcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dGcHat_cfg'+str(cfgId)+'.png'))
-
-            # AcHat1 \cap AcHat2
-            AcHat1capAcHat2_im = np.minimum(muHat1,muHat2)>c
-            plt.figure(6)
-            plt.imshow(1*AcHat1capAcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'FcHat_cfg'+str(cfgId)+'.png'))
-
-            # d(AcHat1 \cap AcHat2)
-            dAcHat1capAcHat2_im = get_bdry_map_combined(np.minimum(muHat1,muHat2),c)
-            plt.figure(7)
-            plt.imshow(1*dAcHat1capAcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dFcHat_cfg'+str(cfgId)+'.png'))
-
-            # dF12cHat = dAcHat1 \cap dAcHat2
-            dAcHat1capdAcHat2_im = dAcHat1capAcHat2_im*dAcHat1cupAcHat2_im
-            plt.figure(8)
-            plt.imshow(1*dAcHat1capdAcHat2_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dF12cHat_cfg'+str(cfgId)+'.png'))
-
-            # dF1cHat = dAcHat1 \cap AcHat2
-            rhs_im = dAcHat1_im*AcHat2_im
-            plt.figure(10)
-            plt.imshow(1*rhs_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dF1cHat_cfg'+str(cfgId)+'.png'))
-
-            # dF2cHat = dAcHat2 \cap AcHat1
-            lhs_im = dAcHat2_im*AcHat1_im
-            plt.figure(9)
-            plt.imshow(1*lhs_im[0,:,:])
-            plt.savefig(os.path.join(figDir, 'dF2cHat_cfg'+str(cfgId)+'.png'))
-
-            # muHat1
-            plt.figure(11)
-            plt.imshow(muHat1[0,:,:])
-            plt.colorbar()
-            plt.savefig(os.path.join(figDir, 'muHat1_cfg'+str(cfgId)+'.png'))
-
-            # muHat2
-            plt.figure(12)
-            plt.imshow(muHat2[0,:,:])
-            plt.colorbar()
-            plt.savefig(os.path.join(figDir, 'muHat2_cfg'+str(cfgId)+'.png'))
-
-            # data1
-            plt.figure(13)
-            plt.imshow(data1[10,:,:])
-            plt.colorbar()
-            plt.savefig(os.path.join(figDir, 'data1_cfg'+str(cfgId)+'.png'))
-
-            # data2
-            plt.figure(14)
-            plt.imshow(data2[10,:,:])
-            plt.colorbar()
-            plt.savefig(os.path.join(figDir, 'data2_cfg'+str(cfgId)+'.png'))
-
-            # max(muHat1,muHat2)
-            plt.figure(15)
-            plt.imshow(np.maximum(muHat1[0,:,:],muHat2[0,:,:]))
-            plt.colorbar()
-            plt.savefig(os.path.join(figDir, 'maxMuHat_cfg'+str(cfgId)+'.png'))
-
-            # min(muHat1,muHat2)
-            plt.figure(16)
-            plt.imshow(np.minimum(muHat1[0,:,:],muHat2[0,:,:]))
-            plt.colorbar()
-            plt.savefig(os.path.join(figDir, 'minMuHat_cfg'+str(cfgId)+'.png'))
-
-
-        # print('shapes here : ', mu1_Fc_bdry_concat.shape,resid1_dFc_concat.shape)
-
-        # Get locations where outer mu1 and mu2 are greater than c
-        d1Fc_loc = np.where(mu2_Fc_bdry_concat[0,:,1]>c)[0]
-        d2Fc_loc = np.where(mu1_Fc_bdry_concat[0,:,1]>c)[0]
-        d12Fc_loc = np.where((mu2_Fc_bdry_concat[0,:,1]<= c)*(mu1_Fc_bdry_concat[0,:,1]<=c))[0]
-
-        # print(resid1_dFc_concat[:,d1Fc_loc,:].shape)
-        # print(resid2_dFc_concat[:,d2Fc_loc,:].shape)
-
-        # Obtain MuHat along Fc
-        muHat1_FcHat_bdry_concat = get_bdry_values_concat(muHat1, FcHat_bdry_locs)
-        muHat2_FcHat_bdry_concat = get_bdry_values_concat(muHat2, FcHat_bdry_locs)
-
-        # print('shapes here : ', muHat1_FcHat_bdry_concat.shape,resid1_FcHat_bdry_concat.shape)
-
-        # Get locations where outer muHat1 and muHat2 are greater than c
-        d1FcHat_loc = np.where(muHat2_FcHat_bdry_concat[0,:,1]>c)[0]
-        d2FcHat_loc = np.where(muHat1_FcHat_bdry_concat[0,:,1]>c)[0]
-        d12FcHat_loc = np.where((muHat2_FcHat_bdry_concat[0,:,1]<= c)*(muHat1_FcHat_bdry_concat[0,:,1]<=c))[0]
-
-        # print(resid1_FcHat_bdry_concat[:,d1FcHat_loc,:].shape)
-        # print(resid2_FcHat_bdry_concat[:,d2FcHat_loc,:].shape)
+        mu1_Fc_bdry_concat = truePlan['mus_dFc'][0:1,...]
+        mu2_Fc_bdry_concat = truePlan['mus_dFc'][1:2,...]
+
+        # Get locations where outer mu1 and mu2 are greater than c. The label of
+        # each point records which of the fields have outer mu less than or 
+        # equal to c (1: mu1 only, 2: mu2 only, 3: both).
+        d1Fc_loc = truePlan['dFc_order'][truePlan['dFc_labels']==1]
+        d2Fc_loc = truePlan['dFc_order'][truePlan['dFc_labels']==2]
+        d12Fc_loc = truePlan['dFc_order'][truePlan['dFc_labels']==3]
+
+        # Mu along dkFc. We bootstrap the residuals for field 1 along dAc1 
+        # intersect Ac2 i.e. along dF where mu2 > c. And vice versa for field 2.
+        mu1_d1Fc_concat = mu1_Fc_bdry_concat[:,d1Fc_loc,:]
+        mu2_d2Fc_concat = mu2_Fc_bdry_concat[:,d2Fc_loc,:]
 
-        # -------------------------------------------------------------------
-        # Residuals along dkFc and dkFcHat boundaries (Array version)
-        # -------------------------------------------------------------------
-        # In this simulation we are bootstrapping the residuals for field 1
-        # along dAc1 intersect Ac2 i.e. along dF where mu2 > c. And vice versa
-        # for field 2.
-        resid1_d1Fc_concat = resid1_dFc_concat[:,d1Fc_loc,:]
-        resid2_d2Fc_concat = resid2_dFc_concat[:,d2Fc_loc,:]
-
-        # In this simulation we are bootstrapping the residuals for field 1
-        # along dAcHat1 intersect AcHat2 i.e. along dF where muHat2 > c. And 
-        # vice versa for field 2.
-        resid1_d1FcHat_concat = resid1_FcHat_bdry_concat[:,d1FcHat_loc,:]
-        resid2_d2FcHat_concat = resid2_FcHat_bdry_concat[:,d2FcHat_loc,:]
+        # Obtain the weights along the boundary for dkFc
+        d1Fc_bdry_weights_concat = get_bdry_weights_concat(mu1_d1Fc_concat, c)
+        d2Fc_bdry_weights_concat = get_bdry_weights_concat(mu2_d2Fc_concat, c)
 
         # If we are in mode 2 or 3 we need to bootstrap along the intersection
         # boundary as well
         if mode == 2 or mode == 3:
 
-            # For true boundary
-            resid1_d12Fc_concat = resid1_dFc_concat[:,d12Fc_loc,:]
-            resid2_d12Fc_concat = resid2_dFc_concat[:,d12Fc_loc,:]
+            # Mu along d12Fc
+            mu1_d12Fc_concat = mu1_Fc_bdry_concat[:,d12Fc_loc,:]
+            mu2_d12Fc_concat = mu2_Fc_bdry_concat[:,d12Fc_loc,:]
 
-            # For estimated boundary
-            resid1_d12FcHat_concat = resid1_FcHat_bdry_concat[:,d12FcHat_loc,:]
-            resid2_d12FcHat_concat = resid2_FcHat_bdry_concat[:,d12FcHat_loc,:]
+            # Obtain the weights along the boundary for d12Fc
+            d12Fc_mu1_bdry_weights_concat = get_bdry_weights_concat(mu1_d12Fc_concat, c)
+            d12Fc_mu2_bdry_weights_concat = get_bdry_weights_concat(mu2_d12Fc_concat, c)
 
-        # -------------------------------------------------------------------
-        # Mu and MuHat along dkFc and dkFcHat boundaries (Array version)
-        # -------------------------------------------------------------------
-        # In this simulation we are bootstrapping the residuals for field 1
-        # along dAc1 intersect Ac2 i.e. along dF where mu2 > c. And vice versa
-        # for field 2.
-        mu1_d1Fc_concat = mu1_Fc_bdry_concat[:,d1Fc_loc,:]
-        mu2_d2Fc_concat = mu2_Fc_bdry_concat[:,d2Fc_loc,:]
+        # Number of voxels in each field (with singleton dimensions removed) and
+        # the number of non-singleton dimensions. Voxel indices into field 2 are
+        # offset by nVox so that they index into the stack of both fields.
+        nVox = np.prod(Fc_bdry_locs['edges']['shape'])
+        nDims = len(Fc_bdry_locs['edges']['shape'])
 
-        # In this simulation we are bootstrapping the residuals for field 1
-        # along dAcHat1 intersect AcHat2 i.e. along dF where muHat2 > c. And 
-        # vice versa for field 2.
-        muHat1_d1FcHat_concat = muHat1_FcHat_bdry_concat[:,d1FcHat_loc,:]
-        muHat2_d2FcHat_concat = muHat2_FcHat_bdry_concat[:,d2FcHat_loc,:]
+        # Flat voxel indices along Fc
+        inds_dFc = get_bdry_inds_concat(Fc_bdry_locs)
 
-        # If we are in mode 2 or 3 we need to bootstrap along the intersection
-        # boundary as well
+        # Obtain Fc
+        Fc = truePlan['cap_mu'] > c
+
+        # Record everything which depends on the threshold
+        thresh = {}
+        thresh['c'] = c
+        thresh['Fc'] = Fc
+        thresh['inds_dFc'] = inds_dFc
+        thresh['d1Fc_loc'] = d1Fc_loc
+        thresh['d2Fc_loc'] = d2Fc_loc
+        thresh['d12Fc_loc'] = d12Fc_loc
+        thresh['d1Fc_bdry_weights_concat'] = d1Fc_bdry_weights_concat
+        thresh['d2Fc_bdry_weights_concat'] = d2Fc_bdry_weights_concat
+        thresh['Fc_bdry_locs'] = Fc_bdry_locs
+
+        # The weights along the intersection boundary are only needed in
+        # modes 2 and 3
         if mode == 2 or mode == 3:
-            
-            # For true boundary
-            mu1_d12Fc_concat = mu1_Fc_bdry_concat[:,d12Fc_loc,:]
-            mu2_d12Fc_concat = mu2_Fc_bdry_concat[:,d12Fc_loc,:]
+            thresh['d12Fc_mu1_bdry_weights_concat'] = d12Fc_mu1_bdry_weights_concat
+            thresh['d12Fc_mu2_bdry_weights_concat'] = d12Fc_mu2_bdry_weights_concat
 
-            # For estimated boundary
-            muHat1_d12FcHat_concat = muHat1_FcHat_bdry_concat[:,d12FcHat_loc,:]
-            muHat2_d12FcHat_concat = muHat2_FcHat_bdry_concat[:,d12FcHat_loc,:]
+        # Save them
+        thresholds.append(thresh)
 
+    # -----------------------------------------------------------------------
+    # Realizations
+    # -----------------------------------------------------------------------
+    # Everything the realizations need which is the same for every
+    # realization
+    consts = {}
+    consts['seed'] = seed
+    consts['simNo'] = simNo
+    consts['cfgId'] = cfgId
+    consts['bitGenerator'] = bitGenerator
+    consts['noiseBank'] = noiseBank
+    consts['subBlockSize'] = subBlockSize
+    consts['dtype'] = dtype
+    consts['mu1'] = mu1
+    consts['mu2'] = mu2
+    consts['muSpec1'] = muSpec1
+    consts['muSpec2'] = muSpec2
+    consts['noiseSpec1'] = noiseSpec1
+    consts['noiseSpec2'] = noiseSpec2
+    consts['data_dim'] = data_dim
+    consts['noiseCorr'] = noiseCorr
+    consts['cfgIds'] = cfgIds
+    consts['figGens'] = figGens
+    consts['OutDir'] = OutDir
+    consts['nVox'] = nVox
+    consts['mode'] = mode
+    consts['nSubs'] = nSubs
+    consts['nDims'] = nDims
+    consts['nBoot'] = nBoot
+    consts['bootBlockSize'] = bootBlockSize
+    consts['bootTol'] = bootTol
+    consts['bootBackend'] = bootBackend
+    consts['p'] = p
+    consts['nPvals'] = nPvals
+    consts['taus'] = taus
+    consts['thresholds'] = thresholds
+
+    # If we are stopping sequentially, stop once the confidence intervals for
+    # the interpolated coverage (the running means of the third and fourth 
+    # results of each realization) are all narrow enough
+    if realTol is not None:
+        def stop(results):
+            return(get_coverage_converged([[res[2] for res in results],[res[3] for res in results]], realTol, realMonitor))
+    else:
+        stop = None
 
-        # print('marker')
-        # print(mu1_d1Fc_concat.shape)
-        # print(mu1_Fc_bdry_concat.shape)
-        # print(d2Fc_loc.shape)
-        # print(mu2_d2Fc_concat.shape)
-        # print(mu2_Fc_bdry_concat.shape)
-        # print(d1Fc_loc.shape)
-        # print(muHat1_d1FcHat_concat.shape)
+    # Run the realizations (sharded across a pool of nWorkers processes if
+    # nWorkers > 1), in order
+    results = get_realizations(SpatialSims_2mu_real, consts, nReals, nWorkers, stop, realCheck)
 
-        # print('marker2')
-        # print(d1FcHat_loc.shape)
-        # print(d2FcHat_loc.shape)
-        # print(d12FcHat_loc.shape)
-        # print(muHat1_FcHat_bdry_concat.shape)
+    # Free the workspace used by the realizations run in this process
+    free_workspace()
 
-        # -------------------------------------------------------------------
-        # Interpolation weights dkFc and dkFcHat boundaries (Array version)
-        # -------------------------------------------------------------------
-        # Obtain the weights along the boundary for dkFc
-        d1Fc_bdry_weights_concat = get_bdry_weights_concat(mu1_d1Fc_concat, c)
-        d2Fc_bdry_weights_concat = get_bdry_weights_concat(mu2_d2Fc_concat, c)
+    # Number of realizations actually run
+    nReals = len(results)
 
-        # Obtain the weights along the boundary for dkFcHat
-        d1FcHat_weights_concat = get_bdry_weights_concat(muHat1_d1FcHat_concat, c)
-        d2FcHat_weights_concat = get_bdry_weights_concat(muHat2_d2FcHat_concat, c)
+    # Record whether each realization observed successful sets (and the 
+    # number of bootstraps it used)
+    for r in np.arange(nReals):
+        trueBdry_success[r,:], estBdry_success[r,:], trueBdry_success_intrp[r,:], estBdry_success_intrp[r,:], nBoot_used[r,:] = results[r]
+
+    # Remove any realizations we did not run
+    trueBdry_success = trueBdry_success[:nReals,...]
+    estBdry_success = estBdry_success[:nReals,...]
+    trueBdry_success_intrp = trueBdry_success_intrp[:nReals,...]
+    estBdry_success_intrp = estBdry_success_intrp[:nReals,...]
+    nBoot_used = nBoot_used[:nReals,:]
+
+    # Loop through the configurations (there is more than one if this is a
+    # nested sample size design) and thresholds
+    for k in np.arange(nCfgs):
+
+        # Simulation directory for this configuration
+        simDir = simDirs[k]
+
+        # Loop through the thresholds
+        for j in np.arange(nCs):
+
+            # Results for this configuration and threshold
+            trueBdry_success_k = trueBdry_success[:,k,j,:]
+            estBdry_success_k = estBdry_success[:,k,j,:]
+            trueBdry_success_intrp_k = trueBdry_success_intrp[:,k,j,:]
+            estBdry_success_intrp_k = estBdry_success_intrp[:,k,j,:]
+            nBoot_used_k = nBoot_used[:,k,j:j+1]
+
+            # Coverage probabilities
+            coverage_trueBdry = np.mean(trueBdry_success_k,axis=0)
+            coverage_estBdry = np.mean(estBdry_success_k,axis=0)
+
+            # Coverage probabilities
+            coverage_trueBdry_intrp = np.mean(trueBdry_success_intrp_k,axis=0)
+            coverage_estBdry_intrp = np.mean(estBdry_success_intrp_k,axis=0)
+
+            # Control variate estimates of the coverage for the estimated 
+            # boundary (using the true boundary successes as the control), and 
+            # their standard errors
+            coverage_estBdry_cv, se_estBdry_cv = get_cv_coverage(estBdry_success_k, trueBdry_success_k, p)
+            coverage_estBdry_intrp_cv, se_estBdry_intrp_cv = get_cv_coverage(estBdry_success_intrp_k, trueBdry_success_intrp_k, p)
+
+            # print(coverage_trueBdry)
+            # print(coverage_estBdry)
+            # print(coverage_trueBdry_intrp)
+            # print(coverage_estBdry_intrp)
+
+            # Make results folder
+            if not os.path.exists(os.path.join(simDir, 'RawResults')):
+                os.mkdir(os.path.join(simDir, 'RawResults'))
+
+            # Folder for the results for this threshold (if there are several
+            # thresholds, each gets its own folder in the results folder)
+            if multiC:
+                resDir = os.path.join(simDir, 'RawResults', 'c'+('%g' % cs[j]))
+            else:
+                resDir = os.path.join(simDir, 'RawResults')
+            if not os.path.exists(resDir):
+                os.mkdir(resDir)
+
+            # Save the violations to a file
+            append_to_file(os.path.join(resDir, 'trueSuccess.csv'), trueBdry_success_k) # Successes based on the true boundary (assessed without interpolation)
+            append_to_file(os.path.join(resDir, 'estSuccess.csv'), estBdry_success_k) # Successes based on the interpolated boundary (assessed without interpolation) 
+            append_to_file(os.path.join(resDir, 'trueSuccess_intrp.csv'), trueBdry_success_intrp_k) # Successes based on the true boundary (assessed with interpolation)
+            append_to_file(os.path.join(resDir, 'estSuccess_intrp.csv'), estBdry_success_intrp_k) # Successes based on the interpolated boundary (assessed with interpolation) 
+            append_to_file(os.path.join(resDir, 'nBoot.csv'), nBoot_used_k) # Number of bootstraps used in each realization
+            append_to_file(os.path.join(resDir, 'nReals.csv'), np.array([[nReals]])) # Number of realizations run
+            append_to_file(os.path.join(resDir, 'trueSuccess_intrp_ci.csv'), np.array(get_coverage_ci(trueBdry_success_intrp_k))) # Confidence interval (lower and upper rows) for the coverage based on the true boundary (assessed with interpolation)
+            append_to_file(os.path.join(resDir, 'estSuccess_intrp_ci.csv'), np.array(get_coverage_ci(estBdry_success_intrp_k))) # Confidence interval (lower and upper rows) for the coverage based on the interpolated boundary (assessed with interpolation)
+            append_to_file(os.path.join(resDir, 'estSuccess_cv.csv'), np.array([coverage_estBdry_cv, se_estBdry_cv])) # Control variate estimate (first row) and standard error (second row) of the coverage based on the interpolated boundary (assessed without interpolation)
+            append_to_file(os.path.join(resDir, 'estSuccess_intrp_cv.csv'), np.array([coverage_estBdry_intrp_cv, se_estBdry_intrp_cv])) # Control variate estimate (first row) and standard error (second row) of the coverage based on the interpolated boundary (assessed with interpolation)
+
+            # Save the computation times (for a nested design or several
+            # thresholds, this is the time taken to run all of them)
+            t2overall = time.time()
+            append_to_file(os.path.join(resDir, 'computationTime.csv'), np.array([t2overall-t1overall]))
 
-        # If we are in mode 2 or 3 we need to bootstrap along the intersection
-        # boundary as well
-        if mode == 2 or mode == 3:
-            
-            # For true boundary
-            d12Fc_mu1_bdry_weights_concat = get_bdry_weights_concat(mu1_d12Fc_concat, c)
-            d12Fc_mu2_bdry_weights_concat = get_bdry_weights_concat(mu2_d12Fc_concat, c)
 
-            # For estimated boundary
-            d12FcHat_muHat1_weights_concat = get_bdry_weights_concat(muHat1_d12FcHat_concat, c)
-            d12FcHat_muHat2_weights_concat = get_bdry_weights_concat(muHat2_d12FcHat_concat, c)
+# ===========================================================================
+#
+# This function runs a single realization of `SpatialSims_2mu`. It is run
+# for every realization by `get_realizations` (serially, or in a pool of
+# worker processes). The data are generated once, for the largest sample 
+# size, and the first nSub subjects of the data are then used for each 
+# sample size (see `SpatialSims_2mu_nSub`). Likewise, the same data,
+# residuals and bootstrap variables are used for every threshold.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `r`: The realization number.
+# - `consts`: Dictionary of everything which is the same for every 
+#             realization (the inputs, mu1 and mu2 and the true boundary
+#             quantities computed in `SpatialSims_2mu`). These must not be
+#             modified.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `trueBdry_success`, `estBdry_success`: Whether the sets based on the
+#                                          true and estimated boundary were
+#                                          successful, for each sample 
+#                                          size, threshold and p-value
+#                                          (assessed without interpolation).
+# - `trueBdry_success_intrp`, `estBdry_success_intrp`: As above, assessed 
+#                                                      with interpolation.
+# - `nBoot_used`: The number of bootstraps used for each sample size and 
+#                threshold (this is nBoot unless the bootstrap is adaptive, 
+#                see `get_boot_converged`).
+#
+# ===========================================================================
+def SpatialSims_2mu_real(r, consts):
 
-        # -------------------------------------------------------------------
-        # True and estimated excursion sets
-        # -------------------------------------------------------------------
-        # Obtain Ac1 and Ac2
-        Ac1 = mu1 > c
-        Ac2 = mu2 > c
+    # -----------------------------------------------------------------------
+    # Unpack the constants
+    # -----------------------------------------------------------------------
+    seed = consts['seed']
+    simNo = consts['simNo']
+    cfgId = consts['cfgId']
+    bitGenerator = consts['bitGenerator']
+    noiseBank = consts['noiseBank']
+    subBlockSize = consts['subBlockSize']
+    dtype = consts['dtype']
+    mu1 = consts['mu1']
+    mu2 = consts['mu2']
+    muSpec1 = consts['muSpec1']
+    muSpec2 = consts['muSpec2']
+    noiseSpec1 = consts['noiseSpec1']
+    noiseSpec2 = consts['noiseSpec2']
+    data_dim = consts['data_dim']
+    noiseCorr = consts['noiseCorr']
+    nSubs = consts['nSubs']
+    thresholds = consts['thresholds']
+
+    print('r: ', r)
+
+    # Workspace for this configuration (the arrays in this are reused by 
+    # every realization, see `get_workspace`)
+    workspace = get_workspace(data_dim, 2, consts['nBoot'], consts['bootBlockSize'], subBlockSize is None, dtype)
 
-        # Obtain Fc
-        Fc = np.minimum(mu1,mu2) > c
+    # -----------------------------------------------------------------------
+    # Random number generators
+    # -----------------------------------------------------------------------
 
-        # Obtain AcHat2 and AcHat2 
-        AcHat1 = muHat1 > c
-        AcHat2 = muHat2 > c
+    # Generators for the noise in each field and for the bootstrap
+    noise_rngs = [get_rng(seed, simNo, cfgId, r, i, 'noise', bitGenerator) for i in np.arange(2)]
+    boot_rng = get_rng(seed, simNo, cfgId, r, 0, 'boot', bitGenerator)
 
-        # Obtain FcHat
-        FcHat = np.minimum(muHat1,muHat2) > c
+    # Noise for each field from the noise bank (if we are using one)
+    if noiseBank is not None:
+        noises = [get_bank_noise(noiseBank, noiseSpec, data_dim, r, i) for i, noiseSpec in enumerate([noiseSpec1, noiseSpec2])]
+    else:
+        noises = [None, None]
 
-        # -------------------------------------------------------------------
-        # Bootstrap 
-        # -------------------------------------------------------------------
-        # Initialize empty bootstrap stores
-        max_g1_d1Fc = np.zeros(nBoot)
-        max_g2_d2Fc = np.zeros(nBoot)
-        max_g1_d1FcHat = np.zeros(nBoot)
-        max_g2_d2FcHat = np.zeros(nBoot)
-
-        if mode == 2:
-
-            # Empty bootstrap store for intersection boundary
-            max_g1g2_d12Fc = np.zeros(nBoot)
-            max_g1g2_d12FcHat = np.zeros(nBoot)
-
-        if mode == 3:
-
-            # Empty bootstrap store for intersection boundary
-            min_g1g2_d12Fc = np.zeros(nBoot)
-            min_g1g2_d12FcHat = np.zeros(nBoot)
-
-        t1 = time.time()
-        # For each bootstrap record the max of the residuals along the
-        # boundary
-        for b in np.arange(nBoot):
-
-            # Obtain bootstrap variables
-            boot_vars = 2*np.random.randint(0,2,boot_dim)-1
-
-            # Reshape for broadcasting purposes (extra axis refers to the fact we have
-            # inner and outer boundary values in the last axes of resid_FsdGc_bdry_concat
-            # and resid_FsdGcHat_bdry_concat)
-            boot_vars = boot_vars.reshape((*boot_vars.shape),1)
-
-            # Bootstrap residuals along d1Fc and d2Fc
-            boot_resid1_d1Fc_concat = boot_vars*resid1_d1Fc_concat
-            boot_resid2_d2Fc_concat = boot_vars*resid2_d2Fc_concat
-
-            # Bootstrap residuals along d1FcHat and d2FcHat
-            boot_resid1_d1FcHat_concat = boot_vars*resid1_d1FcHat_concat
-            boot_resid2_d2FcHat_concat = boot_vars*resid2_d2FcHat_concat
-
-            # If we are in mode 2 or 3 we need to bootstrap along the intersection
-            # boundary as well
-            if mode == 2 or mode == 3:
-            
-                # Bootstrap residuals along d12Fc
-                boot_resid1_d12Fc_concat = boot_vars*resid1_d12Fc_concat
-                boot_resid2_d12Fc_concat = boot_vars*resid2_d12Fc_concat
-
-                # Bootstrap residuals along d12FcHat
-                boot_resid1_d12FcHat_concat = boot_vars*resid1_d12FcHat_concat
-                boot_resid2_d12FcHat_concat = boot_vars*resid2_d12FcHat_concat
-
-            # ------------------------------------------------------------------------------------------
-            # True boundary
-            # ------------------------------------------------------------------------------------------
-
-            # Sum across subjects to get the bootstrapped a values along
-            # the boundary of d1Fc. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. 
-            # I am still looking into why this is)
-            boot_g1_d1Fc_concat = np.zeros(boot_resid1_d1Fc_concat.shape[-2:])
-            boot_g1_d1Fc_concat[...,0] = np.sum(boot_resid1_d1Fc_concat[...,0], axis=0)/np.sqrt(nSub)
-            boot_g1_d1Fc_concat[...,1] = np.sum(boot_resid1_d1Fc_concat[...,1], axis=0)/np.sqrt(nSub)
-
-            # Sum across subjects to get the bootstrapped a values along
-            # the boundary of d2Fc. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. 
-            # I am still looking into why this is)
-            boot_g2_d2Fc_concat = np.zeros(boot_resid2_d2Fc_concat.shape[-2:])
-            boot_g2_d2Fc_concat[...,0] = np.sum(boot_resid2_d2Fc_concat[...,0], axis=0)/np.sqrt(nSub)
-            boot_g2_d2Fc_concat[...,1] = np.sum(boot_resid2_d2Fc_concat[...,1], axis=0)/np.sqrt(nSub)
-
-            # Obtain bootstrap standard deviations along d1Fc. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. I am still looking
-            # into why this is)
-            sigma1_boot_d1Fc_concat = np.zeros(boot_resid1_d1Fc_concat.shape[-2:])
-            sigma1_boot_d1Fc_concat[...,0] = np.std(boot_resid1_d1Fc_concat[...,0], axis=0, ddof=1)
-            sigma1_boot_d1Fc_concat[...,1] = np.std(boot_resid1_d1Fc_concat[...,1], axis=0, ddof=1)
-
-            # Obtain bootstrap standard deviations along d2Fc. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. I am still looking
-            # into why this is)
-            sigma2_boot_d2Fc_concat = np.zeros(boot_resid2_d2Fc_concat.shape[-2:])
-            sigma2_boot_d2Fc_concat[...,0] = np.std(boot_resid2_d2Fc_concat[...,0], axis=0, ddof=1)
-            sigma2_boot_d2Fc_concat[...,1] = np.std(boot_resid2_d2Fc_concat[...,1], axis=0, ddof=1)
-
-            # Divide by the boostrap standard deviation on d1Fc
-            boot_g1_d1Fc_concat = boot_g1_d1Fc_concat/sigma1_boot_d1Fc_concat
-
-            # Divide by the boostrap standard deviation on d2Fc
-            boot_g2_d2Fc_concat = boot_g2_d2Fc_concat/sigma2_boot_d2Fc_concat
-
-            # ------------------------------------------------------------------------------------------
-            # True boundary (mode == 2 or 3)
-            # ------------------------------------------------------------------------------------------
-
-            # If we are in mode 2 or 3 we need to bootstrap along the intersection
-            # boundary as well
-            if mode == 2 or mode == 3:
-
-                # Sum across subjects to get the bootstrapped a values along
-                # the boundary of d12Fc. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. 
-                # I am still looking into why this is)
-                boot_g1_d12Fc_concat = np.zeros(boot_resid1_d12Fc_concat.shape[-2:])
-                boot_g1_d12Fc_concat[...,0] = np.sum(boot_resid1_d12Fc_concat[...,0], axis=0)/np.sqrt(nSub)
-                boot_g1_d12Fc_concat[...,1] = np.sum(boot_resid1_d12Fc_concat[...,1], axis=0)/np.sqrt(nSub)
-
-                # Sum across subjects to get the bootstrapped a values along
-                # the boundary of d12Fc. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. 
-                # I am still looking into why this is)
-                boot_g2_d12Fc_concat = np.zeros(boot_resid2_d12Fc_concat.shape[-2:])
-                boot_g2_d12Fc_concat[...,0] = np.sum(boot_resid2_d12Fc_concat[...,0], axis=0)/np.sqrt(nSub)
-                boot_g2_d12Fc_concat[...,1] = np.sum(boot_resid2_d12Fc_concat[...,1], axis=0)/np.sqrt(nSub)
-
-                # Obtain bootstrap standard deviations along d12Fc. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. I am still looking
-                # into why this is)
-                sigma1_boot_d12Fc_concat = np.zeros(boot_resid1_d12Fc_concat.shape[-2:])
-                sigma1_boot_d12Fc_concat[...,0] = np.std(boot_resid1_d12Fc_concat[...,0], axis=0, ddof=1)
-                sigma1_boot_d12Fc_concat[...,1] = np.std(boot_resid1_d12Fc_concat[...,1], axis=0, ddof=1)
-
-                # Obtain bootstrap standard deviations along d12Fc. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. I am still looking
-                # into why this is)
-                sigma2_boot_d12Fc_concat = np.zeros(boot_resid2_d12Fc_concat.shape[-2:])
-                sigma2_boot_d12Fc_concat[...,0] = np.std(boot_resid2_d12Fc_concat[...,0], axis=0, ddof=1)
-                sigma2_boot_d12Fc_concat[...,1] = np.std(boot_resid2_d12Fc_concat[...,1], axis=0, ddof=1)
-
-                # Divide by the boostrap standard deviation on d12Fc
-                boot_g1_d12Fc_concat = boot_g1_d12Fc_concat/sigma1_boot_d12Fc_concat
-
-                # Divide by the boostrap standard deviation on d12Fc
-                boot_g2_d12Fc_concat = boot_g2_d12Fc_concat/sigma2_boot_d12Fc_concat
-
-            # ------------------------------------------------------------------------------------------
-            # Estimated boundary
-            # ------------------------------------------------------------------------------------------
-
-            # Sum across subjects to get the bootstrapped a values along
-            # the boundary of d1FcHat. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. 
-            # I am still looking into why this is)
-            boot_g1_d1FcHat_concat = np.zeros(boot_resid1_d1FcHat_concat.shape[-2:])
-            boot_g1_d1FcHat_concat[...,0] = np.sum(boot_resid1_d1FcHat_concat[...,0], axis=0)/np.sqrt(nSub)
-            boot_g1_d1FcHat_concat[...,1] = np.sum(boot_resid1_d1FcHat_concat[...,1], axis=0)/np.sqrt(nSub)
-
-            # Sum across subjects to get the bootstrapped a values along
-            # the boundary of d2FcHat. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. 
-            # I am still looking into why this is)
-            boot_g2_d2FcHat_concat = np.zeros(boot_resid2_d2FcHat_concat.shape[-2:])
-            boot_g2_d2FcHat_concat[...,0] = np.sum(boot_resid2_d2FcHat_concat[...,0], axis=0)/np.sqrt(nSub)
-            boot_g2_d2FcHat_concat[...,1] = np.sum(boot_resid2_d2FcHat_concat[...,1], axis=0)/np.sqrt(nSub)
-
-            # Obtain bootstrap standard deviations along d1FcHat. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. I am still looking
-            # into why this is)
-            sigma1_boot_d1FcHat_concat = np.zeros(boot_resid1_d1FcHat_concat.shape[-2:])
-            sigma1_boot_d1FcHat_concat[...,0] = np.std(boot_resid1_d1FcHat_concat[...,0], axis=0, ddof=1)
-            sigma1_boot_d1FcHat_concat[...,1] = np.std(boot_resid1_d1FcHat_concat[...,1], axis=0, ddof=1)
-
-            # Obtain bootstrap standard deviations along d2FcHat. (Note: For some reason this is 
-            # much faster if performed seperately for each of the last rows. I am still looking
-            # into why this is)
-            sigma2_boot_d2FcHat_concat = np.zeros(boot_resid2_d2FcHat_concat.shape[-2:])
-            sigma2_boot_d2FcHat_concat[...,0] = np.std(boot_resid2_d2FcHat_concat[...,0], axis=0, ddof=1)
-            sigma2_boot_d2FcHat_concat[...,1] = np.std(boot_resid2_d2FcHat_concat[...,1], axis=0, ddof=1)
-
-            # Divide by the boostrap standard deviation on d1FcHat
-            boot_g1_d1FcHat_concat = boot_g1_d1FcHat_concat/sigma1_boot_d1FcHat_concat
-
-            # Divide by the boostrap standard deviation on d2FcHat
-            boot_g2_d2FcHat_concat = boot_g2_d2FcHat_concat/sigma2_boot_d2FcHat_concat
-                
-            # ------------------------------------------------------------------------------------------
-            # Estimated boundary (mode == 2 or 3)
-            # ------------------------------------------------------------------------------------------
-
-            # If we are in mode 2 or 3 we need to bootstrap along the intersection
-            # boundary as well
-            if mode == 2 or mode == 3:
-
-                # Sum across subjects to get the bootstrapped a values along
-                # the boundary of d12FcHat. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. 
-                # I am still looking into why this is)
-                boot_g1_d12FcHat_concat = np.zeros(boot_resid1_d12FcHat_concat.shape[-2:])
-                boot_g1_d12FcHat_concat[...,0] = np.sum(boot_resid1_d12FcHat_concat[...,0], axis=0)/np.sqrt(nSub)
-                boot_g1_d12FcHat_concat[...,1] = np.sum(boot_resid1_d12FcHat_concat[...,1], axis=0)/np.sqrt(nSub)
-
-                # Sum across subjects to get the bootstrapped a values along
-                # the boundary of d12FcHat. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. 
-                # I am still looking into why this is)
-                boot_g2_d12FcHat_concat = np.zeros(boot_resid2_d12FcHat_concat.shape[-2:])
-                boot_g2_d12FcHat_concat[...,0] = np.sum(boot_resid2_d12FcHat_concat[...,0], axis=0)/np.sqrt(nSub)
-                boot_g2_d12FcHat_concat[...,1] = np.sum(boot_resid2_d12FcHat_concat[...,1], axis=0)/np.sqrt(nSub)
-
-                # Obtain bootstrap standard deviations along d12FcHat. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. I am still looking
-                # into why this is)
-                sigma1_boot_d12FcHat_concat = np.zeros(boot_resid1_d12FcHat_concat.shape[-2:])
-                sigma1_boot_d12FcHat_concat[...,0] = np.std(boot_resid1_d12FcHat_concat[...,0], axis=0, ddof=1)
-                sigma1_boot_d12FcHat_concat[...,1] = np.std(boot_resid1_d12FcHat_concat[...,1], axis=0, ddof=1)
-
-                # Obtain bootstrap standard deviations along d12FcHat. (Note: For some reason this is 
-                # much faster if performed seperately for each of the last rows. I am still looking
-                # into why this is)
-                sigma2_boot_d12FcHat_concat = np.zeros(boot_resid2_d12FcHat_concat.shape[-2:])
-                sigma2_boot_d12FcHat_concat[...,0] = np.std(boot_resid2_d12FcHat_concat[...,0], axis=0, ddof=1)
-                sigma2_boot_d12FcHat_concat[...,1] = np.std(boot_resid2_d12FcHat_concat[...,1], axis=0, ddof=1)
-
-                # Divide by the boostrap standard deviation on d12FcHat
-                boot_g1_d12FcHat_concat = boot_g1_d12FcHat_concat/sigma1_boot_d12FcHat_concat
-
-                # Divide by the boostrap standard deviation on d12FcHat
-                boot_g2_d12FcHat_concat = boot_g2_d12FcHat_concat/sigma2_boot_d12FcHat_concat
+    # -----------------------------------------------------------------------
+    # Data generation
+    # -----------------------------------------------------------------------
 
-            # ------------------------------------------------------------------------------------------
-            # Interpolation
-            # ------------------------------------------------------------------------------------------
+    # Mean and standard deviation of each field for every sample size
+    snapshots1 = {}
+    snapshots2 = {}
 
-            # Interpolation for d1Fc and d2Fc boundary
-            boot_g1_d1Fc_concat = get_bdry_vals_interpolated_concat(boot_g1_d1Fc_concat,d1Fc_bdry_weights_concat)
-            boot_g2_d2Fc_concat = get_bdry_vals_interpolated_concat(boot_g2_d2Fc_concat,d2Fc_bdry_weights_concat)
+    # If we are not streaming, generate all of the data at once
+    if subBlockSize is None:
 
-            # Interpolation for d1FcHat and d2FcHat boundary
-            boot_g1_d1FcHat_concat = get_bdry_vals_interpolated_concat(boot_g1_d1FcHat_concat,d1FcHat_weights_concat)
-            boot_g2_d2FcHat_concat = get_bdry_vals_interpolated_concat(boot_g2_d2FcHat_concat,d2FcHat_weights_concat)
+        # Obtain data
+        data1, data2, mu1, mu2 = get_data(muSpec1,muSpec2,noiseSpec1,noiseSpec2, data_dim, noiseCorr, mu1, mu2, noise_rngs, noises,
+                                          out=workspace['data'], workspace=workspace, dtype=dtype)
 
-            # If we are in mode 2 or 3 we need to bootstrap along the intersection
-            # boundary as well
-            if mode == 2 or mode == 3:
+        #print('data shapes: ', data1.shape, data2.shape, mu1.shape, mu2.shape)
 
-                # Interpolation for d1Fc and d2Fc boundary
-                boot_g1_d12Fc_concat = get_bdry_vals_interpolated_concat(boot_g1_d12Fc_concat,d12Fc_mu1_bdry_weights_concat)
-                boot_g2_d12Fc_concat = get_bdry_vals_interpolated_concat(boot_g2_d12Fc_concat,d12Fc_mu2_bdry_weights_concat)
+        # -------------------------------------------------------------------
+        # Mean and variance estimates
+        # -------------------------------------------------------------------
 
-                # Interpolation for d12FcHat and d12FcHat boundary
-                boot_g1_d12FcHat_concat = get_bdry_vals_interpolated_concat(boot_g1_d12FcHat_concat,d12FcHat_muHat1_weights_concat)
-                boot_g2_d12FcHat_concat = get_bdry_vals_interpolated_concat(boot_g2_d12FcHat_concat,d12FcHat_muHat2_weights_concat)
+        # Obtain mu estimate and sigma for the first nSub subjects, for 
+        # every sample size
+        get_moments_snapshots(get_moments_init(), data1, nSubs, snapshots1)
+        get_moments_snapshots(get_moments_init(), data2, nSubs, snapshots2)
 
+        # We are not streaming the noise
+        noise_stream1, noise_stream2 = None, None
 
-            # Get the maximum along d1Fc if it exists
-            if np.prod(boot_g1_d1Fc_concat.shape) > 0:
-                max_g1_d1Fc[b] = np.max(np.abs(boot_g1_d1Fc_concat)) 
+        # Subject shown in the figures
+        data1_fig, data2_fig = data1[10,...], data2[10,...]
+
+    # Otherwise, stream the data (pass one)
+    else:
 
+        # Set up streams for the noise (in the same order as get_data), or
+        # read the noise from the noise bank a block at a time
+        if noiseBank is None:
+            noise_stream1 = get_noise_stream(noiseSpec1, data_dim, subBlockSize, noise_rngs[0], dtype)
+            noise_stream2 = get_noise_stream(noiseSpec2, data_dim, subBlockSize, noise_rngs[1], dtype)
+        else:
+            noise_stream1 = get_bank_noise_stream(noises[0], subBlockSize, dtype)
+            noise_stream2 = get_bank_noise_stream(noises[1], subBlockSize, dtype)
 
-            # Get the maximum along d2Fc if it exists
-            if np.prod(boot_g2_d2Fc_concat.shape) > 0:
-                max_g2_d2Fc[b] = np.max(np.abs(boot_g2_d2Fc_concat)) 
+        # Running moments for each field
+        moments1 = get_moments_init()
+        moments2 = get_moments_init()
 
-            # Get the maximum along d1FcHat if it exists
-            if np.prod(boot_g1_d1FcHat_concat.shape) > 0:
-                max_g1_d1FcHat[b] = np.max(np.abs(boot_g1_d1FcHat_concat)) 
+        # Accumulate the moments a block at a time (recording mu estimate 
+        # and sigma for every sample size on the way)
+        for s0, s1, data1, data2 in get_data_blocks_2field(noise_stream1, noise_stream2, mu1, mu2, noiseCorr):
 
+            # Update the moments
+            moments1 = get_moments_snapshots(moments1, data1, nSubs, snapshots1)
+            moments2 = get_moments_snapshots(moments2, data2, nSubs, snapshots2)
 
-            # Get the maximum along d2FcHat if it exists
-            if np.prod(boot_g2_d2FcHat_concat.shape) > 0:
-                max_g2_d2FcHat[b] = np.max(np.abs(boot_g2_d2FcHat_concat)) 
+            # Keep the subject shown in the figures
+            if s0 <= 10 < s1:
+                data1_fig, data2_fig = data1[10-s0,...], data2[10-s0,...]
 
-            if mode == 2:
+        # Delete the last block as it is no longer needed (the data are
+        # regenerated for each sample size in pass two)
+        del data1, data2
+        data1, data2 = None, None
 
-                # Get the maximum along d12Fc if it exists
-                if np.prod(boot_g1_d12Fc_concat.shape) > 0:
+    # -----------------------------------------------------------------------
+    # Results for each sample size and threshold
+    # -----------------------------------------------------------------------
+    results = []
+    for k in np.arange(len(nSubs)):
+
+        # Obtain mu estimate and sigma
+        muHat1, sigma1 = snapshots1[nSubs[k]]
+        muHat2, sigma2 = snapshots2[nSubs[k]]
+        muHat1, sigma1 = muHat1.reshape(mu1.shape), sigma1.reshape(mu1.shape)
+        muHat2, sigma2 = muHat2.reshape(mu1.shape), sigma2.reshape(mu1.shape)
+
+        # Index the boundaries of AcHat1, AcHat2 and FcHat, so that their
+        # edges can be found for each threshold by a binary search
+        bdry_indexes = [get_bdry_index(muHat1), get_bdry_index(muHat2), get_bdry_index(np.minimum(muHat1,muHat2))]
+
+        # The data for the first nSub subjects (the residuals are only 
+        # obtained from these at the boundary voxels, for each threshold).
+        # If we are streaming, the data are instead regenerated once for 
+        # this sample size (pass two), keeping the residuals at the boundary
+        # voxels of every threshold.
+        if subBlockSize is None:
+            data1_k, data2_k = data1[:nSubs[k]], data2[:nSubs[k]]
+            vox_bdry, resid_bdry = None, None
+        else:
+            data1_k, data2_k = None, None
+            vox_bdry, resid_bdry = get_bdry_resid_stream(consts, nSubs[k], muHat1, muHat2, sigma1, sigma2, bdry_indexes,
+                                                         noise_stream1, noise_stream2, workspace)
 
-                    # Maximum of both |g1| and |g2| on d12Fc boundary
-                    max_g1g2_d12Fc[b] = np.maximum(np.max(np.abs(boot_g1_d12Fc_concat)),np.max(np.abs(boot_g2_d12Fc_concat)))
+        # Results for each threshold
+        results_k = []
+        for j in np.arange(len(thresholds)):
 
-                # Get the maximum along d12FcHat if it exists
-                if np.prod(boot_g1_d12FcHat_concat.shape) > 0:
+            # Every sample size and threshold replays the same bootstrap 
+            # variables from a copy of the generator, except the last, which
+            # uses the generator itself (so that it is left in the same state
+            # as if there were only one sample size and threshold)
+            if k < len(nSubs)-1 or j < len(thresholds)-1:
+                boot_rng_k = get_rng_copy(boot_rng)
+            else:
+                boot_rng_k = boot_rng
 
-                    # Maximum of both |g1| and |g2| on d12Fc boundary
-                    max_g1g2_d12FcHat[b] = np.maximum(np.max(np.abs(boot_g1_d12FcHat_concat)),np.max(np.abs(boot_g2_d12FcHat_concat)))
+            # Get the results for this sample size and threshold
+            results_k.append(SpatialSims_2mu_nSub(r, consts, k, j, muHat1, muHat2, sigma1, sigma2, bdry_indexes, data1_k, data2_k, vox_bdry, resid_bdry, data1_fig, data2_fig, boot_rng_k))
 
-            if mode == 3:
+        # Stack the results for every threshold
+        results.append(tuple(np.array(res) for res in zip(*results_k)))
 
-                #print('marker4')
+        # Delete the data for this sample size as it is no longer needed
+        del data1_k, data2_k, vox_bdry, resid_bdry
 
-                # Get the maximum along d12Fc if it exists
-                if np.prod(boot_g1_d12Fc_concat.shape) > 0:
+    # Stack the results for every sample size
+    return(tuple(np.array(res) for res in zip(*results)))
 
-                    #print('marker3')
 
-                    # Minimum of both g1 and g2 on d12Fc boundary (note: the absolute values must be outside
-                    # the minimum in this mode, unlike in mode 2 where they were inside)
-                    min_g1g2_d12Fc[b] = np.max(np.abs(np.minimum(boot_g1_d12Fc_concat,boot_g2_d12Fc_concat)))
+# ===========================================================================
+#
+# This function regenerates the data for the first nSub subjects of a
+# realization of `SpatialSims_2mu` (pass two, when streaming) and returns
+# the residuals at every voxel that the true or estimated boundary of any
+# threshold touches. This means the data are only regenerated once for
+# each sample size, rather than once for each sample size and threshold.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `consts`: Dictionary of everything which is the same for every 
+#             realization (see `SpatialSims_2mu_real`).
+# - `nSub`: The number of subjects.
+# - `muHat1`, `muHat2`: The mean of each field over the first nSub 
+#                       subjects.
+# - `sigma1`, `sigma2`: The standard deviation of each field over the first
+#                       nSub subjects.
+# - `bdry_indexes`: The boundary indexes of muHat1, muHat2 and their 
+#                   minimum (see `get_bdry_index`).
+# - `noise_stream1`, `noise_stream2`: The noise streams for each field.
+# - `workspace`: The workspace for this configuration (see 
+#                `get_workspace`).
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `vox_bdry`: The sorted flat indices of the voxels, in the stack of both
+#               fields (i.e. offset by nVox for the second field).
+# - `resid_bdry`: The residuals at these voxels, of shape 
+#                 [nSub, len(vox_bdry)].
+#
+# ===========================================================================
+def get_bdry_resid_stream(consts, nSub, muHat1, muHat2, sigma1, sigma2, bdry_indexes, noise_stream1, noise_stream2, workspace):
 
-                    # print('1: ', min_g1g2_d12Fc)
-                    # print(min_g1g2_d12Fc[b])
- 
-                # Get the maximum along d12FcHat if it exists
-                if np.prod(boot_g1_d12FcHat_concat.shape) > 0:
-                    
-                    # Minimum of both g1 and g2 on d12Fc boundary (note: the absolute values must be outside
-                    # the minimum in this mode, unlike in mode 2 where they were inside)
-                    min_g1g2_d12FcHat[b] = np.max(np.abs(np.minimum(boot_g1_d12FcHat_concat,boot_g2_d12FcHat_concat)))
+    # -----------------------------------------------------------------------
+    # Unpack the constants
+    # -----------------------------------------------------------------------
+    dtype = consts['dtype']
+    mu1 = consts['mu1']
+    mu2 = consts['mu2']
+    noiseCorr = consts['noiseCorr']
+    nVox = consts['nVox']
+    nDims = consts['nDims']
 
+    # -----------------------------------------------------------------------
+    # Voxels along the boundaries
+    # -----------------------------------------------------------------------
+    # Every segment bootstrapped for a threshold lies along dFc or dFcHat,
+    # so we take the voxels of both, for every threshold
+    inds = []
+    for thresh in consts['thresholds']:
 
-            # -------------------------------------------------------------------------------------
+        # Voxels along the true boundary
+        inds.append(thresh['inds_dFc'].reshape(-1))
 
+        # Voxels along the estimated boundary
+        FcHat_bdry_edges, _ = get_bdry_edges_index(bdry_indexes[2], thresh['c'])
+        inds.append(get_bdry_inds_concat(get_bdry_locs(FcHat_bdry_edges)).reshape(-1))
 
-        # In mode 1, we only bootstrap G1 along d1Fc and G2 along d2Fc
-        if mode == 1:
+    # Unique voxels in one field
+    vox = np.unique(np.concatenate(inds))
+    nBdryVox = len(vox)
 
-            # Get the maximum needed for the true boundary
-            max_g_dFc = np.maximum(max_g1_d1Fc,max_g2_d2Fc)
+    # The same voxels in both fields
+    vox_bdry = np.concatenate((vox, vox + nVox))
 
-            # Get the maximum needed for the estimated boundary
-            max_g_dFcHat = np.maximum(max_g1_d1FcHat,max_g2_d2FcHat)
+    # -----------------------------------------------------------------------
+    # Residuals along the boundaries
+    # -----------------------------------------------------------------------
+    # Residuals at the voxels (of shape [nSub, 2*nBdryVox])
+    resid_bdry = get_workspace_buffer(workspace, 'resid_bdry', (nSub, 2*nBdryVox), dtype)
 
-        # In mode 2, we bootstrap G1 along d1Fc union d12Fc and G2 along d2Fc union d12Fc
-        if mode == 2:
+    # Regenerate the data a block at a time (pass two)
+    for s0, s1, data1, data2 in get_data_blocks_2field(noise_stream1, noise_stream2, mu1, mu2, noiseCorr):
 
-            # Get the maximum needed for the true boundary
-            max_g_dFc = np.maximum(np.maximum(max_g1_d1Fc,max_g2_d2Fc),max_g1g2_d12Fc)
+        # We only need the first nSub subjects
+        if s0 >= nSub:
+            break
+        s1 = min(s1, nSub)
+        data1, data2 = data1[:s1-s0,...], data2[:s1-s0,...]
 
-            # Get the maximum needed for the estimated boundary
-            max_g_dFcHat = np.maximum(np.maximum(max_g1_d1FcHat,max_g2_d2FcHat),max_g1g2_d12FcHat)
+        # Loop through the fields
+        for i, (data, muHat, sigma) in enumerate([(data1, muHat1, sigma1), (data2, muHat2, sigma2)]):
 
+            # Residuals at the voxels for this field
+            resid_bdry[s0:s1,i*nBdryVox:(i+1)*nBdryVox] = get_bdry_vox_resid(data, muHat, sigma, vox, nDims)
 
-        # In mode 3, we bootstrap G1 along d1Fc and G2 along d2Fc and min(G1,G2) along d12Fc
-        if mode == 3:
+    # Return the voxels and residuals
+    return(vox_bdry, resid_bdry)
 
-            # print('3: ', min_g1g2_d12Fc)
-            # Get the maximum needed for the true boundary
-            max_g_dFc = np.maximum(np.maximum(max_g1_d1Fc,max_g2_d2Fc),min_g1g2_d12Fc)
 
-            # Get the maximum needed for the estimated boundary
-            max_g_dFcHat = np.maximum(np.maximum(max_g1_d1FcHat,max_g2_d2FcHat),min_g1g2_d12FcHat)
+# ===========================================================================
+#
+# This function obtains the results of a single realization of
+# `SpatialSims_2mu` for one sample size and threshold, using the first nSub
+# subjects of the data (and the first nSub columns of the bootstrap 
+# variables).
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `r`: The realization number.
+# - `consts`: Dictionary of everything which is the same for every 
+#             realization (see `SpatialSims_2mu_real`).
+# - `k`: The index of the sample size (and configuration) in 
+#        `consts['nSubs']`.
+# - `j`: The index of the threshold in `consts['thresholds']`.
+# - `muHat1`, `muHat2`: The mean of each field over the first nSub 
+#                       subjects.
+# - `sigma1`, `sigma2`: The standard deviation of each field over the first
+#                       nSub subjects.
+# - `bdry_indexes`: The boundary indexes of muHat1, muHat2 and their 
+#                   minimum (see `get_bdry_index`).
+# - `data1`, `data2`: The data for each field, for the first nSub subjects
+#                     (None if we are streaming).
+# - `vox_bdry`, `resid_bdry`: The voxels along the boundaries of every 
+#                             threshold and the residuals at them (as 
+#                             output by `get_bdry_resid_stream`, None if we
+#                             are not streaming).
+# - `data1_fig`, `data2_fig`: The subject shown in the figures.
+# - `boot_rng`: The generator for the bootstrap variables.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `trueBdry_success`, `estBdry_success`: Whether the sets based on the
+#                                          true and estimated boundary were
+#                                          successful, for each p-value 
+#                                          (assessed without interpolation).
+# - `trueBdry_success_intrp`, `estBdry_success_intrp`: As above, assessed 
+#                                                      with interpolation.
+# - `nBoot_used`: The number of bootstraps used.
+#
+# ===========================================================================
+def SpatialSims_2mu_nSub(r, consts, k, j, muHat1, muHat2, sigma1, sigma2, bdry_indexes, data1, data2, vox_bdry, resid_bdry, data1_fig, data2_fig, boot_rng):
 
-            # print('active')
-            # print(max_g1_d1Fc.shape,max_g2_d2Fc.shape,min_g1g2_d12Fc.shape)
-            # print('1')
-            # print(max_g1_d1Fc)
-            # print('2')
-            # print(max_g2_d2Fc)
-            # print('1and2')
-            # print('4: ', min_g1g2_d12Fc)
-            # print('max')
-            # print(max_g_dFc)
+    # -----------------------------------------------------------------------
+    # Unpack the constants
+    # -----------------------------------------------------------------------
+    simNo = consts['simNo']
+    subBlockSize = consts['subBlockSize']
+    dtype = consts['dtype']
+    data_dim = consts['data_dim']
+    OutDir = consts['OutDir']
+    nVox = consts['nVox']
+    mode = consts['mode']
+    nDims = consts['nDims']
+    nBoot = consts['nBoot']
+    bootBlockSize = consts['bootBlockSize']
+    bootTol = consts['bootTol']
+    bootBackend = consts['bootBackend']
+    p = consts['p']
+    nPvals = consts['nPvals']
+
+    # The threshold and the true boundary quantities which depend on it
+    thresh = consts['thresholds'][j]
+    c = thresh['c']
+    Fc = thresh['Fc']
+    inds_dFc = thresh['inds_dFc']
+    d1Fc_loc = thresh['d1Fc_loc']
+    d2Fc_loc = thresh['d2Fc_loc']
+    d12Fc_loc = thresh['d12Fc_loc']
+    d1Fc_bdry_weights_concat = thresh['d1Fc_bdry_weights_concat']
+    d2Fc_bdry_weights_concat = thresh['d2Fc_bdry_weights_concat']
+    Fc_bdry_locs = thresh['Fc_bdry_locs']
+
+    # The sample size, tau, configuration ID and whether to make figures
+    # (figures are only made for the first threshold)
+    nSub = consts['nSubs'][k]
+    tau = consts['taus'][k]
+    cfgId = consts['cfgIds'][k]
+    figGen = consts['figGens'][k] and j == 0
+
+    # The largest sample size (the number of columns of bootstrap variables
+    # drawn for each bootstrap)
+    nSubMax = data_dim[0]
+
+    # Workspace for this configuration (the same workspace as is used by
+    # `SpatialSims_2mu_real`)
+    workspace = get_workspace(data_dim, 2, nBoot, bootBlockSize, subBlockSize is None, dtype)
+
+    # The weights along the intersection boundary (modes 2 and 3 only)
+    if mode == 2 or mode == 3:
+        d12Fc_mu1_bdry_weights_concat = thresh['d12Fc_mu1_bdry_weights_concat']
+        d12Fc_mu2_bdry_weights_concat = thresh['d12Fc_mu2_bdry_weights_concat']
 
-            # print('active2')
-            # print(max_g1_d1FcHat.shape,max_g2_d2FcHat.shape,min_g1g2_d12FcHat.shape)
-            # print(max_g_dFcHat)
-            
-        t2 = time.time()
-        # print('Bootstrap time: ', t2-t1)
+    # -----------------------------------------------------------------------
+    # Boundary locations for AcHat1 and AcHat2
+    # -----------------------------------------------------------------------
+    # Get the edges along the boundary of AcHat1 and AcHat2 (and the values
+    # of muHat1 and muHat2 along them) from their boundary indexes
+    AcHat1_bdry_edges, AcHat1_bdry_vals_concat = get_bdry_edges_index(bdry_indexes[0], c)
+    AcHat2_bdry_edges, AcHat2_bdry_vals_concat = get_bdry_edges_index(bdry_indexes[1], c)
 
-        # -------------------------------------------------------------------
-        # Obtaining a from percentiles of the max distribution
-        # -------------------------------------------------------------------
+    # Get coordinates for the boundary of AcHat1 and AcHat2
+    AcHat1_bdry_locs = get_bdry_locs(AcHat1_bdry_edges)
+    AcHat2_bdry_locs = get_bdry_locs(AcHat2_bdry_edges)
 
-        # Drop the instances where the boundary length was zero
-        max_g_dFc = max_g_dFc[max_g_dFc!=0]
-        max_g_dFcHat = max_g_dFcHat[max_g_dFcHat!=0]
+    # Delete edges as we no longer need them
+    del AcHat1_bdry_edges, AcHat2_bdry_edges
 
-        # If we have recorded values get their quantiles
-        if (np.prod(max_g_dFc.shape) > 0):
-            # Get the a estimates for the true boundary
-            a_trueBdry = np.percentile(max_g_dFc, 100*p).reshape(nPvals,1,1,1)
-        else:
-            # Set to inf by default
-            a_trueBdry = np.Inf*np.ones((nPvals,1,1,1))
+    # -----------------------------------------------------------------------
+    # Boundary locations for FcHat(= AcHat1 intersect AcHat2)
+    # -----------------------------------------------------------------------
+    # Get the edges along the boundary of FcHat (and the values of the
+    # minimum of muHat1 and muHat2 along them) from its boundary index
+    FcHat_bdry_edges, FcHat_bdry_vals_concat = get_bdry_edges_index(bdry_indexes[2], c)
 
+    # Get coordinates for the boundary of FcHat
+    FcHat_bdry_locs = get_bdry_locs(FcHat_bdry_edges)
 
-        # If we have recorded values get their quantiles
-        if (np.prod(max_g_dFcHat.shape) > 0):
-            # Get the a estimates for the estimated boundary
-            a_estBdry = np.percentile(max_g_dFcHat, 100*p).reshape(nPvals,1,1,1) # [pvals, 1, [1 for _ in dim>1]]
-        else:
-            # Set to inf by default
-            a_estBdry = np.Inf*np.ones((nPvals,1,1,1))
+    # Delete edges as we no longer need them
+    del FcHat_bdry_edges
 
-        # Reformat them to an array form useful for boolean operation
-        a_trueBdry = np.concatenate((-a_trueBdry,a_trueBdry),axis=1)
-        a_estBdry = np.concatenate((-a_estBdry,a_estBdry),axis=1)
+    # -----------------------------------------------------------------------
+    # Interpolation weights for AcHat1 and AcHat2 boundary (Array
+    # version)
+    # -----------------------------------------------------------------------
+    # Obtain the weights along the boundary for AcHat1 and AcHat2
+    AcHat1_bdry_weights_concat = get_bdry_weights_concat(AcHat1_bdry_vals_concat, c)
+    AcHat2_bdry_weights_concat = get_bdry_weights_concat(AcHat2_bdry_vals_concat, c)
 
-        # print('a')
-        # print(a_trueBdry)
-        # print(a_estBdry)
+    # Delete values as we no longer need them
+    del AcHat1_bdry_vals_concat, AcHat2_bdry_vals_concat
 
-        # Get the statistic field which defined Achat^{+/-,1/2}
-        g1 = ((muHat1-c)/(sigma1*tau))
-        g2 = ((muHat2-c)/(sigma2*tau))
+    # -----------------------------------------------------------------------
+    # Interpolation weights for FcHat boundary (Array version)
+    # -----------------------------------------------------------------------
+    # Obtain the weights along the boundary for FcHat
+    FcHat_bdry_weights_concat = get_bdry_weights_concat(FcHat_bdry_vals_concat, c)
 
-        # Minimum for intersection
-        stat = np.minimum(g1.reshape(1,(*muHat1.shape)),g2.reshape(1,(*muHat1.shape)))
-        stat = stat.reshape(stat.shape[-2],stat.shape[-1])
+    # Delete values as we no longer need them
+    del FcHat_bdry_vals_concat
 
-        # Obtain FcHat^+ and FcHat^- based on a from the true boundary. This variable
-        # has axes corresponding to [pvalue, plus/minus, field dimensions]
-        FcHat_pm_trueBdry = stat >= a_trueBdry
+    # -----------------------------------------------------------------------
+    # Images
+    # -----------------------------------------------------------------------
+    if r==1 and figGen:
+        
+        # Make image directory
+        figDir = os.path.join(OutDir, 'sim'+str(simNo), 'Figures')
+        if not os.path.exists(figDir):
+            os.mkdir(figDir)
+
+        # AcHat1
+        AcHat1_im = muHat1>c
+        plt.figure(0)
+        plt.imshow(1*AcHat1_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'AcHat1_cfg'+str(cfgId)+'.png'))
+
+        # dAcHat1
+        dAcHat1_im = get_bdry_map_combined(muHat1, c)
+        plt.figure(1)
+        plt.imshow(1*dAcHat1_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dAcHat1_cfg'+str(cfgId)+'.png'))
+
+        # AcHat2
+        AcHat2_im = muHat2>c
+        plt.figure(2)
+        plt.imshow(1*AcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'AcHat2_cfg'+str(cfgId)+'.png'))
+
+        # dAcHat2
+        dAcHat2_im = get_bdry_map_combined(muHat2, c)
+        plt.figure(3)
+        plt.imshow(1*dAcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dAcHat2_cfg'+str(cfgId)+'.png'))
+
+        # AcHat1 \cup AcHat2
+        AcHat1cupAcHat2_im = np.maximum(muHat1,muHat2)>c
+        plt.figure(4)
+        plt.imshow(1*AcHat1cupAcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'GcHat_cfg'+str(cfgId)+'.png'))
+
+        # d(AcHat1 \cup AcHat2)
+        dAcHat1cupAcHat2_im = get_bdry_map_combined(np.maximum(muHat1,muHat2),c)
+        plt.figure(5)
+        plt.imshow(1*dAcHat1cupAcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dGcHat_cfg'+str(cfgId)+'.png'))
+
+        # AcHat1 \cap AcHat2
+        AcHat1capAcHat2_im = np.minimum(muHat1,muHat2)>c
+        plt.figure(6)
+        plt.imshow(1*AcHat1capAcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'FcHat_cfg'+str(cfgId)+'.png'))
+
+        # d(AcHat1 \cap AcHat2)
+        dAcHat1capAcHat2_im = get_bdry_map_combined(np.minimum(muHat1,muHat2),c)
+        plt.figure(7)
+        plt.imshow(1*dAcHat1capAcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dFcHat_cfg'+str(cfgId)+'.png'))
+
+        # dF12cHat = dAcHat1 \cap dAcHat2
+        dAcHat1capdAcHat2_im = dAcHat1capAcHat2_im*dAcHat1cupAcHat2_im
+        plt.figure(8)
+        plt.imshow(1*dAcHat1capdAcHat2_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dF12cHat_cfg'+str(cfgId)+'.png'))
+
+        # dF1cHat = dAcHat1 \cap AcHat2
+        rhs_im = dAcHat1_im*AcHat2_im
+        plt.figure(10)
+        plt.imshow(1*rhs_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dF1cHat_cfg'+str(cfgId)+'.png'))
+
+        # dF2cHat = dAcHat2 \cap AcHat1
+        lhs_im = dAcHat2_im*AcHat1_im
+        plt.figure(9)
+        plt.imshow(1*lhs_im[0,:,:])
+        plt.savefig(os.path.join(figDir, 'dF2cHat_cfg'+str(cfgId)+'.png'))
+
+        # muHat1
+        plt.figure(11)
+        plt.imshow(muHat1[0,:,:])
+        plt.colorbar()
+        plt.savefig(os.path.join(figDir, 'muHat1_cfg'+str(cfgId)+'.png'))
+
+        # muHat2
+        plt.figure(12)
+        plt.imshow(muHat2[0,:,:])
+        plt.colorbar()
+        plt.savefig(os.path.join(figDir, 'muHat2_cfg'+str(cfgId)+'.png'))
+
+        # data1
+        plt.figure(13)
+        plt.imshow(data1_fig)
+        plt.colorbar()
+        plt.savefig(os.path.join(figDir, 'data1_cfg'+str(cfgId)+'.png'))
+
+        # data2
+        plt.figure(14)
+        plt.imshow(data2_fig)
+        plt.colorbar()
+        plt.savefig(os.path.join(figDir, 'data2_cfg'+str(cfgId)+'.png'))
+
+        # max(muHat1,muHat2)
+        plt.figure(15)
+        plt.imshow(np.maximum(muHat1[0,:,:],muHat2[0,:,:]))
+        plt.colorbar()
+        plt.savefig(os.path.join(figDir, 'maxMuHat_cfg'+str(cfgId)+'.png'))
+
+        # min(muHat1,muHat2)
+        plt.figure(16)
+        plt.imshow(np.minimum(muHat1[0,:,:],muHat2[0,:,:]))
+        plt.colorbar()
+        plt.savefig(os.path.join(figDir, 'minMuHat_cfg'+str(cfgId)+'.png'))
+
+
+    # Obtain MuHat along Fc
+    muHat1_FcHat_bdry_concat = get_bdry_values_concat(muHat1, FcHat_bdry_locs)
+    muHat2_FcHat_bdry_concat = get_bdry_values_concat(muHat2, FcHat_bdry_locs)
+
+    # print('shapes here : ', muHat1_FcHat_bdry_concat.shape,resid1_FcHat_bdry_concat.shape)
+
+    # Get locations where outer muHat1 and muHat2 are greater than c
+    d1FcHat_loc = np.where(muHat2_FcHat_bdry_concat[0,:,1]>c)[0]
+    d2FcHat_loc = np.where(muHat1_FcHat_bdry_concat[0,:,1]>c)[0]
+    d12FcHat_loc = np.where((muHat2_FcHat_bdry_concat[0,:,1]<= c)*(muHat1_FcHat_bdry_concat[0,:,1]<=c))[0]
+
+    # print(resid1_FcHat_bdry_concat[:,d1FcHat_loc,:].shape)
+    # print(resid2_FcHat_bdry_concat[:,d2FcHat_loc,:].shape)
 
-        # Obtain FcHat^+ and FcHat^- based on a from the estimated boundary. This variable
-        # has axes corresponding to [pvalue, plus/minus, field dimensions]
-        FcHat_pm_estBdry = stat >= a_estBdry
+    # -----------------------------------------------------------------------
+    # Voxel indices along dkFc and dkFcHat boundaries (Array version)
+    # -----------------------------------------------------------------------
+    # Flat voxel indices along FcHat
+    inds_dFcHat = get_bdry_inds_concat(FcHat_bdry_locs)
 
-        # -------------------------------------------------------------------
-        # Images
-        # -------------------------------------------------------------------
-        if r==1 and inputs['figGen']:
+    # In this simulation we are bootstrapping the residuals for field 1
+    # along dAc1 intersect Ac2 i.e. along dF where mu2 > c. And vice versa
+    # for field 2.
+    inds1_d1Fc = inds_dFc[d1Fc_loc,:]
+    inds2_d2Fc = inds_dFc[d2Fc_loc,:] + nVox
 
-            # Indices for 0.8,0.9 and 0.95
-            pInds = [16,18,19]
+    # In this simulation we are bootstrapping the residuals for field 1
+    # along dAcHat1 intersect AcHat2 i.e. along dF where muHat2 > c. And 
+    # vice versa for field 2.
+    inds1_d1FcHat = inds_dFcHat[d1FcHat_loc,:]
+    inds2_d2FcHat = inds_dFcHat[d2FcHat_loc,:] + nVox
 
-            for pInd in pInds:
+    # If we are in mode 2 or 3 we need to bootstrap along the intersection
+    # boundary as well
+    if mode == 2 or mode == 3:
 
-                # P value of interest
-                pVal = p[pInd]
+        # For true boundary
+        inds1_d12Fc = inds_dFc[d12Fc_loc,:]
+        inds2_d12Fc = inds_dFc[d12Fc_loc,:] + nVox
 
-                # FcHat plus (based on estimated bdry)
-                plt.figure(16)
-                plt.imshow(1*FcHat_pm_estBdry[pInd,0,...])
-                plt.savefig(os.path.join(figDir, 'FcHat_plus_estBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
+        # For estimated boundary
+        inds1_d12FcHat = inds_dFcHat[d12FcHat_loc,:]
+        inds2_d12FcHat = inds_dFcHat[d12FcHat_loc,:] + nVox
 
-                # FcHat minus (based on estimated bdry)
-                plt.figure(17)
-                plt.imshow(1*FcHat_pm_estBdry[pInd,1,...])
-                plt.savefig(os.path.join(figDir, 'FcHat_minus_estBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
+    # -----------------------------------------------------------------------
+    # Mu and MuHat along dkFc and dkFcHat boundaries (Array version)
+    # -----------------------------------------------------------------------
+    # In this simulation we are bootstrapping the residuals for field 1
+    # along dAcHat1 intersect AcHat2 i.e. along dF where muHat2 > c. And 
+    # vice versa for field 2.
+    muHat1_d1FcHat_concat = muHat1_FcHat_bdry_concat[:,d1FcHat_loc,:]
+    muHat2_d2FcHat_concat = muHat2_FcHat_bdry_concat[:,d2FcHat_loc,:]
+
+    # If we are in mode 2 or 3 we need to bootstrap along the intersection
+    # boundary as well
+    if mode == 2 or mode == 3:
+        
+        # For estimated boundary
+        muHat1_d12FcHat_concat = muHat1_FcHat_bdry_concat[:,d12FcHat_loc,:]
+        muHat2_d12FcHat_concat = muHat2_FcHat_bdry_concat[:,d12FcHat_loc,:]
+
+
+    # print('marker')
+    # print(mu1_d1Fc_concat.shape)
+    # print(mu1_Fc_bdry_concat.shape)
+    # print(d2Fc_loc.shape)
+    # print(mu2_d2Fc_concat.shape)
+    # print(mu2_Fc_bdry_concat.shape)
+    # print(d1Fc_loc.shape)
+    # print(muHat1_d1FcHat_concat.shape)
+
+    # print('marker2')
+    # print(d1FcHat_loc.shape)
+    # print(d2FcHat_loc.shape)
+    # print(d12FcHat_loc.shape)
+    # print(muHat1_FcHat_bdry_concat.shape)
 
-                # FcHat plus (based on true bdry)
-                plt.figure(18)
-                plt.imshow(1*FcHat_pm_trueBdry[pInd,0,...])
-                plt.savefig(os.path.join(figDir, 'FcHat_plus_trueBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
+    # -----------------------------------------------------------------------
+    # Interpolation weights dkFc and dkFcHat boundaries (Array version)
+    # -----------------------------------------------------------------------
+    # Obtain the weights along the boundary for dkFcHat
+    d1FcHat_weights_concat = get_bdry_weights_concat(muHat1_d1FcHat_concat, c)
+    d2FcHat_weights_concat = get_bdry_weights_concat(muHat2_d2FcHat_concat, c)
 
-                # FcHat minus (based on true bdry)
-                plt.figure(19)
-                plt.imshow(1*FcHat_pm_trueBdry[pInd,1,...])
-                plt.savefig(os.path.join(figDir, 'FcHat_minus_trueBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
+    # If we are in mode 2 or 3 we need to bootstrap along the intersection
+    # boundary as well
+    if mode == 2 or mode == 3:
+        
+        # For estimated boundary
+        d12FcHat_muHat1_weights_concat = get_bdry_weights_concat(muHat1_d12FcHat_concat, c)
+        d12FcHat_muHat2_weights_concat = get_bdry_weights_concat(muHat2_d12FcHat_concat, c)
 
+    # -----------------------------------------------------------------------
+    # True and estimated excursion sets
+    # -----------------------------------------------------------------------
+    # Obtain AcHat2 and AcHat2 
+    AcHat1 = muHat1 > c
+    AcHat2 = muHat2 > c
 
-        # -------------------------------------------------------------------
-        # Some set logic to work out violations
-        # -------------------------------------------------------------------
+    # Obtain FcHat
+    FcHat = np.minimum(muHat1,muHat2) > c
 
-        # Obtain FcHat^+\FcHat based on the true boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        FcHatp_sub_Fc_trueBdry = FcHat_pm_trueBdry[:,1,...] & ~Fc[...]
+    # -----------------------------------------------------------------------
+    # Stacked boundary segments for the bootstrap
+    # -----------------------------------------------------------------------
+    # In every mode we bootstrap G1 along d1Fc and G2 along d2Fc (and
+    # likewise for the estimated boundary). All of the segments we need 
+    # are stacked into one array so that each block of bootstraps needs 
+    # only one multiply-reduce. The segments are ordered so that all of
+    # the true boundary segments come before the estimated boundary
+    # segments.
+    if mode == 1:
+
+        # Voxel indices along each segment
+        inds_segs = [inds1_d1Fc, inds2_d2Fc,
+                     inds1_d1FcHat, inds2_d2FcHat]
+
+        # Interpolation weights along each segment
+        weights_segs = [d1Fc_bdry_weights_concat, d2Fc_bdry_weights_concat,
+                        d1FcHat_weights_concat, d2FcHat_weights_concat]
+
+        # Boundary each segment belongs to (0: true, 1: estimated)
+        bdry_of_seg = np.array([0, 0, 1, 1])
+
+    # In modes 2 and 3 we need to bootstrap both G1 and G2 along the 
+    # intersection boundary as well
+    if mode == 2 or mode == 3:
+
+        # Voxel indices along each segment
+        inds_segs = [inds1_d1Fc, inds2_d2Fc,
+                     inds1_d12Fc, inds2_d12Fc,
+                     inds1_d1FcHat, inds2_d2FcHat,
+                     inds1_d12FcHat, inds2_d12FcHat]
+
+        # Interpolation weights along each segment
+        weights_segs = [d1Fc_bdry_weights_concat, d2Fc_bdry_weights_concat,
+                        d12Fc_mu1_bdry_weights_concat, d12Fc_mu2_bdry_weights_concat,
+                        d1FcHat_weights_concat, d2FcHat_weights_concat,
+                        d12FcHat_muHat1_weights_concat, d12FcHat_muHat2_weights_concat]
+
+        # Boundary each segment belongs to (0: true, 1: estimated)
+        bdry_of_seg = np.array([0, 0, 0, 0, 1, 1, 1, 1])
+
+    # Stack the voxel indices and weights
+    inds_stack, seg_ids = stack_bdry_segs(inds_segs)
+    weights_stack, _ = stack_bdry_segs(weights_segs)
+
+    # Neighbouring boundary points share voxels, so we only bootstrap
+    # each voxel once. Get the unique voxels along the stack and the
+    # operator interpolating from them onto every point in the stack.
+    vox_stack, interp_op_stack = get_bdry_interp_op(inds_stack, weights_stack)
+
+    # Residuals at the unique voxels (of shape [nSub, nVox])
+    resid_stack = get_workspace_buffer(workspace, 'resid_stack', (nSub, len(vox_stack)), dtype)
+
+    # The voxels which belong to each field
+    vox_fields = [(vox_stack // nVox) == i for i in np.arange(2)]
+
+    # If we are not streaming, we have the data already
+    if subBlockSize is None:
+
+        # Loop through the fields
+        for i, (data, muHat, sigma) in enumerate([(data1, muHat1, sigma1), (data2, muHat2, sigma2)]):
+
+            # Residuals at the voxels for this field
+            resid_stack[:,vox_fields[i]] = get_bdry_vox_resid(data, muHat, sigma, vox_stack[vox_fields[i]] - i*nVox, nDims)
+
+    # Otherwise, take them from the residuals along the boundaries of every
+    # threshold (which contain every voxel in the stack)
+    else:
+        resid_stack[...] = resid_bdry[:,np.searchsorted(vox_bdry, vox_stack)]
+
+    # The sum of squares of the bootstrapped residuals does not change 
+    # across bootstraps, so we only need to compute it once.
+    resid_stack_sumsq = get_resid_sumsq(resid_stack)
+
+    # Starting offsets of the true and estimated boundaries in the stack
+    bdry_starts, bdry_nonempty = get_seg_starts(bdry_of_seg[seg_ids], 2)
+
+    # In mode 3 we take the minimum of G1 and G2 along d12Fc (and d12FcHat)
+    # before taking absolute values. The minimum is written into the G1
+    # segment and the G2 segment is then set to zero, so that it no longer
+    # contributes to the maximum (note: if these segments are empty this
+    # has no effect).
+    if mode == 3:
+        min_pairs = [(seg_ids == 2, seg_ids == 3), (seg_ids == 6, seg_ids == 7)]
+    else:
+        min_pairs = []
 
-        # Obtain FcHat^+\FcHat based on the estimated boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        FcHatp_sub_Fc_estBdry = FcHat_pm_estBdry[:,1,...] & ~Fc[...]
+    # -----------------------------------------------------------------------
+    # Bootstrap 
+    # -----------------------------------------------------------------------
+    # Bootstrap stores (from the workspace)
+    max_g_dFc = workspace['boot_max'][0]
+    max_g_dFcHat = workspace['boot_max'][1]
+
+    # Number of bootstraps used
+    nBoot_used = nBoot
+
+    t1 = time.time()
+    # For each block of bootstraps record the max of the residuals along
+    # the boundary
+    for b0, b1 in get_boot_blocks(nBoot, bootBlockSize):
+
+        # Obtain bootstrap variables for this block (the first nSub columns
+        # of the variables for the largest sample size, so that every sample
+        # size uses the same variables)
+        boot_vars = get_boot_vars(b1-b0, nSubMax, boot_rng, out=workspace['boot_vars'][:(b1-b0)])[:,:nSub]
+
+        # Get the maximum of the bootstrapped g values along the true and 
+        # estimated boundaries (interpolating the g values at every unique 
+        # voxel along every segment, and in mode 3 taking the minimum of G1
+        # and G2 along the intersection boundaries)
+        boot_max = get_boot_seg_max_g(boot_vars, resid_stack, resid_stack_sumsq, interp_op_stack,
+                                      min_pairs, bdry_starts, bdry_nonempty, bootBackend)
+
+        # Save the maxima needed for the true and estimated boundaries
+        max_g_dFc[b0:b1] = boot_max[:,0]
+        max_g_dFcHat[b0:b1] = boot_max[:,1]
+
+        # In the adaptive bootstrap, stop once every percentile has converged
+        if bootTol is not None and get_boot_converged([max_g_dFc[:b1], max_g_dFcHat[:b1]], p, bootTol):
+            nBoot_used = b1
+            break
+
+    # Keep only the bootstraps we used
+    max_g_dFc = max_g_dFc[:nBoot_used]
+    max_g_dFcHat = max_g_dFcHat[:nBoot_used]
+
+    t2 = time.time()
+    # print('Bootstrap time: ', t2-t1)
 
-        # Obtain Fc\FcHat^- based on the true boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        Fc_sub_FcHatm_trueBdry = Fc[...] & ~FcHat_pm_trueBdry[:,0,...]
+    # -----------------------------------------------------------------------
+    # Obtaining a from percentiles of the max distribution
+    # -----------------------------------------------------------------------
 
-        # Obtain Fc\FcHat^- based on the estimated boundary. This variable
-        # has axes corresponding to [pvalue, field dimensions]
-        Fc_sub_FcHatm_estBdry = Fc[...] & ~FcHat_pm_estBdry[:,0,...]
+    # Drop the instances where the boundary length was zero
+    max_g_dFc = max_g_dFc[max_g_dFc!=0]
+    max_g_dFcHat = max_g_dFcHat[max_g_dFcHat!=0]
 
-        # -------------------------------------------------------------------
-        # Check whether there were any boundary violations using voxelwise
-        # set logic (checking if voxels existed in one set but not another, 
-        # etc)
-        # -------------------------------------------------------------------
-        #print(a_trueBdry)
-        # # FcHat plus (based on estimated bdry)
-        # plt.figure(0)
-        # plt.imshow(1*FcHat_pm_trueBdry[0,1,...])
-        # plt.colorbar()
+    # If we have recorded values get their quantiles
+    if (np.prod(max_g_dFc.shape) > 0):
+        # Get the a estimates for the true boundary
+        a_trueBdry = np.percentile(max_g_dFc, 100*p)
+    else:
+        # Set to inf by default
+        a_trueBdry = np.Inf*np.ones(nPvals)
 
-        # # FcHat minus (based on estimated bdry)
-        # plt.figure(1)
-        # plt.imshow(1*(~Fc[0,...]))
-        # plt.colorbar()
-        # plt.show()
-        # plt.clf()
 
+    # If we have recorded values get their quantiles
+    if (np.prod(max_g_dFcHat.shape) > 0):
+        # Get the a estimates for the estimated boundary
+        a_estBdry = np.percentile(max_g_dFcHat, 100*p)
+    else:
+        # Set to inf by default
+        a_estBdry = np.Inf*np.ones(nPvals)
 
-        #print('anys: ', np.any(FcHatp_sub_Fc_trueBdry,axis=(1,2)), np.any(Fc_sub_FcHatm_trueBdry,axis=(1,2)))
-        # Record if we saw a violation in the true boundary based sets
-        trueBdry_success[r,:] = 1-(np.any(FcHatp_sub_Fc_trueBdry,axis=(1,2)) | np.any(Fc_sub_FcHatm_trueBdry,axis=(1,2))) # : AXES WONT WORK FOR 3D ATM
+    # print('a')
+    # print(a_trueBdry)
+    # print(a_estBdry)
 
-        # Record if we saw a violation in the estimated boundary based sets
-        estBdry_success[r,:] = 1-(np.any(FcHatp_sub_Fc_estBdry,axis=(1,2)) | np.any(Fc_sub_FcHatm_estBdry,axis=(1,2)))# : AXES WONT WORK FOR 3D ATM
+    # Get the statistic field which defined Achat^{+/-,1/2}
+    g1 = ((muHat1-c)/(sigma1*tau))
+    g2 = ((muHat2-c)/(sigma2*tau))
 
-        # -------------------------------------------------------------------
-        # Get stat along the Fc boundary
-        # -------------------------------------------------------------------
+    # Minimum for intersection
+    stat = np.minimum(g1.reshape(1,(*muHat1.shape)),g2.reshape(1,(*muHat1.shape)))
+    stat = stat.reshape(stat.shape[-2],stat.shape[-1])
 
+    # -----------------------------------------------------------------------
+    # Images
+    # -----------------------------------------------------------------------
+    if r==1 and figGen:
 
-        # ==================================================================================================================
+        # Indices for 0.8,0.9 and 0.95
+        pInds = [16,18,19]
 
-        # Get locations where outer mu1 and mu2 are greater than c
-        d1Fc_loc = np.where((mu2_Fc_bdry_concat[0,:,1]>c))[0]
-        d2Fc_loc = np.where((mu1_Fc_bdry_concat[0,:,1]>c))[0]
-        d12Fc_loc = np.where((mu2_Fc_bdry_concat[0,:,1]<= c)*(mu1_Fc_bdry_concat[0,:,1]<=c))[0]
+        for pInd in pInds:
 
+            # P value of interest
+            pVal = p[pInd]
 
+            # Obtain FcHat^+ and FcHat^- based on a from the true boundary. This variable
+            # has axes corresponding to [plus/minus, field dimensions]
+            FcHat_pm_trueBdry = stat >= np.array([-a_trueBdry[pInd],a_trueBdry[pInd]]).reshape(2,1,1)
 
-        # Obtain g1 and g2 along the boundary for Fc
-        g1_dFc_concat = get_bdry_values_concat(g1, Fc_bdry_locs)
-        g2_dFc_concat = get_bdry_values_concat(g2, Fc_bdry_locs)
+            # Obtain FcHat^+ and FcHat^- based on a from the estimated boundary. This variable
+            # has axes corresponding to [plus/minus, field dimensions]
+            FcHat_pm_estBdry = stat >= np.array([-a_estBdry[pInd],a_estBdry[pInd]]).reshape(2,1,1)
 
+            # FcHat plus (based on estimated bdry)
+            plt.figure(16)
+            plt.imshow(1*FcHat_pm_estBdry[0,...])
+            plt.savefig(os.path.join(figDir, 'FcHat_plus_estBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
 
-        # g1 and g2 along d1Fc
-        g1_d1Fc_concat = g1_dFc_concat[:,d1Fc_loc,:]
-        g2_d1Fc_concat = g2_dFc_concat[:,d1Fc_loc,:]
+            # FcHat minus (based on estimated bdry)
+            plt.figure(17)
+            plt.imshow(1*FcHat_pm_estBdry[1,...])
+            plt.savefig(os.path.join(figDir, 'FcHat_minus_estBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
 
-        # g1 and g2 along d2Fc
-        g1_d2Fc_concat = g1_dFc_concat[:,d2Fc_loc,:]
-        g2_d2Fc_concat = g2_dFc_concat[:,d2Fc_loc,:]
+            # FcHat plus (based on true bdry)
+            plt.figure(18)
+            plt.imshow(1*FcHat_pm_trueBdry[0,...])
+            plt.savefig(os.path.join(figDir, 'FcHat_plus_trueBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
 
-        # g1 and g2 along d12Fc
-        g1_d12Fc_concat = g1_dFc_concat[:,d12Fc_loc,:]
-        g2_d12Fc_concat = g2_dFc_concat[:,d12Fc_loc,:]
+            # FcHat minus (based on true bdry)
+            plt.figure(19)
+            plt.imshow(1*FcHat_pm_trueBdry[1,...])
+            plt.savefig(os.path.join(figDir, 'FcHat_minus_trueBdry_p'+str(int(100*pVal))+'_cfg'+str(cfgId)+'.png'))
 
-        # Interpolation for d1Fc boundary (we perform this interpolation based on the weights of
-        # mu1 as we are on the boundary of Ac1)
-        g1_d1Fc_concat = get_bdry_vals_interpolated_concat(g1_d1Fc_concat,d1Fc_bdry_weights_concat)
-        g2_d1Fc_concat = get_bdry_vals_interpolated_concat(g2_d1Fc_concat,d1Fc_bdry_weights_concat)
 
+    # -----------------------------------------------------------------------
+    # Work out the smallest a for which the voxelwise set logic observes
+    # no violations (i.e. FcHat^+ is contained in Fc and Fc is contained
+    # in FcHat^-)
+    # -----------------------------------------------------------------------
+    crit = get_crit_val(stat, Fc)
 
-        # Interpolation for d2Fc boundary (we perform this interpolation based on the weights of
-        # mu2 as we are on the boundary of Ac2)
-        g1_d2Fc_concat = get_bdry_vals_interpolated_concat(g1_d2Fc_concat,d2Fc_bdry_weights_concat)
-        g2_d2Fc_concat = get_bdry_vals_interpolated_concat(g2_d2Fc_concat,d2Fc_bdry_weights_concat)
+    # -----------------------------------------------------------------------
+    # Get stat along the Fc boundary
+    # -----------------------------------------------------------------------
 
 
-        # If we are in mode 2 or 3 we need to interpolate along the intersection
-        # boundary as well
-        if mode == 2 or mode == 3:
+    # =======================================================================
 
-            # Interpolation for d1Fc and d2Fc boundary
-            g1_d12Fc_concat = get_bdry_vals_interpolated_concat(g1_d12Fc_concat,d12Fc_mu1_bdry_weights_concat)
-            g2_d12Fc_concat = get_bdry_vals_interpolated_concat(g2_d12Fc_concat,d12Fc_mu2_bdry_weights_concat)
+    # Obtain g1 and g2 along the boundary for Fc
+    g1_dFc_concat = get_bdry_values_concat(g1, Fc_bdry_locs)
+    g2_dFc_concat = get_bdry_values_concat(g2, Fc_bdry_locs)
 
 
-        # Get minimum along interpolated d1Fc boundary
-        ming1g2_d1Fc_concat = np.minimum(g1_d1Fc_concat,g2_d1Fc_concat)
+    # g1 and g2 along d1Fc
+    g1_d1Fc_concat = g1_dFc_concat[:,d1Fc_loc,:]
+    g2_d1Fc_concat = g2_dFc_concat[:,d1Fc_loc,:]
 
-        # Get minimum along interpolated d2Fc boundary
-        ming1g2_d2Fc_concat = np.minimum(g1_d2Fc_concat,g2_d2Fc_concat)
+    # g1 and g2 along d2Fc
+    g1_d2Fc_concat = g1_dFc_concat[:,d2Fc_loc,:]
+    g2_d2Fc_concat = g2_dFc_concat[:,d2Fc_loc,:]
 
-        # Get minimum along interpolated d12Fc boundary
-        ming1g2_d12Fc_concat = np.minimum(g1_d12Fc_concat,g2_d12Fc_concat)
+    # g1 and g2 along d12Fc
+    g1_d12Fc_concat = g1_dFc_concat[:,d12Fc_loc,:]
+    g2_d12Fc_concat = g2_dFc_concat[:,d12Fc_loc,:]
 
-        # print('yaaah')
-        # print(ming1g2_d12Fc_concat.shape)
-        # print(ming1g2_d1Fc_concat)
-        # print('break')
-        # print(ming1g2_d2Fc_concat)
-        # print(np.concatenate((ming1g2_d1Fc_concat,ming1g2_d2Fc_concat,ming1g2_d12Fc_concat),axis=-1).shape)
+    # Interpolation for d1Fc boundary (we perform this interpolation based on the weights of
+    # mu1 as we are on the boundary of Ac1)
+    g1_d1Fc_concat = get_bdry_vals_interpolated_concat(g1_d1Fc_concat,d1Fc_bdry_weights_concat)
+    g2_d1Fc_concat = get_bdry_vals_interpolated_concat(g2_d1Fc_concat,d1Fc_bdry_weights_concat)
 
-        # ==================================================================================================================
 
-        # -------------------------------------------------------------------
-        # Get stat along the Fc boundary
-        # -------------------------------------------------------------------
+    # Interpolation for d2Fc boundary (we perform this interpolation based on the weights of
+    # mu2 as we are on the boundary of Ac2)
+    g1_d2Fc_concat = get_bdry_vals_interpolated_concat(g1_d2Fc_concat,d2Fc_bdry_weights_concat)
+    g2_d2Fc_concat = get_bdry_vals_interpolated_concat(g2_d2Fc_concat,d2Fc_bdry_weights_concat)
 
-        # Take the minimum of the two statistics # NTS MODE 1 OR 2 WILL CURRENTLY BREAK HERE
-        stat_FcBdry = np.concatenate((ming1g2_d1Fc_concat,ming1g2_d2Fc_concat,ming1g2_d12Fc_concat),axis=-1)#stat_FcBdry.reshape(stat_FcBdry.shape[-2],stat_FcBdry.shape[-1])
-        stat_FcBdry = stat_FcBdry.reshape(stat_FcBdry.shape[-2],stat_FcBdry.shape[-1])
 
+    # If we are in mode 2 or 3 we need to interpolate along the intersection
+    # boundary as well
+    if mode == 2 or mode == 3:
 
-        # # ----------------------------------------------------------------------------------------
-        # # Get the values along the outer and inner boundaries
-        # stat_FcBdry1 = get_bdry_values_concat(stat, Fc_bdry_locs)
-        # print('MARKER 1: ', stat_FcBdry1)
+        # Interpolation for d1Fc and d2Fc boundary
+        g1_d12Fc_concat = get_bdry_vals_interpolated_concat(g1_d12Fc_concat,d12Fc_mu1_bdry_weights_concat)
+        g2_d12Fc_concat = get_bdry_vals_interpolated_concat(g2_d12Fc_concat,d12Fc_mu2_bdry_weights_concat)
 
-        # # Interpolate to get the values along the true boundary
-        # stat_FcBdry1 = get_bdry_vals_interpolated_concat(stat_FcBdry1, Fc_bdry_weights_concat)
 
-        # # ----------------------------------------------------------------------------------------
+    # Get minimum along interpolated d1Fc boundary
+    ming1g2_d1Fc_concat = np.minimum(g1_d1Fc_concat,g2_d1Fc_concat)
 
-        
+    # Get minimum along interpolated d2Fc boundary
+    ming1g2_d2Fc_concat = np.minimum(g1_d2Fc_concat,g2_d2Fc_concat)
 
+    # Get minimum along interpolated d12Fc boundary
+    ming1g2_d12Fc_concat = np.minimum(g1_d12Fc_concat,g2_d12Fc_concat)
 
-        # # ----------------------------------------------------------------------------------------
-        # # Get the values along the outer and inner boundaries
-        # stat_FcBdry1_tmp = get_bdry_values(stat, Fc_bdry_locs)
-        # print('MARKER 2: ', stat_FcBdry1)
+    # print('yaaah')
+    # print(ming1g2_d12Fc_concat.shape)
+    # print(ming1g2_d1Fc_concat)
+    # print('break')
+    # print(ming1g2_d2Fc_concat)
+    # print(np.concatenate((ming1g2_d1Fc_concat,ming1g2_d2Fc_concat,ming1g2_d12Fc_concat),axis=-1).shape)
 
+    # =======================================================================
 
-        # # Interpolate to get the values along the true boundary
-        # stat_FcBdry1_tmp = get_bdry_vals_interpolated(stat_FcBdry1_tmp, Fc_bdry_weights)
-        # # ----------------------------------------------------------------------------------------
+    # -----------------------------------------------------------------------
+    # Get stat along the Fc boundary
+    # -----------------------------------------------------------------------
 
-        # print(np.all(np.sort(stat_FcBdry1,axis=1)==np.sort(stat_FcBdry1_tmp,axis=1)))
-        # print(stat_FcBdry1.shape)
-        # print(stat_FcBdry1_tmp.shape)
+    # Take the minimum of the two statistics # NTS MODE 1 OR 2 WILL CURRENTLY BREAK HERE
+    stat_FcBdry = np.concatenate((ming1g2_d1Fc_concat,ming1g2_d2Fc_concat,ming1g2_d12Fc_concat),axis=-1)#stat_FcBdry.reshape(stat_FcBdry.shape[-2],stat_FcBdry.shape[-1])
+    stat_FcBdry = stat_FcBdry.reshape(stat_FcBdry.shape[-2],stat_FcBdry.shape[-1])
 
-        # plt.figure(0)
-        # plt.hist(stat_FcBdry1.reshape(np.prod(stat_FcBdry1.shape)))#stat_FcBdry1.reshape(np.prod(stat_FcBdry.shape)))
 
-        # plt.figure(1)
-        # plt.hist(stat_FcBdry1_tmp.reshape(np.prod(stat_FcBdry1_tmp.shape)))#stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
-        # plt.show()
+    # # ----------------------------------------------------------------------------------------
+    # # Get the values along the outer and inner boundaries
+    # stat_FcBdry1 = get_bdry_values_concat(stat, Fc_bdry_locs)
+    # print('MARKER 1: ', stat_FcBdry1)
 
-        # ming1g2_d1Fc_concat1 = stat_FcBdry1_tmp[:,d1Fc_loc]
-        # ming1g2_d2Fc_concat1 = stat_FcBdry1_tmp[:,d2Fc_loc]
-        # ming1g2_d12Fc_concat1 = stat_FcBdry1_tmp[:,d12Fc_loc]
+    # # Interpolate to get the values along the true boundary
+    # stat_FcBdry1 = get_bdry_vals_interpolated_concat(stat_FcBdry1, Fc_bdry_weights_concat)
 
-        # # Take the minimum of the two statistics
-        # stat_FcBdry3 = np.concatenate((ming1g2_d1Fc_concat1,ming1g2_d2Fc_concat1,ming1g2_d12Fc_concat1),axis=-1)#stat_FcBdry.reshape(stat_FcBdry.shape[-2],stat_FcBdry.shape[-1])
-        # stat_FcBdry3 = stat_FcBdry3.reshape(stat_FcBdry3.shape[-2],stat_FcBdry3.shape[-1])
+    # # ----------------------------------------------------------------------------------------
 
-        # plt.figure(0)
-        # plt.hist(stat_FcBdry1.reshape(np.prod(stat_FcBdry1.shape)))
+    
 
-        # plt.figure(1)
-        # plt.hist(stat_FcBdry1_tmp.reshape(np.prod(stat_FcBdry1_tmp.shape)))
 
-        # plt.figure(2)
-        # plt.hist(ming1g2_d2Fc_concat.reshape(np.prod(ming1g2_d2Fc_concat.shape)))#stat_FcBdry1.reshape(np.prod(stat_FcBdry.shape)))
+    # # ----------------------------------------------------------------------------------------
+    # # Get the values along the outer and inner boundaries
+    # stat_FcBdry1_tmp = get_bdry_values(stat, Fc_bdry_locs)
+    # print('MARKER 2: ', stat_FcBdry1)
 
-        # plt.figure(3)
-        # plt.hist(ming1g2_d2Fc_concat1.reshape(np.prod(ming1g2_d2Fc_concat1.shape)))#stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
 
-        # plt.figure(4)
-        # plt.hist(ming1g2_d12Fc_concat.reshape(np.prod(ming1g2_d12Fc_concat.shape)))#stat_FcBdry1.reshape(np.prod(stat_FcBdry.shape)))
+    # # Interpolate to get the values along the true boundary
+    # stat_FcBdry1_tmp = get_bdry_vals_interpolated(stat_FcBdry1_tmp, Fc_bdry_weights)
+    # # ----------------------------------------------------------------------------------------
 
-        # plt.figure(5)
-        # plt.hist(ming1g2_d12Fc_concat1.reshape(np.prod(ming1g2_d12Fc_concat1.shape)))#stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
-        # plt.show()
-        # print('break')
-        # print(stat_FcBdry1.reshape(np.prod(stat_FcBdry1.shape)))
-        # print('break')
-        # print(stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
-        # print('break')
-        # print(a_estBdry)
+    # print(np.all(np.sort(stat_FcBdry1,axis=1)==np.sort(stat_FcBdry1_tmp,axis=1)))
+    # print(stat_FcBdry1.shape)
+    # print(stat_FcBdry1_tmp.shape)
 
-        #stat_FcBdry = stat_FcBdry2
+    # plt.figure(0)
+    # plt.hist(stat_FcBdry1.reshape(np.prod(stat_FcBdry1.shape)))#stat_FcBdry1.reshape(np.prod(stat_FcBdry.shape)))
 
-        # -------------------------------------------------------------------
-        # Check whether there were any boundary violations using interpolated
-        # boundary values (checking if voxels had values corresponding to no
-        # violations, etc)
-        # -------------------------------------------------------------------
+    # plt.figure(1)
+    # plt.hist(stat_FcBdry1_tmp.reshape(np.prod(stat_FcBdry1_tmp.shape)))#stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
+    # plt.show()
 
-        # Perform lower check on stat map using thresholds based on the
-        # estimated boundary
-        bdry_lowerCheck_estBdry = stat_FcBdry >= a_estBdry[:,0,:,0]
+    # ming1g2_d1Fc_concat1 = stat_FcBdry1_tmp[:,d1Fc_loc]
+    # ming1g2_d2Fc_concat1 = stat_FcBdry1_tmp[:,d2Fc_loc]
+    # ming1g2_d12Fc_concat1 = stat_FcBdry1_tmp[:,d12Fc_loc]
 
-        # Perform upper check on stat map using thresholds based on the
-        # estimated boundary
-        bdry_upperCheck_estBdry = stat_FcBdry <= a_estBdry[:,1,:,0]
+    # # Take the minimum of the two statistics
+    # stat_FcBdry3 = np.concatenate((ming1g2_d1Fc_concat1,ming1g2_d2Fc_concat1,ming1g2_d12Fc_concat1),axis=-1)#stat_FcBdry.reshape(stat_FcBdry.shape[-2],stat_FcBdry.shape[-1])
+    # stat_FcBdry3 = stat_FcBdry3.reshape(stat_FcBdry3.shape[-2],stat_FcBdry3.shape[-1])
 
-        # Perform lower check on stat map using thresholds based on the
-        # true boundary
-        bdry_lowerCheck_trueBdry = stat_FcBdry >= a_trueBdry[:,0,:,0]
+    # plt.figure(0)
+    # plt.hist(stat_FcBdry1.reshape(np.prod(stat_FcBdry1.shape)))
 
-        # Perform upper check on stat map using thresholds based on the
-        # true boundary
-        bdry_upperCheck_trueBdry = stat_FcBdry <= a_trueBdry[:,1,:,0]
+    # plt.figure(1)
+    # plt.hist(stat_FcBdry1_tmp.reshape(np.prod(stat_FcBdry1_tmp.shape)))
 
+    # plt.figure(2)
+    # plt.hist(ming1g2_d2Fc_concat.reshape(np.prod(ming1g2_d2Fc_concat.shape)))#stat_FcBdry1.reshape(np.prod(stat_FcBdry.shape)))
 
-        #print(np.all(bdry_lowerCheck_estBdry,axis=(1)), np.all(bdry_upperCheck_estBdry,axis=(1)))
+    # plt.figure(3)
+    # plt.hist(ming1g2_d2Fc_concat1.reshape(np.prod(ming1g2_d2Fc_concat1.shape)))#stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
 
-        # -------------------------------------------------------------------
-        # Work out whether simulation observed successful sets.
-        # -------------------------------------------------------------------
-        # Record if we saw a violation in the true boundary based sets
-        trueBdry_success_intrp[r,:] = np.all(bdry_lowerCheck_trueBdry,axis=(1)) & np.all(bdry_upperCheck_trueBdry,axis=(1))# : AXES WONT WORK FOR 3D ATM
+    # plt.figure(4)
+    # plt.hist(ming1g2_d12Fc_concat.reshape(np.prod(ming1g2_d12Fc_concat.shape)))#stat_FcBdry1.reshape(np.prod(stat_FcBdry.shape)))
 
-        # Record if we saw a violation in the estimated boundary based sets
-        estBdry_success_intrp[r,:] = np.all(bdry_lowerCheck_estBdry,axis=(1)) & np.all(bdry_upperCheck_estBdry,axis=(1)) # : AXES WONT WORK FOR 3D ATM
+    # plt.figure(5)
+    # plt.hist(ming1g2_d12Fc_concat1.reshape(np.prod(ming1g2_d12Fc_concat1.shape)))#stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
+    # plt.show()
+    # print('break')
+    # print(stat_FcBdry1.reshape(np.prod(stat_FcBdry1.shape)))
+    # print('break')
+    # print(stat_FcBdry2.reshape(np.prod(stat_FcBdry2.shape)))
+    # print('break')
+    # print(a_estBdry)
 
+    #stat_FcBdry = stat_FcBdry2
 
-    # For the interpolated boundary success checks, we still need to do the 
-    # voxelwise checks as well. This will take care of that.
-    trueBdry_success_intrp = trueBdry_success_intrp*trueBdry_success
-    estBdry_success_intrp = estBdry_success_intrp*estBdry_success
+    # -----------------------------------------------------------------------
+    # Work out the smallest a for which the stat lies between -a and a
+    # along the interpolated boundary. For the interpolated boundary 
+    # success checks, we still need to do the voxelwise checks as well,
+    # so we take the larger critical value.
+    # -----------------------------------------------------------------------
+    crit_intrp = np.maximum(crit, get_crit_val_bdry(stat_FcBdry))
 
-    # Coverage probabilities
-    coverage_trueBdry = np.mean(trueBdry_success,axis=0)
-    coverage_estBdry = np.mean(estBdry_success,axis=0)
+    # -----------------------------------------------------------------------
+    # Work out whether simulation observed successful sets.
+    # -----------------------------------------------------------------------
+    # Record if we saw a violation in the true boundary based sets
+    trueBdry_success = get_success(crit, a_trueBdry)
 
-    # Coverage probabilities
-    coverage_trueBdry_intrp = np.mean(trueBdry_success_intrp,axis=0)
-    coverage_estBdry_intrp = np.mean(estBdry_success_intrp,axis=0)
+    # Record if we saw a violation in the estimated boundary based sets
+    estBdry_success = get_success(crit, a_estBdry)
 
-    # print(coverage_trueBdry)
-    # print(coverage_estBdry)
-    # print(coverage_trueBdry_intrp)
-    # print(coverage_estBdry_intrp)
+    # Record if we saw a violation in the true boundary based sets
+    # (assessed with interpolation)
+    trueBdry_success_intrp = get_success(crit_intrp, a_trueBdry)
 
-    # Make results folder
-    if not os.path.exists(os.path.join(simDir, 'RawResults')):
-        os.mkdir(os.path.join(simDir, 'RawResults'))
+    # Record if we saw a violation in the estimated boundary based sets
+    # (assessed with interpolation)
+    estBdry_success_intrp = get_success(crit_intrp, a_estBdry)
 
-    # Save the violations to a file
-    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess.csv'), trueBdry_success) # Successes based on the true boundary (assessed without interpolation)
-    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess.csv'), estBdry_success) # Successes based on the interpolated boundary (assessed without interpolation) 
-    append_to_file(os.path.join(simDir, 'RawResults', 'trueSuccess_intrp.csv'), trueBdry_success_intrp) # Successes based on the true boundary (assessed with interpolation)
-    append_to_file(os.path.join(simDir, 'RawResults', 'estSuccess_intrp.csv'), estBdry_success_intrp) # Successes based on the interpolated boundary (assessed with interpolation) 
+    # Return the successes and the number of bootstraps for this realization
+    return(trueBdry_success, estBdry_success, trueBdry_success_intrp, estBdry_success_intrp, nBoot_used)
 
-    # Save the computation times
-    t2overall = time.time()
-    append_to_file(os.path.join(simDir, 'RawResults', 'computationTime.csv'), np.array([t2overall-t1overall]))
 
 #SpatialSims_2mu('/home/tommaullin/Documents/ConfRes/tmp/sim15/sim15/cfgs/cfg578.yml')
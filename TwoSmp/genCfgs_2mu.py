@@ -2,8 +2,46 @@ import os
 import numpy as np
 import yaml
 
-
-def generateCfgs(OutDir, simNo):
+# ==========================================================================
+#
+# This function adds the inputs for a nested sample size design to the 
+# inputs for a configuration. In a nested design, every sample size for a
+# given setting is run by a single job (that of the configuration with the
+# largest sample size), which takes the first nSub subjects of the same data
+# for each sample size (see `SpatialSims_2mu`). The other configurations are
+# marked as being run by that configuration.
+#
+# --------------------------------------------------------------------------
+#
+# Inputs:
+#
+# --------------------------------------------------------------------------
+#
+# - `inputs`: The inputs for the configuration (these are modified).
+# - `nSubs`: The sample sizes in the design, in the order in which their
+#            configurations are generated (with consecutive IDs).
+# - `nSub`: The sample size for this configuration.
+# - `cfgId`: The ID for this configuration.
+#
+# ==========================================================================
+def add_nested_inputs(inputs, nSubs, nSub, cfgId):
+
+    # Remove the inputs for the previous configuration
+    inputs.pop('nestedCfgIds', None)
+    inputs.pop('nestedIn', None)
+
+    # IDs of the configurations for every sample size
+    cfgIds = cfgId - list(nSubs).index(nSub) + np.arange(len(nSubs))
+
+    # The configuration with the largest sample size runs the design
+    leadId = cfgIds[np.argmax(nSubs)]
+    if cfgId == leadId:
+        inputs['nestedCfgIds'] = [int(i) for i in cfgIds]
+    else:
+        inputs['nestedIn'] = int(leadId)
+
+
+def generateCfgs(OutDir, simNo, nested=False):
 
     # Make simulation directory
     simDir = os.path.join(OutDir, 'sim'+str(simNo))
@@ -40,6 +78,11 @@ def generateCfgs(OutDir, simNo):
     # Add number of bootstraps
     inputs['nBoot'] = 5000
 
+    # Add root seed for the random number generators (every random number
+    # in the simulation is drawn from a stream derived from this, so the
+    # simulation can be reproduced)
+    inputs['seed'] = int(np.random.SeedSequence().entropy)
+
     # Create mu1 and mu2 specification
     mu1 = {}
     mu2 = {}
@@ -144,6 +187,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -258,6 +306,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -372,6 +425,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -486,6 +544,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -599,6 +662,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -713,6 +781,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -827,6 +900,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -941,6 +1019,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1057,6 +1140,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (FWHM2 in fg_FWHM2s):
 
@@ -1173,6 +1261,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (FWHM2 in fg_FWHM2s):
 
@@ -1288,6 +1381,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1403,6 +1501,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1518,6 +1621,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1633,6 +1741,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1747,6 +1860,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1861,6 +1979,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and (center in fg_centers):
 
@@ -1977,6 +2100,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and np.any(np.isclose(fg_corrs,corr)):
 
@@ -2092,6 +2220,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and np.any(np.isclose(fg_corrs,corr)):
 
@@ -2202,6 +2335,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 print(grad, fg_grads, grad in fg_grads)
                 if (nSub in fg_nSubs) and np.any(np.isclose(fg_grads,grad)):
@@ -2315,6 +2453,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and np.any(np.isclose(fg_grads,grad)):
 
@@ -2432,6 +2575,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and np.any(np.isclose(fg_mags,mag)):
 
@@ -2550,6 +2698,11 @@ def generateCfgs(OutDir, simNo):
                 # Save cfg ID (handy to have around)
                 inputs['cfgId'] = int(cfgId)
 
+                # In a nested sample size design, the configuration with the
+                # largest sample size is run for every sample size at once
+                if nested:
+                    add_nested_inputs(inputs, nSubs, nSub, cfgId)
+
                 # Record if we want to save figures for this design or not
                 if (nSub in fg_nSubs) and np.any(np.isclose(fg_mags,mag)):
 
@@ -2577,6 +2730,11 @@ def generateCfgs(OutDir, simNo):
     # script used for running simulations on the cluster will take this files existence as
     # a sign to run the next stage of the simulations)
     #--------------------------------------------------------------------------------------
+    # Remove the inputs for nested designs (these are specific to each 
+    # configuration)
+    inputs.pop('nestedCfgIds', None)
+    inputs.pop('nestedIn', None)
+
     # Save the yml
     with open(os.path.join(simDir,'cfgs','baseline_cfg.yml'), 'w') as outfile:
         yaml.dump(inputs, outfile, default_flow_style=False)
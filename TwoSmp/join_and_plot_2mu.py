@@ -6,6 +6,45 @@ import shutil
 import pandas as pd
 from matplotlib import pyplot as plt
 from lib.fileio import *
+from lib.coverage import *
+
+# ============================================================================
+#
+# This function returns the results directories of a configuration, along
+# with the threshold each holds results for. If several thresholds were run
+# at once (i.e. `c` was given as a string giving a numpy array), the results
+# for each threshold are in their own folder, RawResults/c<value>, and 
+# otherwise they are in RawResults.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `cfgDir`: The directory of the configuration.
+# - `c`: The threshold given in the configuration file.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `resDirs`: List of (threshold, results directory) pairs, sorted by 
+#              threshold.
+#
+# ============================================================================
+def get_res_dirs(cfgDir, c):
+
+    # Several thresholds, each with its own folder
+    if isinstance(c, str):
+        cDirs = [d for d in glob.glob(os.path.join(cfgDir, 'RawResults', 'c*')) if os.path.isdir(d)]
+        return(sorted([(float(os.path.basename(d)[1:]), d) for d in cDirs]))
+
+    # A single threshold
+    return([(float(c), os.path.join(cfgDir, 'RawResults'))])
+
 
 def joinAndPlot(OutDir, simNo):
 
@@ -47,8 +86,10 @@ def joinAndPlot(OutDir, simNo):
             # Get configuration ID
             cfgId = int(inputs['cfgId'])
 
-            # Results directory
-            resDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId), 'RawResults')
+            # Results directories (one for each threshold, if several 
+            # thresholds were run at once)
+            cfgDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId))
+            resDirs = get_res_dirs(cfgDir, inputs['c'])
 
             # ------------------------------------------------------------------
             # Get number of p values
@@ -59,148 +100,200 @@ def joinAndPlot(OutDir, simNo):
             # Number of p values
             n_p = np.prod(p.shape)
 
-            # ------------------------------------------------------------------
-            # Currently there is a try except clause here. The reason for this
-            # is that if a boundary is empty the code will error and no results
-            # will be produced. In such a case, we skip that result.
-            # ------------------------------------------------------------------ 
-            try:
-
-                # ------------------------------------------------------------------
-                # Read in results
-                # ------------------------------------------------------------------
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+            # Whether results were read for every threshold (there are none to
+            # read if the results directories are missing)
+            allRead = len(resDirs) > 0
 
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+            # Loop through the thresholds
+            for thresh, resDir in resDirs:
 
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
-
-                # ------------------------------------------------------------------
-                # Get coverage probabilities
                 # ------------------------------------------------------------------
+                # Currently there is a try except clause here. The reason for this
+                # is that if a boundary is empty the code will error and no results
+                # will be produced. In such a case, we skip that result (only 
+                # missing or empty results files are skipped, anything else 
+                # raises).
+                # ------------------------------------------------------------------ 
+                try:
+
+                    # ------------------------------------------------------------------
+                    # Read in results
+                    # ------------------------------------------------------------------
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # ------------------------------------------------------------------
+                    # Get coverage probabilities
+                    # ------------------------------------------------------------------
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary
+                    covp_est = np.mean(obs_est.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary
+                    covp_true = np.mean(obs_true.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary (for coverage assessed using interpolation)
+                    covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary (for coverage assessed using interpolation)
+                    covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+
+                    # Get the number of realizations run (if the realizations were
+                    # stopped sequentially, this differs between configurations)
+                    nReals = obs_est_intrp.shape[0]
+
+                    # Get control variate estimates of the coverage for the estimated
+                    # boundary (using the true boundary results as the control), and
+                    # their standard errors
+                    covp_est_cv, se_est_cv = get_cv_coverage(obs_est.values, obs_true.values, p)
+                    covp_est_intrp_cv, se_est_intrp_cv = get_cv_coverage(obs_est_intrp.values, obs_true_intrp.values, p)
+
+                    # ------------------------------------------------------------------
+                    # Get number of subjects and distance between radii
+                    # ------------------------------------------------------------------
+
+                    # Number of subjects
+                    nSub = inputs['nSub']
+
+                    # Distance between circle centers
+                    distance = np.sum(eval(inputs['mu2']['center'])-eval(inputs['mu1']['center']))
+
+                    # ------------------------------------------------------------------
+                    # Add coverage probabilities to table
+                    # ------------------------------------------------------------------
+                    # Line for table of estimated boundary results
+                    tableLine_est = np.concatenate((np.array([[cfgId,nSub,distance,thresh,nReals]]),\
+                                                    covp_est.reshape(1,n_p)),\
+                                                    axis=1)
+
+                    # Line for table of true boundary results
+                    tableLine_true = np.concatenate((np.array([[cfgId,nSub,distance,thresh,nReals]]),\
+                                                     covp_true.reshape(1,n_p)),\
+                                                     axis=1)
+
+                    # Line for table of estimated boundary interpolation assessed results
+                    tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,distance,thresh,nReals]]),\
+                                                          covp_est_intrp.reshape(1,n_p)),\
+                                                          axis=1)
+
+                    # Line for table of true boundary interpolation assessed results
+                    tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,distance,thresh,nReals]]),\
+                                                           covp_true_intrp.reshape(1,n_p)),\
+                                                           axis=1)
+
+                    # Line for table of control variate estimated boundary results (the
+                    # estimates followed by their standard errors)
+                    tableLine_est_cv = np.concatenate((np.array([[cfgId,nSub,distance,thresh,nReals]]),\
+                                                       covp_est_cv.reshape(1,n_p),\
+                                                       se_est_cv.reshape(1,n_p)),\
+                                                       axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary
-                covp_est = np.mean(obs_est.values,axis=0)[:]
+                    # Line for table of control variate estimated boundary interpolation
+                    # assessed results (the estimates followed by their standard errors)
+                    tableLine_est_intrp_cv = np.concatenate((np.array([[cfgId,nSub,distance,thresh,nReals]]),\
+                                                             covp_est_intrp_cv.reshape(1,n_p),\
+                                                             se_est_intrp_cv.reshape(1,n_p)),\
+                                                             axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary
-                covp_true = np.mean(obs_true.values,axis=0)[:]
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary (for coverage assessed using interpolation)
-                covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+                        # Initialize estimated boundary results table
+                        table_est = pd.DataFrame(tableLine_est)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary (for coverage assessed using interpolation)
-                covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+                        # Initialize true boundary results table
+                        table_true = pd.DataFrame(tableLine_true)
 
-                # ------------------------------------------------------------------
-                # Get number of subjects and distance between radii
-                # ------------------------------------------------------------------
+                        # Initialize estimated boundary interpolated results table
+                        table_est_intrp = pd.DataFrame(tableLine_est_intrp)
 
-                # Number of subjects
-                nSub = inputs['nSub']
+                        # Initialize true boundary interpolated results table
+                        table_true_intrp = pd.DataFrame(tableLine_true_intrp)
 
-                # Distance between circle centers
-                distance = np.sum(eval(inputs['mu2']['center'])-eval(inputs['mu1']['center']))
+                        # Initialize control variate estimated boundary results table
+                        table_est_cv = pd.DataFrame(tableLine_est_cv)
 
-                # ------------------------------------------------------------------
-                # Add coverage probabilities to table
-                # ------------------------------------------------------------------
-                # Line for table of estimated boundary results
-                tableLine_est = np.concatenate((np.array([[cfgId,nSub,distance]]),\
-                                                covp_est.reshape(1,n_p)),\
-                                                axis=1)
-
-                # Line for table of true boundary results
-                tableLine_true = np.concatenate((np.array([[cfgId,nSub,distance]]),\
-                                                 covp_true.reshape(1,n_p)),\
-                                                 axis=1)
-
-                # Line for table of estimated boundary interpolation assessed results
-                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,distance]]),\
-                                                      covp_est_intrp.reshape(1,n_p)),\
-                                                      axis=1)
-
-                # Line for table of true boundary interpolation assessed results
-                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,distance]]),\
-                                                       covp_true_intrp.reshape(1,n_p)),\
-                                                       axis=1)
-
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Initialize control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = pd.DataFrame(tableLine_est_intrp_cv)
 
-                    # Initialize estimated boundary results table
-                    table_est = pd.DataFrame(tableLine_est)
+                    else:
 
-                    # Initialize true boundary results table
-                    table_true = pd.DataFrame(tableLine_true)
+                        # Append to existing estimated boundary results table
+                        table_est = table_est.append(pd.DataFrame(tableLine_est))
 
-                    # Initialize estimated boundary interpolated results table
-                    table_est_intrp = pd.DataFrame(tableLine_est_intrp)
+                        # Append to existing true boundary results table
+                        table_true = table_true.append(pd.DataFrame(tableLine_true))
 
-                    # Initialize true boundary interpolated results table
-                    table_true_intrp = pd.DataFrame(tableLine_true_intrp)
+                        # Append to existing estimated boundary interpolated results table
+                        table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
 
-                else:
+                        # Append to existing true boundary interpolated results table
+                        table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
 
-                    # Append to existing estimated boundary results table
-                    table_est = table_est.append(pd.DataFrame(tableLine_est))
+                        # Append to existing control variate estimated boundary results table
+                        table_est_cv = table_est_cv.append(pd.DataFrame(tableLine_est_cv))
 
-                    # Append to existing true boundary results table
-                    table_true = table_true.append(pd.DataFrame(tableLine_true))
+                        # Append to existing control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = table_est_intrp_cv.append(pd.DataFrame(tableLine_est_intrp_cv))
 
-                    # Append to existing estimated boundary interpolated results table
-                    table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
+                    # ------------------------------------------------------------------
+                    # Get computation times
+                    # ------------------------------------------------------------------
+                    tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
 
-                    # Append to existing true boundary interpolated results table
-                    table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
-
-                # ------------------------------------------------------------------
-                # Get computation times
-                # ------------------------------------------------------------------
-                tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Initialize time table
+                        table_time = pd.DataFrame(tableLine_time)
 
-                    # Initialize time table
-                    table_time = pd.DataFrame(tableLine_time)
+                    else:
 
-                else:
+                        # Append to existing time table
+                        table_time = table_time.append(pd.DataFrame(tableLine_time))
 
-                    # Append to existing time table
-                    table_time = table_time.append(pd.DataFrame(tableLine_time))
+                    # We are no longer looking at the first configuration file
+                    if first:
+                        first = False
 
-                # ------------------------------------------------------------------
-                # Delete files
-                # ------------------------------------------------------------------
-                # Delete folder for this simulation
-                shutil.rmtree(os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId)))
+                except (FileNotFoundError, pd.errors.EmptyDataError):
 
-                # We are no longer looking at the first configuration file
-                if first:
-                    first = False
+                    # Record that no results were read for this threshold
+                    print('No results were read from ' + resDir)
+                    allRead = False
 
-            except:
+            # ------------------------------------------------------------------
+            # Delete files
+            # ------------------------------------------------------------------
+            # Delete folder for this configuration (if every result was read)
+            if allRead:
+                shutil.rmtree(cfgDir)
 
-                pass
+        # Check that results were read for at least one configuration
+        if first:
+            raise ValueError('No results were read for simulation ' + str(simNo) + '.')
 
         # ----------------------------------------------------------------------
         # Sort and save to csv
@@ -225,100 +318,125 @@ def joinAndPlot(OutDir, simNo):
         # Save true boundary (with interpolation) results table
         append_to_file(os.path.join(fResDir,'trueBdry_intrp.csv'), table_true_intrp)
 
+        # Save control variate estimated boundary results table
+        append_to_file(os.path.join(fResDir,'estBdry_cv.csv'), table_est_cv)
+
+        # Save control variate estimated boundary (with interpolation) results table
+        append_to_file(os.path.join(fResDir,'estBdry_intrp_cv.csv'), table_est_intrp_cv)
+
         # ----------------------------------------------------------------------
         # Make figures
         # ----------------------------------------------------------------------
 
         # Column headers
-        colhdr = ['cfgID', 'n', 'distance']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
+        colhdr = ['cfgID', 'n', 'distance', 'c', 'nReals']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
 
         # Assign column headers
         table_true_intrp.columns=colhdr
         table_est_intrp.columns=colhdr
 
-        # List of n and p values
-        n_values = np.unique(table_est_intrp['n'].values)
-        d_values = np.unique(table_est_intrp['distance'].values)
-        p_values = np.linspace(0,1,21)
-
-        # Loop through all values of n
-        for n in n_values:
-
-            # Loop through all values of p
-            for p in p_values:
-
-                table_est_n = table_est_intrp[table_est_intrp['n']==n].sort_values('distance')
-                table_true_n = table_true_intrp[table_true_intrp['n']==n].sort_values('distance')
-
-                # Distances
-                distances_est_n = table_est_n[['distance']].values
-                p_est_n = table_est_n[['p='+('%.2f' % p)]].values
-                distances_true_n = table_true_n[['distance']].values
-                p_true_n = table_true_n[['p='+('%.2f' % p)]].values
-
-                plt.plot(distances_est_n,p_est_n,color="red",label="Estimated boundary")
-                plt.plot(distances_true_n,p_true_n,color="blue",label="True boundary")
-                plt.hlines(p, np.min(distances_est_n), np.max(distances_est_n),linestyles='dashed',label="Expected")
-
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects)")
-
-                # Axes
-                if simNo in [1,2]:
-                    plt.xlabel("Distance between circles")
-                else:
-                    plt.xlabel("Distance between squares")
-                plt.ylabel("Observed coverage")
-
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_n)-0.02,1))
+        # List of thresholds
+        thresh_values = np.unique(table_est_intrp['c'].values)
+
+        # Loop through all thresholds
+        for thresh in thresh_values:
+
+            # Results for this threshold
+            table_est_intrp_c = table_est_intrp[table_est_intrp['c']==thresh]
+            table_true_intrp_c = table_true_intrp[table_true_intrp['c']==thresh]
+
+            # If there are several thresholds, the figures for each are 
+            # labelled with the threshold
+            if len(thresh_values) > 1:
+                cSuffix = '_c' + ('%g' % thresh)
+                cTitle = ", c=" + ('%g' % thresh)
+            else:
+                cSuffix = ''
+                cTitle = ''
+
+            # List of n and p values
+            n_values = np.unique(table_est_intrp_c['n'].values)
+            d_values = np.unique(table_est_intrp_c['distance'].values)
+            p_values = np.linspace(0,1,21)
+
+            # Loop through all values of n
+            for n in n_values:
+
+                # Loop through all values of p
+                for p in p_values:
+
+                    table_est_n = table_est_intrp_c[table_est_intrp_c['n']==n].sort_values('distance')
+                    table_true_n = table_true_intrp_c[table_true_intrp_c['n']==n].sort_values('distance')
+
+                    # Distances
+                    distances_est_n = table_est_n[['distance']].values
+                    p_est_n = table_est_n[['p='+('%.2f' % p)]].values
+                    distances_true_n = table_true_n[['distance']].values
+                    p_true_n = table_true_n[['p='+('%.2f' % p)]].values
+
+                    plt.plot(distances_est_n,p_est_n,color="red",label="Estimated boundary")
+                    plt.plot(distances_true_n,p_true_n,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(distances_est_n), np.max(distances_est_n),linestyles='dashed',label="Expected")
+
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects" + cTitle + ")")
+
+                    # Axes
+                    if simNo in [1,2]:
+                        plt.xlabel("Distance between circles")
+                    else:
+                        plt.xlabel("Distance between squares")
+                    plt.ylabel("Observed coverage")
+
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_n)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'd_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'd_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-        # Loop through all values of distance
-        for d in d_values:
+            # Loop through all values of distance
+            for d in d_values:
 
-            # Loop through all values of p
-            for p in p_values:
+                # Loop through all values of p
+                for p in p_values:
 
-                table_est_d = table_est_intrp[table_est_intrp['distance']==d].sort_values('n')
-                table_true_d = table_true_intrp[table_true_intrp['distance']==d].sort_values('n')
+                    table_est_d = table_est_intrp_c[table_est_intrp_c['distance']==d].sort_values('n')
+                    table_true_d = table_true_intrp_c[table_true_intrp_c['distance']==d].sort_values('n')
 
-                # Distances
-                n_est_d = table_est_d[['n']].values
-                p_est_d = table_est_d[['p='+('%.2f' % p)]].values
-                n_true_d = table_true_d[['n']].values
-                p_true_d = table_true_d[['p='+('%.2f' % p)]].values
+                    # Distances
+                    n_est_d = table_est_d[['n']].values
+                    p_est_d = table_est_d[['p='+('%.2f' % p)]].values
+                    n_true_d = table_true_d[['n']].values
+                    p_true_d = table_true_d[['p='+('%.2f' % p)]].values
 
-                plt.plot(n_est_d,p_est_d,color="red",label="Estimated boundary")
-                plt.plot(n_true_d,p_true_d,color="blue",label="True boundary")
-                plt.hlines(p, np.min(n_est_d), np.max(n_est_d),linestyles='dashed',label="Expected")
+                    plt.plot(n_est_d,p_est_d,color="red",label="Estimated boundary")
+                    plt.plot(n_true_d,p_true_d,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(n_est_d), np.max(n_est_d),linestyles='dashed',label="Expected")
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, distance " + str(int(d)) + ")")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, distance " + str(int(d)) + cTitle + ")")
 
-                # Axes
-                plt.xlabel("Number of subjects")
-                plt.ylabel("Observed coverage")
+                    # Axes
+                    plt.xlabel("Number of subjects")
+                    plt.ylabel("Observed coverage")
                 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_d)-0.02,1))
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_d)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_d'+str(np.int(d))+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_d'+str(np.int(d))+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
     if simNo in [9,10]:
 
@@ -341,8 +459,10 @@ def joinAndPlot(OutDir, simNo):
             # Get configuration ID
             cfgId = int(inputs['cfgId'])
 
-            # Results directory
-            resDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId), 'RawResults')
+            # Results directories (one for each threshold, if several 
+            # thresholds were run at once)
+            cfgDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId))
+            resDirs = get_res_dirs(cfgDir, inputs['c'])
 
             # ------------------------------------------------------------------
             # Get number of p values
@@ -353,148 +473,200 @@ def joinAndPlot(OutDir, simNo):
             # Number of p values
             n_p = np.prod(p.shape)
 
-            # ------------------------------------------------------------------
-            # Currently there is a try except clause here. The reason for this
-            # is that if a boundary is empty the code will error and no results
-            # will be produced. In such a case, we skip that result.
-            # ------------------------------------------------------------------ 
-            try:
+            # Whether results were read for every threshold (there are none to
+            # read if the results directories are missing)
+            allRead = len(resDirs) > 0
 
-                # ------------------------------------------------------------------
-                # Read in results
-                # ------------------------------------------------------------------
+            # Loop through the thresholds
+            for thresh, resDir in resDirs:
 
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
-
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
-
-                # ------------------------------------------------------------------
-                # Get coverage probabilities
                 # ------------------------------------------------------------------
+                # Currently there is a try except clause here. The reason for this
+                # is that if a boundary is empty the code will error and no results
+                # will be produced. In such a case, we skip that result (only 
+                # missing or empty results files are skipped, anything else 
+                # raises).
+                # ------------------------------------------------------------------ 
+                try:
+
+                    # ------------------------------------------------------------------
+                    # Read in results
+                    # ------------------------------------------------------------------
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # ------------------------------------------------------------------
+                    # Get coverage probabilities
+                    # ------------------------------------------------------------------
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary
+                    covp_est = np.mean(obs_est.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary
+                    covp_true = np.mean(obs_true.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary (for coverage assessed using interpolation)
+                    covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary (for coverage assessed using interpolation)
+                    covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+
+                    # Get the number of realizations run (if the realizations were
+                    # stopped sequentially, this differs between configurations)
+                    nReals = obs_est_intrp.shape[0]
+
+                    # Get control variate estimates of the coverage for the estimated
+                    # boundary (using the true boundary results as the control), and
+                    # their standard errors
+                    covp_est_cv, se_est_cv = get_cv_coverage(obs_est.values, obs_true.values, p)
+                    covp_est_intrp_cv, se_est_intrp_cv = get_cv_coverage(obs_est_intrp.values, obs_true_intrp.values, p)
+
+                    # ------------------------------------------------------------------
+                    # Get number of subjects and fwhm for second noise field
+                    # ------------------------------------------------------------------
+
+                    # Number of subjects
+                    nSub = inputs['nSub']
+
+                    # FWHM for second noise field
+                    FWHM2 = str2vec(inputs['noise2']['FWHM'])[1]
+
+                    # ------------------------------------------------------------------
+                    # Add coverage probabilities to table
+                    # ------------------------------------------------------------------
+                    # Line for table of estimated boundary results
+                    tableLine_est = np.concatenate((np.array([[cfgId,nSub,FWHM2,thresh,nReals]]),\
+                                                    covp_est.reshape(1,n_p)),\
+                                                    axis=1)
+
+                    # Line for table of true boundary results
+                    tableLine_true = np.concatenate((np.array([[cfgId,nSub,FWHM2,thresh,nReals]]),\
+                                                     covp_true.reshape(1,n_p)),\
+                                                     axis=1)
+
+                    # Line for table of estimated boundary interpolation assessed results
+                    tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,FWHM2,thresh,nReals]]),\
+                                                          covp_est_intrp.reshape(1,n_p)),\
+                                                          axis=1)
+
+                    # Line for table of true boundary interpolation assessed results
+                    tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,FWHM2,thresh,nReals]]),\
+                                                           covp_true_intrp.reshape(1,n_p)),\
+                                                           axis=1)
+
+                    # Line for table of control variate estimated boundary results (the
+                    # estimates followed by their standard errors)
+                    tableLine_est_cv = np.concatenate((np.array([[cfgId,nSub,FWHM2,thresh,nReals]]),\
+                                                       covp_est_cv.reshape(1,n_p),\
+                                                       se_est_cv.reshape(1,n_p)),\
+                                                       axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary
-                covp_est = np.mean(obs_est.values,axis=0)[:]
+                    # Line for table of control variate estimated boundary interpolation
+                    # assessed results (the estimates followed by their standard errors)
+                    tableLine_est_intrp_cv = np.concatenate((np.array([[cfgId,nSub,FWHM2,thresh,nReals]]),\
+                                                             covp_est_intrp_cv.reshape(1,n_p),\
+                                                             se_est_intrp_cv.reshape(1,n_p)),\
+                                                             axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary
-                covp_true = np.mean(obs_true.values,axis=0)[:]
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary (for coverage assessed using interpolation)
-                covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+                        # Initialize estimated boundary results table
+                        table_est = pd.DataFrame(tableLine_est)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary (for coverage assessed using interpolation)
-                covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+                        # Initialize true boundary results table
+                        table_true = pd.DataFrame(tableLine_true)
 
-                # ------------------------------------------------------------------
-                # Get number of subjects and fwhm for second noise field
-                # ------------------------------------------------------------------
+                        # Initialize estimated boundary interpolated results table
+                        table_est_intrp = pd.DataFrame(tableLine_est_intrp)
 
-                # Number of subjects
-                nSub = inputs['nSub']
+                        # Initialize true boundary interpolated results table
+                        table_true_intrp = pd.DataFrame(tableLine_true_intrp)
 
-                # FWHM for second noise field
-                FWHM2 = str2vec(inputs['FWHM2'])[1]
+                        # Initialize control variate estimated boundary results table
+                        table_est_cv = pd.DataFrame(tableLine_est_cv)
 
-                # ------------------------------------------------------------------
-                # Add coverage probabilities to table
-                # ------------------------------------------------------------------
-                # Line for table of estimated boundary results
-                tableLine_est = np.concatenate((np.array([[cfgId,nSub,FWHM2]]),\
-                                                covp_est.reshape(1,n_p)),\
-                                                axis=1)
-
-                # Line for table of true boundary results
-                tableLine_true = np.concatenate((np.array([[cfgId,nSub,FWHM2]]),\
-                                                 covp_true.reshape(1,n_p)),\
-                                                 axis=1)
-
-                # Line for table of estimated boundary interpolation assessed results
-                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,FWHM2]]),\
-                                                      covp_est_intrp.reshape(1,n_p)),\
-                                                      axis=1)
-
-                # Line for table of true boundary interpolation assessed results
-                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,FWHM2]]),\
-                                                       covp_true_intrp.reshape(1,n_p)),\
-                                                       axis=1)
+                        # Initialize control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = pd.DataFrame(tableLine_est_intrp_cv)
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                    else:
 
-                    # Initialize estimated boundary results table
-                    table_est = pd.DataFrame(tableLine_est)
+                        # Append to existing estimated boundary results table
+                        table_est = table_est.append(pd.DataFrame(tableLine_est))
 
-                    # Initialize true boundary results table
-                    table_true = pd.DataFrame(tableLine_true)
+                        # Append to existing true boundary results table
+                        table_true = table_true.append(pd.DataFrame(tableLine_true))
 
-                    # Initialize estimated boundary interpolated results table
-                    table_est_intrp = pd.DataFrame(tableLine_est_intrp)
+                        # Append to existing estimated boundary interpolated results table
+                        table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
 
-                    # Initialize true boundary interpolated results table
-                    table_true_intrp = pd.DataFrame(tableLine_true_intrp)
+                        # Append to existing true boundary interpolated results table
+                        table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
 
-                else:
+                        # Append to existing control variate estimated boundary results table
+                        table_est_cv = table_est_cv.append(pd.DataFrame(tableLine_est_cv))
 
-                    # Append to existing estimated boundary results table
-                    table_est = table_est.append(pd.DataFrame(tableLine_est))
+                        # Append to existing control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = table_est_intrp_cv.append(pd.DataFrame(tableLine_est_intrp_cv))
 
-                    # Append to existing true boundary results table
-                    table_true = table_true.append(pd.DataFrame(tableLine_true))
+                    # ------------------------------------------------------------------
+                    # Get computation times
+                    # ------------------------------------------------------------------
+                    tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
 
-                    # Append to existing estimated boundary interpolated results table
-                    table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                    # Append to existing true boundary interpolated results table
-                    table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
+                        # Initialize time table
+                        table_time = pd.DataFrame(tableLine_time)
 
-                # ------------------------------------------------------------------
-                # Get computation times
-                # ------------------------------------------------------------------
-                tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
+                    else:
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Append to existing time table
+                        table_time = table_time.append(pd.DataFrame(tableLine_time))
 
-                    # Initialize time table
-                    table_time = pd.DataFrame(tableLine_time)
+                    # We are no longer looking at the first configuration file
+                    if first:
+                        first = False
 
-                else:
+                except (FileNotFoundError, pd.errors.EmptyDataError):
 
-                    # Append to existing time table
-                    table_time = table_time.append(pd.DataFrame(tableLine_time))
+                    # Record that no results were read for this threshold
+                    print('No results were read from ' + resDir)
+                    allRead = False
 
-                # ------------------------------------------------------------------
-                # Delete files
-                # ------------------------------------------------------------------
-                # Delete folder for this simulation
-                shutil.rmtree(os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId)))
-
-                # We are no longer looking at the first configuration file
-                if first:
-                    first = False
-
-            except:
+            # ------------------------------------------------------------------
+            # Delete files
+            # ------------------------------------------------------------------
+            # Delete folder for this configuration (if every result was read)
+            if allRead:
+                shutil.rmtree(cfgDir)
 
-                pass
+        # Check that results were read for at least one configuration
+        if first:
+            raise ValueError('No results were read for simulation ' + str(simNo) + '.')
 
         # ----------------------------------------------------------------------
         # Sort and save to csv
@@ -519,99 +691,124 @@ def joinAndPlot(OutDir, simNo):
         # Save true boundary (with interpolation) results table
         append_to_file(os.path.join(fResDir,'trueBdry_intrp.csv'), table_true_intrp)
 
+        # Save control variate estimated boundary results table
+        append_to_file(os.path.join(fResDir,'estBdry_cv.csv'), table_est_cv)
+
+        # Save control variate estimated boundary (with interpolation) results table
+        append_to_file(os.path.join(fResDir,'estBdry_intrp_cv.csv'), table_est_intrp_cv)
+
         # ----------------------------------------------------------------------
         # Make figures
         # ----------------------------------------------------------------------
 
         # Column headers
-        colhdr = ['cfgID', 'n', 'FWHM2']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
+        colhdr = ['cfgID', 'n', 'FWHM2', 'c', 'nReals']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
 
         # Assign column headers
         table_true_intrp.columns=colhdr
         table_est_intrp.columns=colhdr
 
-        # List of n and p values
-        n_values = np.unique(table_est_intrp['n'].values)
-        f_values = np.unique(table_est_intrp['FWHM2'].values)
-        p_values = np.linspace(0,1,21)
+        # List of thresholds
+        thresh_values = np.unique(table_est_intrp['c'].values)
+
+        # Loop through all thresholds
+        for thresh in thresh_values:
+
+            # Results for this threshold
+            table_est_intrp_c = table_est_intrp[table_est_intrp['c']==thresh]
+            table_true_intrp_c = table_true_intrp[table_true_intrp['c']==thresh]
+
+            # If there are several thresholds, the figures for each are 
+            # labelled with the threshold
+            if len(thresh_values) > 1:
+                cSuffix = '_c' + ('%g' % thresh)
+                cTitle = ", c=" + ('%g' % thresh)
+            else:
+                cSuffix = ''
+                cTitle = ''
 
-        # Loop through all values of n
-        for n in n_values:
+            # List of n and p values
+            n_values = np.unique(table_est_intrp_c['n'].values)
+            f_values = np.unique(table_est_intrp_c['FWHM2'].values)
+            p_values = np.linspace(0,1,21)
 
-            # Loop through all values of p
-            for p in p_values:
+            # Loop through all values of n
+            for n in n_values:
 
-                table_est_n = table_est_intrp[table_est_intrp['n']==n].sort_values('FWHM2')
-                table_true_n = table_true_intrp[table_true_intrp['n']==n].sort_values('FWHM2')
+                # Loop through all values of p
+                for p in p_values:
 
-                # FWHMs
-                fwhm2_est_n = table_est_n[['FWHM2']].values
-                p_est_n = table_est_n[['p='+('%.2f' % p)]].values
-                fwhm2_true_n = table_true_n[['FWHM2']].values
-                p_true_n = table_true_n[['p='+('%.2f' % p)]].values
+                    table_est_n = table_est_intrp_c[table_est_intrp_c['n']==n].sort_values('FWHM2')
+                    table_true_n = table_true_intrp_c[table_true_intrp_c['n']==n].sort_values('FWHM2')
 
-                plt.plot(fwhm2_est_n,p_est_n,color="red",label="Estimated boundary")
-                plt.plot(fwhm2_true_n,p_true_n,color="blue",label="True boundary")
-                plt.hlines(p, np.min(fwhm2_est_n), np.max(fwhm2_est_n),linestyles='dashed',label="Expected")
+                    # FWHMs
+                    fwhm2_est_n = table_est_n[['FWHM2']].values
+                    p_est_n = table_est_n[['p='+('%.2f' % p)]].values
+                    fwhm2_true_n = table_true_n[['FWHM2']].values
+                    p_true_n = table_true_n[['p='+('%.2f' % p)]].values
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects)")
+                    plt.plot(fwhm2_est_n,p_est_n,color="red",label="Estimated boundary")
+                    plt.plot(fwhm2_true_n,p_true_n,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(fwhm2_est_n), np.max(fwhm2_est_n),linestyles='dashed',label="Expected")
 
-                # Axes
-                plt.xlabel("FWHM for 2nd noise field")
-                plt.ylabel("Observed coverage")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects" + cTitle + ")")
 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_n)-0.02,1))
+                    # Axes
+                    plt.xlabel("FWHM for 2nd noise field")
+                    plt.ylabel("Observed coverage")
+
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_n)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'fwhm_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'fwhm_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-        # Loop through all values of fwhm2
-        for f in f_values:
+            # Loop through all values of fwhm2
+            for f in f_values:
 
-            # Loop through all values of p
-            for p in p_values:
+                # Loop through all values of p
+                for p in p_values:
 
-                table_est_f = table_est_intrp[table_est_intrp['FWHM2']==f].sort_values('n')
-                table_true_f = table_true_intrp[table_true_intrp['FWHM2']==f].sort_values('n')
+                    table_est_f = table_est_intrp_c[table_est_intrp_c['FWHM2']==f].sort_values('n')
+                    table_true_f = table_true_intrp_c[table_true_intrp_c['FWHM2']==f].sort_values('n')
 
-                # n and p for this fwhm
-                n_est_f = table_est_f[['n']].values
-                p_est_f = table_est_f[['p='+('%.2f' % p)]].values
-                n_true_f = table_true_f[['n']].values
-                p_true_f = table_true_f[['p='+('%.2f' % p)]].values
+                    # n and p for this fwhm
+                    n_est_f = table_est_f[['n']].values
+                    p_est_f = table_est_f[['p='+('%.2f' % p)]].values
+                    n_true_f = table_true_f[['n']].values
+                    p_true_f = table_true_f[['p='+('%.2f' % p)]].values
 
-                plt.plot(n_est_f,p_est_f,color="red",label="Estimated boundary")
-                plt.plot(n_true_f,p_true_f,color="blue",label="True boundary")
-                plt.hlines(p, np.min(n_est_f), np.max(n_est_f),linestyles='dashed',label="Expected")
+                    plt.plot(n_est_f,p_est_f,color="red",label="Estimated boundary")
+                    plt.plot(n_true_f,p_true_f,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(n_est_f), np.max(n_est_f),linestyles='dashed',label="Expected")
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, FWHM2 " + ('%.2f' % f) + ")")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, FWHM2 " + ('%.2f' % f) + cTitle + ")")
 
-                # Axes
-                plt.xlabel("Number of subjects")
-                plt.ylabel("Observed coverage")
+                    # Axes
+                    plt.xlabel("Number of subjects")
+                    plt.ylabel("Observed coverage")
                 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_f)-0.02,1))
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_f)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_FWHM'+('%.2f' % f)+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_FWHM'+('%.2f' % f)+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-    # Simulated over correlation range
+        # Simulated over correlation range
     if simNo in [17,18]:
 
         # Variable to check if this is the first file weve looked at
@@ -633,8 +830,10 @@ def joinAndPlot(OutDir, simNo):
             # Get configuration ID
             cfgId = int(inputs['cfgId'])
 
-            # Results directory
-            resDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId), 'RawResults')
+            # Results directories (one for each threshold, if several 
+            # thresholds were run at once)
+            cfgDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId))
+            resDirs = get_res_dirs(cfgDir, inputs['c'])
 
             # ------------------------------------------------------------------
             # Get number of p values
@@ -645,148 +844,200 @@ def joinAndPlot(OutDir, simNo):
             # Number of p values
             n_p = np.prod(p.shape)
 
-            # ------------------------------------------------------------------
-            # Currently there is a try except clause here. The reason for this
-            # is that if a boundary is empty the code will error and no results
-            # will be produced. In such a case, we skip that result.
-            # ------------------------------------------------------------------ 
-            try:
-
-                # ------------------------------------------------------------------
-                # Read in results
-                # ------------------------------------------------------------------
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+            # Whether results were read for every threshold (there are none to
+            # read if the results directories are missing)
+            allRead = len(resDirs) > 0
 
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
+            # Loop through the thresholds
+            for thresh, resDir in resDirs:
 
                 # ------------------------------------------------------------------
-                # Get coverage probabilities
-                # ------------------------------------------------------------------
-
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary
-                covp_est = np.mean(obs_est.values,axis=0)[:]
-
-                # Get the coverage probabilities from the observed results for the
-                # true boundary
-                covp_true = np.mean(obs_true.values,axis=0)[:]
+                # Currently there is a try except clause here. The reason for this
+                # is that if a boundary is empty the code will error and no results
+                # will be produced. In such a case, we skip that result (only 
+                # missing or empty results files are skipped, anything else 
+                # raises).
+                # ------------------------------------------------------------------ 
+                try:
+
+                    # ------------------------------------------------------------------
+                    # Read in results
+                    # ------------------------------------------------------------------
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # ------------------------------------------------------------------
+                    # Get coverage probabilities
+                    # ------------------------------------------------------------------
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary
+                    covp_est = np.mean(obs_est.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary
+                    covp_true = np.mean(obs_true.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary (for coverage assessed using interpolation)
+                    covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary (for coverage assessed using interpolation)
+                    covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+
+                    # Get the number of realizations run (if the realizations were
+                    # stopped sequentially, this differs between configurations)
+                    nReals = obs_est_intrp.shape[0]
+
+                    # Get control variate estimates of the coverage for the estimated
+                    # boundary (using the true boundary results as the control), and
+                    # their standard errors
+                    covp_est_cv, se_est_cv = get_cv_coverage(obs_est.values, obs_true.values, p)
+                    covp_est_intrp_cv, se_est_intrp_cv = get_cv_coverage(obs_est_intrp.values, obs_true_intrp.values, p)
+
+                    # ------------------------------------------------------------------
+                    # Get number of subjects and covariance between noise fields
+                    # ------------------------------------------------------------------
+
+                    # Number of subjects
+                    nSub = inputs['nSub']
+
+                    # Correlation between noise fields
+                    corr = float(inputs['noiseCorr'])
+
+                    # ------------------------------------------------------------------
+                    # Add coverage probabilities to table
+                    # ------------------------------------------------------------------
+                    # Line for table of estimated boundary results
+                    tableLine_est = np.concatenate((np.array([[cfgId,nSub,corr,thresh,nReals]]),\
+                                                    covp_est.reshape(1,n_p)),\
+                                                    axis=1)
+
+                    # Line for table of true boundary results
+                    tableLine_true = np.concatenate((np.array([[cfgId,nSub,corr,thresh,nReals]]),\
+                                                     covp_true.reshape(1,n_p)),\
+                                                     axis=1)
+
+                    # Line for table of estimated boundary interpolation assessed results
+                    tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,corr,thresh,nReals]]),\
+                                                          covp_est_intrp.reshape(1,n_p)),\
+                                                          axis=1)
+
+                    # Line for table of true boundary interpolation assessed results
+                    tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,corr,thresh,nReals]]),\
+                                                           covp_true_intrp.reshape(1,n_p)),\
+                                                           axis=1)
+
+                    # Line for table of control variate estimated boundary results (the
+                    # estimates followed by their standard errors)
+                    tableLine_est_cv = np.concatenate((np.array([[cfgId,nSub,corr,thresh,nReals]]),\
+                                                       covp_est_cv.reshape(1,n_p),\
+                                                       se_est_cv.reshape(1,n_p)),\
+                                                       axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary (for coverage assessed using interpolation)
-                covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+                    # Line for table of control variate estimated boundary interpolation
+                    # assessed results (the estimates followed by their standard errors)
+                    tableLine_est_intrp_cv = np.concatenate((np.array([[cfgId,nSub,corr,thresh,nReals]]),\
+                                                             covp_est_intrp_cv.reshape(1,n_p),\
+                                                             se_est_intrp_cv.reshape(1,n_p)),\
+                                                             axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary (for coverage assessed using interpolation)
-                covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # ------------------------------------------------------------------
-                # Get number of subjects and covariance between noise fields
-                # ------------------------------------------------------------------
+                        # Initialize estimated boundary results table
+                        table_est = pd.DataFrame(tableLine_est)
 
-                # Number of subjects
-                nSub = inputs['nSub']
+                        # Initialize true boundary results table
+                        table_true = pd.DataFrame(tableLine_true)
 
-                # Correlation between noise fields
-                corr = np.float(inputs['noiseCorr'])
+                        # Initialize estimated boundary interpolated results table
+                        table_est_intrp = pd.DataFrame(tableLine_est_intrp)
 
-                # ------------------------------------------------------------------
-                # Add coverage probabilities to table
-                # ------------------------------------------------------------------
-                # Line for table of estimated boundary results
-                tableLine_est = np.concatenate((np.array([[cfgId,nSub,corr]]),\
-                                                covp_est.reshape(1,n_p)),\
-                                                axis=1)
-
-                # Line for table of true boundary results
-                tableLine_true = np.concatenate((np.array([[cfgId,nSub,corr]]),\
-                                                 covp_true.reshape(1,n_p)),\
-                                                 axis=1)
-
-                # Line for table of estimated boundary interpolation assessed results
-                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,corr]]),\
-                                                      covp_est_intrp.reshape(1,n_p)),\
-                                                      axis=1)
-
-                # Line for table of true boundary interpolation assessed results
-                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,corr]]),\
-                                                       covp_true_intrp.reshape(1,n_p)),\
-                                                       axis=1)
+                        # Initialize true boundary interpolated results table
+                        table_true_intrp = pd.DataFrame(tableLine_true_intrp)
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Initialize control variate estimated boundary results table
+                        table_est_cv = pd.DataFrame(tableLine_est_cv)
 
-                    # Initialize estimated boundary results table
-                    table_est = pd.DataFrame(tableLine_est)
+                        # Initialize control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = pd.DataFrame(tableLine_est_intrp_cv)
 
-                    # Initialize true boundary results table
-                    table_true = pd.DataFrame(tableLine_true)
+                    else:
 
-                    # Initialize estimated boundary interpolated results table
-                    table_est_intrp = pd.DataFrame(tableLine_est_intrp)
+                        # Append to existing estimated boundary results table
+                        table_est = table_est.append(pd.DataFrame(tableLine_est))
 
-                    # Initialize true boundary interpolated results table
-                    table_true_intrp = pd.DataFrame(tableLine_true_intrp)
+                        # Append to existing true boundary results table
+                        table_true = table_true.append(pd.DataFrame(tableLine_true))
 
-                else:
+                        # Append to existing estimated boundary interpolated results table
+                        table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
 
-                    # Append to existing estimated boundary results table
-                    table_est = table_est.append(pd.DataFrame(tableLine_est))
+                        # Append to existing true boundary interpolated results table
+                        table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
 
-                    # Append to existing true boundary results table
-                    table_true = table_true.append(pd.DataFrame(tableLine_true))
+                        # Append to existing control variate estimated boundary results table
+                        table_est_cv = table_est_cv.append(pd.DataFrame(tableLine_est_cv))
 
-                    # Append to existing estimated boundary interpolated results table
-                    table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
+                        # Append to existing control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = table_est_intrp_cv.append(pd.DataFrame(tableLine_est_intrp_cv))
 
-                    # Append to existing true boundary interpolated results table
-                    table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
+                    # ------------------------------------------------------------------
+                    # Get computation times
+                    # ------------------------------------------------------------------
+                    tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
 
-                # ------------------------------------------------------------------
-                # Get computation times
-                # ------------------------------------------------------------------
-                tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Initialize time table
+                        table_time = pd.DataFrame(tableLine_time)
 
-                    # Initialize time table
-                    table_time = pd.DataFrame(tableLine_time)
+                    else:
 
-                else:
+                        # Append to existing time table
+                        table_time = table_time.append(pd.DataFrame(tableLine_time))
 
-                    # Append to existing time table
-                    table_time = table_time.append(pd.DataFrame(tableLine_time))
+                    # We are no longer looking at the first configuration file
+                    if first:
+                        first = False
 
-                # ------------------------------------------------------------------
-                # Delete files
-                # ------------------------------------------------------------------
-                # Delete folder for this simulation
-                shutil.rmtree(os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId)))
+                except (FileNotFoundError, pd.errors.EmptyDataError):
 
-                # We are no longer looking at the first configuration file
-                if first:
-                    first = False
+                    # Record that no results were read for this threshold
+                    print('No results were read from ' + resDir)
+                    allRead = False
 
-            except:
+            # ------------------------------------------------------------------
+            # Delete files
+            # ------------------------------------------------------------------
+            # Delete folder for this configuration (if every result was read)
+            if allRead:
+                shutil.rmtree(cfgDir)
 
-                pass
+        # Check that results were read for at least one configuration
+        if first:
+            raise ValueError('No results were read for simulation ' + str(simNo) + '.')
 
         # ----------------------------------------------------------------------
         # Sort and save to csv
@@ -811,103 +1062,128 @@ def joinAndPlot(OutDir, simNo):
         # Save true boundary (with interpolation) results table
         append_to_file(os.path.join(fResDir,'trueBdry_intrp.csv'), table_true_intrp)
 
+        # Save control variate estimated boundary results table
+        append_to_file(os.path.join(fResDir,'estBdry_cv.csv'), table_est_cv)
+
+        # Save control variate estimated boundary (with interpolation) results table
+        append_to_file(os.path.join(fResDir,'estBdry_intrp_cv.csv'), table_est_intrp_cv)
+
         # ----------------------------------------------------------------------
         # Make figures
         # ----------------------------------------------------------------------
 
         # Column headers
-        colhdr = ['cfgID', 'n', 'corr']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
+        colhdr = ['cfgID', 'n', 'corr', 'c', 'nReals']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
 
         # Assign column headers
         table_true_intrp.columns=colhdr
         table_est_intrp.columns=colhdr
 
-        # List of n and p values
-        n_values = np.unique(table_est_intrp['n'].values)
-        c_values = np.unique(table_est_intrp['corr'].values)
-        p_values = np.linspace(0,1,21)
+        # List of thresholds
+        thresh_values = np.unique(table_est_intrp['c'].values)
+
+        # Loop through all thresholds
+        for thresh in thresh_values:
+
+            # Results for this threshold
+            table_est_intrp_c = table_est_intrp[table_est_intrp['c']==thresh]
+            table_true_intrp_c = table_true_intrp[table_true_intrp['c']==thresh]
 
-        # Loop through all values of n
-        for n in n_values:
+            # If there are several thresholds, the figures for each are 
+            # labelled with the threshold
+            if len(thresh_values) > 1:
+                cSuffix = '_c' + ('%g' % thresh)
+                cTitle = ", c=" + ('%g' % thresh)
+            else:
+                cSuffix = ''
+                cTitle = ''
 
-            # Loop through all values of p
-            for p in p_values:
+            # List of n and p values
+            n_values = np.unique(table_est_intrp_c['n'].values)
+            c_values = np.unique(table_est_intrp_c['corr'].values)
+            p_values = np.linspace(0,1,21)
 
-                table_est_n = table_est_intrp[table_est_intrp['n']==n].sort_values('corr')
-                table_true_n = table_true_intrp[table_true_intrp['n']==n].sort_values('corr')
+            # Loop through all values of n
+            for n in n_values:
 
-                # Correlations
-                corr_est_n = table_est_n[['corr']].values
-                p_est_n = table_est_n[['p='+('%.2f' % p)]].values
-                corr_true_n = table_true_n[['corr']].values
-                p_true_n = table_true_n[['p='+('%.2f' % p)]].values
+                # Loop through all values of p
+                for p in p_values:
 
-                print(corr_est_n,p_est_n)
+                    table_est_n = table_est_intrp_c[table_est_intrp_c['n']==n].sort_values('corr')
+                    table_true_n = table_true_intrp_c[table_true_intrp_c['n']==n].sort_values('corr')
 
-                plt.plot(corr_est_n,p_est_n,color="red",label="Estimated boundary")
-                plt.plot(corr_true_n,p_true_n,color="blue",label="True boundary")
-                plt.hlines(p, np.min(corr_est_n), np.max(corr_est_n),linestyles='dashed',label="Expected")
+                    # Correlations
+                    corr_est_n = table_est_n[['corr']].values
+                    p_est_n = table_est_n[['p='+('%.2f' % p)]].values
+                    corr_true_n = table_true_n[['corr']].values
+                    p_true_n = table_true_n[['p='+('%.2f' % p)]].values
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects)")
+                    print(corr_est_n,p_est_n)
 
-                # Axes
-                plt.xlabel("Correlation between noise fields")
-                plt.ylabel("Observed coverage")
+                    plt.plot(corr_est_n,p_est_n,color="red",label="Estimated boundary")
+                    plt.plot(corr_true_n,p_true_n,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(corr_est_n), np.max(corr_est_n),linestyles='dashed',label="Expected")
 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_n)-0.02,1))
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects" + cTitle + ")")
+
+                    # Axes
+                    plt.xlabel("Correlation between noise fields")
+                    plt.ylabel("Observed coverage")
+
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_n)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'corr_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'corr_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-        # Loop through all values of correlation
-        for c in c_values:
+            # Loop through all values of correlation
+            for c in c_values:
 
-            # Loop through all values of p
-            for p in p_values:
+                # Loop through all values of p
+                for p in p_values:
 
-                table_est_c = table_est_intrp[table_est_intrp['corr']==c].sort_values('n')
-                table_true_c = table_true_intrp[table_true_intrp['corr']==c].sort_values('n')
+                    table_est_c = table_est_intrp_c[table_est_intrp_c['corr']==c].sort_values('n')
+                    table_true_c = table_true_intrp_c[table_true_intrp_c['corr']==c].sort_values('n')
 
-                # n and p for this correlation
-                n_est_c = table_est_c[['n']].values
-                p_est_c = table_est_c[['p='+('%.2f' % p)]].values
-                n_true_c = table_true_c[['n']].values
-                p_true_c = table_true_c[['p='+('%.2f' % p)]].values
+                    # n and p for this correlation
+                    n_est_c = table_est_c[['n']].values
+                    p_est_c = table_est_c[['p='+('%.2f' % p)]].values
+                    n_true_c = table_true_c[['n']].values
+                    p_true_c = table_true_c[['p='+('%.2f' % p)]].values
 
-                plt.plot(n_est_c,p_est_c,color="red",label="Estimated boundary")
-                plt.plot(n_true_c,p_true_c,color="blue",label="True boundary")
-                plt.hlines(p, np.min(n_est_c), np.max(n_est_c),linestyles='dashed',label="Expected")
+                    plt.plot(n_est_c,p_est_c,color="red",label="Estimated boundary")
+                    plt.plot(n_true_c,p_true_c,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(n_est_c), np.max(n_est_c),linestyles='dashed',label="Expected")
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, noise correlation " + ('%.2f' % c) + ")")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, noise correlation " + ('%.2f' % c) + cTitle + ")")
 
-                # Axes
-                plt.xlabel("Number of subjects")
-                plt.ylabel("Observed coverage")
+                    # Axes
+                    plt.xlabel("Number of subjects")
+                    plt.ylabel("Observed coverage")
                 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_c)-0.02,1))
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_c)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_corr'+('%.2f' % c)+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_corr'+('%.2f' % c)+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
 
 
-    # Simulated over gradient range
+        # Simulated over gradient range
     if simNo in [19,20]:
 
         # Variable to check if this is the first file weve looked at
@@ -929,8 +1205,10 @@ def joinAndPlot(OutDir, simNo):
             # Get configuration ID
             cfgId = int(inputs['cfgId'])
 
-            # Results directory
-            resDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId), 'RawResults')
+            # Results directories (one for each threshold, if several 
+            # thresholds were run at once)
+            cfgDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId))
+            resDirs = get_res_dirs(cfgDir, inputs['c'])
 
             # ------------------------------------------------------------------
             # Get number of p values
@@ -941,148 +1219,200 @@ def joinAndPlot(OutDir, simNo):
             # Number of p values
             n_p = np.prod(p.shape)
 
-            # ------------------------------------------------------------------
-            # Currently there is a try except clause here. The reason for this
-            # is that if a boundary is empty the code will error and no results
-            # will be produced. In such a case, we skip that result.
-            # ------------------------------------------------------------------ 
-            try:
-
-                # ------------------------------------------------------------------
-                # Read in results
-                # ------------------------------------------------------------------
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+            # Whether results were read for every threshold (there are none to
+            # read if the results directories are missing)
+            allRead = len(resDirs) > 0
 
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+            # Loop through the thresholds
+            for thresh, resDir in resDirs:
 
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
-
-                # ------------------------------------------------------------------
-                # Get coverage probabilities
                 # ------------------------------------------------------------------
+                # Currently there is a try except clause here. The reason for this
+                # is that if a boundary is empty the code will error and no results
+                # will be produced. In such a case, we skip that result (only 
+                # missing or empty results files are skipped, anything else 
+                # raises).
+                # ------------------------------------------------------------------ 
+                try:
+
+                    # ------------------------------------------------------------------
+                    # Read in results
+                    # ------------------------------------------------------------------
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # ------------------------------------------------------------------
+                    # Get coverage probabilities
+                    # ------------------------------------------------------------------
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary
+                    covp_est = np.mean(obs_est.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary
+                    covp_true = np.mean(obs_true.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary (for coverage assessed using interpolation)
+                    covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary (for coverage assessed using interpolation)
+                    covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+
+                    # Get the number of realizations run (if the realizations were
+                    # stopped sequentially, this differs between configurations)
+                    nReals = obs_est_intrp.shape[0]
+
+                    # Get control variate estimates of the coverage for the estimated
+                    # boundary (using the true boundary results as the control), and
+                    # their standard errors
+                    covp_est_cv, se_est_cv = get_cv_coverage(obs_est.values, obs_true.values, p)
+                    covp_est_intrp_cv, se_est_intrp_cv = get_cv_coverage(obs_est_intrp.values, obs_true_intrp.values, p)
+
+                    # ------------------------------------------------------------------
+                    # Get number of subjects and gradient of ramps
+                    # ------------------------------------------------------------------
+
+                    # Number of subjects
+                    nSub = inputs['nSub']
+
+                    # Gradient of ramps
+                    grad = (float(inputs['mu1']['b']) - float(inputs['mu1']['a']))/2
+
+                    # ------------------------------------------------------------------
+                    # Add coverage probabilities to table
+                    # ------------------------------------------------------------------
+                    # Line for table of estimated boundary results
+                    tableLine_est = np.concatenate((np.array([[cfgId,nSub,grad,thresh,nReals]]),\
+                                                    covp_est.reshape(1,n_p)),\
+                                                    axis=1)
+
+                    # Line for table of true boundary results
+                    tableLine_true = np.concatenate((np.array([[cfgId,nSub,grad,thresh,nReals]]),\
+                                                     covp_true.reshape(1,n_p)),\
+                                                     axis=1)
+
+                    # Line for table of estimated boundary interpolation assessed results
+                    tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,grad,thresh,nReals]]),\
+                                                          covp_est_intrp.reshape(1,n_p)),\
+                                                          axis=1)
+
+                    # Line for table of true boundary interpolation assessed results
+                    tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,grad,thresh,nReals]]),\
+                                                           covp_true_intrp.reshape(1,n_p)),\
+                                                           axis=1)
+
+                    # Line for table of control variate estimated boundary results (the
+                    # estimates followed by their standard errors)
+                    tableLine_est_cv = np.concatenate((np.array([[cfgId,nSub,grad,thresh,nReals]]),\
+                                                       covp_est_cv.reshape(1,n_p),\
+                                                       se_est_cv.reshape(1,n_p)),\
+                                                       axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary
-                covp_est = np.mean(obs_est.values,axis=0)[:]
+                    # Line for table of control variate estimated boundary interpolation
+                    # assessed results (the estimates followed by their standard errors)
+                    tableLine_est_intrp_cv = np.concatenate((np.array([[cfgId,nSub,grad,thresh,nReals]]),\
+                                                             covp_est_intrp_cv.reshape(1,n_p),\
+                                                             se_est_intrp_cv.reshape(1,n_p)),\
+                                                             axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary
-                covp_true = np.mean(obs_true.values,axis=0)[:]
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary (for coverage assessed using interpolation)
-                covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+                        # Initialize estimated boundary results table
+                        table_est = pd.DataFrame(tableLine_est)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary (for coverage assessed using interpolation)
-                covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+                        # Initialize true boundary results table
+                        table_true = pd.DataFrame(tableLine_true)
 
-                # ------------------------------------------------------------------
-                # Get number of subjects and gradient of ramps
-                # ------------------------------------------------------------------
+                        # Initialize estimated boundary interpolated results table
+                        table_est_intrp = pd.DataFrame(tableLine_est_intrp)
 
-                # Number of subjects
-                nSub = inputs['nSub']
+                        # Initialize true boundary interpolated results table
+                        table_true_intrp = pd.DataFrame(tableLine_true_intrp)
 
-                # Gradient of ramps
-                grad = (np.float(inputs['mu1']['b']) - np.float(inputs['mu1']['a']))/2
+                        # Initialize control variate estimated boundary results table
+                        table_est_cv = pd.DataFrame(tableLine_est_cv)
 
-                # ------------------------------------------------------------------
-                # Add coverage probabilities to table
-                # ------------------------------------------------------------------
-                # Line for table of estimated boundary results
-                tableLine_est = np.concatenate((np.array([[cfgId,nSub,grad]]),\
-                                                covp_est.reshape(1,n_p)),\
-                                                axis=1)
-
-                # Line for table of true boundary results
-                tableLine_true = np.concatenate((np.array([[cfgId,nSub,grad]]),\
-                                                 covp_true.reshape(1,n_p)),\
-                                                 axis=1)
-
-                # Line for table of estimated boundary interpolation assessed results
-                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,grad]]),\
-                                                      covp_est_intrp.reshape(1,n_p)),\
-                                                      axis=1)
-
-                # Line for table of true boundary interpolation assessed results
-                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,grad]]),\
-                                                       covp_true_intrp.reshape(1,n_p)),\
-                                                       axis=1)
+                        # Initialize control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = pd.DataFrame(tableLine_est_intrp_cv)
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                    else:
 
-                    # Initialize estimated boundary results table
-                    table_est = pd.DataFrame(tableLine_est)
+                        # Append to existing estimated boundary results table
+                        table_est = table_est.append(pd.DataFrame(tableLine_est))
 
-                    # Initialize true boundary results table
-                    table_true = pd.DataFrame(tableLine_true)
+                        # Append to existing true boundary results table
+                        table_true = table_true.append(pd.DataFrame(tableLine_true))
 
-                    # Initialize estimated boundary interpolated results table
-                    table_est_intrp = pd.DataFrame(tableLine_est_intrp)
+                        # Append to existing estimated boundary interpolated results table
+                        table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
 
-                    # Initialize true boundary interpolated results table
-                    table_true_intrp = pd.DataFrame(tableLine_true_intrp)
+                        # Append to existing true boundary interpolated results table
+                        table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
 
-                else:
+                        # Append to existing control variate estimated boundary results table
+                        table_est_cv = table_est_cv.append(pd.DataFrame(tableLine_est_cv))
 
-                    # Append to existing estimated boundary results table
-                    table_est = table_est.append(pd.DataFrame(tableLine_est))
+                        # Append to existing control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = table_est_intrp_cv.append(pd.DataFrame(tableLine_est_intrp_cv))
 
-                    # Append to existing true boundary results table
-                    table_true = table_true.append(pd.DataFrame(tableLine_true))
+                    # ------------------------------------------------------------------
+                    # Get computation times
+                    # ------------------------------------------------------------------
+                    tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
 
-                    # Append to existing estimated boundary interpolated results table
-                    table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                    # Append to existing true boundary interpolated results table
-                    table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
+                        # Initialize time table
+                        table_time = pd.DataFrame(tableLine_time)
 
-                # ------------------------------------------------------------------
-                # Get computation times
-                # ------------------------------------------------------------------
-                tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
+                    else:
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Append to existing time table
+                        table_time = table_time.append(pd.DataFrame(tableLine_time))
 
-                    # Initialize time table
-                    table_time = pd.DataFrame(tableLine_time)
+                    # We are no longer looking at the first configuration file
+                    if first:
+                        first = False
 
-                else:
-
-                    # Append to existing time table
-                    table_time = table_time.append(pd.DataFrame(tableLine_time))
-
-                # ------------------------------------------------------------------
-                # Delete files
-                # ------------------------------------------------------------------
-                # Delete folder for this simulation
-                shutil.rmtree(os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId)))
+                except (FileNotFoundError, pd.errors.EmptyDataError):
 
-                # We are no longer looking at the first configuration file
-                if first:
-                    first = False
+                    # Record that no results were read for this threshold
+                    print('No results were read from ' + resDir)
+                    allRead = False
 
-            except:
+            # ------------------------------------------------------------------
+            # Delete files
+            # ------------------------------------------------------------------
+            # Delete folder for this configuration (if every result was read)
+            if allRead:
+                shutil.rmtree(cfgDir)
 
-                pass
+        # Check that results were read for at least one configuration
+        if first:
+            raise ValueError('No results were read for simulation ' + str(simNo) + '.')
 
         # ----------------------------------------------------------------------
         # Sort and save to csv
@@ -1107,101 +1437,126 @@ def joinAndPlot(OutDir, simNo):
         # Save true boundary (with interpolation) results table
         append_to_file(os.path.join(fResDir,'trueBdry_intrp.csv'), table_true_intrp)
 
+        # Save control variate estimated boundary results table
+        append_to_file(os.path.join(fResDir,'estBdry_cv.csv'), table_est_cv)
+
+        # Save control variate estimated boundary (with interpolation) results table
+        append_to_file(os.path.join(fResDir,'estBdry_intrp_cv.csv'), table_est_intrp_cv)
+
         # ----------------------------------------------------------------------
         # Make figures
         # ----------------------------------------------------------------------
 
         # Column headers
-        colhdr = ['cfgID', 'n', 'grad']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
+        colhdr = ['cfgID', 'n', 'grad', 'c', 'nReals']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
 
         # Assign column headers
         table_true_intrp.columns=colhdr
         table_est_intrp.columns=colhdr
 
-        # List of n and p values
-        n_values = np.unique(table_est_intrp['n'].values)
-        g_values = np.unique(table_est_intrp['grad'].values)
-        p_values = np.linspace(0,1,21)
+        # List of thresholds
+        thresh_values = np.unique(table_est_intrp['c'].values)
+
+        # Loop through all thresholds
+        for thresh in thresh_values:
 
-        # Loop through all values of n
-        for n in n_values:
+            # Results for this threshold
+            table_est_intrp_c = table_est_intrp[table_est_intrp['c']==thresh]
+            table_true_intrp_c = table_true_intrp[table_true_intrp['c']==thresh]
 
-            # Loop through all values of p
-            for p in p_values:
+            # If there are several thresholds, the figures for each are 
+            # labelled with the threshold
+            if len(thresh_values) > 1:
+                cSuffix = '_c' + ('%g' % thresh)
+                cTitle = ", c=" + ('%g' % thresh)
+            else:
+                cSuffix = ''
+                cTitle = ''
 
-                table_est_n = table_est_intrp[table_est_intrp['n']==n].sort_values('grad')
-                table_true_n = table_true_intrp[table_true_intrp['n']==n].sort_values('grad')
+            # List of n and p values
+            n_values = np.unique(table_est_intrp_c['n'].values)
+            g_values = np.unique(table_est_intrp_c['grad'].values)
+            p_values = np.linspace(0,1,21)
 
-                # Covariances
-                grad_est_n = table_est_n[['grad']].values
-                p_est_n = table_est_n[['p='+('%.2f' % p)]].values
-                grad_true_n = table_true_n[['grad']].values
-                p_true_n = table_true_n[['p='+('%.2f' % p)]].values
+            # Loop through all values of n
+            for n in n_values:
 
-                print(grad_est_n,p_est_n)
+                # Loop through all values of p
+                for p in p_values:
 
-                plt.plot(grad_est_n,p_est_n,color="red",label="Estimated boundary")
-                plt.plot(grad_true_n,p_true_n,color="blue",label="True boundary")
-                plt.hlines(p, np.min(grad_est_n), np.max(grad_est_n),linestyles='dashed',label="Expected")
+                    table_est_n = table_est_intrp_c[table_est_intrp_c['n']==n].sort_values('grad')
+                    table_true_n = table_true_intrp_c[table_true_intrp_c['n']==n].sort_values('grad')
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects)")
+                    # Covariances
+                    grad_est_n = table_est_n[['grad']].values
+                    p_est_n = table_est_n[['p='+('%.2f' % p)]].values
+                    grad_true_n = table_true_n[['grad']].values
+                    p_true_n = table_true_n[['p='+('%.2f' % p)]].values
 
-                # Axes
-                plt.xlabel("Slope (per 50 voxels)")
-                plt.ylabel("Observed coverage")
+                    print(grad_est_n,p_est_n)
 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_n)-0.02,1))
+                    plt.plot(grad_est_n,p_est_n,color="red",label="Estimated boundary")
+                    plt.plot(grad_true_n,p_true_n,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(grad_est_n), np.max(grad_est_n),linestyles='dashed',label="Expected")
+
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects" + cTitle + ")")
+
+                    # Axes
+                    plt.xlabel("Slope (per 50 voxels)")
+                    plt.ylabel("Observed coverage")
+
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_n)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'grad_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'grad_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-        # Loop through all values of fwhm2
-        for g in g_values:
+            # Loop through all values of fwhm2
+            for g in g_values:
 
-            # Loop through all values of p
-            for p in p_values:
+                # Loop through all values of p
+                for p in p_values:
 
-                table_est_g = table_est_intrp[table_est_intrp['grad']==g].sort_values('n')
-                table_true_g = table_true_intrp[table_true_intrp['grad']==g].sort_values('n')
+                    table_est_g = table_est_intrp_c[table_est_intrp_c['grad']==g].sort_values('n')
+                    table_true_g = table_true_intrp_c[table_true_intrp_c['grad']==g].sort_values('n')
 
-                # n and p for this gradient
-                n_est_g = table_est_g[['n']].values
-                p_est_g = table_est_g[['p='+('%.2f' % p)]].values
-                n_true_g = table_true_g[['n']].values
-                p_true_g = table_true_g[['p='+('%.2f' % p)]].values
+                    # n and p for this gradient
+                    n_est_g = table_est_g[['n']].values
+                    p_est_g = table_est_g[['p='+('%.2f' % p)]].values
+                    n_true_g = table_true_g[['n']].values
+                    p_true_g = table_true_g[['p='+('%.2f' % p)]].values
 
-                plt.plot(n_est_g,p_est_g,color="red",label="Estimated boundary")
-                plt.plot(n_true_g,p_true_g,color="blue",label="True boundary")
-                plt.hlines(p, np.min(n_est_g), np.max(n_est_g),linestyles='dashed',label="Expected")
+                    plt.plot(n_est_g,p_est_g,color="red",label="Estimated boundary")
+                    plt.plot(n_true_g,p_true_g,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(n_est_g), np.max(n_est_g),linestyles='dashed',label="Expected")
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, gradient " + ('%.2f' % g) + ")")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, gradient " + ('%.2f' % g) + cTitle + ")")
 
-                # Axes
-                plt.xlabel("Number of subjects")
-                plt.ylabel("Observed coverage")
+                    # Axes
+                    plt.xlabel("Number of subjects")
+                    plt.ylabel("Observed coverage")
                 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_g)-0.02,1))
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_g)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_grad'+('%.2f' % g)+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_grad'+('%.2f' % g)+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-    # Simulated over noise magnitude range
+        # Simulated over noise magnitude range
     if simNo in [21,22]:
 
         # Variable to check if this is the first file weve looked at
@@ -1223,8 +1578,10 @@ def joinAndPlot(OutDir, simNo):
             # Get configuration ID
             cfgId = int(inputs['cfgId'])
 
-            # Results directory
-            resDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId), 'RawResults')
+            # Results directories (one for each threshold, if several 
+            # thresholds were run at once)
+            cfgDir = os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId))
+            resDirs = get_res_dirs(cfgDir, inputs['c'])
 
             # ------------------------------------------------------------------
             # Get number of p values
@@ -1235,148 +1592,200 @@ def joinAndPlot(OutDir, simNo):
             # Number of p values
             n_p = np.prod(p.shape)
 
-            # ------------------------------------------------------------------
-            # Currently there is a try except clause here. The reason for this
-            # is that if a boundary is empty the code will error and no results
-            # will be produced. In such a case, we skip that result.
-            # ------------------------------------------------------------------ 
-            try:
+            # Whether results were read for every threshold (there are none to
+            # read if the results directories are missing)
+            allRead = len(resDirs) > 0
 
-                # ------------------------------------------------------------------
-                # Read in results
-                # ------------------------------------------------------------------
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations
-                obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
-
-                # Read in observed values for the estimated boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+            # Loop through the thresholds
+            for thresh, resDir in resDirs:
 
-                # Read in observed values for the true boundary. This will be a 
-                # boolean array of ones and zeros representing observed violations
-                # across simulations (based on interpolation assessment)
-                obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
-
-                # ------------------------------------------------------------------
-                # Get coverage probabilities
                 # ------------------------------------------------------------------
+                # Currently there is a try except clause here. The reason for this
+                # is that if a boundary is empty the code will error and no results
+                # will be produced. In such a case, we skip that result (only 
+                # missing or empty results files are skipped, anything else 
+                # raises).
+                # ------------------------------------------------------------------ 
+                try:
+
+                    # ------------------------------------------------------------------
+                    # Read in results
+                    # ------------------------------------------------------------------
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_est = pd.read_csv(os.path.join(resDir,'estSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations
+                    obs_true = pd.read_csv(os.path.join(resDir,'trueSuccess.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the estimated boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_est_intrp = pd.read_csv(os.path.join(resDir,'estSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # Read in observed values for the true boundary. This will be a 
+                    # boolean array of ones and zeros representing observed violations
+                    # across simulations (based on interpolation assessment)
+                    obs_true_intrp = pd.read_csv(os.path.join(resDir,'trueSuccess_intrp.csv'), header=None, index_col=None)
+
+                    # ------------------------------------------------------------------
+                    # Get coverage probabilities
+                    # ------------------------------------------------------------------
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary
+                    covp_est = np.mean(obs_est.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary
+                    covp_true = np.mean(obs_true.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # estimated boundary (for coverage assessed using interpolation)
+                    covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+
+                    # Get the coverage probabilities from the observed results for the
+                    # true boundary (for coverage assessed using interpolation)
+                    covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+
+                    # Get the number of realizations run (if the realizations were
+                    # stopped sequentially, this differs between configurations)
+                    nReals = obs_est_intrp.shape[0]
+
+                    # Get control variate estimates of the coverage for the estimated
+                    # boundary (using the true boundary results as the control), and
+                    # their standard errors
+                    covp_est_cv, se_est_cv = get_cv_coverage(obs_est.values, obs_true.values, p)
+                    covp_est_intrp_cv, se_est_intrp_cv = get_cv_coverage(obs_est_intrp.values, obs_true_intrp.values, p)
+
+                    # ------------------------------------------------------------------
+                    # Get number of subjects and magnitude of second noise field
+                    # ------------------------------------------------------------------
+
+                    # Number of subjects
+                    nSub = inputs['nSub']
+
+                    # Magnitude of second noise field
+                    mag = float(inputs['noise2']['mag'])
+
+                    # ------------------------------------------------------------------
+                    # Add coverage probabilities to table
+                    # ------------------------------------------------------------------
+                    # Line for table of estimated boundary results
+                    tableLine_est = np.concatenate((np.array([[cfgId,nSub,mag,thresh,nReals]]),\
+                                                    covp_est.reshape(1,n_p)),\
+                                                    axis=1)
+
+                    # Line for table of true boundary results
+                    tableLine_true = np.concatenate((np.array([[cfgId,nSub,mag,thresh,nReals]]),\
+                                                     covp_true.reshape(1,n_p)),\
+                                                     axis=1)
+
+                    # Line for table of estimated boundary interpolation assessed results
+                    tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,mag,thresh,nReals]]),\
+                                                          covp_est_intrp.reshape(1,n_p)),\
+                                                          axis=1)
+
+                    # Line for table of true boundary interpolation assessed results
+                    tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,mag,thresh,nReals]]),\
+                                                           covp_true_intrp.reshape(1,n_p)),\
+                                                           axis=1)
+
+                    # Line for table of control variate estimated boundary results (the
+                    # estimates followed by their standard errors)
+                    tableLine_est_cv = np.concatenate((np.array([[cfgId,nSub,mag,thresh,nReals]]),\
+                                                       covp_est_cv.reshape(1,n_p),\
+                                                       se_est_cv.reshape(1,n_p)),\
+                                                       axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary
-                covp_est = np.mean(obs_est.values,axis=0)[:]
-
-                # Get the coverage probabilities from the observed results for the
-                # true boundary
-                covp_true = np.mean(obs_true.values,axis=0)[:]
-
-                # Get the coverage probabilities from the observed results for the
-                # estimated boundary (for coverage assessed using interpolation)
-                covp_est_intrp = np.mean(obs_est_intrp.values,axis=0)[:]
+                    # Line for table of control variate estimated boundary interpolation
+                    # assessed results (the estimates followed by their standard errors)
+                    tableLine_est_intrp_cv = np.concatenate((np.array([[cfgId,nSub,mag,thresh,nReals]]),\
+                                                             covp_est_intrp_cv.reshape(1,n_p),\
+                                                             se_est_intrp_cv.reshape(1,n_p)),\
+                                                             axis=1)
 
-                # Get the coverage probabilities from the observed results for the
-                # true boundary (for coverage assessed using interpolation)
-                covp_true_intrp = np.mean(obs_true_intrp.values,axis=0)[:]
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # ------------------------------------------------------------------
-                # Get number of subjects and magnitude of second noise field
-                # ------------------------------------------------------------------
+                        # Initialize estimated boundary results table
+                        table_est = pd.DataFrame(tableLine_est)
 
-                # Number of subjects
-                nSub = inputs['nSub']
+                        # Initialize true boundary results table
+                        table_true = pd.DataFrame(tableLine_true)
 
-                # Magnitude of second noise field
-                mag = np.float(inputs['noise2']['mag'])
+                        # Initialize estimated boundary interpolated results table
+                        table_est_intrp = pd.DataFrame(tableLine_est_intrp)
 
-                # ------------------------------------------------------------------
-                # Add coverage probabilities to table
-                # ------------------------------------------------------------------
-                # Line for table of estimated boundary results
-                tableLine_est = np.concatenate((np.array([[cfgId,nSub,mag]]),\
-                                                covp_est.reshape(1,n_p)),\
-                                                axis=1)
-
-                # Line for table of true boundary results
-                tableLine_true = np.concatenate((np.array([[cfgId,nSub,mag]]),\
-                                                 covp_true.reshape(1,n_p)),\
-                                                 axis=1)
-
-                # Line for table of estimated boundary interpolation assessed results
-                tableLine_est_intrp = np.concatenate((np.array([[cfgId,nSub,mag]]),\
-                                                      covp_est_intrp.reshape(1,n_p)),\
-                                                      axis=1)
-
-                # Line for table of true boundary interpolation assessed results
-                tableLine_true_intrp = np.concatenate((np.array([[cfgId,nSub,mag]]),\
-                                                       covp_true_intrp.reshape(1,n_p)),\
-                                                       axis=1)
+                        # Initialize true boundary interpolated results table
+                        table_true_intrp = pd.DataFrame(tableLine_true_intrp)
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Initialize control variate estimated boundary results table
+                        table_est_cv = pd.DataFrame(tableLine_est_cv)
 
-                    # Initialize estimated boundary results table
-                    table_est = pd.DataFrame(tableLine_est)
+                        # Initialize control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = pd.DataFrame(tableLine_est_intrp_cv)
 
-                    # Initialize true boundary results table
-                    table_true = pd.DataFrame(tableLine_true)
+                    else:
 
-                    # Initialize estimated boundary interpolated results table
-                    table_est_intrp = pd.DataFrame(tableLine_est_intrp)
+                        # Append to existing estimated boundary results table
+                        table_est = table_est.append(pd.DataFrame(tableLine_est))
 
-                    # Initialize true boundary interpolated results table
-                    table_true_intrp = pd.DataFrame(tableLine_true_intrp)
+                        # Append to existing true boundary results table
+                        table_true = table_true.append(pd.DataFrame(tableLine_true))
 
-                else:
+                        # Append to existing estimated boundary interpolated results table
+                        table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
 
-                    # Append to existing estimated boundary results table
-                    table_est = table_est.append(pd.DataFrame(tableLine_est))
+                        # Append to existing true boundary interpolated results table
+                        table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
 
-                    # Append to existing true boundary results table
-                    table_true = table_true.append(pd.DataFrame(tableLine_true))
+                        # Append to existing control variate estimated boundary results table
+                        table_est_cv = table_est_cv.append(pd.DataFrame(tableLine_est_cv))
 
-                    # Append to existing estimated boundary interpolated results table
-                    table_est_intrp = table_est_intrp.append(pd.DataFrame(tableLine_est_intrp))
+                        # Append to existing control variate estimated boundary interpolated results table
+                        table_est_intrp_cv = table_est_intrp_cv.append(pd.DataFrame(tableLine_est_intrp_cv))
 
-                    # Append to existing true boundary interpolated results table
-                    table_true_intrp = table_true_intrp.append(pd.DataFrame(tableLine_true_intrp))
+                    # ------------------------------------------------------------------
+                    # Get computation times
+                    # ------------------------------------------------------------------
+                    tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
 
-                # ------------------------------------------------------------------
-                # Get computation times
-                # ------------------------------------------------------------------
-                tableLine_time = pd.read_csv(os.path.join(resDir,'computationTime.csv'), header=None, index_col=None)
+                    # If this is the first cfg we've looked at, intialize the results tables
+                    if first:
 
-                # If this is the first cfg we've looked at, intialize the results tables
-                if first:
+                        # Initialize time table
+                        table_time = pd.DataFrame(tableLine_time)
 
-                    # Initialize time table
-                    table_time = pd.DataFrame(tableLine_time)
+                    else:
 
-                else:
+                        # Append to existing time table
+                        table_time = table_time.append(pd.DataFrame(tableLine_time))
 
-                    # Append to existing time table
-                    table_time = table_time.append(pd.DataFrame(tableLine_time))
+                    # We are no longer looking at the first configuration file
+                    if first:
+                        first = False
 
-                # ------------------------------------------------------------------
-                # Delete files
-                # ------------------------------------------------------------------
-                # Delete folder for this simulation
-                shutil.rmtree(os.path.join(OutDir, 'sim'+str(simNo), 'cfg' + str(cfgId)))
+                except (FileNotFoundError, pd.errors.EmptyDataError):
 
-                # We are no longer looking at the first configuration file
-                if first:
-                    first = False
+                    # Record that no results were read for this threshold
+                    print('No results were read from ' + resDir)
+                    allRead = False
 
-            except:
+            # ------------------------------------------------------------------
+            # Delete files
+            # ------------------------------------------------------------------
+            # Delete folder for this configuration (if every result was read)
+            if allRead:
+                shutil.rmtree(cfgDir)
 
-                pass
+        # Check that results were read for at least one configuration
+        if first:
+            raise ValueError('No results were read for simulation ' + str(simNo) + '.')
 
         # ----------------------------------------------------------------------
         # Sort and save to csv
@@ -1401,96 +1810,121 @@ def joinAndPlot(OutDir, simNo):
         # Save true boundary (with interpolation) results table
         append_to_file(os.path.join(fResDir,'trueBdry_intrp.csv'), table_true_intrp)
 
+        # Save control variate estimated boundary results table
+        append_to_file(os.path.join(fResDir,'estBdry_cv.csv'), table_est_cv)
+
+        # Save control variate estimated boundary (with interpolation) results table
+        append_to_file(os.path.join(fResDir,'estBdry_intrp_cv.csv'), table_est_intrp_cv)
+
         # ----------------------------------------------------------------------
         # Make figures
         # ----------------------------------------------------------------------
 
         # Column headers
-        colhdr = ['cfgID', 'n', 'mag']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
+        colhdr = ['cfgID', 'n', 'mag', 'c', 'nReals']+['p='+('%.2f' % p) for p in np.linspace(0,1,21)]
 
         # Assign column headers
         table_true_intrp.columns=colhdr
         table_est_intrp.columns=colhdr
 
-        # List of n and p values
-        n_values = np.unique(table_est_intrp['n'].values)
-        m_values = np.unique(table_est_intrp['mag'].values)
-        p_values = np.linspace(0,1,21)
+        # List of thresholds
+        thresh_values = np.unique(table_est_intrp['c'].values)
+
+        # Loop through all thresholds
+        for thresh in thresh_values:
+
+            # Results for this threshold
+            table_est_intrp_c = table_est_intrp[table_est_intrp['c']==thresh]
+            table_true_intrp_c = table_true_intrp[table_true_intrp['c']==thresh]
+
+            # If there are several thresholds, the figures for each are 
+            # labelled with the threshold
+            if len(thresh_values) > 1:
+                cSuffix = '_c' + ('%g' % thresh)
+                cTitle = ", c=" + ('%g' % thresh)
+            else:
+                cSuffix = ''
+                cTitle = ''
+
+            # List of n and p values
+            n_values = np.unique(table_est_intrp_c['n'].values)
+            m_values = np.unique(table_est_intrp_c['mag'].values)
+            p_values = np.linspace(0,1,21)
 
-        # Loop through all values of n
-        for n in n_values:
+            # Loop through all values of n
+            for n in n_values:
 
-            # Loop through all values of p
-            for p in p_values:
+                # Loop through all values of p
+                for p in p_values:
 
-                table_est_n = table_est_intrp[table_est_intrp['n']==n].sort_values('mag')
-                table_true_n = table_true_intrp[table_true_intrp['n']==n].sort_values('mag')
+                    table_est_n = table_est_intrp_c[table_est_intrp_c['n']==n].sort_values('mag')
+                    table_true_n = table_true_intrp_c[table_true_intrp_c['n']==n].sort_values('mag')
 
-                # Covariances
-                mag_est_n = table_est_n[['mag']].values
-                p_est_n = table_est_n[['p='+('%.2f' % p)]].values
-                mag_true_n = table_true_n[['mag']].values
-                p_true_n = table_true_n[['p='+('%.2f' % p)]].values
+                    # Covariances
+                    mag_est_n = table_est_n[['mag']].values
+                    p_est_n = table_est_n[['p='+('%.2f' % p)]].values
+                    mag_true_n = table_true_n[['mag']].values
+                    p_true_n = table_true_n[['p='+('%.2f' % p)]].values
 
-                print(mag_est_n,p_est_n)
+                    print(mag_est_n,p_est_n)
 
-                plt.plot(mag_est_n,p_est_n,color="red",label="Estimated boundary")
-                plt.plot(mag_true_n,p_true_n,color="blue",label="True boundary")
-                plt.hlines(p, np.min(mag_est_n), np.max(mag_est_n),linestyles='dashed',label="Expected")
+                    plt.plot(mag_est_n,p_est_n,color="red",label="Estimated boundary")
+                    plt.plot(mag_true_n,p_true_n,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(mag_est_n), np.max(mag_est_n),linestyles='dashed',label="Expected")
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects)")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, " + str(int(n)) + " subjects" + cTitle + ")")
 
-                # Axes
-                plt.xlabel("Magitude of second noise field")
-                plt.ylabel("Observed coverage")
+                    # Axes
+                    plt.xlabel("Magitude of second noise field")
+                    plt.ylabel("Observed coverage")
 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_n)-0.02,1))
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_n)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'mag_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'mag_vs_obsp_truep'+str(np.int(100*p))+'_n'+str(np.int(n))+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
+                    # Clear figure
+                    plt.clf()
 
-        # Loop through all values of noise magnitude
-        for m in m_values:
+            # Loop through all values of noise magnitude
+            for m in m_values:
 
-            # Loop through all values of p
-            for p in p_values:
+                # Loop through all values of p
+                for p in p_values:
 
-                table_est_m = table_est_intrp[table_est_intrp['mag']==m].sort_values('n')
-                table_true_m = table_true_intrp[table_true_intrp['mag']==m].sort_values('n')
+                    table_est_m = table_est_intrp_c[table_est_intrp_c['mag']==m].sort_values('n')
+                    table_true_m = table_true_intrp_c[table_true_intrp_c['mag']==m].sort_values('n')
 
-                # n and p for this gradient
-                n_est_m = table_est_m[['n']].values
-                p_est_m = table_est_m[['p='+('%.2f' % p)]].values
-                n_true_m = table_true_m[['n']].values
-                p_true_m = table_true_m[['p='+('%.2f' % p)]].values
+                    # n and p for this gradient
+                    n_est_m = table_est_m[['n']].values
+                    p_est_m = table_est_m[['p='+('%.2f' % p)]].values
+                    n_true_m = table_true_m[['n']].values
+                    p_true_m = table_true_m[['p='+('%.2f' % p)]].values
 
-                plt.plot(n_est_m,p_est_m,color="red",label="Estimated boundary")
-                plt.plot(n_true_m,p_true_m,color="blue",label="True boundary")
-                plt.hlines(p, np.min(n_est_m), np.max(n_est_m),linestyles='dashed',label="Expected")
+                    plt.plot(n_est_m,p_est_m,color="red",label="Estimated boundary")
+                    plt.plot(n_true_m,p_true_m,color="blue",label="True boundary")
+                    plt.hlines(p, np.min(n_est_m), np.max(n_est_m),linestyles='dashed',label="Expected")
 
-                # Title
-                plt.title("Coverage (" + str(np.int(100*p)) + "% probability, noise magnitude " + ('%.2f' % m) + ")")
+                    # Title
+                    plt.title("Coverage (" + str(np.int(100*p)) + "% probability, noise magnitude " + ('%.2f' % m) + cTitle + ")")
 
-                # Axes
-                plt.xlabel("Number of subjects")
-                plt.ylabel("Observed coverage")
+                    # Axes
+                    plt.xlabel("Number of subjects")
+                    plt.ylabel("Observed coverage")
                 
-                # Make axis a bit clearer
-                plt.ylim((np.min(p_true_m)-0.02,1))
+                    # Make axis a bit clearer
+                    plt.ylim((np.min(p_true_m)-0.02,1))
                 
-                # Legend
-                plt.legend()
+                    # Legend
+                    plt.legend()
 
-                # Save plots
-                plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_mag'+('%.2f' % m)+'.png'))
+                    # Save plots
+                    plt.savefig(os.path.join(fResDir, 'n_vs_obsp_truep'+str(np.int(100*p))+'_mag'+('%.2f' % m)+cSuffix+'.png'))
 
-                # Clear figure
-                plt.clf()
\ No newline at end of file
+                    # Clear figure
+                    plt.clf()
\ No newline at end of file
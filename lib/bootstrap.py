@@ -0,0 +1,696 @@
+import numpy as np
+import warnings
+from lib.rng import *
+from lib.bootstrapNumba import *
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to perform the Rademacher (wild)
+# bootstrap of the residuals along the boundary. Rather than drawing one
+# vector of Rademacher variables at a time, the bootstrap is performed in
+# blocks; a (nBlock x nSub) matrix of signs is drawn and every bootstrapped
+# sum in the block is obtained from a single matrix multiplication against
+# the residuals.
+#
+# The bootstrap can also be run with a fused kernel compiled by numba (see
+# `get_boot_backend` and lib/bootstrapNumba.py). The first time each 
+# variant of the fused bootstrap runs in a process, its output is checked
+# against the NumPy bootstrap.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Default number of bootstraps to perform at once
+BOOT_BLOCK_SIZE = 500
+
+# Normal quantile used for the confidence intervals of the bootstrap
+# percentiles (see `get_boot_converged`)
+BOOT_CI_Z = 1.959963984540054
+
+# The variants of the fused bootstrap which have been checked against the
+# NumPy bootstrap in this process
+_BOOT_FUSED_CHECKED = set()
+
+# ============================================================================
+#
+# This function checks the backend used to run the bootstrap, falling back
+# to NumPy (with a warning) if numba is requested but not installed.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `backend`: The requested backend. The options are:
+#                 - 'numpy': (Default) The bootstrap is run with NumPy 
+#                            operations on each block of bootstraps.
+#                 - 'numba': The bootstrap is run with a fused kernel 
+#                            compiled by numba (see 
+#                            `get_boot_seg_max_fused`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `backend`: The backend to use.
+#
+# ============================================================================
+def get_boot_backend(backend='numpy'):
+
+    # Check the backend is one we know
+    if backend not in ('numpy', 'numba'):
+        raise ValueError('The bootstrap backend must be numpy or numba.')
+
+    # Fall back to NumPy if numba is not installed
+    if backend == 'numba' and numba is None:
+        warnings.warn('numba is not installed, so the NumPy bootstrap is used.')
+        backend = 'numpy'
+
+    # Return the backend
+    return(backend)
+
+
+# ============================================================================
+#
+# This function checks the output of the fused bootstrap against the NumPy
+# bootstrap, the first time each variant is run (on a non-empty boundary)
+# in this process.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `variant`: The name of the variant of the bootstrap.
+# - `plan`: The plan of the fused bootstrap (see `get_fused_plan_max`).
+# - `seg_max`: The output of the fused bootstrap.
+# - `get_ref`: Function returning the output of the NumPy bootstrap.
+# - `dtype`: The type the NumPy bootstrap is computed in (this sets the
+#            tolerance of the check).
+#
+# ============================================================================
+def check_boot_fused(variant, plan, seg_max, get_ref, dtype):
+
+    # Only check each variant once, on a non-empty boundary
+    if variant in _BOOT_FUSED_CHECKED or len(plan['pt_seg']) == 0:
+        return
+
+    # Tolerance for the type of the bootstrap
+    tol = np.sqrt(np.finfo(dtype).eps)
+
+    # Compare against the NumPy bootstrap
+    if not np.allclose(seg_max, get_ref(), rtol=tol, atol=tol):
+        raise RuntimeError('The fused bootstrap (' + variant + ') does not match the NumPy bootstrap.')
+
+    # Record the check
+    _BOOT_FUSED_CHECKED.add(variant)
+
+# ============================================================================
+#
+# This function yields the (start, end) indices of each block of bootstrap
+# instances, in order.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `nBoot`: The total number of bootstraps.
+# - `blockSize`: The (maximum) number of bootstraps in each block.
+#
+# ============================================================================
+def get_boot_blocks(nBoot, blockSize=BOOT_BLOCK_SIZE):
+
+    # Loop through the blocks
+    for start in np.arange(0, nBoot, blockSize):
+
+        # The last block may be smaller than the others
+        yield(start, np.minimum(start + blockSize, nBoot))
+
+
+# ============================================================================
+#
+# This function returns a matrix of Rademacher variables of dimension
+# (nBlock x nSub). Each row of this matrix is drawn in exactly the same way
+# (and consumes the random number stream in exactly the same way) as a
+# single (nSub x 1) draw of the form used previously, so the bootstrap is
+# unchanged by blocking.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `nBlock`: The number of bootstraps in this block.
+# - `nSub`: The number of subjects.
+# - `rng`: The random number generator for the bootstrap (optional, see
+#          `get_rng`). If this is not given, the legacy global generator is
+#          used.
+# - `out`: Array of shape [nBlock, nSub] to fill with the variables 
+#          (optional, e.g. from the workspace, see `get_workspace`).
+#
+# ============================================================================
+def get_boot_vars(nBlock, nSub, rng=None, out=None):
+
+    # Obtain bootstrap variables
+    if out is None:
+        return(2.0*get_randint(0,2,(nBlock,nSub),rng)-1)
+
+    # Obtain bootstrap variables in place
+    out[...] = get_randint(0,2,(nBlock,nSub),rng)
+    out *= 2
+    out -= 1
+    return(out)
+
+
+# ============================================================================
+#
+# This function computes the sum of squares of the residuals along the
+# boundary. As the square of every Rademacher variable is 1, this is the same
+# for every bootstrap instance and need only be computed once. The sum is 
+# accumulated in float64, whatever the type of the residuals.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `resid_bdry`: The residuals along the boundary, with subjects along the
+#                 first axis (e.g. of shape [nSub, nBdry, 2] for inner and
+#                 outer boundary residuals).
+#
+# ============================================================================
+def get_resid_sumsq(resid_bdry):
+
+    # Sum of squares across subjects
+    return(np.sum(np.asarray(resid_bdry, dtype=np.float64)**2, axis=0))
+
+
+# ============================================================================
+#
+# This function takes in a block of Rademacher variables and returns the
+# bootstrapped g values along the boundary, given by:
+#
+#            g*(s) = (sum_j r_j e_j(s)/sqrt(n)) / sigma*(s)
+#
+# where sigma* is the bootstrap (ddof=1) standard deviation of r_j e_j(s).
+# The sums for the whole block are obtained with one matrix multiplication
+# and, as r_j^2=1, sigma* is computed in closed form from the precomputed
+# sum of squares:
+#
+#            sigma*(s)^2 = (sum_j e_j(s)^2 - (sum_j r_j e_j(s))^2/n)/(n-1)
+#
+# The bootstrap is computed in the type of the bootstrap variables and
+# residuals (e.g. float32 for single precision).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_vars`: The (nBlock x nSub) matrix of Rademacher variables.
+# - `resid_bdry`: The residuals along the boundary, with subjects along the
+#                 first axis (e.g. of shape [nSub, nBdry, 2]).
+# - `resid_sumsq`: The sum of squares of `resid_bdry` across subjects (as
+#                  output by `get_resid_sumsq`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_g`: The bootstrapped g values, of shape [nBlock,
+#             *resid_bdry.shape[1:]] (e.g. [nBlock, nBdry, 2]).
+#
+# ============================================================================
+def get_boot_g(boot_vars, resid_bdry, resid_sumsq):
+
+    # Number of subjects
+    nSub = resid_bdry.shape[0]
+
+    # Number of bootstraps in this block
+    nBlock = boot_vars.shape[0]
+
+    # Bootstrapped sums across subjects, using the residuals in point-major
+    # form (i.e. one column per boundary point)
+    boot_sums = boot_vars @ resid_bdry.reshape(nSub, -1)
+
+    # Reshape back to the shape of the boundary
+    boot_sums = boot_sums.reshape(nBlock, *resid_bdry.shape[1:])
+
+    # Bootstrap standard deviations (with ddof=1)
+    sigma_boot = np.sqrt((resid_sumsq.astype(boot_sums.dtype, copy=False) - boot_sums**2/nSub)/(nSub-1))
+
+    # Divide by the bootstrap standard deviation
+    boot_g = boot_sums/(np.sqrt(nSub)*sigma_boot)
+
+    # Return g
+    return(boot_g)
+
+
+# ============================================================================
+#
+# This function takes in a block of Rademacher variables and returns the
+# bootstrapped maximum of |g*| along a boundary (see `get_boot_g`), 
+# interpolating g* along the boundary first if an interpolation operator is
+# given.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_vars`: The (nBlock x nSub) matrix of Rademacher variables.
+# - `resid_bdry`: The residuals along the boundary (or at the unique
+#                 boundary voxels), of shape [nSub, nBdry].
+# - `resid_sumsq`: The sum of squares of `resid_bdry` across subjects.
+# - `interp_op`: The sparse interpolation operator (optional, as output by
+#                `get_bdry_interp_op`). If this is not given, g* is not
+#                interpolated.
+# - `backend`: The backend used to run the bootstrap (see 
+#              `get_boot_backend`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_max`: The maximum of |g*| along the boundary for each bootstrap.
+#
+# ============================================================================
+def get_boot_max_g(boot_vars, resid_bdry, resid_sumsq, interp_op=None, backend='numpy'):
+
+    # Run the fused bootstrap
+    if backend == 'numba':
+
+        # Number of boundary points
+        nPts = resid_bdry.shape[-1] if interp_op is None else interp_op.shape[0]
+
+        # Get the maximum along the boundary
+        plan = get_fused_plan_max(nPts)
+        boot_max = get_boot_seg_max_fused(boot_vars, resid_bdry, resid_sumsq, interp_op, plan)[:,0]
+
+        # Check against the NumPy bootstrap
+        check_boot_fused('max_g', plan, boot_max,
+                         lambda: get_boot_max_g(boot_vars, resid_bdry, resid_sumsq, interp_op),
+                         boot_vars.dtype)
+
+        # Return the maxima
+        return(boot_max)
+
+    # Get the bootstrapped g values
+    boot_g = get_boot_g(boot_vars, resid_bdry, resid_sumsq)
+
+    # Interpolate along the boundary
+    if interp_op is not None:
+        boot_g = (interp_op.astype(boot_g.dtype, copy=False) @ boot_g.T).T
+
+    # Return the maximum along the boundary
+    return(np.max(np.abs(boot_g),axis=-1))
+
+
+# ============================================================================
+#
+# This function stacks the values along several boundary segments into one
+# contiguous array, so that all segments can be bootstrapped at once. It also
+# returns a segment-id vector recording which segment each boundary point 
+# came from.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `segs`: A list of arrays of values along each boundary segment. The 
+#           boundary points must lie along the second last axis (e.g. each
+#           array may be of shape [nSub, nBdry, 2]).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `stack`: The stacked values, concatenated along the second last axis.
+# - `seg_ids`: A vector with the index (in `segs`) of the segment each
+#              boundary point belongs to.
+#
+# ============================================================================
+def stack_bdry_segs(segs):
+
+    # Number of boundary points in each segment
+    seg_lens = np.array([seg.shape[-2] for seg in segs], dtype=int)
+
+    # Segment each point belongs to
+    seg_ids = np.repeat(np.arange(len(segs)), seg_lens)
+
+    # Stack the segments
+    stack = np.concatenate(segs, axis=-2)
+
+    # Return the stack and segment ids
+    return(stack, seg_ids)
+
+
+# ============================================================================
+#
+# This function takes in a sorted vector of segment ids and returns the 
+# offsets needed to reduce over each segment with `get_seg_max`. It need 
+# only be called once, before the bootstrap loop.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `seg_ids`: A sorted vector of (integer) segment ids.
+# - `nSegs`: The total number of segments (some of which may be empty).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `seg_starts`: The index at which each non-empty segment starts.
+# - `seg_nonempty`: Boolean vector indicating which segments are non-empty.
+#
+# ============================================================================
+def get_seg_starts(seg_ids, nSegs):
+
+    # Number of points in each segment
+    seg_lens = np.bincount(seg_ids, minlength=nSegs)
+
+    # Segments with at least one point
+    seg_nonempty = seg_lens > 0
+
+    # Start index of each segment
+    seg_starts = np.concatenate(([0], np.cumsum(seg_lens)[:-1]))
+
+    # Return the starts of the non-empty segments
+    return(seg_starts[seg_nonempty], seg_nonempty)
+
+
+# ============================================================================
+#
+# This function takes the maximum of `vals` along the last axis within each
+# segment. Empty segments are given a maximum of zero (which is the value the
+# bootstrap stores were previously initialised to for empty boundaries).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `vals`: The values to reduce, of shape [nBlock, nPoints], with the points 
+#           ordered by segment.
+# - `seg_starts`: The start index of each non-empty segment (as output by 
+#                 `get_seg_starts`).
+# - `seg_nonempty`: Boolean vector indicating which segments are non-empty
+#                   (as output by `get_seg_starts`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `seg_max`: The maximum within each segment, of shape [nBlock, nSegs].
+#
+# ============================================================================
+def get_seg_max(vals, seg_starts, seg_nonempty):
+
+    # Initialise to zero
+    seg_max = np.zeros((vals.shape[0], len(seg_nonempty)))
+
+    # Reduce over the non-empty segments
+    if len(seg_starts) > 0:
+        seg_max[:,seg_nonempty] = np.maximum.reduceat(vals, seg_starts, axis=-1)
+
+    # Return the maxima
+    return(seg_max)
+
+
+# ============================================================================
+#
+# This function takes in a block of Rademacher variables and returns the
+# bootstrapped maximum of |g*| along each segment of a stack of boundary 
+# points. g* is bootstrapped once per unique boundary voxel and interpolated
+# onto every point with a single sparse matrix multiplication. For given
+# pairs of points, min(g1*, g2*) is taken before the absolute value (the
+# minimum replaces the first point of each pair and the second point is set
+# to zero, so that it no longer contributes to the maximum).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_vars`: The (nBlock x nSub) matrix of Rademacher variables.
+# - `resids_vox`: The residuals at the unique boundary voxels, of shape 
+#                 [nSub, nVox].
+# - `resids_sumsq`: The sum of squares of `resids_vox` across subjects.
+# - `interp_op`: The sparse interpolation operator, with one row for every
+#                point in the stack (as output by `get_bdry_interp_op`).
+# - `min_pairs`: List of pairs of boolean vectors, marking the first and
+#                second point of each pair (in order).
+# - `seg_starts`: The start index of each non-empty segment (as output by
+#                 `get_seg_starts`).
+# - `seg_nonempty`: Boolean vector indicating which segments are non-empty
+#                   (as output by `get_seg_starts`).
+# - `backend`: The backend used to run the bootstrap (see 
+#              `get_boot_backend`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_max`: The maximum of |g*| along each segment, of shape 
+#               [nBlock, nSegs].
+#
+# ============================================================================
+def get_boot_seg_max_g(boot_vars, resids_vox, resids_sumsq, interp_op, min_pairs, seg_starts, seg_nonempty, backend='numpy'):
+
+    # Run the fused bootstrap
+    if backend == 'numba':
+
+        # Get the maximum along each segment
+        plan = get_fused_plan_pairs(interp_op.shape[0], min_pairs, seg_starts, seg_nonempty)
+        boot_max = get_boot_seg_max_fused(boot_vars, resids_vox, resids_sumsq, interp_op, plan)
+
+        # Check against the NumPy bootstrap
+        check_boot_fused('seg_max_g', plan, boot_max,
+                         lambda: get_boot_seg_max_g(boot_vars, resids_vox, resids_sumsq, interp_op,
+                                                    min_pairs, seg_starts, seg_nonempty),
+                         boot_vars.dtype)
+
+        # Return the maxima
+        return(boot_max)
+
+    # Get the bootstrapped g values at every unique voxel
+    boot_g = get_boot_g(boot_vars, resids_vox, resids_sumsq)
+
+    # Interpolation along every segment
+    boot_g = (interp_op.astype(boot_g.dtype, copy=False) @ boot_g.T).T
+
+    # Minimum of g1 and g2 for each pair of points
+    for pts1, pts2 in min_pairs:
+
+        # Minimum of both g1 and g2 (note: the absolute values must be 
+        # outside the minimum)
+        boot_g[:,pts1] = np.minimum(boot_g[:,pts1], boot_g[:,pts2])
+        boot_g[:,pts2] = 0
+
+    # Get the maximum along each segment
+    return(get_seg_max(np.abs(boot_g), seg_starts, seg_nonempty))
+
+
+# ============================================================================
+#
+# This function takes in a block of Rademacher variables and returns, for
+# each partition d^alpha F of a boundary, the bootstrapped value of:
+#
+#                  sup_{s in d^alpha F} |min_{i in alpha} g^i*(s)|
+#
+# The g^i are bootstrapped once per unique boundary voxel (of every field)
+# and interpolated onto every (field, boundary point) pair with a single 
+# sparse matrix multiplication. Fields which do not belong to a point's
+# partition are masked to +inf, so the minimum can be taken over the field
+# axis in one operation, and the supremum over each partition is then taken
+# with a segment reduction over the (label sorted) boundary points.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_vars`: The (nBlock x nSub) matrix of Rademacher variables.
+# - `resids_vox`: The residuals at the unique boundary voxels of every field,
+#                 of shape [nSub, nVox].
+# - `resids_sumsq`: The sum of squares of `resids_vox` across subjects.
+# - `interp_op`: The sparse interpolation operator, with one row for every
+#                (field, boundary point) pair in field-major order (as 
+#                output by `get_bdry_interp_op`).
+# - `field_mask`: Boolean array of shape [m, nBdry] indicating which fields 
+#                 belong to the partition of each boundary point.
+# - `seg_starts`: The start index of each non-empty partition (as output by
+#                 `get_seg_starts`).
+# - `seg_nonempty`: Boolean vector indicating which partitions are non-empty
+#                   (as output by `get_seg_starts`).
+# - `backend`: The backend used to run the bootstrap (see 
+#              `get_boot_backend`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_sup_ming`: The supremum of |min g| along each partition, of shape
+#                    [nBlock, nSegs].
+#
+# ============================================================================
+def get_boot_sup_ming(boot_vars, resids_vox, resids_sumsq, interp_op, field_mask, seg_starts, seg_nonempty, backend='numpy'):
+
+    # Run the fused bootstrap
+    if backend == 'numba':
+
+        # Get the suprema along each partition
+        plan = get_fused_plan_ming(field_mask, seg_starts, seg_nonempty)
+        boot_sup_ming = get_boot_seg_max_fused(boot_vars, resids_vox, resids_sumsq, interp_op, plan)
+
+        # Check against the NumPy bootstrap
+        check_boot_fused('sup_ming', plan, boot_sup_ming,
+                         lambda: get_boot_sup_ming(boot_vars, resids_vox, resids_sumsq, interp_op,
+                                                   field_mask, seg_starts, seg_nonempty),
+                         boot_vars.dtype)
+
+        # Return the suprema
+        return(boot_sup_ming)
+
+    # Get the bootstrapped g^i values at every unique voxel
+    boot_g = get_boot_g(boot_vars, resids_vox, resids_sumsq)
+
+    # Interpolate every g^i along the boundary, of shape [nBlock, m, nBdry]
+    boot_g = (interp_op.astype(boot_g.dtype, copy=False) @ boot_g.T).T.reshape(boot_g.shape[0], *field_mask.shape)
+
+    # Mask out the fields which are not in each point's partition
+    boot_g[:,~field_mask] = np.inf
+
+    # Take the minimum over fields
+    boot_ming = np.amin(boot_g, axis=1)
+
+    # Get the supremum along each partition
+    boot_sup_ming = get_seg_max(np.abs(boot_ming), seg_starts, seg_nonempty)
+
+    # Return the suprema
+    return(boot_sup_ming)
+
+
+# ============================================================================
+#
+# This function returns the half-widths of distribution-free confidence
+# intervals for the percentiles of a bootstrap distribution. The number of
+# bootstraps below the q^th quantile is Binomial(n, q), so the interval 
+# between the order statistics
+#
+#                    x_(nq - z sqrt(nq(1-q)))  and  x_(nq + z sqrt(nq(1-q)))
+#
+# covers the q^th quantile with (approximate) probability given by z. Note
+# that for q = 0 or 1 the interval is a single order statistic.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `samples`: The bootstrap samples (a vector).
+# - `p`: The vector of quantiles (between 0 and 1).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `halfwidth`: The half-width of the confidence interval for each quantile.
+#
+# ============================================================================
+def get_quantile_ci_halfwidth(samples, p):
+
+    # Sort the samples
+    samples = np.sort(samples)
+
+    # Number of samples
+    n = len(samples)
+
+    # Standard deviation of the number of samples below each quantile
+    sd = np.sqrt(n*p*(1-p))
+
+    # Order statistics bounding each interval
+    lower = np.clip(np.floor(n*p - BOOT_CI_Z*sd).astype(int), 0, n-1)
+    upper = np.clip(np.ceil(n*p + BOOT_CI_Z*sd).astype(int), 0, n-1)
+
+    # Return the half-widths
+    return((samples[upper] - samples[lower])/2)
+
+
+# ============================================================================
+#
+# This function checks whether the percentiles of the bootstrap
+# distributions have converged, i.e. whether the confidence interval for
+# every percentile (see `get_quantile_ci_halfwidth`) of every distribution
+# has half-width at most `tol`. As when the percentiles are taken, zeros
+# (recorded when the boundary was empty) are ignored.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `samples_list`: List of vectors of bootstrap samples (e.g. the maxima
+#                   along the true and estimated boundaries).
+# - `p`: The vector of quantiles (between 0 and 1).
+# - `tol`: The tolerance on the half-width of each confidence interval.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `converged`: True if every percentile has converged.
+#
+# ============================================================================
+def get_boot_converged(samples_list, p, tol):
+
+    # Loop through the distributions
+    for samples in samples_list:
+
+        # Drop the instances where the boundary length was zero
+        samples = samples[samples!=0]
+
+        # If we have recorded values, check their percentiles
+        if (len(samples) > 0) and np.any(get_quantile_ci_halfwidth(samples, p) > tol):
+            return(False)
+
+    # Every percentile has converged
+    return(True)
@@ -0,0 +1,339 @@
+import numpy as np
+
+# numba is optional; without it only the NumPy bootstrap is available (see
+# `get_boot_backend`)
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the fused (numba compiled) bootstrap kernel. The NumPy
+# bootstrap (see `get_boot_g`) makes a full pass over a block of bootstraps,
+# and a temporary array, for each of the standard deviation, the division,
+# the interpolation along the boundary, the minimum over fields, the 
+# absolute value and the maximum. The fused kernel obtains the bootstrapped
+# sums with one matrix multiplication (as in `get_boot_g`, this is left to
+# BLAS), and then performs every other step in a single loop over a chunk of
+# bootstraps at a time, with the chunks run in parallel (with `prange`). 
+# Within a chunk the g* values are held voxel-major (i.e. of shape 
+# [nVox, chunk]), so the interpolation runs along contiguous bootstraps.
+#
+# Every variant of the bootstrap (the maximum along the boundary for one
+# field, the maxima along the boundaries of the 2mu simulations, with the
+# minimum of g1 and g2 taken along d12, and the suprema of min g^i along
+# each partition for m fields) is described by a "plan", giving for each
+# boundary point:
+#
+#    - the rows of the interpolation operator to take the minimum over (at
+#      least one, padded with -1).
+#    - the segment (i.e. the output column) it belongs to.
+#
+# The kernel then returns, for each bootstrap and segment:
+#
+#                  max_{s in segment} |min_{rows of s} g*(row)|
+#
+# with zero for empty segments. The compiled kernel is cached on disk (in
+# the __pycache__ folder next to this file, or numba's cache folder if that
+# cannot be written to), so it is only compiled once rather than by every
+# job. The number of threads it uses can be set with NUMBA_NUM_THREADS
+# (this should be reduced when running several worker processes).
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Number of bootstraps in each chunk of the fused kernel
+BOOT_FUSED_CHUNK = 64
+
+# ============================================================================
+#
+# This function returns the plan for the maximum of |g*| over every
+# boundary point (i.e. one segment, with each point taking a single row).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `nPts`: The number of boundary points.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `plan`: Dictionary holding the rows (`pt_rows`, of shape [nPts, 1]), the
+#           segment of each point (`pt_seg`) and the number of segments
+#           (`nSegs`).
+#
+# ============================================================================
+def get_fused_plan_max(nPts):
+
+    # Every point takes its own row and belongs to the one segment
+    return({'pt_rows': np.arange(nPts, dtype=np.int64).reshape(nPts, 1),
+            'pt_seg': np.zeros(nPts, dtype=np.int64),
+            'nSegs': 1})
+
+
+# ============================================================================
+#
+# This function returns the plan for the maxima of |g*| along segments of
+# boundary points, where for pairs of points the minimum of g* is taken
+# before the absolute value (see the mode 3 bootstrap in
+# `SpatialSims_2mu_nSub`). The second point of each pair is then ignored.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `nPts`: The number of boundary points (ordered by segment).
+# - `min_pairs`: List of pairs of boolean vectors, marking the first and
+#                second point of each pair (in order).
+# - `seg_starts`: The start index of each non-empty segment (as output by
+#                 `get_seg_starts`).
+# - `seg_nonempty`: Boolean vector indicating which segments are non-empty
+#                   (as output by `get_seg_starts`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `plan`: The plan (see `get_fused_plan_max`).
+#
+# ============================================================================
+def get_fused_plan_pairs(nPts, min_pairs, seg_starts, seg_nonempty):
+
+    # By default every point takes its own row
+    pt_rows = np.full((nPts, 2), -1, dtype=np.int64)
+    pt_rows[:,0] = np.arange(nPts)
+
+    # The first point of each pair also takes the row of the second, and the
+    # second is ignored
+    for pts1, pts2 in min_pairs:
+        pt_rows[pts1,1] = np.flatnonzero(pts2)
+        pt_rows[pts2,0] = -1
+
+    # Return the plan
+    return({'pt_rows': pt_rows,
+            'pt_seg': get_fused_pt_seg(nPts, seg_starts, seg_nonempty),
+            'nSegs': len(seg_nonempty)})
+
+
+# ============================================================================
+#
+# This function returns the plan for the suprema of |min_{i in alpha} g^i*|
+# along each partition d^alpha F of a boundary (see `get_boot_sup_ming`).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `field_mask`: Boolean array of shape [m, nBdry] indicating which fields
+#                 belong to the partition of each boundary point.
+# - `seg_starts`: The start index of each non-empty partition (as output by
+#                 `get_seg_starts`).
+# - `seg_nonempty`: Boolean vector indicating which partitions are non-empty
+#                   (as output by `get_seg_starts`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `plan`: The plan (see `get_fused_plan_max`).
+#
+# ============================================================================
+def get_fused_plan_ming(field_mask, seg_starts, seg_nonempty):
+
+    # Number of fields and boundary points
+    m, nBdry = field_mask.shape
+
+    # The rows of the (field-major) interpolation operator for every field
+    # of each point, with the fields outside its partition masked out
+    pt_rows = (np.arange(m).reshape(m, 1)*nBdry + np.arange(nBdry)).T
+    pt_rows = np.where(field_mask.T, pt_rows, -1).astype(np.int64)
+
+    # Return the plan
+    return({'pt_rows': pt_rows,
+            'pt_seg': get_fused_pt_seg(nBdry, seg_starts, seg_nonempty),
+            'nSegs': len(seg_nonempty)})
+
+
+# ============================================================================
+#
+# This function returns the segment each boundary point belongs to, given
+# the starts of the (non-empty) segments.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `nPts`: The number of boundary points (ordered by segment).
+# - `seg_starts`: The start index of each non-empty segment (as output by
+#                 `get_seg_starts`).
+# - `seg_nonempty`: Boolean vector indicating which segments are non-empty
+#                   (as output by `get_seg_starts`).
+#
+# ============================================================================
+def get_fused_pt_seg(nPts, seg_starts, seg_nonempty):
+
+    # No points
+    if nPts == 0:
+        return(np.zeros(0, dtype=np.int64))
+
+    # Index of the non-empty segment each point falls in
+    inds = np.searchsorted(seg_starts, np.arange(nPts), side='right') - 1
+
+    # Convert to the index amongst all segments
+    return(np.flatnonzero(seg_nonempty)[inds].astype(np.int64))
+
+
+# ============================================================================
+#
+# This function takes in a block of Rademacher variables and returns, for
+# each segment of the plan, the bootstrapped value of:
+#
+#                  max_{s in segment} |min_{rows of s} g*(row)|
+#
+# where g* is bootstrapped at the unique boundary voxels (as in
+# `get_boot_g`) and interpolated onto every row with the interpolation
+# operator. This requires numba (see `get_boot_backend`).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `boot_vars`: The (nBlock x nSub) matrix of Rademacher variables.
+# - `resids_vox`: The residuals at the unique boundary voxels, of shape
+#                 [nSub, nVox].
+# - `resids_sumsq`: The sum of squares of `resids_vox` across subjects.
+# - `interp_op`: The sparse (CSR) interpolation operator (as output by
+#                `get_bdry_interp_op`), or None if the g* values are not
+#                interpolated.
+# - `plan`: The plan (see `get_fused_plan_max`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `seg_max`: The maximum within each segment, of shape [nBlock, nSegs].
+#
+# ============================================================================
+def get_boot_seg_max_fused(boot_vars, resids_vox, resids_sumsq, interp_op, plan):
+
+    # Residuals in point-major form, and the Rademacher variables in the 
+    # same type (both must be contiguous for the matrix multiplication)
+    resids_vox = np.ascontiguousarray(resids_vox.reshape(resids_vox.shape[0], -1))
+    boot_vars = np.ascontiguousarray(boot_vars, dtype=resids_vox.dtype)
+    resids_sumsq = np.asarray(resids_sumsq, dtype=np.float64).reshape(-1)
+
+    # Without interpolation, every row is a single voxel
+    if interp_op is None:
+        nVox = resids_vox.shape[1]
+        indptr = np.arange(nVox + 1, dtype=np.int64)
+        indices = np.arange(nVox, dtype=np.int64)
+        weights = np.ones(nVox)
+    else:
+        indptr, indices, weights = interp_op.indptr, interp_op.indices, interp_op.data
+
+    # Run the kernel
+    return(_get_boot_seg_max_kernel(boot_vars, resids_vox, resids_sumsq, indptr, indices, weights,
+                                    plan['pt_rows'], plan['pt_seg'], plan['nSegs'], BOOT_FUSED_CHUNK))
+
+
+# The kernel (compiled in parallel and cached on disk) for
+# `get_boot_seg_max_fused`. The standard deviations are computed in float64,
+# whatever the type of the residuals.
+if numba is not None:
+
+    @numba.njit(parallel=True, cache=True)
+    def _get_boot_seg_max_kernel(boot_vars, resids, resids_sumsq, indptr, indices, weights, pt_rows, pt_seg, nSegs, chunk):
+
+        # Sizes
+        nBlock, nSub = boot_vars.shape
+        nVox = resids.shape[1]
+        nPts, nRows = pt_rows.shape
+
+        # Bootstrapped sums across subjects
+        boot_sums = np.dot(boot_vars, resids)
+
+        # Maxima (zero for empty segments)
+        seg_max = np.zeros((nBlock, nSegs))
+
+        # Loop through the chunks of bootstraps in parallel
+        nChunks = (nBlock + chunk - 1)//chunk
+        for k in numba.prange(nChunks):
+
+            # Bootstraps in this chunk
+            b0 = k*chunk
+            nChunk = min(chunk, nBlock - b0)
+
+            # Divide by the bootstrap standard deviation (with ddof=1), 
+            # storing g* voxel-major
+            g = np.empty((nVox, nChunk))
+            for v in range(nVox):
+                for c in range(nChunk):
+                    s = boot_sums[b0+c, v]
+                    g[v, c] = s/(np.sqrt(nSub)*np.sqrt((resids_sumsq[v] - s*s/nSub)/(nSub-1)))
+
+            # Interpolated g* for a row, the minimum for a point, and the 
+            # maxima for each segment
+            val = np.empty(nChunk)
+            ming = np.empty(nChunk)
+            chunk_max = np.zeros((nSegs, nChunk))
+
+            # Loop through the boundary points
+            for s in range(nPts):
+
+                # Minimum of the interpolated g* over the rows of this point
+                found = False
+                for i in range(nRows):
+                    row = pt_rows[s, i]
+                    if row >= 0:
+
+                        # Interpolate g* onto this row
+                        val[:] = 0.0
+                        for e in range(indptr[row], indptr[row+1]):
+                            w = weights[e]
+                            v = indices[e]
+                            for c in range(nChunk):
+                                val[c] += w*g[v, c]
+
+                        # Update the minimum
+                        if not found:
+                            ming[:] = val
+                            found = True
+                        else:
+                            for c in range(nChunk):
+                                if val[c] < ming[c]:
+                                    ming[c] = val[c]
+
+                # Update the maximum of the absolute value in its segment
+                if found:
+                    seg = pt_seg[s]
+                    for c in range(nChunk):
+                        if abs(ming[c]) > chunk_max[seg, c]:
+                            chunk_max[seg, c] = abs(ming[c])
+
+            # Record the maxima for this chunk
+            for c in range(nChunk):
+                for seg in range(nSegs):
+                    seg_max[b0+c, seg] = chunk_max[seg, c]
+
+        # Return the maxima
+        return(seg_max)
@@ -2,6 +2,7 @@ import numpy as np
 import os
 import time
 import matplotlib.pyplot as plt
+import scipy.sparse
 from lib.generateData import *
 
 
@@ -10,130 +11,280 @@ from lib.generateData import *
 
 # field - field to thresh
 # c - thresh
-# d - dimension along which we get bdry
-def get_bdry_map(field, c, d): 
-
-    # Get field dimensions
-    dim = field.shape
-
-    # Get boolean for where field is greater than c
-    exc_set = field>c
+#
+# Returns the boundary of the excursion set of field as a compact list of
+# edges. Each edge joins an inner voxel (inside the excursion set) to an
+# outer voxel (outside the excursion set) which neighbours it along one of 
+# the non-singleton dimensions of field. Every edge is described by:
+#
+#  - 'inner'/'outer': flat indices of the inner and outer voxels (into 
+#                     field with its singleton dimensions removed)
+#  - 'axis': the dimension of field the edge lies along
+#  - 'direction': 0 if the outer voxel lies after the inner voxel along 
+#                 this axis ('bottom') and 1 if it lies before it ('top')
+#
+# The edges are ordered by axis, then direction, then in C order (the order
+# used by get_bdry_locs and get_bdry_values_concat).
+def get_bdry_edges(field, c):
 
-    # ----------------------------------------------------------------------
-    # Work out shift down and shift up indices
-    # ----------------------------------------------------------------------
-    # Initialize empty index collections
-    up_indices = np.empty(shape=(len(dim)),dtype=object)
-    down_indices = np.empty(shape=(len(dim)),dtype=object)
-
-
-    # Loop through indices and join them in a list
-    for i in np.arange(len(dim)):
+    # Shape of field
+    shape = np.array(field.shape)
 
-        # If the d is not the i^th dimension keep all rows
-        if d == i:
+    # Dimensions of 1 are assumed to be uninteresting as they are usually 
+    # only included for broadcasting purposes.
+    dims = np.arange(field.ndim)[shape>1]
+
+    # Get boolean for where field is greater than c (with the singleton
+    # dimensions removed)
+    exc_set = (field>c).reshape(shape[dims])
+
+    # Empty lists to store the edges along each axis and direction
+    inner, outer, axis, direction = [], [], [], []
+
+    # Loop through the non-singleton dimensions
+    for j, d in enumerate(dims):
+
+        # Views of the excursion set without the last and first slices along
+        # this axis
+        lower = exc_set[(slice(None),)*j + (slice(None,-1),)]
+        upper = exc_set[(slice(None),)*j + (slice(1,None),)]
+
+        # The bottom boundary has its inner voxel in the lower view and the 
+        # top boundary has its inner voxel in the upper view
+        for k, (shift, bdry) in enumerate([(0, lower & ~upper), (1, upper & ~lower)]):
+
+            # Coordinates of the boundary in the views
+            coords = np.nonzero(bdry)
+
+            # Coordinates of the inner and outer voxels
+            inner_coords = list(coords)
+            outer_coords = list(coords)
+            inner_coords[j] = coords[j] + shift
+            outer_coords[j] = coords[j] + 1 - shift
+
+            # Record the edges
+            inner.append(np.ravel_multi_index(inner_coords, exc_set.shape))
+            outer.append(np.ravel_multi_index(outer_coords, exc_set.shape))
+            axis.append(np.full(len(coords[0]), d, dtype=np.int8))
+            direction.append(np.full(len(coords[0]), k, dtype=np.int8))
+
+    # Make the edge structure
+    bdry_edges = dict()
+    bdry_edges['inner'] = np.concatenate([np.zeros(0,dtype=np.intp)] + inner)
+    bdry_edges['outer'] = np.concatenate([np.zeros(0,dtype=np.intp)] + outer)
+    bdry_edges['axis'] = np.concatenate([np.zeros(0,dtype=np.int8)] + axis)
+    bdry_edges['direction'] = np.concatenate([np.zeros(0,dtype=np.int8)] + direction)
+
+    # Add the non-flat (>1) dimensions, the shape with these dimensions 
+    # removed and the original shape
+    bdry_edges['dims'] = dims
+    bdry_edges['shape'] = shape[dims]
+    bdry_edges['shape_orig'] = shape
+
+    # Return the edges
+    return(bdry_edges)
+
+
+# field - field to index (the same field is then thresholded at any number
+#         of thresholds)
+#
+# Returns an index of every pair of neighbouring voxels in field (along its
+# non-singleton dimensions), from which the boundary edges of the excursion
+# set of field can be read off for any threshold by get_bdry_edges_index. A
+# pair lies on the boundary exactly when the threshold, c, satisfies 
+# lo <= c < hi, where lo and hi are the smaller and larger of its two values
+# (the voxel with value hi is then the inner voxel). Every pair is stored 
+# once, sorted by lo:
+#
+#  - 'lo'/'hi': the smaller and larger value of each pair (i.e. the outer 
+#               and inner values of the pair whenever it is an edge)
+#  - 'inner'/'outer'/'axis'/'direction': the edge each pair gives when it 
+#                                        is on the boundary (as in 
+#                                        get_bdry_edges)
+#  - 'rank': the position of each edge in the order used by get_bdry_edges
+#
+# Pairs with equal values can never be on the boundary and are left out.
+def get_bdry_index(field):
 
-            # Add all but last to up indices
-            up_indices[i] = np.arange(dim[i]-1)
+    # Shape of field
+    shape = np.array(field.shape)
 
-            # Add all but first to down indices
-            down_indices[i] = np.arange(1, dim[i])
+    # Dimensions of 1 are assumed to be uninteresting as they are usually 
+    # only included for broadcasting purposes.
+    dims = np.arange(field.ndim)[shape>1]
+
+    # Field with the singleton dimensions removed
+    field = field.reshape(shape[dims])
+
+    # Flat indices of the voxels
+    inds = np.arange(field.size).reshape(field.shape)
+
+    # Empty lists to store the pairs along each axis
+    lo, hi, inner, outer, axis, direction, rank = [], [], [], [], [], [], []
+
+    # Number of edges in the order used by get_bdry_edges before the current 
+    # axis
+    offset = 0
+
+    # Loop through the non-singleton dimensions
+    for j, d in enumerate(dims):
+
+        # Values and indices of the voxels without the last and first slices
+        # along this axis
+        lower = field[(slice(None),)*j + (slice(None,-1),)].ravel()
+        upper = field[(slice(None),)*j + (slice(1,None),)].ravel()
+        lower_inds = inds[(slice(None),)*j + (slice(None,-1),)].ravel()
+        upper_inds = inds[(slice(None),)*j + (slice(1,None),)].ravel()
+
+        # Pairs with the inner voxel in the lower view (bottom boundary,
+        # direction 0) or in the upper view (top boundary, direction 1)
+        bottom = lower > upper
+        keep = lower != upper
+
+        # Record the pairs
+        lo.append(np.where(bottom, upper, lower)[keep])
+        hi.append(np.where(bottom, lower, upper)[keep])
+        inner.append(np.where(bottom, lower_inds, upper_inds)[keep])
+        outer.append(np.where(bottom, upper_inds, lower_inds)[keep])
+        axis.append(np.full(np.count_nonzero(keep), d, dtype=np.int8))
+        direction.append((~bottom[keep]).astype(np.int8))
+
+        # get_bdry_edges orders the edges along each axis by direction and
+        # then by the C order of their position in the views
+        rank.append(offset + np.where(bottom, 0, len(lower))[keep] + np.arange(len(lower))[keep])
+        offset = offset + 2*len(lower)
+
+    # Concatenate the pairs
+    lo = np.concatenate([np.zeros(0,dtype=field.dtype)] + lo)
+    hi = np.concatenate([np.zeros(0,dtype=field.dtype)] + hi)
+
+    # Sort the pairs by lo
+    order = np.argsort(lo, kind='stable')
+
+    # Make the index
+    bdry_index = dict()
+    bdry_index['lo'] = lo[order]
+    bdry_index['hi'] = hi[order]
+    bdry_index['inner'] = np.concatenate([np.zeros(0,dtype=np.intp)] + inner)[order]
+    bdry_index['outer'] = np.concatenate([np.zeros(0,dtype=np.intp)] + outer)[order]
+    bdry_index['axis'] = np.concatenate([np.zeros(0,dtype=np.int8)] + axis)[order]
+    bdry_index['direction'] = np.concatenate([np.zeros(0,dtype=np.int8)] + direction)[order]
+    bdry_index['rank'] = np.concatenate([np.zeros(0,dtype=np.intp)] + rank)[order]
+
+    # Add the non-flat (>1) dimensions, the shape with these dimensions 
+    # removed and the original shape
+    bdry_index['dims'] = dims
+    bdry_index['shape'] = shape[dims]
+    bdry_index['shape_orig'] = shape
+
+    # Return the index
+    return(bdry_index)
+
+
+# bdry_index - boundary index of a field (as output by get_bdry_index)
+# c - thresh
+#
+# Returns the boundary edges of the excursion set of the indexed field at
+# threshold c, exactly as get_bdry_edges(field, c) would, along with the 
+# values of the field at the edges, exactly as get_bdry_values_concat would
+# (i.e. [...,0] inner, [...,1] outer). The pairs with lo <= c are found by a 
+# binary search, so only these are looked at (rather than the whole field).
+def get_bdry_edges_index(bdry_index, c):
 
-        # If the d is not the i^th dimension keep all rows
-        else:
+    # Number of pairs with lo <= c
+    n = np.searchsorted(bdry_index['lo'], c, side='right')
 
-            # Add full numpy range to both up and down
-            up_indices[i] = np.arange(dim[i])
-            down_indices[i] = np.arange(dim[i])
+    # Of these, the pairs which are on the boundary (hi > c)
+    sel = np.nonzero(bdry_index['hi'][:n] > c)[0]
 
-    # Padding dimensions to add zeros back on at the end (basically just 
-    # same as dim but with the d^th dimension set to 1
-    pdim = np.array(dim)
-    pdim[d] = 1
+    # Put them in the order used by get_bdry_edges
+    sel = sel[np.argsort(bdry_index['rank'][sel])]
 
-    # ----------------------------------------------------------------------
-    # Bottom boundary
-    # ----------------------------------------------------------------------
+    # Make the edge structure
+    bdry_edges = dict()
+    for key in ['inner', 'outer', 'axis', 'direction']:
+        bdry_edges[key] = bdry_index[key][sel]
 
-    # Boundary without the bottom row (we can't assess downwards violations
-    # when there is no data below)
-    bdry_wo_bottom = exc_set[np.ix_(*up_indices)]
+    # Add the dimensions and shapes
+    for key in ['dims', 'shape', 'shape_orig']:
+        bdry_edges[key] = bdry_index[key]
 
-    # Complement of boundary downwards shifted
-    shif_bdry_bottom = np.logical_not(exc_set[np.ix_(*down_indices)])
+    # Values at the inner and outer voxels
+    bdry_vals_concat = np.stack((bdry_index['hi'][sel], bdry_index['lo'][sel]), axis=-1)
 
-    # The boundary "below" the excursion set in this dimension
-    bottom_bdry = bdry_wo_bottom*shif_bdry_bottom
+    # Return the edges and values
+    return(bdry_edges, bdry_vals_concat)
 
-    # Inner bottom bdry - add back on a bottom row
-    bottom_bdry_inner = np.concatenate((bottom_bdry,np.zeros(pdim)),axis=d)
 
-    # Outer bottom bdry - add back on a top row
-    bottom_bdry_outer = np.concatenate((np.zeros(pdim),bottom_bdry),axis=d)
+# bdry_edges - boundary edges (as output by get_bdry_edges)
+# d - dimension along which we get bdry
+# direction - 0 (bottom) or 1 (top)
+# side - 'inner' or 'outer'
+#
+# Returns a boolean map, the same shape as the original field, of the inner 
+# or outer voxels of the edges along dimension d in the given direction.
+def get_bdry_edge_map(bdry_edges, d, direction, side):
 
-    # ----------------------------------------------------------------------
-    # Top boundary
-    # ----------------------------------------------------------------------
+    # Edges along this dimension and direction
+    sel = (bdry_edges['axis']==d) & (bdry_edges['direction']==direction)
 
-    # Boundary without the top row (we can't assess upwards violations
-    # when there is no data above)
-    bdry_wo_top = exc_set[np.ix_(*down_indices)]
+    # Boolean map
+    bdry_map = np.zeros(np.prod(bdry_edges['shape_orig']), dtype=bool)
+    bdry_map[bdry_edges[side][sel]] = True
 
-    # Complement of boundary upwards shifted
-    shif_bdry_top = np.logical_not(exc_set[np.ix_(*up_indices)])
+    # Return the map in the original shape
+    return(bdry_map.reshape(bdry_edges['shape_orig']))
 
-    # The boundary "above" the excursion set in this dimension
-    top_bdry = bdry_wo_top*shif_bdry_top
 
-    # Inner top bdry - add back on a top row
-    top_bdry_inner = np.concatenate((np.zeros(pdim),top_bdry),axis=d)
+# field - field to thresh
+# c - thresh
+# d - dimension along which we get bdry
+#
+# Adapter for get_bdry_edges, returning boolean maps of the bottom inner,
+# bottom outer, top inner and top outer boundaries along dimension d.
+def get_bdry_map(field, c, d): 
 
-    # Outer top bdry - add back on a bottom row
-    top_bdry_outer = np.concatenate((top_bdry,np.zeros(pdim)),axis=d)
+    # Get the boundary edges
+    bdry_edges = get_bdry_edges(field, c)
 
-    return(bottom_bdry_inner, bottom_bdry_outer, top_bdry_inner, top_bdry_outer)
+    # Return the maps
+    return(get_bdry_edge_map(bdry_edges, d, 0, 'inner'), get_bdry_edge_map(bdry_edges, d, 0, 'outer'),
+           get_bdry_edge_map(bdry_edges, d, 1, 'inner'), get_bdry_edge_map(bdry_edges, d, 1, 'outer'))
 
 
+# field - field to thresh
+# c - thresh
+#
+# Adapter for get_bdry_edges, returning the boundary in dictionary form, i.e.
+# bdry_maps[d][direction][inner/outer] is a boolean map of the boundary. The
+# edges themselves are stored under bdry_maps['edges'].
 def get_bdry_maps(field, c):
 
-    # Shape of field
-    shape = np.array(field.shape)
-
-    # Dimension of field
-    dim = np.array(field.ndim)
+    # Get the boundary edges
+    bdry_edges = get_bdry_edges(field, c)
 
     # Make an empty dictionary to store boundaries
     bdry_maps = dict()
 
-    # Loop through dimensions of field and get the boundary boolean maps.
-    for d in np.arange(dim):
-
-        # Dimensions of 1 are assumed to be uninteresting as they are usually 
-        # only included for broadcasting purposes.
-        if shape[d]>1:
-
-            # Get boundaries
-            bottom_inner, bottom_outer, top_inner, top_outer = get_bdry_map(field, c, d)
-
-            # Record d^th boundary
-            bdry_maps[d] = dict()
+    # Directions we can interpolate in
+    directions = ['bottom', 'top']
 
-            # Add bottom boundaries
-            bdry_maps[d]['bottom'] = dict()
+    # Loop through dimensions of field and get the boundary boolean maps.
+    for d in bdry_edges['dims']:
 
-            # Add inner and outer bottom boundaries
-            bdry_maps[d]['bottom']['inner'] = bottom_inner
-            bdry_maps[d]['bottom']['outer'] = bottom_outer
+        # Record d^th boundary
+        bdry_maps[d] = dict()
 
-            # Add top boundaries
-            bdry_maps[d]['top'] = dict()
+        # Loop through all directions
+        for k, direction in enumerate(directions):
 
-            # Add inner and outer top boundaries
-            bdry_maps[d]['top']['inner'] = top_inner
-            bdry_maps[d]['top']['outer'] = top_outer
+            # Add inner and outer boundaries
+            bdry_maps[d][direction] = dict()
+            bdry_maps[d][direction]['inner'] = get_bdry_edge_map(bdry_edges, d, k, 'inner')
+            bdry_maps[d][direction]['outer'] = get_bdry_edge_map(bdry_edges, d, k, 'outer')
 
     # Add the non-flat (>1) dimensions as an array for good measure
-    bdry_maps['dims'] = np.arange(dim)[shape>1]
+    bdry_maps['dims'] = bdry_edges['dims']
 
     # Save original field shapes
     bdry_maps['shape_orig'] = np.array(field.shape)
@@ -141,50 +292,41 @@ def get_bdry_maps(field, c):
     # Save original field dimension
     bdry_maps['dim_orig'] = np.array(field.ndim)
 
+    # Save the edges
+    bdry_maps['edges'] = bdry_edges
+
     # Return the bounaries
     return(bdry_maps)
 
 
 def get_bdry_map_combined(field, c):
 
-    # Shape of field
-    shape = np.array(field.shape)
-
-    # Dimension of field
-    dim = np.array(field.ndim)
-
-    # Record if this is the first boundary we've seen
-    first = True
-
-    # Loop through dimensions of field and get the boundary boolean maps.
-    for d in np.arange(dim):
-
-        # Dimensions of 1 are assumed to be uninteresting as they are usually 
-        # only included for broadcasting purposes.
-        if shape[d]>1:
-
-            # Get boundaries
-            bottom_inner, bottom_outer, top_inner, top_outer = get_bdry_map(field, c, d)
-
-            # Record d^th boundary
-            if first:
-
-                # Add inner and outer bottom boundaries
-                bdry_map = bottom_inner + bottom_outer + top_inner + top_outer
+    # Get the boundary edges
+    bdry_edges = get_bdry_edges(field, c)
 
-                # No longer looking at first boundary
-                first = False
-
-            else:
-
-                # Add inner and outer bottom boundaries
-                bdry_map = bdry_map + bottom_inner + bottom_outer + top_inner + top_outer
+    # Mark every voxel on the inner or outer boundary
+    bdry_map = np.zeros(np.prod(bdry_edges['shape_orig']), dtype=bool)
+    bdry_map[bdry_edges['inner']] = True
+    bdry_map[bdry_edges['outer']] = True
 
     # Return the boundary
-    return(bdry_map>0)
-
+    return(bdry_map.reshape(bdry_edges['shape_orig']))
+
+# bdry_maps - boundary edges (as output by get_bdry_edges), or boundary maps
+#             (as output by get_bdry_maps)
+#
+# Returns the boundary locations in dictionary form, i.e. 
+# bdry_locs[d][direction][inner/outer] is a tuple of coordinates (into the
+# field with its singleton dimensions removed). The edges themselves are 
+# stored under bdry_locs['edges'].
 def get_bdry_locs(bdry_maps):
 
+    # Get the edges
+    if 'edges' in bdry_maps:
+        bdry_edges = bdry_maps['edges']
+    else:
+        bdry_edges = bdry_maps
+
     # Make an empty dictionary to store boundaries
     bdry_locs = dict()
 
@@ -192,42 +334,31 @@ def get_bdry_locs(bdry_maps):
     directions = ['bottom', 'top']
 
     # -------------------------------------------------------------------------------------
-    # Minimal dimensions (i.e. dimensions we would have if all dimensions of length 1 were
-    # removed
+    # Loop through dimensions of field and get the locations of the boundary.
     # -------------------------------------------------------------------------------------
-    # Read in 0^th dimension to get a boundary image to work with
-    dims = bdry_maps['dims']
-
-    # Get the new shape we want to record indices for.
-    new_shape = bdry_maps['shape_orig'][dims]
-
-    # -------------------------------------------------------------------------------------
-    # Loop through dimensions of field and get the locations of the boundary in the 
-    # boundary boolean maps.
-    # -------------------------------------------------------------------------------------
-    for d in bdry_maps['dims']:
+    for d in bdry_edges['dims']:
 
         # Record d^th boundary
         bdry_locs[d] = dict()
 
         # Loop through all directions getting locations
-        for direction in directions:
+        for k, direction in enumerate(directions):
 
             # Add bottom boundaries
             bdry_locs[d][direction] = dict()
 
-            # Get inner map and reshape 
-            inner = bdry_maps[d][direction]['inner'].reshape(new_shape)
+            # Edges along this dimension and direction
+            sel = (bdry_edges['axis']==d) & (bdry_edges['direction']==k)
 
-            # Get outer map and reshape 
-            outer = bdry_maps[d][direction]['outer'].reshape(new_shape)
-
-            # Get coordinates of non-zero entries
-            bdry_locs[d][direction]['inner'] = np.where(inner)
-            bdry_locs[d][direction]['outer'] = np.where(outer)
+            # Get coordinates of the inner and outer voxels
+            bdry_locs[d][direction]['inner'] = np.unravel_index(bdry_edges['inner'][sel], bdry_edges['shape'])
+            bdry_locs[d][direction]['outer'] = np.unravel_index(bdry_edges['outer'][sel], bdry_edges['shape'])
 
     # Add the non-zero dimensions as an array for good measure
-    bdry_locs['dims'] = bdry_maps['dims']
+    bdry_locs['dims'] = bdry_edges['dims']
+
+    # Save the edges
+    bdry_locs['edges'] = bdry_edges
 
     # Return the bounaries
     return(bdry_locs)
@@ -271,6 +402,30 @@ def get_bdry_values(field, bdry_locs):
     # Return boundary values
     return(bdry_vals)
 
+# data - data (with subjects along the first axis)
+# muHat - mean of the data
+# sigma - standard deviation of the data
+# bdry_locs - boundary locations (as output by get_bdry_locs)
+#
+# Returns the standardised residuals (data-muHat)/sigma along the boundary,
+# in the same form as get_bdry_values. Only the boundary voxels are read, 
+# so the residuals are never formed over the whole image.
+def get_bdry_resid(data, muHat, sigma, bdry_locs):
+
+    # Values of the data, mean and standard deviation along the boundary
+    data_vals = get_bdry_values(data, bdry_locs)
+    muHat_vals = get_bdry_values(muHat, bdry_locs)
+    sigma_vals = get_bdry_values(sigma, bdry_locs)
+
+    # Standardise them
+    for d in bdry_locs['dims']:
+        for direction in ['bottom', 'top']:
+            for side in ['inner', 'outer']:
+                data_vals[d][direction][side] = (data_vals[d][direction][side] - muHat_vals[d][direction][side])/sigma_vals[d][direction][side]
+
+    # Return the residuals
+    return(data_vals)
+
 def get_bdry_weights(bdry_vals,c):
 
     # New dictionary to store weights for interpolation along boundary
@@ -390,44 +545,22 @@ def get_bdry_vals_interpolated(bdry_vals,bdry_weights,dictform=False):
 
 def get_bdry_values_concat(field, bdry_locs):
 
-    # Directions we can interpolate in
-    directions = ['bottom', 'top']
-
-    # Boolean to tell if this is the first edge we are looking at.
-    first = True
-
-    # Loop through dimensions of field and get the boundary boolean maps.
-    for d in bdry_locs['dims']:
-
-        # Loop through all directions getting locations
-        for direction in directions:
-
-            # Get inner and outer boundary values in this dimension and
-            # direction            
-            inner_vals = field[...,(*bdry_locs[d][direction]['inner'])]
-            outer_vals = field[...,(*bdry_locs[d][direction]['outer'])]
-
-            # Reshape for concatenation
-            inner_vals = inner_vals.reshape((*inner_vals.shape),1)
-            outer_vals = outer_vals.reshape((*outer_vals.shape),1)
-            
-            # If this is the first edge we've looked at initialise 
-            # concatenated interpolated boundary array
-            if first:
+    # Get the edges
+    bdry_edges = bdry_locs['edges']
 
-                # Initialise array
-                bdry_vals_concat = np.concatenate((inner_vals,outer_vals),axis=-1)
+    # Number of non-singleton dimensions the boundary was found in
+    nDims = len(bdry_edges['shape'])
 
-                # We're no longer looking at the first edge
-                first = False
+    # Flatten the last dimensions of the field (these must match the shape
+    # of the boundary, with singleton dimensions removed)
+    field_flat = field.reshape(*field.shape[:-nDims], -1)
 
-            else:
+    # Preallocate the boundary values
+    bdry_vals_concat = np.empty((*field_flat.shape[:-1], len(bdry_edges['inner']), 2), dtype=field.dtype)
 
-                # Initialise array
-                current_bdry_vals = np.concatenate((inner_vals,outer_vals),axis=-1)
-
-                # Add the boundary values we just worked out
-                bdry_vals_concat =  np.concatenate((bdry_vals_concat,current_bdry_vals),axis=-2)
+    # Gather the inner and outer boundary values
+    np.take(field_flat, bdry_edges['inner'], axis=-1, out=bdry_vals_concat[...,0])
+    np.take(field_flat, bdry_edges['outer'], axis=-1, out=bdry_vals_concat[...,1])
 
     # Return boundary values
     return(bdry_vals_concat)
@@ -489,6 +622,165 @@ def get_bdry_vals_interpolated_concat(bdry_vals_concat,bdry_weights_concat):
 
 
 
+# bdry_locs - boundary locations (as output by get_bdry_locs)
+#
+# Returns the flat indices of the inner and outer voxels of every boundary
+# point, of shape (nBdry, 2), in the same layout as get_bdry_values_concat
+# (i.e. [...,0] is inner and [...,1] is outer).
+def get_bdry_inds_concat(bdry_locs):
+
+    # Get the edges
+    bdry_edges = bdry_locs['edges']
+
+    # Stack the inner and outer indices
+    return(np.stack((bdry_edges['inner'], bdry_edges['outer']), axis=-1))
+
+
+# bdry_inds_concat - flat voxel indices along a boundary, of shape 
+#                    (..., nBdry, 2) (as output by get_bdry_inds_concat, 
+#                    possibly offset to index into a stack of fields)
+# bdry_weights_concat - interpolation weights along the boundary (as output
+#                       by get_bdry_weights_concat), broadcastable against
+#                       bdry_inds_concat
+# mask - optional boolean array of shape (..., nBdry). Points which are
+#        False are left out of the operator (their rows are empty)
+#
+# Neighbouring boundary points share voxels, so rather than working with the
+# inner and outer value of every point we compile the boundary into:
+#
+#  - bdry_vox: the sorted unique flat indices of the voxels it touches
+#  - interp_op: a sparse (CSR) matrix, of shape (nRows, len(bdry_vox)), with
+#               one row per boundary point (leading dimensions flattened)
+#
+# such that interp_op @ vals[bdry_vox] gives the interpolated values along
+# the boundary (see get_bdry_vals_interpolated_op).
+def get_bdry_interp_op(bdry_inds_concat, bdry_weights_concat, mask=None):
+
+    # Broadcast the indices and weights against one another
+    bdry_inds_concat, bdry_weights_concat = np.broadcast_arrays(bdry_inds_concat, bdry_weights_concat)
+
+    # Flatten the leading dimensions (one row per boundary point)
+    inds = bdry_inds_concat.reshape(-1, 2)
+    weights = bdry_weights_concat.reshape(-1, 2)
+
+    # Number of rows in the operator
+    nRows = inds.shape[0]
+
+    # Row of every entry
+    rows = np.repeat(np.arange(nRows), 2)
+
+    # Only keep the points we have been asked for
+    if mask is not None:
+        keep = np.repeat(np.broadcast_to(mask, bdry_inds_concat.shape[:-1]).reshape(-1), 2)
+    else:
+        keep = np.ones(2*nRows, dtype=bool)
+
+    # Unique voxels and the column each entry maps to
+    bdry_vox, cols = np.unique(inds.reshape(-1)[keep], return_inverse=True)
+
+    # Build the operator
+    interp_op = scipy.sparse.csr_matrix((weights.reshape(-1)[keep], (rows[keep], cols)),
+                                        shape=(nRows, len(bdry_vox)))
+
+    # Return the unique voxels and the operator
+    return(bdry_vox, interp_op)
+
+
+# field - field (or stack of fields) to take values from
+# bdry_vox - flat voxel indices (as output by get_bdry_interp_op)
+# nDims - number of trailing dimensions of field which the flat indices 
+#         index into
+#
+# Returns the values of field at the given voxels, of shape 
+# (*field.shape[:-nDims], len(bdry_vox)).
+def get_bdry_vox_values(field, bdry_vox, nDims):
+
+    # Flatten the last dimensions of the field and take the voxels
+    return(np.take(field.reshape(*field.shape[:-nDims], -1), bdry_vox, axis=-1))
+
+
+# data - data (with subjects along the first axis)
+# muHat - mean of the data
+# sigma - standard deviation of the data
+# bdry_vox - flat voxel indices (as output by get_bdry_interp_op)
+# nDims - number of trailing dimensions of the data which the flat indices
+#         index into
+#
+# Returns the standardised residuals (data-muHat)/sigma at the given voxels,
+# of shape (*data.shape[:-nDims], len(bdry_vox)). Only these voxels are 
+# read, so the residuals are never formed over the whole image.
+def get_bdry_vox_resid(data, muHat, sigma, bdry_vox, nDims):
+
+    # Values of the data, mean and standard deviation at the voxels
+    data_vox = get_bdry_vox_values(data, bdry_vox, nDims)
+    muHat_vox = get_bdry_vox_values(muHat, bdry_vox, nDims)
+    sigma_vox = get_bdry_vox_values(sigma, bdry_vox, nDims)
+
+    # Return the standardised residuals
+    return((data_vox - muHat_vox)/sigma_vox)
+
+
+# vals_vox - values at the unique boundary voxels, of shape (..., nVox)
+# interp_op - interpolation operator (as output by get_bdry_interp_op)
+#
+# Returns the interpolated values along the boundary, of shape (..., nRows).
+def get_bdry_vals_interpolated_op(vals_vox, interp_op):
+
+    # Flatten the leading dimensions
+    vals = vals_vox.reshape(-1, vals_vox.shape[-1])
+
+    # Apply the operator (in the type of the values)
+    bdry_interp = (interp_op.astype(vals.dtype, copy=False) @ vals.T).T
+
+    # Return the interpolated values
+    return(bdry_interp.reshape(*vals_vox.shape[:-1], interp_op.shape[0]))
+
+
+# vals_concat - values of m fields along a boundary, of shape (m, nBdry, 2)
+#               (as output by get_bdry_values_concat for a stack of fields)
+# c - thresh
+#
+# Each boundary point is labelled with an integer bitmask of the fields whose
+# outer value is less than or equal to c, i.e. a point on d^alpha F_c gets the
+# label sum_{i in alpha} 2^i (with fields indexed from 0). Points with label
+# 0 do not lie on any d^alpha F_c and are dropped. The remaining points are
+# sorted by label, so that every partition is a contiguous block.
+def get_bdry_partitions(vals_concat, c):
+
+    # Number of fields
+    m = vals_concat.shape[0]
+
+    # Bitmask labels for every boundary point
+    labels = np.sum((vals_concat[...,1] <= c).astype(np.int64) << np.arange(m,dtype=np.int64).reshape(m,1), axis=0)
+
+    # Sort the labelled points by label (stable, so points keep their
+    # original order within each partition)
+    order = np.argsort(labels, kind='stable')
+    order = order[labels[order] > 0]
+
+    # Labels in sorted order
+    labels = labels[order]
+
+    # The labels that are actually present, and where each of their blocks 
+    # starts in the sorted order
+    alphas, starts = np.unique(labels, return_index=True)
+
+    # Return the partitions
+    return(order, labels, alphas, starts)
+
+
+# labels - bitmask labels of boundary points (as output by
+#          get_bdry_partitions)
+# m - number of fields
+#
+# Returns a boolean array of shape [m, len(labels)] recording which fields
+# belong to the partition of each boundary point.
+def get_label_field_mask(labels, m):
+
+    return(((labels >> np.arange(m,dtype=np.int64).reshape(m,1)) & 1).astype(bool))
+
+
+
 
 
 
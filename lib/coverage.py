@@ -0,0 +1,349 @@
+import numpy as np
+
+# Two-sided 95% normal quantile used for the coverage confidence intervals
+COVER_CI_Z = 1.959963984540054
+
+# Default number of realizations to run between checks of the coverage
+# confidence intervals (when stopping the realizations sequentially)
+REAL_CHECK = 50
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to assess whether a realization
+# achieved coverage. Whether or not the confidence sets obtained for a given
+# threshold, a, are successful is monotone in a; if they are successful for
+# some a they are also successful for every larger a. Rather than building
+# the confidence sets for every p-value, each realization therefore computes
+# a single critical value, the smallest a for which it is successful, and
+# this is then compared against the bootstrap quantiles.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# ============================================================================
+#
+# This function returns the critical value for the voxelwise set logic. For
+# a given a, the confidence sets are defined as:
+#
+#             AcHat^+ = {stat >= a}       AcHat^- = {stat >= -a}
+#
+# and a violation is observed if AcHat^+ is not contained in Ac, or if Ac is
+# not contained in AcHat^-. The sets are therefore successful if and only if:
+#
+#           a > max_{s not in Ac} stat(s)   and   a >= max_{s in Ac} -stat(s)
+#
+# The strict inequality is accounted for by taking the next representable
+# float above the first maximum, so that success is given by `crit <= a`.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `stat`: The statistic image.
+# - `Ac`: The boolean excursion set image (this must broadcast against
+#         `stat`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `crit`: The critical value for this realization.
+#
+# ============================================================================
+def get_crit_val(stat, Ac):
+
+    # Largest value of the statistic outside Ac
+    crit_plus = np.max(np.where(Ac, -np.inf, stat), initial=-np.inf)
+
+    # Largest value of minus the statistic inside Ac
+    crit_minus = np.max(np.where(Ac, -stat, -np.inf), initial=-np.inf)
+
+    # Combine them (the first inequality is strict)
+    crit = np.maximum(np.nextafter(crit_plus, np.inf), crit_minus)
+
+    # Return the critical value
+    return(crit)
+
+
+# ============================================================================
+#
+# This function returns the critical value for the interpolated boundary
+# checks. For a given a, the checks along the boundary are successful if and
+# only if -a <= stat <= a everywhere along the (interpolated) boundary, i.e.
+# if and only if a >= max |stat|.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `stat_bdry`: The statistic interpolated along the boundary.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `crit`: The critical value for this realization.
+#
+# ============================================================================
+def get_crit_val_bdry(stat_bdry):
+
+    # Maximum absolute value along the boundary
+    return(np.max(np.abs(stat_bdry), initial=-np.inf))
+
+
+# ============================================================================
+#
+# This function takes in a critical value and a vector of thresholds (one
+# for each p-value) and returns the vector of successes.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `crit`: The critical value for this realization (as output by
+#           `get_crit_val` or `get_crit_val_bdry`).
+# - `a`: The vector of thresholds, a, obtained from the bootstrap quantiles.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `success`: A vector which is 1 where coverage was observed and 0
+#              otherwise.
+#
+# ============================================================================
+def get_success(crit, a):
+
+    # Successful wherever a is at least the critical value
+    return(1*(crit <= a))
+
+
+# ============================================================================
+#
+# This function returns the Wilson score confidence intervals for the
+# coverage observed over a set of realizations. Unlike the usual (Wald)
+# interval, the Wilson interval does not collapse to zero width when the
+# observed coverage is 0 or 1, which matters here as the coverage for large
+# p is often observed to be 1 over the first few realizations.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `success`: Array of successes (1 where coverage was observed and 0
+#              otherwise), with one row per realization and one column per
+#              p-value.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `lower`: The lower bounds of the intervals, one per p-value.
+# - `upper`: The upper bounds of the intervals, one per p-value.
+#
+# ============================================================================
+def get_coverage_ci(success):
+
+    # Number of realizations and observed coverage
+    n = success.shape[0]
+    covp = np.mean(success, axis=0)
+
+    # Centre and half-width of the Wilson interval
+    z2 = COVER_CI_Z**2
+    centre = (covp + z2/(2*n))/(1 + z2/n)
+    halfwidth = COVER_CI_Z*np.sqrt(covp*(1-covp)/n + z2/(4*n**2))/(1 + z2/n)
+
+    # Return the bounds (clipped to remove rounding error at 0 and 1)
+    return(np.clip(centre - halfwidth, 0, 1), np.clip(centre + halfwidth, 0, 1))
+
+
+# ============================================================================
+#
+# This function checks whether the coverage has been estimated precisely
+# enough to stop running realizations; that is whether, for each of the
+# given sets of successes, the confidence interval for every monitored
+# p-value has a half-width of at most `tol`.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `successes`: List of arrays of successes (each with one row per
+#                realization run so far and one column per p-value, or 
+#                with p-values along the last axis).
+# - `tol`: The target half-width of the confidence intervals.
+# - `monitor`: Boolean vector of the p-values to monitor (optional, by
+#              default every p-value is monitored).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `converged`: True if every monitored interval is narrow enough.
+#
+# ============================================================================
+def get_coverage_converged(successes, tol, monitor=None):
+
+    # Loop through the sets of successes
+    for success in successes:
+
+        # Get the confidence intervals
+        lower, upper = get_coverage_ci(np.asarray(success))
+
+        # Restrict to the monitored p-values (the last axis)
+        if monitor is not None:
+            lower, upper = lower[...,monitor], upper[...,monitor]
+
+        # Check whether any are still too wide
+        if np.any((upper - lower)/2 > tol):
+            return(False)
+
+    # Every interval is narrow enough
+    return(True)
+
+
+# ============================================================================
+#
+# This function returns control variate estimates of the coverage obtained
+# using the estimated boundary. In each realization the successes for the
+# estimated and true boundaries are observed on the same data and are
+# strongly correlated. As the coverage of the true boundary is (at least
+# asymptotically) the target p, the error in its observed coverage can be
+# used to correct the observed coverage for the estimated boundary:
+#
+#       covp_cv = covp_est - beta*(covp_true - p)
+#
+# where beta = cov(est, true)/var(true) is estimated from the realizations.
+# This has variance var(est)*(1 - rho^2)/nReals, where rho is the
+# correlation between the successes, rather than var(est)/nReals.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `estSuccess`: Array of successes for the estimated boundary, with one 
+#                 row per realization and one column per p-value.
+# - `trueSuccess`: Array of successes for the true boundary (of the same
+#                  shape as `estSuccess`).
+# - `p`: The vector of p-values.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `covp_cv`: The control variate estimates of the coverage, one per 
+#              p-value (these are not clipped to [0,1]).
+# - `se_cv`: The standard errors of the estimates.
+#
+# ============================================================================
+def get_cv_coverage(estSuccess, trueSuccess, p):
+
+    # Number of realizations
+    n = estSuccess.shape[0]
+
+    # Observed coverage
+    covp_est = np.mean(estSuccess, axis=0)
+    covp_true = np.mean(trueSuccess, axis=0)
+
+    # Sample variances and covariance of the successes
+    dEst = estSuccess - covp_est
+    dTrue = trueSuccess - covp_true
+    var_est = np.sum(dEst**2, axis=0)/max(n-1, 1)
+    var_true = np.sum(dTrue**2, axis=0)/max(n-1, 1)
+    cov = np.sum(dEst*dTrue, axis=0)/max(n-1, 1)
+
+    # Coefficient of the control variate (zero wherever the successes for 
+    # the true boundary did not vary)
+    beta = np.divide(cov, var_true, out=np.zeros(cov.shape), where=var_true > 0)
+
+    # Control variate estimates
+    covp_cv = covp_est - beta*(covp_true - np.asarray(p))
+
+    # Variance remaining after the control variate is removed
+    var_cv = np.maximum(var_est - beta*cov, 0)
+
+    # Return the estimates and their standard errors
+    return(covp_cv, np.sqrt(var_cv/n))
+
+
+# ============================================================================
+#
+# This function checks whether two sets of successes (e.g. the same
+# configuration run with `dtype` float32 and float64) give coverage which
+# agrees within Monte Carlo error. For each p-value the difference in
+# observed coverage is compared to its standard error under the hypothesis
+# that both have the same coverage (a pooled two-proportion z-test):
+#
+#       z = (covp_a - covp_b)/sqrt(covp*(1-covp)*(1/n_a + 1/n_b))
+#
+# where covp is the coverage pooled over both sets. If the two runs share
+# a seed their successes are positively correlated, so this check is
+# conservative.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `success_a`: Array of successes, with one row per realization and one
+#                column per p-value.
+# - `success_b`: Array of successes to compare against (with the same 
+#                number of columns as `success_a`).
+# - `z`: The critical value the z statistics are compared to (optional, by
+#        default that of a 95% test).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `agree`: Boolean vector, True for each p-value where the coverage 
+#            agrees within Monte Carlo error.
+# - `zstat`: The z statistics, one per p-value (0 where both sets have 
+#            the same coverage).
+#
+# ============================================================================
+def get_coverage_agreement(success_a, success_b, z=COVER_CI_Z):
+
+    # Number of realizations and observed coverage for each set
+    success_a, success_b = np.asarray(success_a), np.asarray(success_b)
+    n_a, n_b = success_a.shape[0], success_b.shape[0]
+    covp_a = np.mean(success_a, axis=0)
+    covp_b = np.mean(success_b, axis=0)
+
+    # Pooled coverage and the standard error of the difference
+    covp = (n_a*covp_a + n_b*covp_b)/(n_a + n_b)
+    se = np.sqrt(covp*(1-covp)*(1/n_a + 1/n_b))
+
+    # z statistics (where the standard error is 0 both sets have the same
+    # coverage of 0 or 1)
+    zstat = np.zeros(covp.shape)
+    np.divide(covp_a - covp_b, se, out=zstat, where=se > 0)
+
+    # Return whether the coverage agrees, and the z statistics
+    return(np.abs(zstat) <= z, zstat)
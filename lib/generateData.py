@@ -1,7 +1,24 @@
 import numpy as np
 from scipy import ndimage
+import scipy.fft
 import time
 from matplotlib import pyplot as plt
+from lib.rng import *
+from lib.workspace import *
+
+# Kernel length (in voxels) from which `smooth_data` smooths with the FFT
+# rather than with separable 1D filters (when `method='auto'`)
+SMOOTH_FFT_MIN_KERNEL = 33
+
+# Kernel spectra which have already been computed (see `get_kernel_spectrum`)
+_KERNEL_SPECTRA = {}
+
+# Smoothing plans which have already been built (see `get_smoothing_plan`)
+_SMOOTHING_PLANS = {}
+
+# Number of voxels of a noise stack mixed at once when correlating the
+# fields (see `correlate_noise_stack`)
+NOISE_MIX_BLOCK_SIZE = 16384
 
 # ===========================================================================
 #
@@ -28,25 +45,47 @@ from matplotlib import pyplot as plt
 #           np array. Can include 0 or None for dimensions not to be
 #           smoothed.
 # - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `noiseCorr`: Correlation between the two noise fields (optional).
+# - `mu1`, `mu2`: Precomputed mu fields (optional). If these are given,
+#                 `muSpec1` and `muSpec2` are ignored and mu is not
+#                 regenerated.
+# - `rngs`: The random number generators for the noise in each field 
+#           (optional, see `get_rng`). If these are not given, the legacy
+#           global generator is used.
+# - `noises`: Precomputed (uncorrelated) noise fields (optional, e.g. from a
+#             noise bank, see `get_bank_noise`). If these are given, 
+#             `noiseSpec1`, `noiseSpec2` and `rngs` are ignored and the 
+#             noise is not regenerated.
+# - `out`: Array of shape [2, *dim] in which to make the data (optional, 
+#          see `get_noise_stack`).
+# - `workspace`: The workspace from which the padded noise is taken
+#                (optional, see `get_noise_stack`).
+# - `dtype`: The floating point type of the data (float64 or float32, see
+#            `get_randn`). If `out` is given, its type is used. Note mu is 
+#            always float64.
 #
 # ===========================================================================
-def get_data(muSpec1,muSpec2,noiseSpec1,noiseSpec2,dim,noiseCorr=None):
+def get_data(muSpec1,muSpec2,noiseSpec1,noiseSpec2,dim,noiseCorr=None,mu1=None,mu2=None,rngs=(None,None),noises=(None,None),out=None,workspace=None,dtype=np.float64):
 
-    # Obtain the noise fields
-    noise1 = get_noise(noiseSpec1, dim)
-    noise2 = get_noise(noiseSpec2, dim)
+    # Obtain the noise for both fields in one preallocated stack (copying in
+    # any noise we were given)
+    noise = get_noise_stack([noiseSpec1, noiseSpec2], dim, rngs, out=out, noises=noises, workspace=workspace, dtype=dtype)
 
-    # Correlate the data if needed
+    # Correlate the data in place if needed
     if noiseCorr is not None:
-        noise1, noise2 = correlateData(noise1,noise2,noiseCorr)
+        correlate_noise_stack(noise, get_corr_factor(noiseCorr, 2))
 
-    # Obtain mu
-    mu1 = get_mu(muSpec1, dim)
-    mu2 = get_mu(muSpec2, dim)
+    # Obtain mu (if we weren't given it)
+    if mu1 is None:
+        mu1 = get_mu(muSpec1, dim)
+    if mu2 is None:
+        mu2 = get_mu(muSpec2, dim)
     
-    # Create the data
-    data1 = mu1 + noise1
-    data2 = mu2 + noise2
+    # Create the data (in place, in the noise stack)
+    data1 = noise[0]
+    data1 += mu1
+    data2 = noise[1]
+    data2 += mu2
 
     # Return the data and mu
     return(data1, data2, mu1, mu2)
@@ -203,13 +242,28 @@ def get_mu(muSpec, dim):
 #
 # ---------------------------------------------------------------------------
 #
-# - `fwhm`: Full Width Half Maximum for noise smoothness. Must be given as an
-#           np array. Can include 0 or None for dimensions not to be
-#           smoothed.
+# - `noiseSpec`: Dictionary specifying the noise. This must include:
+#                - type: `homogen` or `heterogen`
+#                - FWHM: Full Width Half Maximum for noise smoothness. Must 
+#                        be given as an np array. Can include 0 or None for
+#                        dimensions not to be smoothed.
+#               and may optionally include:
+#                - mag: Magnitude of the noise
+#                - periodic: If true, the noise is smoothed on a periodic
+#                            (wrapped around) grid of exactly `dim` rather
+#                            than on a padded grid which is then cropped.
+#                            This avoids generating and smoothing the 
+#                            padding, but the noise is then stationary on the
+#                            torus rather than the plane.
 # - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `rng`: The random number generator for the noise (optional, see 
+#          `get_rng`). If this is not given, the legacy global generator is
+#          used.
+# - `dtype`: The floating point type of the noise (float64 or float32, see
+#            `get_randn`).
 #
 # ===========================================================================
-def get_noise(noiseSpec, dim):
+def get_noise(noiseSpec, dim, rng=None, dtype=np.float64):
 
     # Get FWHM
     fwhm = noiseSpec['FWHM']
@@ -228,41 +282,34 @@ def get_noise(noiseSpec, dim):
     fwhm = np.asarray([fwhm]).ravel()
     fwhm = np.asarray([0. if elem is None else elem for elem in fwhm])
 
+    # Check whether we are smoothing on a periodic grid
+    periodic = ('periodic' in noiseSpec) and bool(noiseSpec['periodic'])
+
+    # Get the smoothing plan (this holds the padded dimensions, the kernels
+    # and the indices used to truncate the noise)
+    plan = get_smoothing_plan(fwhm, dim, trunc, periodic)
+
     # -----------------------------------------------------------------------
     # Raw (padded) noise generation
     # -----------------------------------------------------------------------
 
-    # Convert fwhm to sigma values
-    sigma = fwhm / np.sqrt(8 * np.log(2))
-
-    # Calculate kernel radii
-    radii = np.int16(trunc*sigma + 0.5)
-
-    # Work out padded dimensions
-    pdim = dim + 2*(radii+1)
-
     # Generate unsmoothed random normal data for noise
-    noise = np.random.randn(*pdim)
+    noise = get_randn(plan['pdim'], rng, dtype=dtype)
 
     # -----------------------------------------------------------------------
     # Perform smoothing
     # -----------------------------------------------------------------------
-    noise = smooth_data(noise, D, fwhm, trunc)
+    noise = smooth_data(noise, D, fwhm, trunc, periodic=periodic, plan=plan)
 
     # -----------------------------------------------------------------------
     # Truncate the noise
     # -----------------------------------------------------------------------
-    if D==2:
-        noise = noise[(radii+1)[0]:(dim+radii+1)[0],(radii+1)[1]:(dim+radii+1)[1]]
-    if D==3:
-        noise = noise[(radii+1)[0]:(dim+radii+1)[0],(radii+1)[1]:(dim+radii+1)[1],(radii+1)[2]:(dim+radii+1)[2]]
-    if D==4:
-        noise = noise[(radii+1)[0]:(dim+radii+1)[0],(radii+1)[1]:(dim+radii+1)[1],(radii+1)[2]:(dim+radii+1)[2],(radii+1)[3]:(dim+radii+1)[3]]
+    noise = noise[plan['crop']]
 
     # Heterogenous noise (ramp)
     if noiseSpec['type']=='heterogen':
 
-        noise = noise*np.linspace(0.5,1.5,noise.shape[-1])
+        noise *= np.linspace(0.5,1.5,noise.shape[-1])
 
     # Alter the magnitude of the noise
     if 'mag' in noiseSpec:
@@ -270,138 +317,708 @@ def get_noise(noiseSpec, dim):
 
     return(noise)
 
-def correlateData(noise1,noise2,noiseCorr):
+# ===========================================================================
+#
+# This function generates the noise for a stack of m fields at once, 
+# filling a single preallocated array of shape [m, *dim]. The noise for each
+# field is exactly the noise `get_noise` would generate for it (from its own
+# random number generator), but fields which are smoothed in the same way 
+# are smoothed together, in a single call to `smooth_data` (with the field
+# axis left unsmoothed), rather than one field at a time.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `noiseSpecs`: List of m dictionaries specifying the noise in each field
+#                 (see `get_noise`).
+# - `dim`: Dimensions of the noise in each field. Must be given as an np
+#          array.
+# - `rngs`: The random number generators for the noise in each field 
+#           (optional, see `get_rng`). If these are not given, the legacy
+#           global generator is used (drawing the fields in order).
+# - `out`: Array of shape [m, *dim] to fill with the noise (optional).
+# - `noises`: Precomputed noise for each field (optional, e.g. from a noise
+#             bank, see `get_bank_noise`). Fields with precomputed noise are
+#             copied into the stack rather than being generated.
+# - `workspace`: The workspace from which the padded (unsmoothed) noise is
+#                taken (optional, see `get_workspace`). If this is not 
+#                given, the padded noise is allocated afresh.
+# - `dtype`: The floating point type of the noise (float64 or float32, see
+#            `get_randn`). If `out` is given, its type is used.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `out`: The noise for every field, of shape [m, *dim].
+#
+# ===========================================================================
+def get_noise_stack(noiseSpecs, dim, rngs=None, out=None, noises=None, workspace=None, dtype=np.float64):
+
+    # Number of fields
+    m = len(noiseSpecs)
 
-    # Reshape noises
-    noise1 = noise1.reshape(*noise1.shape,1)
-    noise2 = noise2.reshape(*noise2.shape,1)
+    # Default generators and precomputed noise
+    if rngs is None:
+        rngs = [None]*m
+    if noises is None:
+        noises = [None]*m
 
-    # Combine them (for broadcasting covariance matrix multiplication)
-    noises = np.concatenate((noise1,noise2),axis=-1)
-    noises = noises.reshape(*noises.shape,1)
+    # Preallocate the stack
+    if out is None:
+        out = np.empty((m, *dim), dtype=dtype)
+    dtype = out.dtype
 
-    abs_noiseCorr = np.abs(noiseCorr)
-    sgn_noiseCorr = np.sign(noiseCorr)
+    # Truncation (this must match `get_noise`)
+    trunc = 6
 
-    # Work out covariance matrix we need.
-    covMat = np.array([[1,0],[abs_noiseCorr, np.sqrt(1/abs_noiseCorr**2 -1)*abs_noiseCorr]])
+    # Dimension D
+    D = np.prod(np.shape(dim))
 
-    # Correlate noises
-    new_noises = covMat @ noises
+    # Group the fields which are smoothed in the same way (fields with 
+    # precomputed noise are just copied in)
+    groups = {}
+    for i in np.arange(m):
 
-    # Get back noise 1 and noise 2
-    new_noise1 = new_noises[...,0,0]
-    new_noise2 = new_noises[...,1,0]
+        # Copy in precomputed noise
+        if noises[i] is not None:
+            out[i,...] = noises[i]
+            continue
 
-    # Multiply one of the fields by -1 if need negative correlation
-    if (sgn_noiseCorr == -1):
-        new_noise2 = -new_noise2
-        print('-ve')
+        # Format fwhm and replace None with 0 (as in `get_noise`)
+        fwhm = np.asarray([noiseSpecs[i]['FWHM']]).ravel()
+        fwhm = tuple(0. if elem is None else float(elem) for elem in fwhm)
 
-    # Return the noises
-    return(new_noise1,new_noise2)
+        # Check whether we are smoothing on a periodic grid
+        periodic = ('periodic' in noiseSpecs[i]) and bool(noiseSpecs[i]['periodic'])
 
-# Smoothing function
-def smooth_data(data, D, fwhm, trunc=6, scaling='kernel'):
+        # Add the field to its group
+        groups.setdefault((fwhm, periodic), []).append(i)
 
     # -----------------------------------------------------------------------
-    # Reformat fwhm
+    # Raw (padded) noise generation
     # -----------------------------------------------------------------------
 
-    # Format fwhm and replace None with 0
-    fwhm = np.asarray([fwhm]).ravel()
-    fwhm = np.asarray([0. if elem is None else elem for elem in fwhm])
+    # Preallocate the unsmoothed noise for each group, using the smoothing
+    # plan for a single field (this holds the padded dimensions)
+    raw = {}
+    for (fwhm, periodic), fields in groups.items():
+        plan = get_smoothing_plan(np.array(fwhm), dim, trunc, periodic)
+        raw[(fwhm, periodic)] = get_workspace_buffer(workspace, ('raw', fwhm, periodic), (len(fields), *plan['pdim']), dtype)
+
+    # Generate unsmoothed random normal data for every field, each from its
+    # own generator (in order of field, so that the legacy global generator
+    # draws the same numbers as `get_noise` would)
+    slots = {i: (key, j) for key, fields in groups.items() for j, i in enumerate(fields)}
+    for i in sorted(slots):
+        key, j = slots[i]
+        get_randn(raw[key].shape[1:], rngs[i], out=raw[key][j,...])
+
+    # Loop through the groups
+    for (fwhm, periodic), fields in groups.items():
+
+        # Get the smoothing plan for a single field (this holds the indices
+        # used to truncate the noise)
+        plan = get_smoothing_plan(np.array(fwhm), dim, trunc, periodic)
+
+        # Get the smoothing plan for the stack of fields (with the field 
+        # axis unsmoothed)
+        stack_plan = get_smoothing_plan(np.array((0.,) + fwhm), np.array((len(fields), *dim)), trunc, periodic)
+
+        # -------------------------------------------------------------------
+        # Perform smoothing (on every field at once)
+        # -------------------------------------------------------------------
+        noise = raw.pop((fwhm, periodic))
+        noise = smooth_data(noise, D+1, np.array((0.,) + fwhm), trunc, periodic=periodic, plan=stack_plan)
+
+        # -------------------------------------------------------------------
+        # Truncate the noise and save it in the stack
+        # -------------------------------------------------------------------
+        for j, i in enumerate(fields):
+
+            # Truncate the noise
+            out[i,...] = noise[(j,) + plan['crop']]
+
+            # Heterogenous noise (ramp)
+            if noiseSpecs[i]['type']=='heterogen':
+
+                out[i,...] *= np.linspace(0.5,1.5,dim[-1])
+
+            # Alter the magnitude of the noise
+            if 'mag' in noiseSpecs[i]:
+                out[i,...] *= float(noiseSpecs[i]['mag'])
+
+    # Return the stack
+    return(out)
+
+# ===========================================================================
+#
+# This function factorises a correlation matrix for the noise in m fields,
+# returning the (lower triangular) matrix used to mix m independent noise
+# fields into m correlated ones (see `correlate_noise_stack`). The factor
+# is the Cholesky factor of the correlation matrix, except that, as has 
+# always been done for two fields, the independent noise entering field j
+# is negated whenever field j is negatively correlated with the first 
+# field. Correlation matrices which are only positive semi-definite (e.g.
+# two fields with correlation 1) are allowed.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `noiseCorr`: Either a single correlation (used between every pair of 
+#                fields) or an m by m correlation matrix.
+# - `m`: The number of fields.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `factor`: The m by m mixing matrix.
+#
+# ===========================================================================
+def get_corr_factor(noiseCorr, m=2):
+
+    # Make the correlation matrix
+    corrMat = np.array(noiseCorr, dtype=np.float64)
+    if corrMat.ndim == 0:
+        corrMat = np.full((m, m), corrMat)
+        np.fill_diagonal(corrMat, 1)
+
+    # Check the correlation matrix
+    if corrMat.shape != (m, m):
+        raise ValueError('The noise correlation matrix must be ' + str(m) + ' by ' + str(m) + '.')
+    if not (np.allclose(corrMat, corrMat.T) and np.allclose(np.diag(corrMat), 1)):
+        raise ValueError('The noise correlation matrix must be symmetric with ones along the diagonal.')
+
+    # Tolerance below which a pivot is treated as zero
+    tol = 1e-12
+
+    # Cholesky factorisation, one column at a time (pivots which are zero
+    # give columns of zeros, so that semi-definite matrices are allowed)
+    factor = np.zeros((m, m))
+    for j in np.arange(m):
+
+        # Pivot
+        pivot = corrMat[j,j] - factor[j,:j] @ factor[j,:j]
+        if pivot < -tol:
+            raise ValueError('The noise correlation matrix must be positive semi-definite.')
+
+        # Column j
+        if pivot > tol:
+            factor[j,j] = np.sqrt(pivot)
+            factor[(j+1):,j] = (corrMat[(j+1):,j] - factor[(j+1):,:j] @ factor[j,:j])/factor[j,j]
+
+    # Negate the independent noise entering the fields which are negatively
+    # correlated with the first field
+    factor[1:,1:] *= np.where(corrMat[0,1:] < 0, -1, 1)
+
+    # Return the factor
+    return(factor)
+
+
+# ===========================================================================
+#
+# This function correlates the noise in a stack of m fields in place, 
+# replacing the noise in field i with 
+#
+#                   sum_j factor[i,j] * noise[j]
+#
+# The stack is mixed a block of voxels at a time (with a matrix 
+# multiplication over the field axis), so only a block of temporary memory
+# is needed however large the stack is.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `noise`: The (C contiguous) stack of independent noise, of shape
+#            [m, ...] (e.g. as output by `get_noise_stack`).
+# - `factor`: The m by m mixing matrix (as output by `get_corr_factor`).
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `noise`: The stack of correlated noise (the same array as was given).
+#
+# ===========================================================================
+def correlate_noise_stack(noise, factor):
+
+    # The stack must be contiguous to be mixed in place
+    if not noise.flags['C_CONTIGUOUS']:
+        raise ValueError('The noise stack must be C contiguous.')
+
+    # View the stack as [m, nVox]
+    flat = noise.reshape(noise.shape[0], -1)
+    nVox = flat.shape[1]
 
-    # Non-zero dimensions
-    D_nz = np.sum(fwhm>0)
+    # Temporary array for a block of mixed noise, and the factor (both in
+    # the type of the noise)
+    mixed = np.empty((flat.shape[0], min(nVox, NOISE_MIX_BLOCK_SIZE)), dtype=noise.dtype)
+    factor = factor.astype(noise.dtype, copy=False)
+
+    # Mix the fields a block of voxels at a time
+    for v0 in np.arange(0, nVox, NOISE_MIX_BLOCK_SIZE):
+
+        # The last block may be smaller than the others
+        v1 = min(v0 + NOISE_MIX_BLOCK_SIZE, nVox)
+
+        # Mix this block and write it back
+        np.matmul(factor, flat[:,v0:v1], out=mixed[:,:(v1-v0)])
+        flat[:,v0:v1] = mixed[:,:(v1-v0)]
+
+    # Return the stack
+    return(noise)
+
+
+# ===========================================================================
+#
+# This function correlates the noise in two fields (see 
+# `correlate_noise_stack`), returning the correlated noise for each field.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `noise1`, `noise2`: The independent noise in each field.
+# - `noiseCorr`: Correlation between the two noise fields.
+#
+# ===========================================================================
+def correlateData(noise1,noise2,noiseCorr):
+
+    # Stack the noises and correlate them in place
+    noises = correlate_noise_stack(np.stack((noise1, noise2)), get_corr_factor(noiseCorr, 2))
+
+    # Return the noises
+    return(noises[0], noises[1])
+
+# ===========================================================================
+#
+# Smoothing function. The data are smoothed with a truncated Gaussian kernel
+# along every dimension with a non-zero FWHM, treating the data as zero 
+# outside of the grid (or, if `periodic` is true, as wrapping around).
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `data`: Data to smooth. If smoothed with separable filters this is done
+#           in place.
+# - `D`: Dimension of the data.
+# - `fwhm`: Full Width Half Maximum for each dimension. Can include 0 or None
+#           for dimensions not to be smoothed.
+# - `trunc`: Number of standard deviations at which the kernel is truncated.
+# - `scaling`: `kernel` to rescale the smoothed data to unit variance (for
+#              white noise input) or `max` to rescale to a maximum of 1.
+# - `method`: `separable` to filter along each dimension in turn (with 
+#             `ndimage.gaussian_filter1d`), `fft` to filter all dimensions 
+#             at once in the frequency domain (see `smooth_data_fft`) or 
+#             `auto` (default) to use the FFT only once the longest kernel
+#             has at least SMOOTH_FFT_MIN_KERNEL voxels.
+# - `periodic`: If true the data are smoothed on a periodic grid (this is
+#               only available with the FFT).
+# - `plan`: The smoothing plan (optional, as output by `get_smoothing_plan`).
+#           If this is not given, the plan for smoothing data of this shape
+#           is used.
+#
+# ===========================================================================
+def smooth_data(data, D, fwhm, trunc=6, scaling='kernel', method='auto', periodic=False, plan=None):
+
+    # -----------------------------------------------------------------------
+    # Get the smoothing plan
+    # -----------------------------------------------------------------------
+    if plan is None:
+        plan = get_smoothing_plan(fwhm, data.shape, trunc, periodic)
 
     # Convert fwhm to sigma values
-    sigma = fwhm / np.sqrt(8 * np.log(2))
+    sigma = plan['sigma']
+
+    # -----------------------------------------------------------------------
+    # Choose the smoothing method
+    # -----------------------------------------------------------------------
+
+    # Periodic smoothing is only available with the FFT
+    if periodic:
+        method = 'fft'
+
+    # Otherwise choose by the length of the longest kernel
+    if method == 'auto':
+        method = plan['method']
+
+    # -----------------------------------------------------------------------
+    # Perform smoothing in the frequency domain
+    # -----------------------------------------------------------------------
+    if method == 'fft':
+
+        # Smooth all dimensions at once
+        data = smooth_data_fft(data, sigma, trunc, periodic)
 
     # -----------------------------------------------------------------------
     # Perform smoothing (this code is based on `_smooth_array` from the
     # nilearn package)
     # -----------------------------------------------------------------------
+    else:
     
-    # Loop through each dimension and smooth
-    for n, s in enumerate(sigma):
+        # Loop through each dimension and smooth
+        for n, phi in enumerate(plan['kernels']):
 
-        # If s is non-zero smooth by s in that direction.
-        if s > 0.0:
+            # If s is non-zero smooth by s in that direction (this is what
+            # `ndimage.gaussian_filter1d` does, with the kernel from the plan)
+            if phi is not None:
 
-            # Perform smoothing in nth dimension
-            ndimage.gaussian_filter1d(data, s, output=data, mode='constant', axis=n, truncate=trunc)
+                # Perform smoothing in nth dimension
+                ndimage.correlate1d(data, phi[::-1], output=data, mode='constant', axis=n)
 
 
     # -----------------------------------------------------------------------
     # Rescale
     # -----------------------------------------------------------------------
     if scaling=='kernel':
-    
-        # -----------------------------------------------------------------------
-        # Rescale smoothed data to standard deviation 1 (this code is based on
-        # `_gaussian_kernel1d` from the `scipy.ndimage` package).
-        # -----------------------------------------------------------------------
 
-        # Calculate sigma^2
-        sigma2 = sigma*sigma
+        # Rescale smoothed data to standard deviation 1, using the normaliser
+        # from the plan
+        data = data/np.sqrt(plan['ss'])
+
+    elif scaling=='max':
+
+        # Rescale noise by dividing by maximum value
+        data = data/np.max(data)
+
+    return(data)
+
+
+
+# ===========================================================================
+#
+# This function returns the smoothing plan for data of dimension `dim`
+# smoothed with a given FWHM. A plan holds everything about the smoothing
+# which does not depend on the data itself; the 1D kernels, the normalising
+# constant used to rescale smoothed white noise to unit variance, the 
+# padding used when generating noise and the indices used to remove it. As
+# the Gaussian kernel is separable, the normalising constant (the sum of 
+# squares of the D dimensional kernel) is the product of the sums of squares
+# of the 1D kernels.
+#
+# Plans are memoised, so repeated realizations only ever build each plan 
+# once. The arrays stored in a plan are shared and must not be modified.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `fwhm`: Full Width Half Maximum for each dimension. Can include 0 or None
+#           for dimensions not to be smoothed.
+# - `dim`: Dimensions of the (unpadded) data. Must be given as an np array.
+# - `trunc`: Number of standard deviations at which the kernel is truncated.
+# - `periodic`: Whether the data are smoothed on a periodic grid (in which
+#               case no padding is used and the kernels wrap around).
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `plan`: A dictionary containing:
+#     - `fwhm`, `sigma`: The FWHM and standard deviation for each dimension.
+#     - `trunc`, `periodic`: As input.
+#     - `kernels`: The 1D kernel for each dimension (None for dimensions 
+#                  which are not smoothed).
+#     - `method`: The method `smooth_data` uses by default (`fft` if 
+#                 periodic or if any kernel has at least 
+#                 SMOOTH_FFT_MIN_KERNEL voxels and `separable` otherwise).
+#     - `ss`: The normalising constant for `scaling='kernel'`.
+#     - `pad`: The padding added to each side of each dimension.
+#     - `pdim`: The padded dimensions.
+#     - `crop`: A tuple of slices which removes the padding.
+#
+# ===========================================================================
+def get_smoothing_plan(fwhm, dim, trunc=6, periodic=False):
+
+    # Format fwhm and replace None with 0
+    fwhm = np.asarray([fwhm]).ravel()
+    fwhm = np.asarray([0. if elem is None else elem for elem in fwhm], dtype=float)
+
+    # Format dim
+    dim = np.asarray(dim, dtype=int).ravel()
+
+    # Key for the cache
+    key = (tuple(fwhm), tuple(dim), float(trunc), bool(periodic))
+
+    # Return the plan if we have already built it
+    if key in _SMOOTHING_PLANS:
+        return(_SMOOTHING_PLANS[key])
+
+    # New empty plan
+    plan = {}
+    plan['fwhm'] = fwhm
+    plan['trunc'] = trunc
+    plan['periodic'] = periodic
+
+    # Convert fwhm to sigma values
+    plan['sigma'] = fwhm / np.sqrt(8 * np.log(2))
+
+    # Calculate kernel radii
+    radii = np.int16(trunc*plan['sigma'] + 0.5)
 
-        # Calculate kernel radii
-        radii = np.int16(trunc*sigma + 0.5)
+    # -----------------------------------------------------------------------
+    # Padding
+    # -----------------------------------------------------------------------
 
-        # Initialize array for phi values (has to be object as dimensions can 
-        # vary in length)
-        phis = np.empty(shape=(D_nz),dtype=object)
+    # Work out the padding (none is needed on a periodic grid)
+    if periodic:
+        plan['pad'] = np.zeros(len(dim), dtype=np.int16)
+    else:
+        plan['pad'] = radii+1
 
-        # Index for non-zero dimensions
-        j = 0
+    # Work out padded dimensions
+    plan['pdim'] = dim + 2*plan['pad']
 
-        # Loop through dimensions to get scaling constants
-        for k in np.arange(D):
+    # Indices which truncate the padded data back to dim
+    plan['crop'] = tuple(slice(plan['pad'][k], dim[k]+plan['pad'][k]) for k in np.arange(len(dim)))
 
-            # Skip the non-smoothed dimensions
-            if fwhm[k]!=0:
+    # -----------------------------------------------------------------------
+    # Kernels and normalising constant
+    # -----------------------------------------------------------------------
 
-                # Get range of values for this dimension
-                r = np.arange(-radii[k], radii[k]+1)
-                
-                # Get the kernel for this dimension
-                phi = np.exp(-0.5 / sigma2[k] * r ** 2)
+    # Kernels for each dimension
+    plan['kernels'] = []
 
-                # Normalise phi
-                phi = phi / phi.sum()
+    # Normalising constant
+    plan['ss'] = 1.0
 
-                # Add phi to dictionary
-                phis[j]= phi[::-1]
+    # Loop through dimensions
+    for k in np.arange(len(dim)):
 
-                # Increment j
-                j = j + 1
-                
-        # Create the D_nz dimensional grid
-        grids = np.meshgrid(*phis);
+        # Skip the non-smoothed dimensions
+        if fwhm[k] == 0:
+            plan['kernels'].append(None)
+            continue
 
-        # Initialize empty product grid
-        product_grid = np.ones(grids[0].shape)
+        # Get the kernel for this dimension
+        phi = get_kernel_1d(plan['sigma'][k], trunc)
+        plan['kernels'].append(phi)
 
-        # Loop through axes and take products
-        for j in np.arange(D_nz):
+        # On a periodic grid the kernel wraps around
+        if periodic:
+            phi = np.zeros(plan['pdim'][k])
+            np.add.at(phi, np.arange(-radii[k], radii[k]+1) % plan['pdim'][k], plan['kernels'][k])
 
-            product_grid = grids[j]*product_grid
+        # Multiply in the sum of squares for this dimension
+        plan['ss'] = plan['ss']*np.sum(phi**2)
 
-        # Get the normalizing constant by summing over grid
-        ss = np.sum(product_grid**2)
+    # -----------------------------------------------------------------------
+    # Default smoothing method
+    # -----------------------------------------------------------------------
 
-        # Rescale noise
-        data = data/np.sqrt(ss)
+    # Kernel lengths
+    lengths = 2*radii+1
 
-    elif scaling=='max':
+    # Use the FFT if periodic or for long kernels
+    if periodic or np.any((fwhm > 0) & (lengths >= SMOOTH_FFT_MIN_KERNEL)):
+        plan['method'] = 'fft'
+    else:
+        plan['method'] = 'separable'
 
-        # Rescale noise by dividing by maximum value
-        data = data/np.max(data)
+    # Save the plan
+    _SMOOTHING_PLANS[key] = plan
 
-    return(data)
+    # Return the plan
+    return(plan)
+
+
+# ===========================================================================
+#
+# This function returns the (normalised, truncated) 1D Gaussian kernel used
+# by `ndimage.gaussian_filter1d`, centred on the middle element.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `sigma`: Standard deviation of the kernel.
+# - `trunc`: Number of standard deviations at which the kernel is truncated.
+#
+# ===========================================================================
+def get_kernel_1d(sigma, trunc=6):
+
+    # Kernel radius
+    radius = int(trunc*sigma + 0.5)
+
+    # Get range of values for the kernel
+    r = np.arange(-radius, radius+1)
+
+    # Get the kernel
+    phi = np.exp(-0.5 / (sigma*sigma) * r ** 2)
+
+    # Return the normalised kernel
+    return(phi / phi.sum())
+
+
+# ===========================================================================
+#
+# This function returns the spectrum of the separable Gaussian kernel used to
+# smooth data of a given shape in the frequency domain, along with the
+# lengths of the FFTs along each smoothed axis. For linear (zero padded)
+# smoothing each FFT is at least n+radius long, so that the circular
+# convolution does not wrap around onto the first n voxels. For periodic
+# smoothing each FFT is exactly n long and the kernel is wrapped around.
+#
+# As the kernel is symmetric, its spectrum is real. Spectra are cached by 
+# shape, sigma, truncation and mode, so they are only computed once.
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `shape`: Shape of the data to be smoothed.
+# - `sigma`: Standard deviation of the kernel along each dimension (0 for
+#            dimensions which are not smoothed).
+# - `trunc`: Number of standard deviations at which the kernel is truncated.
+# - `periodic`: Whether the data are smoothed on a periodic grid.
+#
+# ---------------------------------------------------------------------------
+#
+# It returns:
+#
+# ---------------------------------------------------------------------------
+#
+# - `axes`: The smoothed axes.
+# - `nffts`: The FFT length along each smoothed axis.
+# - `spectrum`: The kernel spectrum, broadcastable against the output of
+#               `scipy.fft.rfftn(data, s=nffts, axes=axes)`.
+#
+# ===========================================================================
+def get_kernel_spectrum(shape, sigma, trunc=6, periodic=False):
+
+    # Smoothed axes
+    axes = tuple(int(k) for k in np.arange(len(shape)) if sigma[k] > 0)
+
+    # Key for the cache (the lengths of unsmoothed axes don't matter)
+    key = (len(shape), axes, tuple(int(shape[k]) for k in axes), 
+           tuple(float(sigma[k]) for k in axes), float(trunc), bool(periodic))
+
+    # Compute the spectrum if we haven't already
+    if key not in _KERNEL_SPECTRA:
+
+        # FFT lengths
+        nffts = []
+
+        # Spectrum, built up one axis at a time
+        spectrum = np.ones([1]*len(shape))
+
+        # Loop through the smoothed axes
+        for j, k in enumerate(axes):
+
+            # Kernel along this axis
+            phi = get_kernel_1d(sigma[k], trunc)
+
+            # Kernel radius
+            radius = len(phi)//2
+
+            # Work out the FFT length
+            if periodic:
+                nfft = int(shape[k])
+
+            else:
+
+                nfft = scipy.fft.next_fast_len(int(max(shape[k] + radius, 2*radius + 1)), real=True)
+
+            # Wrap the kernel around so that it is centred on the first voxel
+            h = np.zeros(nfft)
+            np.add.at(h, np.arange(-radius, radius+1) % nfft, phi)
+
+            # Spectrum along this axis (the last smoothed axis uses a real FFT)
+            if j == len(axes)-1:
+                h_spec = scipy.fft.rfft(h).real
+            else:
+                h_spec = scipy.fft.fft(h).real
+
+            # Add this axis to the spectrum
+            spec_shape = [1]*len(shape)
+            spec_shape[k] = len(h_spec)
+            spectrum = spectrum*h_spec.reshape(spec_shape)
+
+            # Record the FFT length
+            nffts.append(nfft)
+
+        # Save the spectrum
+        _KERNEL_SPECTRA[key] = (axes, tuple(nffts), spectrum)
+
+    # Return the spectrum
+    return(_KERNEL_SPECTRA[key])
+
+
+# ===========================================================================
+#
+# This function smooths data with a truncated Gaussian kernel in the 
+# frequency domain, along every axis with a non-zero sigma at once. Up to
+# rounding error, this gives the same result as filtering along each axis in
+# turn with `ndimage.gaussian_filter1d(..., mode='constant')` (or, if
+# `periodic` is true, `mode='wrap'`).
+#
+# ---------------------------------------------------------------------------
+#
+# Inputs:
+#
+# ---------------------------------------------------------------------------
+#
+# - `data`: Data to smooth.
+# - `sigma`: Standard deviation of the kernel along each dimension (0 for
+#            dimensions which are not smoothed).
+# - `trunc`: Number of standard deviations at which the kernel is truncated.
+# - `periodic`: Whether the data are smoothed on a periodic grid.
+#
+# ===========================================================================
+def smooth_data_fft(data, sigma, trunc=6, periodic=False):
+
+    # Get the kernel spectrum
+    axes, nffts, spectrum = get_kernel_spectrum(data.shape, sigma, trunc, periodic)
+
+    # Nothing to do if no axes are smoothed
+    if len(axes) == 0:
+        return(data)
+
+    # Transform the (zero padded) data
+    data_spec = scipy.fft.rfftn(data, s=nffts, axes=axes)
+
+    # Multiply by the kernel spectrum
+    data_spec *= spectrum
+
+    # Transform back
+    smoothed = scipy.fft.irfftn(data_spec, s=nffts, axes=axes)
 
+    # Crop off the padding
+    crop = [slice(None)]*data.ndim
+    for k in axes:
+        crop[k] = slice(0, data.shape[k])
 
+    # Return the smoothed data
+    return(smoothed[tuple(crop)])
 
 
 
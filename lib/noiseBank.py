@@ -0,0 +1,450 @@
+import os
+import time
+import hashlib
+import numpy as np
+import yaml
+from lib.generateData import *
+from lib.streaming import *
+from lib.rng import *
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to read noise from a noise bank. The
+# noise does not depend on mu, so configurations which differ only in mu
+# (e.g. in the center of the circles) would otherwise each regenerate and
+# resmooth exactly the same kind of noise. Instead, the smoothed noise for
+# each realization is generated once, saved in the bank (a directory on
+# local or shared disk) as a `.npy` file, and then read by every
+# configuration which needs it using a memory map.
+#
+# Each file in the bank holds the noise for one field of one realization and
+# is keyed by:
+#
+#       (noise type, FWHM, magnitude, periodic, dim, seed, bit generator,
+#        field, realization)
+#
+# The noise is drawn from its own stream (see `get_rng`), which does not
+# depend on the simulation or configuration, so every configuration reading
+# the bank sees the same noise in each realization (i.e. the configurations
+# share common random numbers).
+#
+# The keys in the bank are listed in an index file, `index.yml`, along with
+# the size of each file. If the bank has a maximum size, the least recently
+# used files are deleted whenever a new file takes it over this size. Jobs
+# sharing a bank take turns to write the index (using a lock file, as in
+# `append_to_file`) and each file is written under a temporary name and then
+# renamed, so a file in the bank is always complete.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Name of the index file in the bank directory
+NOISE_BANK_INDEX = 'index.yml'
+
+# Number of subjects generated at once when filling the bank (if the noise
+# is not smoothed across subjects)
+NOISE_BANK_BLOCK_SIZE = 10
+
+# ============================================================================
+#
+# This function describes a noise bank.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `bankDir`: The directory holding the bank (this is made if it does not
+#              exist).
+# - `maxSize`: The maximum size of the bank in gigabytes (None for no
+#              limit).
+# - `seed`: The root seed (as output by `get_root_seed`). This must be given,
+#           as otherwise the noise in the bank could not be reproduced.
+# - `bitGenerator`: The name of the bit generator.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `bank`: A dictionary describing the bank (to be passed to
+#           `get_bank_noise`).
+#
+# ============================================================================
+def get_noise_bank(bankDir, maxSize=None, seed=None, bitGenerator=RNG_BIT_GENERATOR):
+
+    # The noise in the bank must be reproducible
+    if seed is None:
+        raise ValueError('A root seed must be given to use a noise bank.')
+
+    # Make the bank directory
+    if not os.path.exists(bankDir):
+        os.makedirs(bankDir, exist_ok=True)
+
+    # Describe the bank
+    bank = dict()
+    bank['dir'] = bankDir
+    bank['seed'] = int(seed)
+    bank['bitGenerator'] = bitGenerator
+
+    # Maximum size in bytes
+    if maxSize is None:
+        bank['maxBytes'] = None
+    else:
+        bank['maxBytes'] = int(float(maxSize)*1e9)
+
+    # Return the bank
+    return(bank)
+
+
+# ============================================================================
+#
+# This function returns the noise for one field of one realization from a
+# noise bank, generating it (and adding it to the bank) if it is not already
+# there. The noise is exactly the noise `get_noise` would generate from the
+# bank's stream for this field and realization.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `bank`: The noise bank (as output by `get_noise_bank`).
+# - `noiseSpec`: Dictionary specifying the noise (see `get_noise`).
+# - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `r`: The realization.
+# - `field`: The field the noise is used for.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise`: The noise, as a read-only memory map of the file in the bank.
+#
+# ============================================================================
+def get_bank_noise(bank, noiseSpec, dim, r, field=0):
+
+    # Key and file for this noise
+    key = get_bank_key(bank, noiseSpec, dim, r, field)
+    fname = os.path.join(bank['dir'], 'noise_' + hashlib.sha1(repr(key).encode()).hexdigest()[:20] + '.npy')
+
+    # Generate the noise if it is not in the bank (the file may be deleted
+    # by another job making room in the bank before we have opened it, in
+    # which case we generate it again)
+    while True:
+
+        # Add the noise to the bank if it is not there already
+        if not os.path.isfile(fname):
+            add_bank_noise(bank, noiseSpec, dim, r, field, key, fname)
+
+        try:
+
+            # Open the file as a memory map
+            noise = np.load(fname, mmap_mode='r')
+
+            # Record that the file has been used
+            os.utime(fname)
+            break
+
+        except FileNotFoundError:
+
+            # The file was deleted, so we must generate it again
+            continue
+
+    # Return the noise
+    return(noise)
+
+
+# ============================================================================
+#
+# This function returns the key for the noise for one field of one
+# realization in a noise bank.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `bank`: The noise bank (as output by `get_noise_bank`).
+# - `noiseSpec`: Dictionary specifying the noise (see `get_noise`).
+# - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `r`: The realization.
+# - `field`: The field the noise is used for.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `key`: A dictionary of everything the noise depends on.
+#
+# ============================================================================
+def get_bank_key(bank, noiseSpec, dim, r, field=0):
+
+    # Format fwhm and replace None with 0 (as in `get_noise`)
+    fwhm = np.asarray([noiseSpec['FWHM']]).ravel()
+    fwhm = [0. if elem is None else float(elem) for elem in fwhm]
+
+    # Everything the noise depends on
+    key = dict()
+    key['type'] = str(noiseSpec['type'])
+    key['FWHM'] = fwhm
+    key['mag'] = float(noiseSpec['mag']) if 'mag' in noiseSpec else None
+    key['periodic'] = ('periodic' in noiseSpec) and bool(noiseSpec['periodic'])
+    key['dim'] = [int(d) for d in np.asarray(dim).ravel()]
+    key['seed'] = bank['seed']
+    key['bitGenerator'] = bank['bitGenerator']
+    key['field'] = int(field)
+    key['r'] = int(r)
+
+    # Return the key
+    return(key)
+
+
+# ============================================================================
+#
+# This function generates the noise for one field of one realization and
+# adds it to a noise bank, making room for it if the bank has a maximum
+# size.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `bank`: The noise bank (as output by `get_noise_bank`).
+# - `noiseSpec`: Dictionary specifying the noise (see `get_noise`).
+# - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `r`: The realization.
+# - `field`: The field the noise is used for.
+# - `key`: The key for the noise (as output by `get_bank_key`).
+# - `fname`: The file the noise is saved in.
+#
+# ============================================================================
+def add_bank_noise(bank, noiseSpec, dim, r, field, key, fname):
+
+    # Generator for the noise (this does not depend on the simulation or
+    # configuration)
+    rng = get_rng(bank['seed'], 0, 0, r, field, 'bank', bank['bitGenerator'])
+
+    # Write the noise under a temporary name (unique to this job)
+    tmpname = fname[:-4] + '.' + str(os.getpid()) + '.tmp.npy'
+    noise = np.lib.format.open_memmap(tmpname, mode='w+', dtype=np.float64, shape=tuple(key['dim']))
+
+    # If the noise is not smoothed across subjects, generate it a block of
+    # subjects at a time (so that the noise for every subject is never held
+    # in memory at once)
+    if key['FWHM'][0] == 0:
+        for s0, s1, block in get_noise_blocks(get_noise_stream(noiseSpec, dim, NOISE_BANK_BLOCK_SIZE, rng)):
+            noise[s0:s1,...] = block
+
+    # Otherwise, generate it all at once
+    else:
+        noise[...] = get_noise(noiseSpec, dim, rng)
+
+    # Write the noise to disk
+    noise.flush()
+    del noise
+
+    # Lock the bank
+    lock_noise_bank(bank)
+
+    try:
+
+        # Read the index
+        index = read_bank_index(bank)
+
+        # Put the file in the bank (another job may have just done so, in
+        # which case we just replace its file with our identical one)
+        os.replace(tmpname, fname)
+
+        # Add the file to the index
+        index[os.path.basename(fname)] = {'key': key, 'nbytes': int(os.path.getsize(fname))}
+
+        # Make room in the bank
+        if bank['maxBytes'] is not None:
+            evict_bank_noise(bank, index, os.path.basename(fname))
+
+        # Write the index
+        write_bank_index(bank, index)
+
+    finally:
+
+        # Unlock the bank
+        unlock_noise_bank(bank)
+
+
+# ============================================================================
+#
+# This function deletes the least recently used files in a noise bank until
+# the bank is no larger than its maximum size. The bank must be locked.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `bank`: The noise bank (as output by `get_noise_bank`).
+# - `index`: The index of the bank (as output by `read_bank_index`). The
+#            deleted files are removed from the index.
+# - `keep`: A file which must not be deleted (the file just added).
+#
+# ============================================================================
+def evict_bank_noise(bank, index, keep):
+
+    # When each file in the bank was last used (files which have already
+    # been deleted are dropped from the index)
+    lastUsed = dict()
+    for name in list(index.keys()):
+        try:
+            lastUsed[name] = os.path.getmtime(os.path.join(bank['dir'], name))
+        except FileNotFoundError:
+            del index[name]
+
+    # Total size of the bank
+    nbytes = np.sum([index[name]['nbytes'] for name in index])
+
+    # Delete the least recently used files until the bank is small enough
+    for name in sorted(lastUsed, key=lambda name: lastUsed[name]):
+
+        # Stop once the bank is small enough
+        if nbytes <= bank['maxBytes']:
+            break
+
+        # Never delete the file we were asked to keep
+        if name == keep:
+            continue
+
+        # Delete the file (jobs which already have it open can still read
+        # it)
+        try:
+            os.remove(os.path.join(bank['dir'], name))
+        except FileNotFoundError:
+            pass
+
+        # Remove it from the index
+        nbytes = nbytes - index[name]['nbytes']
+        del index[name]
+
+
+# ============================================================================
+#
+# This function reads the index of a noise bank (a dictionary mapping the
+# name of each file in the bank to its key and size).
+#
+# ============================================================================
+def read_bank_index(bank):
+
+    # Index file
+    fname = os.path.join(bank['dir'], NOISE_BANK_INDEX)
+
+    # Empty index if the bank is new
+    if not os.path.isfile(fname):
+        return({})
+
+    # Read the index
+    with open(fname, 'r') as stream:
+        index = yaml.load(stream, Loader=yaml.FullLoader)
+
+    # Return the index
+    return(index if index is not None else {})
+
+
+# ============================================================================
+#
+# This function writes the index of a noise bank (under a temporary name,
+# which is then renamed, so the index is always complete).
+#
+# ============================================================================
+def write_bank_index(bank, index):
+
+    # Index file
+    fname = os.path.join(bank['dir'], NOISE_BANK_INDEX)
+
+    # Write the index
+    with open(fname + '.tmp', 'w') as stream:
+        yaml.dump(index, stream, default_flow_style=False)
+    os.replace(fname + '.tmp', fname)
+
+
+# ============================================================================
+#
+# This function locks a noise bank, waiting until no other job has it
+# locked.
+#
+# ============================================================================
+def lock_noise_bank(bank):
+
+    # Check if the bank is in use
+    bankLocked = True
+    while bankLocked:
+
+        try:
+
+            # Create lock file, so other jobs know we are writing to the bank
+            os.close(os.open(os.path.join(bank['dir'], NOISE_BANK_INDEX + '.lock'), os.O_CREAT|os.O_EXCL|os.O_RDWR))
+            bankLocked = False
+
+        except FileExistsError:
+
+            # Bank is still locked
+            time.sleep(0.01)
+
+
+# ============================================================================
+#
+# This function unlocks a noise bank.
+#
+# ============================================================================
+def unlock_noise_bank(bank):
+
+    # Delete lock file, so other jobs know they can now write to the bank
+    os.remove(os.path.join(bank['dir'], NOISE_BANK_INDEX + '.lock'))
+
+
+# ============================================================================
+#
+# This function sets up a stream which yields noise already held in memory
+# (or memory mapped, e.g. from a noise bank) a block of subjects at a time,
+# so that it can be used in place of a stream from `get_noise_stream`.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise`: The noise.
+# - `blockSize`: The (maximum) number of subjects yielded at once.
+# - `dtype`: The floating point type of the noise blocks (float64 or 
+#            float32).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream`: A dictionary describing the stream (to be passed to
+#                   `get_noise_blocks`).
+#
+# ============================================================================
+def get_bank_noise_stream(noise, blockSize, dtype=np.float64):
+
+    # Make the stream
+    noise_stream = dict()
+    noise_stream['noise'] = noise
+    noise_stream['dim'] = np.array(noise.shape)
+    noise_stream['blockSize'] = int(blockSize)
+    noise_stream['dtype'] = np.dtype(dtype)
+
+    # Return the stream
+    return(noise_stream)
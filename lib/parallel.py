@@ -0,0 +1,282 @@
+import numpy as np
+import multiprocessing
+from multiprocessing import shared_memory
+import scipy.sparse
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to run the realizations of a
+# configuration in parallel. Each simulation splits its realization loop into
+# a function of the form:
+#
+#                         results = fn(r, consts)
+#
+# where `consts` is a dictionary holding everything which is the same for
+# every realization (the inputs, the mu fields, the true boundary plan, ...)
+# and `results` is whatever that realization records (e.g. its success
+# rows). The realizations are then sharded across a pool of worker
+# processes and their results are returned in order of realization, so the
+# output is the same however many workers are used.
+#
+# The numpy arrays (and sparse matrices) in `consts` are placed once in
+# shared memory rather than being copied to every worker. Shared arrays are
+# read-only in the workers.
+#
+# The realizations can also be stopped early; every `stopEvery` realizations
+# the results so far are passed to a `stop` function, and no more
+# realizations are run once it returns True. As the results are checked in
+# order of realization, the stopping point is also the same however many
+# workers are used (though the workers may have run a few realizations past
+# it, the results of which are discarded).
+#
+# Note: Each realization must draw its random numbers from its own streams
+# (see `get_rng`), as otherwise the workers would all draw the same numbers.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# The function and constants used by this worker (set by `_init_worker`)
+_WORKER = {}
+
+# ============================================================================
+#
+# This function runs the realizations of a configuration, either serially or
+# sharded across a pool of worker processes.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `fn`: The function run for each realization (this must be defined at the
+#         top level of a module, so that the workers can find it).
+# - `consts`: Dictionary of everything which is the same for every
+#             realization.
+# - `nReals`: The number of realizations (the maximum number, if `stop` is
+#             given).
+# - `nWorkers`: The number of worker processes (if this is 1 the
+#               realizations are run serially in this process).
+# - `stop`: Function of the list of results so far, returning True once no
+#           more realizations are needed (optional).
+# - `stopEvery`: How many realizations to run between calls to `stop`.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `results`: List of the results of `fn` for each realization run, in
+#              order.
+#
+# ============================================================================
+def get_realizations(fn, consts, nReals, nWorkers=1, stop=None, stopEvery=1):
+
+    # Run serially if we only have one worker
+    if nWorkers <= 1:
+        return(_collect_results((fn(r, consts) for r in np.arange(nReals)), stop, stopEvery))
+
+    # Shared memory blocks
+    shms = []
+
+    try:
+
+        # Place the constants in shared memory
+        shared = share_consts(consts, shms)
+
+        # Run the realizations across the pool, one at a time so that slow
+        # realizations do not hold up a whole chunk (imap returns the results
+        # in order, and leaving the pool terminates any workers still
+        # running once we have stopped)
+        with multiprocessing.Pool(nWorkers, initializer=_init_worker, initargs=(fn, shared)) as pool:
+            results = _collect_results(pool.imap(_run_worker, np.arange(nReals), chunksize=1), stop, stopEvery)
+
+    finally:
+
+        # Free the shared memory
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    # Return the results
+    return(results)
+
+
+# ============================================================================
+#
+# This function collects the results of the realizations, in order, until
+# either every realization has been run or `stop` returns True.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `resultIter`: Iterator over the results of the realizations, in order.
+# - `stop`: Function of the list of results so far, returning True once no
+#           more realizations are needed (None to run every realization).
+# - `stopEvery`: How many realizations to run between calls to `stop`.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `results`: List of the results collected.
+#
+# ============================================================================
+def _collect_results(resultIter, stop, stopEvery):
+
+    # Results so far
+    results = []
+
+    # Loop through the realizations
+    for result in resultIter:
+
+        # Record the result
+        results.append(result)
+
+        # Check whether we can stop
+        if stop is not None and len(results) % stopEvery == 0 and stop(results):
+            break
+
+    # Return the results
+    return(results)
+
+
+# ============================================================================
+#
+# This function copies the numpy arrays (and sparse matrices) in a set of
+# constants into shared memory, replacing each of them with a small
+# description of where it was put. Dictionaries, lists and tuples are
+# searched recursively and everything else is left as it is.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `consts`: The constants (a dictionary, list, tuple, array, ...).
+# - `shms`: List to which the new shared memory blocks are appended (these
+#           must be closed and unlinked once they are no longer needed).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `shared`: The constants, with every array replaced by its description
+#             (as read by `attach_consts`).
+#
+# ============================================================================
+def share_consts(consts, shms):
+
+    # Search dictionaries, lists and tuples
+    if isinstance(consts, dict):
+        return({key: share_consts(val, shms) for key, val in consts.items()})
+    if isinstance(consts, (list, tuple)):
+        return(type(consts)(share_consts(val, shms) for val in consts))
+
+    # Share the arrays making up a sparse matrix
+    if scipy.sparse.isspmatrix_csr(consts):
+        return(('__csr__', share_consts((consts.data, consts.indices, consts.indptr), shms), consts.shape))
+
+    # Share numpy arrays (empty and object arrays are just copied)
+    if isinstance(consts, np.ndarray) and consts.nbytes > 0 and not consts.dtype.hasobject:
+
+        # Copy the array into a new block of shared memory
+        shm = shared_memory.SharedMemory(create=True, size=consts.nbytes)
+        np.ndarray(consts.shape, dtype=consts.dtype, buffer=shm.buf)[...] = consts
+        shms.append(shm)
+
+        # Describe where the array was put
+        return(('__shm__', shm.name, consts.shape, consts.dtype.str))
+
+    # Anything else is left as it is
+    return(consts)
+
+
+# ============================================================================
+#
+# This function reverses `share_consts`, replacing each description with a
+# (read-only) view of the array in shared memory.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `shared`: The constants (as output by `share_consts`).
+# - `shms`: List to which the attached shared memory blocks are appended
+#           (these must be kept open while the arrays are in use).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `consts`: The constants.
+#
+# ============================================================================
+def attach_consts(shared, shms):
+
+    # Search dictionaries
+    if isinstance(shared, dict):
+        return({key: attach_consts(val, shms) for key, val in shared.items()})
+
+    # Shared arrays and sparse matrices
+    if isinstance(shared, tuple) and len(shared) > 0 and isinstance(shared[0], str):
+
+        # Rebuild a sparse matrix from its shared arrays
+        if shared[0] == '__csr__':
+            return(scipy.sparse.csr_matrix(attach_consts(shared[1], shms), shape=shared[2], copy=False))
+
+        # Attach to a shared array
+        if shared[0] == '__shm__':
+
+            # Attach to the block of shared memory
+            shm = shared_memory.SharedMemory(name=shared[1])
+            shms.append(shm)
+
+            # View it as an array
+            arr = np.ndarray(shared[2], dtype=np.dtype(shared[3]), buffer=shm.buf)
+            arr.flags.writeable = False
+            return(arr)
+
+    # Search lists and tuples
+    if isinstance(shared, (list, tuple)):
+        return(type(shared)(attach_consts(val, shms) for val in shared))
+
+    # Anything else is left as it is
+    return(shared)
+
+
+# ============================================================================
+#
+# This function initialises a worker process, attaching it to the shared
+# constants.
+#
+# ============================================================================
+def _init_worker(fn, shared):
+
+    # Record the function and attach to the constants
+    _WORKER['shms'] = []
+    _WORKER['fn'] = fn
+    _WORKER['consts'] = attach_consts(shared, _WORKER['shms'])
+
+
+# ============================================================================
+#
+# This function runs a single realization in a worker process.
+#
+# ============================================================================
+def _run_worker(r):
+
+    # Run the realization
+    return(_WORKER['fn'](r, _WORKER['consts']))
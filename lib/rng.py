@@ -0,0 +1,243 @@
+import numpy as np
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to seed the random number generators
+# used by the simulations. A single root seed is stored in the configuration
+# file and every stream of random numbers a simulation needs is derived from
+# it using numpy's `SeedSequence`, keyed by:
+#
+#            (simNo, cfgId, realization, field, purpose)
+#
+# Each key gives an independent stream, so a realization can be reproduced
+# on its own (and realizations can be run in any order, or by different
+# workers) without the streams overlapping or being correlated.
+#
+# If no root seed is given, no generators are made (every `rng` is None) and
+# the random numbers are drawn from the legacy global generator
+# (`np.random.randn` and `np.random.randint`), exactly as before.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# The purposes for which random numbers are drawn (the last element of the
+# key for each stream). Noise for a noise bank (see `get_bank_noise`) has
+# its own purpose, as it is shared by every configuration.
+RNG_PURPOSES = {'noise': 0, 'boot': 1, 'bank': 2}
+
+# Default bit generator
+RNG_BIT_GENERATOR = 'PCG64'
+
+# ============================================================================
+#
+# This function reads the root seed from the inputs of a configuration file.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `inputs`: The dictionary of inputs read from the configuration file. The
+#             root seed is given by `seed` and the bit generator (optional,
+#             `PCG64` by default, or e.g. `Philox` or `SFC64`) by
+#             `bitGenerator`.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `seed`: The root seed (None if not given).
+# - `bitGenerator`: The name of the bit generator.
+#
+# ============================================================================
+def get_root_seed(inputs):
+
+    # Get the root seed
+    if 'seed' in inputs:
+        seed = int(inputs['seed'])
+    else:
+        seed = None
+
+    # Get the bit generator
+    if 'bitGenerator' in inputs:
+        bitGenerator = str(inputs['bitGenerator'])
+    else:
+        bitGenerator = RNG_BIT_GENERATOR
+
+    # Return the seed and bit generator
+    return(seed, bitGenerator)
+
+
+# ============================================================================
+#
+# This function returns the random number generator for one stream.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `seed`: The root seed (as output by `get_root_seed`).
+# - `simNo`: The simulation number.
+# - `cfgId`: The configuration ID.
+# - `r`: The realization.
+# - `field`: The field the random numbers are used for (0 if they are not
+#            specific to a field).
+# - `purpose`: What the random numbers are used for (a key of
+#              RNG_PURPOSES).
+# - `bitGenerator`: The name of the bit generator.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `rng`: A numpy Generator for this stream (None if `seed` is None, in
+#          which case the legacy global generator should be used).
+#
+# ============================================================================
+def get_rng(seed, simNo, cfgId, r, field=0, purpose='noise', bitGenerator=RNG_BIT_GENERATOR):
+
+    # Use the legacy global generator if we have no root seed
+    if seed is None:
+        return(None)
+
+    # Key for this stream
+    key = (int(simNo), int(cfgId), int(r), int(field), RNG_PURPOSES[purpose])
+
+    # Derive the seed sequence for this stream from the root seed
+    seq = np.random.SeedSequence(seed, spawn_key=key)
+
+    # Make the generator
+    return(np.random.Generator(getattr(np.random, bitGenerator)(seq)))
+
+
+# ============================================================================
+#
+# This function draws standard normal random numbers, from `rng` if it is
+# given and from the legacy global generator otherwise.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `shape`: The shape of the array of random numbers.
+# - `rng`: A numpy Generator or RandomState (optional).
+# - `out`: C contiguous array of the given shape to fill with the random 
+#          numbers (optional). The legacy generators cannot draw directly 
+#          into an array, so for these the numbers are copied in.
+# - `dtype`: The floating point type of the random numbers (float64 or
+#            float32, ignored if `out` is given). The legacy generators 
+#            only draw float64 numbers, which are then rounded, whereas a
+#            Generator draws float32 numbers directly (so the numbers, and
+#            how much of the stream is used, depend on the type).
+#
+# ============================================================================
+def get_randn(shape, rng=None, out=None, dtype=np.float64):
+
+    # The type of the output
+    if out is not None:
+        dtype = out.dtype
+
+    # Legacy global generator
+    if rng is None:
+        randn = np.random.randn(*shape)
+
+    # Legacy generator with its own state (as used to replay streams)
+    elif isinstance(rng, np.random.RandomState):
+        randn = rng.randn(*shape)
+
+    # Generator (Ziggurat sampling)
+    else:
+        return(rng.standard_normal(tuple(shape), dtype=dtype, out=out))
+
+    # Copy the numbers into the output (if we were given one)
+    if out is not None:
+        out[...] = randn
+        return(out)
+
+    # Return the numbers
+    return(randn.astype(dtype, copy=False))
+
+
+# ============================================================================
+#
+# This function draws uniform random integers in [low, high), from `rng` if
+# it is given and from the legacy global generator otherwise.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `low`, `high`: The range of integers.
+# - `shape`: The shape of the array of random numbers.
+# - `rng`: A numpy Generator or RandomState (optional).
+#
+# ============================================================================
+def get_randint(low, high, shape, rng=None):
+
+    # Legacy global generator
+    if rng is None:
+        return(np.random.randint(low, high, shape))
+
+    # Legacy generator with its own state
+    if isinstance(rng, np.random.RandomState):
+        return(rng.randint(low, high, shape))
+
+    # Generator
+    return(rng.integers(low, high, shape))
+
+
+# ============================================================================
+#
+# This function returns a copy of a random number generator in its current
+# state. Drawing from the copy does not affect the original, so the copy can
+# be used to replay the numbers the original is about to draw.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `rng`: A numpy Generator or RandomState (optional). If this is not 
+#          given, a copy of the legacy global generator is returned.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `rng_copy`: A numpy Generator (or a RandomState, if `rng` was not given
+#               or was a RandomState).
+#
+# ============================================================================
+def get_rng_copy(rng=None):
+
+    # Copy the legacy global generator
+    if rng is None:
+        rng_copy = np.random.RandomState()
+        rng_copy.set_state(np.random.get_state())
+
+    # Copy a legacy generator with its own state
+    elif isinstance(rng, np.random.RandomState):
+        rng_copy = np.random.RandomState()
+        rng_copy.set_state(rng.get_state())
+
+    # Copy the generator, with a bit generator of the same type
+    else:
+        bit_generator = type(rng.bit_generator)()
+        bit_generator.state = rng.bit_generator.state
+        rng_copy = np.random.Generator(bit_generator)
+
+    # Return the copy
+    return(rng_copy)
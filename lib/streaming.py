@@ -0,0 +1,580 @@
+import numpy as np
+from lib.generateData import *
+from lib.boundary import *
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to stream data a block of subjects
+# at a time, rather than holding all nSub subjects in memory at once. The
+# simulations only ever need the mean and standard deviation of the data,
+# and the residuals at a small number of boundary voxels, so the data are
+# streamed twice:
+#
+#  - Pass one generates each block and accumulates the running mean and
+#    variance (see `get_moments_update`).
+#  - Pass two regenerates exactly the same blocks and keeps only the
+#    standardised residuals at the boundary voxels.
+#
+# To regenerate the same blocks, the state of the random number generator at
+# the start of each noise field is recorded and replayed (see
+# `get_noise_stream`). The noise in each block is identical to the
+# corresponding subjects of the noise `get_noise` would have generated, and
+# the random number generator (the legacy global generator, or the generator
+# for the field, see `get_rng`) is left in the same state, so every later
+# random number (e.g. in the bootstrap) is unchanged by streaming.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# ============================================================================
+#
+# This function sets up a stream for the noise field `get_noise` would
+# generate for the given inputs. The current state of the random number
+# generator is recorded in the stream and the generator is then advanced
+# past the noise (a block at a time), exactly as though `get_noise` had been
+# called.
+#
+# Note: Subjects can only be generated a block at a time if the noise is not
+# smoothed across subjects (i.e. the first FWHM must be 0 or None).
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noiseSpec`: Dictionary specifying the noise (see `get_noise`).
+# - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `blockSize`: The (maximum) number of subjects generated at once.
+# - `rng`: The random number generator for the noise (optional, see 
+#          `get_rng`). If this is not given, the legacy global generator is
+#          used.
+# - `dtype`: The floating point type of the noise (float64 or float32, see
+#            `get_randn`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream`: A dictionary describing the stream (to be passed to
+#                   `get_noise_blocks`).
+#
+# ============================================================================
+def get_noise_stream(noiseSpec, dim, blockSize, rng=None, dtype=np.float64):
+
+    # Truncation (this must match `get_noise`)
+    trunc = 6
+
+    # Format fwhm and replace None with 0
+    fwhm = np.asarray([noiseSpec['FWHM']]).ravel()
+    fwhm = np.asarray([0. if elem is None else elem for elem in fwhm])
+
+    # Check we are not smoothing across subjects
+    if fwhm[0] != 0:
+        raise ValueError('Noise can only be streamed if it is not smoothed across subjects.')
+
+    # Check whether we are smoothing on a periodic grid
+    periodic = ('periodic' in noiseSpec) and bool(noiseSpec['periodic'])
+
+    # Get the smoothing plan (this is the same plan `get_noise` uses)
+    plan = get_smoothing_plan(fwhm, dim, trunc, periodic)
+    pdim = plan['pdim']
+
+    # Make the stream
+    noise_stream = dict()
+    noise_stream['noiseSpec'] = noiseSpec
+    noise_stream['dim'] = dim
+    noise_stream['blockSize'] = int(blockSize)
+    noise_stream['fwhm'] = fwhm
+    noise_stream['trunc'] = trunc
+    noise_stream['periodic'] = periodic
+    noise_stream['plan'] = plan
+    noise_stream['dtype'] = np.dtype(dtype)
+
+    # Record the state of the random number generator
+    noise_stream['rng'] = get_rng_copy(rng)
+
+    # Advance the random number generator past the padded noise, discarding
+    # the values
+    for s0 in np.arange(0, pdim[0], blockSize):
+        get_randn((np.minimum(blockSize, pdim[0]-s0), *pdim[1:]), rng, dtype=dtype)
+
+    # Return the stream
+    return(noise_stream)
+
+
+# ============================================================================
+#
+# This function yields the noise described by a noise stream a block of
+# subjects at a time. Every call replays the stream from the beginning, using
+# its own copy of the random number generator, so the generator the stream
+# was set up with is not affected.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream`: The noise stream (as output by `get_noise_stream` or
+#                   `get_bank_noise_stream`).
+#
+# ----------------------------------------------------------------------------
+#
+# It yields:
+#
+# ----------------------------------------------------------------------------
+#
+# - `s0`, `s1`: The first subject, and one past the last subject, in this
+#               block.
+# - `noise`: The noise for subjects s0 to s1 (i.e. noise[s0:s1] for the
+#            noise `get_noise` would have generated).
+#
+# ============================================================================
+def get_noise_blocks(noise_stream):
+
+    # Noise which is already held in memory (or memory mapped, see
+    # `get_bank_noise_stream`) is just yielded a block at a time
+    if 'noise' in noise_stream:
+        for s0 in np.arange(0, noise_stream['dim'][0], noise_stream['blockSize']):
+            s1 = np.minimum(s0 + noise_stream['blockSize'], noise_stream['dim'][0])
+            yield(s0, s1, np.array(noise_stream['noise'][s0:s1,...], dtype=noise_stream['dtype']))
+        return
+
+    # Unpack the stream
+    noiseSpec = noise_stream['noiseSpec']
+    dim = noise_stream['dim']
+    blockSize = noise_stream['blockSize']
+    fwhm = noise_stream['fwhm']
+    trunc = noise_stream['trunc']
+    periodic = noise_stream['periodic']
+    plan = noise_stream['plan']
+    dtype = noise_stream['dtype']
+    pad = plan['pad']
+    pdim = plan['pdim']
+
+    # Dimension D
+    D = np.prod(np.shape(dim))
+
+    # Replay the random number generator from the start of the stream
+    rng = get_rng_copy(noise_stream['rng'])
+
+    # Skip the padding before the first subject
+    get_randn((pad[0], *pdim[1:]), rng, dtype=dtype)
+
+    # Indices used to truncate the noise for every subject
+    crop = (slice(None),) + plan['crop'][1:]
+
+    # Loop through the blocks of subjects
+    for s0 in np.arange(0, dim[0], blockSize):
+
+        # The last block may be smaller than the others
+        s1 = np.minimum(s0 + blockSize, dim[0])
+
+        # Generate unsmoothed random normal data for this block
+        noise = get_randn((s1-s0, *pdim[1:]), rng, dtype=dtype)
+
+        # Perform smoothing
+        noise = smooth_data(noise, D, fwhm, trunc, periodic=periodic, plan=plan)
+
+        # Truncate the noise
+        noise = noise[crop]
+
+        # Heterogenous noise (ramp)
+        if noiseSpec['type']=='heterogen':
+
+            noise *= np.linspace(0.5,1.5,noise.shape[-1])
+
+        # Alter the magnitude of the noise
+        if 'mag' in noiseSpec:
+            noise = noise*float(noiseSpec['mag'])
+
+        # Yield the block
+        yield(s0, s1, noise)
+
+
+# ============================================================================
+#
+# This function returns an empty set of running moments (the number of
+# subjects seen so far, their mean and their sum of squared deviations from
+# the mean).
+#
+# ============================================================================
+def get_moments_init():
+
+    # Nothing seen yet
+    return({'n': 0, 'mean': None, 'm2': None})
+
+
+# ============================================================================
+#
+# This function updates a set of running moments with a block of subjects.
+# The block is combined with the moments seen so far using the pairwise
+# update of Chan et al. (which is stable when the blocks are large):
+#
+#      mean = mean_a + delta*n_b/n
+#      m2   = m2_a + m2_b + delta^2*n_a*n_b/n,     delta = mean_b - mean_a
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `moments`: The running moments (as output by `get_moments_init` or a
+#              previous call to this function).
+# - `block`: The block of data, with subjects along the first axis.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `moments`: The updated moments.
+#
+# ============================================================================
+def get_moments_update(moments, block):
+
+    # Number of subjects in the block
+    n_b = block.shape[0]
+
+    # Mean and sum of squared deviations for the block (accumulated in 
+    # float64, whatever the type of the data)
+    mean_b = np.mean(block, axis=0, dtype=np.float64)
+    m2_b = np.sum((block - mean_b)**2, axis=0)
+
+    # If this is the first block we just record it
+    if moments['n'] == 0:
+
+        return({'n': n_b, 'mean': mean_b, 'm2': m2_b})
+
+    # Number of subjects seen so far
+    n_a = moments['n']
+    n = n_a + n_b
+
+    # Difference in means
+    delta = mean_b - moments['mean']
+
+    # Combine the moments
+    mean = moments['mean'] + delta*(n_b/n)
+    m2 = moments['m2'] + m2_b + delta**2*(n_a*n_b/n)
+
+    # Return the updated moments
+    return({'n': n, 'mean': mean, 'm2': m2})
+
+
+# ============================================================================
+#
+# This function returns the mean and (ddof=0) standard deviation from a set
+# of running moments, matching `np.mean(data, axis=0)` and
+# `np.std(data, axis=0)`.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `moments`: The running moments (as output by `get_moments_update`).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `mean`: The mean.
+# - `sigma`: The standard deviation.
+#
+# ============================================================================
+def get_moments_final(moments):
+
+    # Return the mean and standard deviation
+    return(moments['mean'], np.sqrt(moments['m2']/moments['n']))
+
+
+# ============================================================================
+#
+# This function updates a set of running moments with a block of subjects,
+# recording a snapshot of the mean and standard deviation whenever the 
+# number of subjects seen reaches one of a set of cutoffs. This is used for
+# nested sample sizes, where the first nSub subjects of the same data are
+# used for each of several values of nSub; the moments for every nSub are
+# then obtained from a single pass through the data.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `moments`: The running moments (as output by `get_moments_init` or a
+#              previous call to this function).
+# - `block`: The block of data, with subjects along the first axis.
+# - `cutoffs`: The numbers of subjects at which to record the snapshots.
+# - `snapshots`: Dictionary to which the snapshots are added (mapping each
+#                cutoff reached in this block to its mean and standard
+#                deviation).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `moments`: The updated moments.
+#
+# ============================================================================
+def get_moments_snapshots(moments, block, cutoffs, snapshots):
+
+    # Subjects covered by this block
+    s0 = moments['n']
+    s1 = s0 + block.shape[0]
+
+    # Split the block at every cutoff inside it
+    for cutoff in sorted(cutoffs):
+
+        # Only cutoffs inside this block are needed
+        if s0 < cutoff <= s1:
+
+            # Update the moments up to the cutoff
+            moments = get_moments_update(moments, block[:cutoff-s0,...])
+            block = block[cutoff-s0:,...]
+            s0 = cutoff
+
+            # Record the snapshot
+            snapshots[cutoff] = get_moments_final(moments)
+
+    # Update the moments with the rest of the block
+    if block.shape[0] > 0:
+        moments = get_moments_update(moments, block)
+
+    # Return the updated moments
+    return(moments)
+
+
+# ============================================================================
+#
+# This function yields the data for a single field (mu plus the noise from a
+# noise stream) a block of subjects at a time.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream`: The noise stream (as output by `get_noise_stream`).
+# - `mu`: The mu field.
+#
+# ----------------------------------------------------------------------------
+#
+# It yields:
+#
+# ----------------------------------------------------------------------------
+#
+# - `s0`, `s1`: The first subject, and one past the last subject, in this
+#               block.
+# - `data`: The data for subjects s0 to s1.
+#
+# ============================================================================
+def get_data_blocks(noise_stream, mu):
+
+    # Loop through the noise blocks
+    for s0, s1, noise in get_noise_blocks(noise_stream):
+
+        # Create the data
+        yield(s0, s1, mu + noise)
+
+
+# ============================================================================
+#
+# This function yields the data for a pair of (possibly correlated) fields a
+# block of subjects at a time, matching `get_data`.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream1`, `noise_stream2`: The noise streams for each field (as
+#                                     output by `get_noise_stream`, with the
+#                                     same block size).
+# - `mu1`, `mu2`: The mu fields.
+# - `noiseCorr`: Correlation between the two noise fields (optional).
+#
+# ----------------------------------------------------------------------------
+#
+# It yields:
+#
+# ----------------------------------------------------------------------------
+#
+# - `s0`, `s1`: The first subject, and one past the last subject, in this
+#               block.
+# - `data1`, `data2`: The data for subjects s0 to s1 for each field.
+#
+# ============================================================================
+def get_data_blocks_2field(noise_stream1, noise_stream2, mu1, mu2, noiseCorr=None):
+
+    # Factorise the correlation matrix (if needed)
+    if noiseCorr is not None:
+        noiseFactor = get_corr_factor(noiseCorr, 2)
+    else:
+        noiseFactor = None
+
+    # Stack of mu fields
+    mus = np.concatenate((mu1, mu2))
+
+    # Loop through the data blocks for both fields together
+    for s0, s1, datas in get_data_blocks_mfield([noise_stream1, noise_stream2], mus, noiseFactor):
+
+        # Yield the data for each field
+        yield(s0, s1, datas[0], datas[1])
+
+
+# ============================================================================
+#
+# This function yields the data for a stack of m (possibly correlated) 
+# fields a block of subjects at a time.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_streams`: The noise streams for each field (as output by 
+#                    `get_noise_stream`, with the same block size).
+# - `mus`: The stack of mu fields (of shape [m, ...]).
+# - `noiseFactor`: The mixing matrix used to correlate the fields 
+#                  (optional, as output by `get_corr_factor`).
+#
+# ----------------------------------------------------------------------------
+#
+# It yields:
+#
+# ----------------------------------------------------------------------------
+#
+# - `s0`, `s1`: The first subject, and one past the last subject, in this
+#               block.
+# - `datas`: The data for subjects s0 to s1 for every field (of shape 
+#            [m, s1-s0, ...]).
+#
+# ============================================================================
+def get_data_blocks_mfield(noise_streams, mus, noiseFactor=None):
+
+    # Number of fields
+    m = len(noise_streams)
+
+    # Loop through the noise blocks for every field together
+    for blocks in zip(*[get_noise_blocks(noise_stream) for noise_stream in noise_streams]):
+
+        # The subjects in this block
+        s0, s1 = blocks[0][:2]
+
+        # Stack the noise for every field
+        datas = np.stack([noise for _, _, noise in blocks])
+
+        # Correlate the data in place if needed
+        if noiseFactor is not None:
+            correlate_noise_stack(datas, noiseFactor)
+
+        # Create the data
+        datas += mus.reshape(m, 1, *mus.shape[1:])
+
+        # Yield the block
+        yield(s0, s1, datas)
+
+
+# ============================================================================
+#
+# This function performs pass one for a single field, returning the mean and
+# standard deviation of the data without holding all subjects in memory.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream`: The noise stream (as output by `get_noise_stream`).
+# - `mu`: The mu field.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `muHat`: The mean of the data (with the same shape as mu).
+# - `sigma`: The standard deviation of the data (with the same shape as mu).
+#
+# ============================================================================
+def get_stream_moments(noise_stream, mu):
+
+    # Running moments
+    moments = get_moments_init()
+
+    # Accumulate the moments a block at a time
+    for s0, s1, data in get_data_blocks(noise_stream, mu):
+        moments = get_moments_update(moments, data)
+
+    # Get the mean and standard deviation
+    muHat, sigma = get_moments_final(moments)
+
+    # Return them with the same shape as mu
+    return(muHat.reshape(mu.shape), sigma.reshape(mu.shape))
+
+
+# ============================================================================
+#
+# This function performs pass two for a single field, returning the
+# standardised residuals at one or more sets of boundary voxels without
+# holding all subjects in memory.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `noise_stream`: The noise stream (as output by `get_noise_stream`).
+# - `mu`: The mu field.
+# - `muHat`: The mean of the data (as output by `get_stream_moments`).
+# - `sigma`: The standard deviation of the data (as output by 
+#            `get_stream_moments`).
+# - `vox_list`: A list of arrays of flat voxel indices (as output by
+#               `get_bdry_interp_op`).
+# - `nDims`: The number of trailing dimensions of the data which the flat
+#            indices index into.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `resid_vox_list`: A list containing, for each array of voxels, the 
+#                     residuals at those voxels (of shape [nSub, nVox]).
+#
+# ============================================================================
+def get_stream_resid_vox(noise_stream, mu, muHat, sigma, vox_list, nDims):
+
+    # Number of subjects
+    nSub = noise_stream['dim'][0]
+
+    # Empty arrays to store the residuals
+    resid_vox_list = [np.zeros((nSub, len(vox))) for vox in vox_list]
+
+    # Loop through the blocks
+    for s0, s1, data in get_data_blocks(noise_stream, mu):
+
+        # Residuals for this block at each set of voxels
+        for resid_vox, vox in zip(resid_vox_list, vox_list):
+            resid_vox[s0:s1,:] = get_bdry_vox_resid(data, muHat, sigma, vox, nDims)
+
+    # Return the residuals
+    return(resid_vox_list)
@@ -0,0 +1,170 @@
+import numpy as np
+from lib.generateData import *
+from lib.boundary import *
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to build the "true boundary plan"
+# for a simulation. The true mean fields, mu, (and hence everything derived
+# from them, such as the boundary of Fc, the interpolation weights along it
+# and the partition labels) are the same for every realization of a given
+# configuration. Rather than recomputing these in every realization, they
+# are computed once and stored in a plan which is shared by all
+# realizations. Plans are memoised, so that a plan is only ever built once
+# per configuration (per process).
+#
+# Note: The arrays stored in a plan are shared between realizations and
+# must not be modified in place.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Plans that have already been built
+_TRUE_PLANS = {}
+
+# ============================================================================
+#
+# This function returns the true boundary plan for a list of mu
+# specifications. If the plan has already been built it is returned from the
+# cache, otherwise it is built using `make_true_plan`.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `muSpecs`: List of dictionaries specifying each of the m mu fields (see
+#              `get_mu` for details).
+# - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `c`: threshold of interest for mu.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `plan`: The true boundary plan (see `make_true_plan`).
+#
+# ============================================================================
+def get_true_plan(muSpecs, dim, c):
+
+    # The mu fields do not depend on the number of subjects, so the first
+    # dimension is not included in the key
+    key = (repr(muSpecs), tuple(np.array(dim)[1:]), len(dim), float(c))
+
+    # Build the plan if we haven't already
+    if key not in _TRUE_PLANS:
+        _TRUE_PLANS[key] = make_true_plan(muSpecs, dim, c)
+
+    # Return the plan
+    return(_TRUE_PLANS[key])
+
+
+# ============================================================================
+#
+# This function builds the true boundary plan for a list of mu
+# specifications.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `muSpecs`: List of dictionaries specifying each of the m mu fields (see
+#              `get_mu` for details).
+# - `dim`: Dimensions of data to be generated. Must be given as an np array.
+# - `c`: threshold of interest for mu.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `plan`: A dictionary containing:
+#     - `mus`: The m mu fields, stacked along the first axis.
+#     - `cap_mu`: The minimum of the mu fields (with a leading axis of
+#                 length one, so that it has the same shape as each mu).
+#     - `Fc_bdry_locs`: The boundary locations of Fc (the excursion set of
+#                       `cap_mu`).
+#     - `Fc_bdry_weights`: The interpolation weights along the boundary of
+#                          Fc (Dict version).
+#     - `Fc_bdry_weights_concat`: The interpolation weights along the
+#                                 boundary of Fc (Array version).
+#     - `Fc_bdry_vox`: The unique voxels along the boundary of Fc (flat
+#                      indices, as output by `get_bdry_interp_op`).
+#     - `Fc_bdry_interp_op`: The sparse operator interpolating from 
+#                            `Fc_bdry_vox` onto the boundary of Fc.
+#     - `mus_dFc`: The values of every mu field along the boundary of Fc, of
+#                  shape [m, nBdry, 2].
+#     - `dFc_order`, `dFc_labels`, `dFc_alphas`, `dFc_starts`: The
+#                  partitions of the boundary of Fc (as output by
+#                  `get_bdry_partitions`).
+#
+# ============================================================================
+def make_true_plan(muSpecs, dim, c):
+
+    # New empty plan
+    plan = {}
+
+    # -----------------------------------------------------------------------
+    # Mu fields
+    # -----------------------------------------------------------------------
+    # Obtain each mu and stack them
+    plan['mus'] = np.concatenate([get_mu(muSpec, dim) for muSpec in muSpecs], axis=0)
+
+    # This is named cap as the excursion set of the minimum field is the
+    # intersection of all fields (\cap in latex)
+    plan['cap_mu'] = np.amin(plan['mus'], axis=0, keepdims=True)
+
+    # -----------------------------------------------------------------------
+    # Boundary locations for Fc
+    # -----------------------------------------------------------------------
+    # Get the edges along the boundary of Fc
+    Fc_bdry_edges = get_bdry_edges(plan['cap_mu'], c)
+
+    # Get coordinates for the boundary of Fc
+    plan['Fc_bdry_locs'] = get_bdry_locs(Fc_bdry_edges)
+
+    # Delete edges as we no longer need them
+    del Fc_bdry_edges
+
+    # -----------------------------------------------------------------------
+    # Interpolation weights for Fc boundary (Dict version)
+    # -----------------------------------------------------------------------
+    # Obtain the values along the boundary for Fc
+    Fc_bdry_vals = get_bdry_values(plan['cap_mu'], plan['Fc_bdry_locs'])
+
+    # Obtain the weights along the boundary for Fc
+    plan['Fc_bdry_weights'] = get_bdry_weights(Fc_bdry_vals, c)
+
+    # -----------------------------------------------------------------------
+    # Interpolation weights for Fc boundary (Array version)
+    # -----------------------------------------------------------------------
+    # Obtain the values along the boundary for Fc
+    Fc_bdry_vals_concat = get_bdry_values_concat(plan['cap_mu'], plan['Fc_bdry_locs'])
+
+    # Obtain the weights along the boundary for Fc
+    plan['Fc_bdry_weights_concat'] = get_bdry_weights_concat(Fc_bdry_vals_concat, c)
+
+    # -----------------------------------------------------------------------
+    # Interpolation operator for Fc boundary (Sparse version)
+    # -----------------------------------------------------------------------
+    # Obtain the unique voxels along the boundary of Fc and the operator 
+    # interpolating from them onto the boundary
+    plan['Fc_bdry_vox'], plan['Fc_bdry_interp_op'] = get_bdry_interp_op(get_bdry_inds_concat(plan['Fc_bdry_locs']), plan['Fc_bdry_weights_concat'])
+
+    # -----------------------------------------------------------------------
+    # Mu along dFc and the partitions of dFc
+    # -----------------------------------------------------------------------
+    # Obtain mu for every field along Fc (of shape [m, nBdry, 2])
+    plan['mus_dFc'] = get_bdry_values_concat(plan['mus'], plan['Fc_bdry_locs'])
+
+    # Label each point on dFc with a bitmask of the fields for which mu is
+    # less than or equal to c outside Fc
+    plan['dFc_order'], plan['dFc_labels'], plan['dFc_alphas'], plan['dFc_starts'] = get_bdry_partitions(plan['mus_dFc'], c)
+
+    # Return the plan
+    return(plan)
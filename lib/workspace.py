@@ -0,0 +1,156 @@
+import numpy as np
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#
+# This file contains the functions used to manage the workspace of a
+# configuration. The workspace is a dictionary owning the large arrays each
+# realization needs (the stack of data, the padded noise, mu estimate and
+# sigma, the bootstrap variables, the residuals at the boundary voxels, ...).
+# It is sized once per configuration and every realization then writes into
+# the same arrays, rather than allocating (and freeing) them again, so the
+# peak memory of a configuration is reached in its first realization and
+# stays the same from then on.
+#
+# Each process has its own workspace (the workspace of a worker process is
+# made by the first realization it runs, see `get_realizations`). Arrays
+# taken from the workspace are overwritten by the next realization, so
+# nothing a realization returns may be a view of them.
+#
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# The workspace of this process (see `get_workspace`)
+_WORKSPACE = {}
+
+# ============================================================================
+#
+# This function returns the workspace for a configuration, making it if this
+# process does not already hold a workspace of the same size.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `dim`: Dimensions of the data in each field (i.e. [nSub, ...]). Must be
+#          given as an np array.
+# - `m`: The number of fields.
+# - `nBoot`: The number of bootstraps.
+# - `bootBlockSize`: The number of bootstraps performed at once.
+# - `holdData`: Whether the workspace holds the stack of data (this should
+#               be False if the data are streamed, see `get_noise_stream`).
+# - `dtype`: The data type of the data and bootstrap variables (the mu
+#            estimate, sigma and bootstrap maxima are always float64).
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `workspace`: Dictionary holding the arrays:
+#                   - data: the stack of data, of shape [m, *dim] (None
+#                           if holdData is False).
+#                   - muHat: mu estimate for every field, of shape
+#                            [m, *dim[1:]].
+#                   - sigma: sigma for every field, of shape [m, *dim[1:]].
+#                   - boot_vars: the bootstrap variables for a block of
+#                                bootstraps, of shape [bootBlockSize, nSub].
+#                   - boot_max: the bootstrap maxima along the true and
+#                               estimated boundaries, of shape [2, nBoot].
+#                   - buffers: the arrays whose size depends on the
+#                              realization (see `get_workspace_buffer`).
+#
+# ============================================================================
+def get_workspace(dim, m=1, nBoot=0, bootBlockSize=0, holdData=True, dtype=np.float64):
+
+    # Sizes of the workspace
+    key = (tuple(int(n) for n in dim), int(m), int(nBoot), int(bootBlockSize), bool(holdData), np.dtype(dtype))
+
+    # Reuse the workspace we already have if it is the right size
+    if _WORKSPACE.get('key') == key:
+        return(_WORKSPACE['workspace'])
+
+    # Free the old workspace before making the new one
+    free_workspace()
+
+    # Make the workspace
+    workspace = {}
+    workspace['data'] = np.empty((m, *key[0]), dtype=key[5]) if holdData else None
+    workspace['muHat'] = np.empty((m, *key[0][1:]))
+    workspace['sigma'] = np.empty((m, *key[0][1:]))
+    workspace['boot_vars'] = np.empty((key[3], key[0][0]), dtype=key[5])
+    workspace['boot_max'] = np.empty((2, key[2]))
+    workspace['buffers'] = {}
+
+    # Record it
+    _WORKSPACE['key'] = key
+    _WORKSPACE['workspace'] = workspace
+
+    # Return the workspace
+    return(workspace)
+
+
+# ============================================================================
+#
+# This function frees the workspace of this process (e.g. once every
+# realization of a configuration has been run).
+#
+# ============================================================================
+def free_workspace():
+
+    # Forget the workspace
+    _WORKSPACE.clear()
+
+
+# ============================================================================
+#
+# This function returns an array of a given shape from the workspace, for
+# arrays whose size is only known once a realization is run (e.g. the
+# residuals at the boundary voxels, or the padded noise for a given
+# smoothing). Each named buffer only grows, so once it is large enough for
+# every realization it is never reallocated.
+#
+# ----------------------------------------------------------------------------
+#
+# This function takes the following inputs:
+#
+# ----------------------------------------------------------------------------
+#
+# - `workspace`: The workspace (as output by `get_workspace`). If this is
+#                None, a new array is returned.
+# - `name`: The name of the buffer (any hashable value).
+# - `shape`: The shape of the array.
+# - `dtype`: The data type of the array.
+#
+# ----------------------------------------------------------------------------
+#
+# It returns:
+#
+# ----------------------------------------------------------------------------
+#
+# - `arr`: An (uninitialised) C contiguous array of the given shape, viewing
+#          the buffer.
+#
+# ============================================================================
+def get_workspace_buffer(workspace, name, shape, dtype=np.float64):
+
+    # Without a workspace we just make a new array
+    if workspace is None:
+        return(np.empty(shape, dtype=dtype))
+
+    # Number of elements needed
+    shape = tuple(int(n) for n in shape)
+    size = int(np.prod(shape))
+
+    # Grow the buffer if it is too small (at least doubling it, so that a
+    # buffer which grows slowly is only reallocated a few times), or make a
+    # new one if it has the wrong type
+    buffers = workspace['buffers']
+    if name not in buffers or buffers[name].dtype != dtype:
+        buffers[name] = np.empty(size, dtype=dtype)
+    elif buffers[name].size < size:
+        buffers[name] = np.empty(max(size, 2*buffers[name].size), dtype=dtype)
+
+    # Return a view of the start of the buffer
+    return(buffers[name][:size].reshape(shape))